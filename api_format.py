@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+API 响应格式化
+
+把 StockAnalyzer 的分析报告和指标数据整理为接口返回的格式，
+Flask 服务（app.py）和异步服务（asgi_app.py）共用，保证两种服务模式的响应完全一致。
+"""
+
+import calendar
+import json
+from datetime import date
+from email.utils import formatdate
+
+import compact
+import indicator_kernels as kernels
+import metrics
+
+
+@metrics.timed('format')
+def format_analysis(stock_code, report):
+    """/api/analyze 响应中的 data 部分"""
+    # 提取关键数据并格式化
+    formatted_result = {
+        # 股票基本信息
+        "basic_info": {
+            "stock_code": stock_code,
+            "analysis_date": report['analysis_date'],
+            "price": round(report['price'], 2),
+            "price_change": round(report['price_change'], 2)
+        },
+        # 分析评分和建议
+        "analysis_summary": {
+            "score": report['score'],
+            "recommendation": report['recommendation'],
+            "category_scores": report['category_scores'],
+            "score_details": report['score_details']
+        },
+        # 技术指标
+        "technical_indicators": {
+            "ma_trend": report['ma_trend'],
+            "rsi": round(report['rsi'], 2),
+            "macd_signal": report['macd_signal'],
+            "volume_status": report['volume_status'],
+            "adx": round(report.get('adx', 0), 2),
+            "stoch_k": round(report.get('stoch_k', 0), 2),
+            "stoch_d": round(report.get('stoch_d', 0), 2),
+            "cci": round(report.get('cci', 0), 2),
+            "mfi": round(report.get('mfi', 0), 2),
+            "obv_trend": report.get('obv_trend', '未知'),
+            "volatility": round(report.get('volatility', 0), 2),
+            "z_score": round(report.get('z_score', 0), 2)
+        }
+    }
+    
+    # 添加分析描述文本
+    trend_description = "上升" if report['ma_trend'] == "UP" else "下降"
+    volume_description = "放量" if report['volume_status'] == "HIGH" else "成交量正常"
+    
+    # 生成详细的评分说明
+    score_explanation = []
+    for category, score in report['category_scores'].items():
+        category_name = {
+            'trend': '📊 趋势类',
+            'momentum': '⚡ 动量类',
+            'volume': '💹 成交量类',
+            'volatility': '🧠 波动率类',
+            'statistical': '🧮 统计类'
+        }.get(category, category)
+        
+        score_explanation.append(f"{category_name}: {score}分")
+    
+    score_details = []
+    for indicator, detail in report['score_details'].items():
+        score_details.append(f"- {indicator}: {detail}")
+    
+    formatted_result["analysis_text"] = f"""
+股票 {stock_code} 分析报告 (生成于 {report['analysis_date']})
+
+当前价格: {formatted_result['basic_info']['price']} 元 (变动: {formatted_result['basic_info']['price_change']}%)
+综合评分: {report['score']} 分
+投资建议: {report['recommendation']}
+
+评分明细:
+{chr(10).join(score_explanation)}
+
+评分详情:
+{chr(10).join(score_details)}
+
+📊 趋势类指标:
+- 移动平均线趋势: {trend_description}
+- MACD信号: {"买入" if report['macd_signal'] == "BUY" else "卖出"}
+- ADX(趋势强度): {round(report.get('adx', 0), 2)}
+- 布林带位置: {report.get('bb_position', '中轨')}
+
+⚡ 动量类指标:
+- RSI指标: {round(report['rsi'], 2)}
+- 随机震荡指标: K({round(report.get('stoch_k', 0), 2)}) D({round(report.get('stoch_d', 0), 2)})
+- CCI指标: {round(report.get('cci', 0), 2)}
+- ROC变动率: {round(report.get('roc', 0), 2)}%
+
+💹 成交量类指标:
+- 成交量状态: {volume_description}
+- OBV趋势: {report.get('obv_trend', '未知')}
+- MFI指标: {round(report.get('mfi', 0), 2)}
+
+🧠 波动率指标:
+- 波动率: {round(report.get('volatility', 0), 2)}%
+- 标准差: {round(report.get('std_dev', 0), 2)}
+
+🧮 统计类指标:
+- Z-Score: {round(report.get('z_score', 0), 2)}
+
+支撑压力位:
+- {report.get('support_resistance', '详见图表分析')}
+"""
+    
+    return formatted_result
+
+
+@metrics.timed('format')
+def format_analysis_for_llm(stock_code, report):
+    """/api/analyze_for_llm 返回的纯文本"""
+    # 格式化指标
+    price = round(report['price'], 2)
+    price_change = round(report['price_change'], 2)
+    rsi = round(report['rsi'], 2)
+    trend_description = "上升" if report['ma_trend'] == "UP" else "下降"
+    volume_description = "放量" if report['volume_status'] == "HIGH" else "成交量正常"
+    macd_signal = "买入" if report['macd_signal'] == "BUY" else "卖出"
+    
+    # 生成评分明细
+    score_categories = []
+    for category, score in report['category_scores'].items():
+        category_name = {
+            'trend': '📊 趋势评分',
+            'momentum': '⚡ 动量评分',
+            'volume': '💹 成交量评分',
+            'volatility': '🧠 波动率评分',
+            'statistical': '🧮 统计套利评分'
+        }.get(category, category)
+        
+        max_scores = {
+            'trend': 40,
+            'momentum': 25,
+            'volume': 20,
+            'volatility': 10,
+            'statistical': 5
+        }
+        
+        score_categories.append(f"{category_name}: {score}/{max_scores.get(category, 0)}分")
+    
+    # 生成关键指标评分详情
+    detail_items = []
+    for indicator, detail in report['score_details'].items():
+        detail_items.append(f"- {indicator}: {detail}")
+    
+    # 生成分析文本
+    analysis_text = f"""# 股票{stock_code}分析报告
+
+## 基本情况
+- 分析日期: {report['analysis_date']}
+- 当前价格: {price} 元
+- 价格变动: {price_change}%
+- 综合评分: {report['score']}分
+- 投资建议: {report['recommendation']}
+
+## 评分明细
+{chr(10).join(score_categories)}
+
+## 评分详情
+{chr(10).join(detail_items)}
+
+## 📊 趋势类指标
+- 移动平均线趋势: {trend_description}
+- MACD信号: {macd_signal}
+- ADX(趋势强度): {round(report.get('adx', 0), 2)}
+- 布林带位置: {report.get('bb_position', '中轨')}
+
+## ⚡ 动量类指标
+- RSI指标: {rsi}
+- 随机震荡指标: K({round(report.get('stoch_k', 0), 2)}) D({round(report.get('stoch_d', 0), 2)})
+- CCI指标: {round(report.get('cci', 0), 2)}
+- ROC(变动率): {round(report.get('roc', 0), 2)}%
+
+## 💹 成交量类指标
+- 成交量状态: {volume_description}
+- OBV趋势: {report.get('obv_trend', '未知')}
+- MFI指标: {round(report.get('mfi', 0), 2)}
+
+## 🧠 波动率指标
+- ATR: {round(report.get('atr', 0), 2)}
+- 波动率: {round(report.get('volatility', 0), 2)}%
+- 标准差: {round(report.get('std_dev', 0), 2)}
+
+## 🧮 统计套利类指标
+- Z-Score: {round(report.get('z_score', 0), 2)}
+
+## 支撑与压力位
+- {report.get('support_resistance', '详见图表分析')}
+
+## 交易建议
+- 根据当前技术指标分析，该股票{report['recommendation']}。
+- 综合评分{report['score']}分（满分100分）反映了各项指标的整体情况。
+- 指标中得分较高的部分: {", ".join([cat for cat, score in report['category_scores'].items() if score >= max_scores.get(cat, 0) * 0.6])}
+- 指标中存在问题的部分: {", ".join([cat for cat, score in report['category_scores'].items() if score < max_scores.get(cat, 0) * 0.4]) or "无明显问题"}
+"""
+    
+    return analysis_text
+
+
+def format_refresh(result):
+    """/api/bars/refresh 响应中的 data 部分：各类股票数和跳过的股票代码"""
+    return {
+        'appended': len(result['appended']),
+        'replaced': len(result['replaced']),
+        'skipped': len(result['skipped']),
+        'skipped_codes': result['skipped'],
+        'recomputed': result['recomputed']
+    }
+
+
+def parse_fields(fields):
+    """
+    解析 /api/technical_indicators 的 fields 参数，可以是字符串列表或逗号分隔的字符串，例如 "RSI,MACD"
+
+    返回 (指标列表或 None, 错误信息或 None)
+    """
+    if isinstance(fields, str):
+        fields = [name.strip() for name in fields.split(',') if name.strip()]
+    if fields is None:
+        return None, None
+    if not isinstance(fields, list) or not fields or not all(isinstance(name, str) for name in fields):
+        return None, 'fields 参数无效'
+    unknown = [name for name in fields if name not in kernels.INDICATORS]
+    if unknown:
+        return None, f'不支持的技术指标: {", ".join(unknown)}'
+    return fields, None
+
+
+def parse_screen(data):
+    """
+    解析 /api/screen 的请求参数
+
+    返回 (ScreenerIndex.query 的参数或 None, 错误信息或 None)
+    """
+    query = data.get('query') if isinstance(data, dict) else None
+    if not isinstance(query, str) or not query.strip():
+        return None, '请提供查询条件 query'
+    order = str(data.get('order', 'desc')).lower()
+    if order not in ('asc', 'desc'):
+        return None, 'order 只能是 asc 或 desc'
+    limit = data.get('limit', 100)
+    if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 0):
+        return None, 'limit 参数无效'
+    sort = data.get('sort') or 'score'
+    if not isinstance(sort, str):
+        return None, 'sort 参数无效'
+    fields = data.get('fields')
+    if isinstance(fields, str):
+        fields = [name.strip() for name in fields.split(',') if name.strip()]
+    if fields is not None and (not isinstance(fields, list) or not all(isinstance(name, str) for name in fields)):
+        return None, 'fields 参数无效'
+    return {
+        'query': query,
+        'sort': sort,
+        'descending': order == 'desc',
+        'limit': limit,
+        'fields': fields,
+    }, None
+
+
+def parse_flag(data, name, default):
+    """
+    读取布尔型请求参数：接受 true/false、1/0 及其字符串形式（不区分大小写），未提供时返回 default
+
+    其他值抛出 ValueError，避免 "false" 之类的字符串被当作真值
+    """
+    value = data.get(name, default)
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ('true', '1', 'false', '0'):
+        return value.strip().lower() in ('true', '1')
+    raise ValueError(f'{name} 只能是 true 或 false')
+
+
+def parse_scan_options(data, max_workers, compute_workers, chunksize, short_circuit):
+    """
+    解析扫描接口（/api/scan、/api/scan/stream、/api/scan/jobs）的并发参数
+
+    其余参数为服务端配置的默认值，并发数和计算进程数不超过默认值；参数无效时抛出 TypeError 或 ValueError
+    """
+    options = {
+        'max_workers': min(int(data.get('max_workers', max_workers)), max_workers),
+        'compute_workers': min(int(data.get('compute_workers', compute_workers)), compute_workers),
+        'chunksize': int(data.get('chunksize', chunksize)),
+        'short_circuit': parse_flag(data, 'short_circuit', short_circuit),
+    }
+    if options['chunksize'] < 1:
+        raise ValueError('chunksize 必须大于 0')
+    return options
+
+
+def indicator_records(df, fields=None, rows=20):
+    """
+    /api/technical_indicators 返回的最近 rows 根K线，指定 fields 时只保留行情列和这些指标
+
+    紧凑模式下的 float32 列还原为 float64（compact.widen_frame）
+    """
+    if fields is not None:
+        df = df[[name for name in df.columns if name not in kernels.INDICATORS] + list(dict.fromkeys(fields))]
+    return compact.widen_frame(df.tail(rows)).to_dict('records')
+
+
+def _json_default(o):
+    """与 Flask 默认 JSON 编码一致：日期输出为 HTTP 日期格式"""
+    if isinstance(o, date):
+        return formatdate(calendar.timegm(o.timetuple()), usegmt=True)
+    if hasattr(o, 'item'):
+        return o.item()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """按 Flask jsonify 的规则序列化（键排序、紧凑格式、NaN 原样输出），异步服务用它保证响应一致"""
+    return json.dumps(obj, default=_json_default, sort_keys=True, separators=(',', ':'))
+
+
+class ScanStream:
+    """
+    /api/scan/stream 的事件
+
+    每只达到最低评分的股票评分完成后立即产出一个 result 事件，出错的股票产出 error 事件，
+    最后产出 summary 事件，包含按 /api/scan 规则排序的 (股票代码, 评分) 排名。
+    只保留排名需要的代码和评分，不保留完整报告，内存占用与股票数成正比且很小
+    """
+
+    def __init__(self, min_score):
+        self.min_score = min_score
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self._ranking = []
+
+    def item(self, index, stock_code, report, error):
+        """处理一只股票的结果，返回要发送的事件，没有时返回 None"""
+        self.total += 1
+        if error is not None:
+            self.failed += 1
+            return {'event': 'error', 'index': index, 'stock_code': stock_code, 'message': str(error)}
+        self.done += 1
+        if report is None or report['score'] < self.min_score:
+            return None
+        self._ranking.append((index, stock_code, report['score']))
+        return {'event': 'result', 'index': index, 'data': report}
+
+    def summary(self):
+        """扫描结束时的汇总事件"""
+        ranking = sorted(self._ranking, key=lambda item: (-item[2], item[0]))
+        return {
+            'event': 'summary',
+            'status': 'success',
+            'total': self.total,
+            'done': self.done,
+            'failed': self.failed,
+            'count': len(ranking),
+            'ranking': [{'stock_code': stock_code, 'score': score} for _, stock_code, score in ranking],
+        }
+
+
+def encode_event(event, sse=False):
+    """编码一个流式事件：默认为 NDJSON 的一行，sse 为 True 时为 Server-Sent Events 帧"""
+    if sse:
+        return f"event: {event['event']}\ndata: {dumps(event)}\n\n"
+    return dumps(event) + '\n'
+
+
+def wants_sse(data, accept):
+    """请求参数 format 为 sse，或 未指定 format 且 Accept 头包含 text/event-stream 时使用 SSE"""
+    fmt = (data or {}).get('format')
+    if fmt is not None:
+        return str(fmt).lower() == 'sse'
+    return 'text/event-stream' in (accept or '')
@@ -1,10 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from flask import Flask, request, jsonify, send_from_directory, Response
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 from stock_analyzer import StockAnalyzer
+from scan_jobs import ScanJobManager
+from screener import QueryError
+import snapshot
+import api_format
+import metrics
 import logging
+import re
+import time
 from waitress import serve
 import os
 import json
@@ -19,6 +26,15 @@ logging.basicConfig(level=logging.INFO,
                   format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 服务模式：flask（waitress 线程池，默认）或 asgi（异步服务，见 asgi_app.py）
+SERVER_MODE = os.getenv('SERVER_MODE', 'flask').lower()
+
+# 直接运行 app.py 且 SERVER_MODE=asgi 时交给异步服务，不创建 Flask 服务的分析器、后台任务和快照调度
+if __name__ == '__main__' and SERVER_MODE == 'asgi':
+    import asgi_app
+    asgi_app.main()
+    raise SystemExit(0)
+
 # 初始化Flask应用
 app = Flask(__name__, static_folder='static')
 
@@ -28,6 +44,46 @@ CORS(app)
 # 初始化股票分析器
 analyzer = StockAnalyzer()
 
+# 市场扫描的默认并发数，同时也是单次请求允许的上限
+SCAN_MAX_WORKERS = int(os.getenv('SCAN_MAX_WORKERS', 8))
+
+# 计算阶段的进程数（0 表示不使用进程池）及每批股票数
+SCAN_COMPUTE_WORKERS = int(os.getenv('SCAN_COMPUTE_WORKERS', 0))
+SCAN_CHUNK_SIZE = int(os.getenv('SCAN_CHUNK_SIZE', 16))
+
+# 扫描默认是否在确定达不到 min_score 时提前停止计算
+SCAN_SHORT_CIRCUIT = os.getenv('SCAN_SHORT_CIRCUIT', 'false').lower() == 'true'
+
+# 单只股票分析默认是否只获取和计算最新K线所需的尾部数据
+ANALYZE_LATEST_ONLY = os.getenv('ANALYZE_LATEST_ONLY', 'false').lower() == 'true'
+
+# 后台扫描任务：同时执行的任务数和保留的已结束任务数
+SCAN_JOB_WORKERS = int(os.getenv('SCAN_JOB_WORKERS', 2))
+SCAN_JOB_HISTORY = int(os.getenv('SCAN_JOB_HISTORY', 100))
+scan_jobs = ScanJobManager(analyzer, workers=SCAN_JOB_WORKERS, history=SCAN_JOB_HISTORY)
+
+# 收盘后预计算快照：配置 SNAPSHOT_UNIVERSE 后启用，分析和扫描优先从快照读取；调度线程在 main() 中启动
+snapshot_scheduler = snapshot.setup_from_env(analyzer)
+
+def _endpoint_label():
+    """请求耗时指标的 endpoint 标签：路由模板（与异步服务相同的 {参数} 写法），未匹配的请求为 unmatched"""
+    if request.url_rule is None:
+        return 'unmatched'
+    return re.sub(r'<(?:[^:<>]+:)?([^<>]+)>', r'{\1}', request.url_rule.rule)
+
+@app.before_request
+def _start_timer():
+    request.environ['metrics.start'] = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    """记录请求耗时；流式响应在响应体发送完毕时记录"""
+    start = request.environ.get('metrics.start')
+    if start is not None:
+        labels = {'method': request.method, 'endpoint': _endpoint_label(), 'status': response.status_code}
+        response.call_on_close(lambda: metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, **labels))
+    return response
+
 @app.route('/')
 def index():
     """首页"""
@@ -41,6 +97,11 @@ def health_check():
         'message': '股票分析服务运行正常'
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 格式的运行指标"""
+    return Response(metrics.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze_stock():
     """分析单只股票的接口，返回格式化结果供大模型使用"""
@@ -54,105 +115,20 @@ def analyze_stock():
         }), 400
     
     stock_code = data['stock_code']
+    try:
+        latest_only = api_format.parse_flag(data, 'latest_only', ANALYZE_LATEST_ONLY)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     
     try:
         # 分析股票
-        report = analyzer.analyze_stock(stock_code)
+        report = analyzer.analyze_stock(stock_code, latest_only=latest_only)
         
         # 提取关键数据并格式化
-        formatted_result = {
-            # 股票基本信息
-            "basic_info": {
-                "stock_code": stock_code,
-                "analysis_date": report['analysis_date'],
-                "price": round(report['price'], 2),
-                "price_change": round(report['price_change'], 2)
-            },
-            # 分析评分和建议
-            "analysis_summary": {
-                "score": report['score'],
-                "recommendation": report['recommendation'],
-                "category_scores": report['category_scores'],
-                "score_details": report['score_details']
-            },
-            # 技术指标
-            "technical_indicators": {
-                "ma_trend": report['ma_trend'],
-                "rsi": round(report['rsi'], 2),
-                "macd_signal": report['macd_signal'],
-                "volume_status": report['volume_status'],
-                "adx": round(report.get('adx', 0), 2),
-                "stoch_k": round(report.get('stoch_k', 0), 2),
-                "stoch_d": round(report.get('stoch_d', 0), 2),
-                "cci": round(report.get('cci', 0), 2),
-                "mfi": round(report.get('mfi', 0), 2),
-                "obv_trend": report.get('obv_trend', '未知'),
-                "volatility": round(report.get('volatility', 0), 2),
-                "z_score": round(report.get('z_score', 0), 2)
-            }
-        }
-        
-        # 添加分析描述文本
-        trend_description = "上升" if report['ma_trend'] == "UP" else "下降"
-        volume_description = "放量" if report['volume_status'] == "HIGH" else "成交量正常"
-        
-        # 生成详细的评分说明
-        score_explanation = []
-        for category, score in report['category_scores'].items():
-            category_name = {
-                'trend': '📊 趋势类',
-                'momentum': '⚡ 动量类',
-                'volume': '💹 成交量类',
-                'volatility': '🧠 波动率类',
-                'statistical': '🧮 统计类'
-            }.get(category, category)
-            
-            score_explanation.append(f"{category_name}: {score}分")
-        
-        score_details = []
-        for indicator, detail in report['score_details'].items():
-            score_details.append(f"- {indicator}: {detail}")
-        
-        formatted_result["analysis_text"] = f"""
-股票 {stock_code} 分析报告 (生成于 {report['analysis_date']})
-
-当前价格: {formatted_result['basic_info']['price']} 元 (变动: {formatted_result['basic_info']['price_change']}%)
-综合评分: {report['score']} 分
-投资建议: {report['recommendation']}
-
-评分明细:
-{chr(10).join(score_explanation)}
-
-评分详情:
-{chr(10).join(score_details)}
-
-📊 趋势类指标:
-- 移动平均线趋势: {trend_description}
-- MACD信号: {"买入" if report['macd_signal'] == "BUY" else "卖出"}
-- ADX(趋势强度): {round(report.get('adx', 0), 2)}
-- 布林带位置: {report.get('bb_position', '中轨')}
-
-⚡ 动量类指标:
-- RSI指标: {round(report['rsi'], 2)}
-- 随机震荡指标: K({round(report.get('stoch_k', 0), 2)}) D({round(report.get('stoch_d', 0), 2)})
-- CCI指标: {round(report.get('cci', 0), 2)}
-- ROC变动率: {round(report.get('roc', 0), 2)}%
-
-💹 成交量类指标:
-- 成交量状态: {volume_description}
-- OBV趋势: {report.get('obv_trend', '未知')}
-- MFI指标: {round(report.get('mfi', 0), 2)}
-
-🧠 波动率指标:
-- 波动率: {round(report.get('volatility', 0), 2)}%
-- 标准差: {round(report.get('std_dev', 0), 2)}
-
-🧮 统计类指标:
-- Z-Score: {round(report.get('z_score', 0), 2)}
-
-支撑压力位:
-- {report.get('support_resistance', '详见图表分析')}
-"""
+        formatted_result = api_format.format_analysis(stock_code, report)
         
         # 构建最终响应
         response = {
@@ -181,95 +157,20 @@ def analyze_stock_for_llm():
         }), 400
     
     stock_code = data['stock_code']
+    try:
+        latest_only = api_format.parse_flag(data, 'latest_only', ANALYZE_LATEST_ONLY)
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     
     try:
         # 分析股票
-        report = analyzer.analyze_stock(stock_code)
-        
-        # 格式化指标
-        price = round(report['price'], 2)
-        price_change = round(report['price_change'], 2)
-        rsi = round(report['rsi'], 2)
-        trend_description = "上升" if report['ma_trend'] == "UP" else "下降"
-        volume_description = "放量" if report['volume_status'] == "HIGH" else "成交量正常"
-        macd_signal = "买入" if report['macd_signal'] == "BUY" else "卖出"
-        
-        # 生成评分明细
-        score_categories = []
-        for category, score in report['category_scores'].items():
-            category_name = {
-                'trend': '📊 趋势评分',
-                'momentum': '⚡ 动量评分',
-                'volume': '💹 成交量评分',
-                'volatility': '🧠 波动率评分',
-                'statistical': '🧮 统计套利评分'
-            }.get(category, category)
-            
-            max_scores = {
-                'trend': 40,
-                'momentum': 25,
-                'volume': 20,
-                'volatility': 10,
-                'statistical': 5
-            }
-            
-            score_categories.append(f"{category_name}: {score}/{max_scores.get(category, 0)}分")
-        
-        # 生成关键指标评分详情
-        detail_items = []
-        for indicator, detail in report['score_details'].items():
-            detail_items.append(f"- {indicator}: {detail}")
+        report = analyzer.analyze_stock(stock_code, latest_only=latest_only)
         
         # 生成分析文本
-        analysis_text = f"""# 股票{stock_code}分析报告
-
-## 基本情况
-- 分析日期: {report['analysis_date']}
-- 当前价格: {price} 元
-- 价格变动: {price_change}%
-- 综合评分: {report['score']}分
-- 投资建议: {report['recommendation']}
-
-## 评分明细
-{chr(10).join(score_categories)}
-
-## 评分详情
-{chr(10).join(detail_items)}
-
-## 📊 趋势类指标
-- 移动平均线趋势: {trend_description}
-- MACD信号: {macd_signal}
-- ADX(趋势强度): {round(report.get('adx', 0), 2)}
-- 布林带位置: {report.get('bb_position', '中轨')}
-
-## ⚡ 动量类指标
-- RSI指标: {rsi}
-- 随机震荡指标: K({round(report.get('stoch_k', 0), 2)}) D({round(report.get('stoch_d', 0), 2)})
-- CCI指标: {round(report.get('cci', 0), 2)}
-- ROC(变动率): {round(report.get('roc', 0), 2)}%
-
-## 💹 成交量类指标
-- 成交量状态: {volume_description}
-- OBV趋势: {report.get('obv_trend', '未知')}
-- MFI指标: {round(report.get('mfi', 0), 2)}
-
-## 🧠 波动率指标
-- ATR: {round(report.get('atr', 0), 2)}
-- 波动率: {round(report.get('volatility', 0), 2)}%
-- 标准差: {round(report.get('std_dev', 0), 2)}
-
-## 🧮 统计套利类指标
-- Z-Score: {round(report.get('z_score', 0), 2)}
-
-## 支撑与压力位
-- {report.get('support_resistance', '详见图表分析')}
-
-## 交易建议
-- 根据当前技术指标分析，该股票{report['recommendation']}。
-- 综合评分{report['score']}分（满分100分）反映了各项指标的整体情况。
-- 指标中得分较高的部分: {", ".join([cat for cat, score in report['category_scores'].items() if score >= max_scores.get(cat, 0) * 0.6])}
-- 指标中存在问题的部分: {", ".join([cat for cat, score in report['category_scores'].items() if score < max_scores.get(cat, 0) * 0.4]) or "无明显问题"}
-"""
+        analysis_text = api_format.format_analysis_for_llm(stock_code, report)
         
         # 返回纯文本
         return Response(analysis_text, mimetype='text/plain; charset=utf-8')
@@ -278,6 +179,11 @@ def analyze_stock_for_llm():
         error_message = f"分析股票{stock_code}时出错: {str(e)}"
         return Response(error_message, mimetype='text/plain; charset=utf-8', status=500)
 
+def _scan_options(data):
+    """扫描的并发参数，不超过服务端配置的上限"""
+    return api_format.parse_scan_options(data, SCAN_MAX_WORKERS, SCAN_COMPUTE_WORKERS, SCAN_CHUNK_SIZE,
+                                         SCAN_SHORT_CIRCUIT)
+
 @app.route('/api/scan', methods=['POST'])
 def scan_market():
     """扫描市场的接口"""
@@ -292,10 +198,17 @@ def scan_market():
     
     stock_list = data['stock_list']
     min_score = data.get('min_score', 60)
+    try:
+        options = _scan_options(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'扫描参数无效: {str(e)}'
+        }), 400
     
     try:
         # 扫描市场
-        recommendations = analyzer.scan_market(stock_list, min_score)
+        recommendations = analyzer.scan_market(stock_list, min_score, **options)
         
         return jsonify({
             'status': 'success',
@@ -309,6 +222,235 @@ def scan_market():
             'message': f'扫描市场时出错: {str(e)}'
         }), 500
 
+@app.route('/api/scan/stream', methods=['POST'])
+def scan_market_stream():
+    """流式扫描：每只达到最低评分的股票评分后立即返回，最后返回排序后的汇总（NDJSON 或 SSE）"""
+    data = request.json
+    
+    # 验证输入
+    if not data or 'stock_list' not in data:
+        return jsonify({
+            'status': 'error',
+            'message': '请提供有效的股票代码列表'
+        }), 400
+    
+    stock_list = data['stock_list']
+    stream = api_format.ScanStream(data.get('min_score', 60))
+    sse = api_format.wants_sse(data, request.headers.get('Accept'))
+    try:
+        options = _scan_options(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'扫描参数无效: {str(e)}'
+        }), 400
+    if options.pop('short_circuit'):
+        options['min_score'] = stream.min_score
+    
+    def generate():
+        # 客户端断开时生成器被关闭，尚未开始的股票不再分析
+        reports = analyzer.iter_reports(stock_list, **options)
+        try:
+            for index, stock_code, report, error in reports:
+                if error is not None:
+                    logger.error(f"分析股票 {stock_code} 时出错: {str(error)}")
+                event = stream.item(index, stock_code, report, error)
+                if event is not None:
+                    yield api_format.encode_event(event, sse)
+            yield api_format.encode_event(stream.summary(), sse)
+        except Exception as e:
+            logger.error(f"流式扫描市场时出错: {str(e)}")
+            yield api_format.encode_event({'event': 'summary', 'status': 'error',
+                                           'message': f'扫描市场时出错: {str(e)}'}, sse)
+        finally:
+            reports.close()
+    
+    mimetype = 'text/event-stream' if sse else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/scan/jobs', methods=['POST'])
+def submit_scan_job():
+    """提交后台扫描任务，立即返回任务ID"""
+    data = request.json
+    
+    # 验证输入
+    if not data or 'stock_list' not in data:
+        return jsonify({
+            'status': 'error',
+            'message': '请提供有效的股票代码列表'
+        }), 400
+    
+    try:
+        options = _scan_options(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'扫描参数无效: {str(e)}'
+        }), 400
+    
+    try:
+        job = scan_jobs.submit(data['stock_list'], data.get('min_score', 60), **options)
+        return jsonify({
+            'status': 'success',
+            'data': job.progress()
+        }), 202
+    except Exception as e:
+        logger.error(f"提交扫描任务时出错: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f'提交扫描任务时出错: {str(e)}'
+        }), 500
+
+@app.route('/api/scan/jobs', methods=['GET'])
+def list_scan_jobs():
+    """列出保留的扫描任务及其进度"""
+    jobs = scan_jobs.list()
+    return jsonify({
+        'status': 'success',
+        'data': jobs,
+        'count': len(jobs)
+    })
+
+def _job_not_found(job_id):
+    return jsonify({
+        'status': 'error',
+        'message': f'扫描任务不存在: {job_id}'
+    }), 404
+
+@app.route('/api/scan/jobs/<job_id>', methods=['GET'])
+def get_scan_job(job_id):
+    """查询扫描任务进度"""
+    job = scan_jobs.get(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    return jsonify({
+        'status': 'success',
+        'data': job.progress()
+    })
+
+@app.route('/api/scan/jobs/<job_id>/results', methods=['GET'])
+def get_scan_job_results(job_id):
+    """获取扫描任务的结果，任务未结束时返回已得到的部分结果"""
+    job = scan_jobs.get(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    recommendations, errors = job.results()
+    return jsonify({
+        'status': 'success',
+        'job': job.progress(),
+        'data': recommendations,
+        'count': len(recommendations),
+        'errors': errors
+    })
+
+@app.route('/api/scan/jobs/<job_id>', methods=['DELETE'])
+def cancel_scan_job(job_id):
+    """取消扫描任务，正在分析的股票完成后停止，已得到的结果保留"""
+    job = scan_jobs.cancel(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    return jsonify({
+        'status': 'success',
+        'data': job.progress()
+    })
+
+@app.route('/api/snapshot', methods=['GET'])
+def get_snapshot_status():
+    """查询收盘后快照的版本和构建状态"""
+    if snapshot_scheduler is None:
+        return jsonify({
+            'status': 'error',
+            'message': '未启用快照，请配置 SNAPSHOT_UNIVERSE'
+        }), 404
+    return jsonify({
+        'status': 'success',
+        'data': snapshot_scheduler.status()
+    })
+
+@app.route('/api/snapshot/refresh', methods=['POST'])
+def refresh_snapshot():
+    """立即在后台重新构建快照"""
+    if snapshot_scheduler is None:
+        return jsonify({
+            'status': 'error',
+            'message': '未启用快照，请配置 SNAPSHOT_UNIVERSE'
+        }), 404
+    started = snapshot_scheduler.trigger()
+    return jsonify({
+        'status': 'success',
+        'message': '快照开始构建' if started else '快照正在构建中',
+        'data': snapshot_scheduler.status()
+    }), 202
+
+@app.route('/api/bars/refresh', methods=['POST'])
+def refresh_latest_bars():
+    """用一次全市场行情请求刷新本地K线存储中所有股票的最新K线"""
+    if analyzer.bar_store is None:
+        return jsonify({
+            'status': 'error',
+            'message': '未启用本地K线存储，请配置 BAR_STORE_DIR'
+        }), 404
+    
+    adjust = (request.get_json(silent=True) or {}).get('adjust', 'qfq')
+    if adjust not in ('qfq', ''):
+        return jsonify({
+            'status': 'error',
+            'message': 'adjust 只支持 qfq 或空字符串（不复权）'
+        }), 400
+    
+    try:
+        result = analyzer.refresh_latest(adjust)
+        return jsonify({
+            'status': 'success',
+            'data': api_format.format_refresh(result)
+        })
+    except Exception as e:
+        logger.error(f"批量刷新最新K线时出错: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f'批量刷新最新K线时出错: {str(e)}'
+        }), 500
+
+@app.route('/api/screen', methods=['POST'])
+def screen_stocks():
+    """在快照的最新指标值上按条件选股，例如 "RSI < 30 AND ADX > 25" """
+    if snapshot_scheduler is None:
+        return jsonify({
+            'status': 'error',
+            'message': '未启用快照，请配置 SNAPSHOT_UNIVERSE'
+        }), 404
+    
+    options, error = api_format.parse_screen(request.json or {})
+    if error is not None:
+        return jsonify({
+            'status': 'error',
+            'message': error
+        }), 400
+    
+    index = analyzer.snapshot.screener(analyzer.params_fingerprint())
+    if index is None:
+        return jsonify({
+            'status': 'error',
+            'message': '快照尚未构建完成或已过期'
+        }), 503
+    
+    try:
+        total, rows = index.query(**options)
+    except QueryError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    
+    return jsonify({
+        'status': 'success',
+        'data': rows,
+        'count': len(rows),
+        'total': total,
+        'snapshot_version': index.version
+    })
+
 @app.route('/api/technical_indicators', methods=['POST'])
 def get_technical_indicators():
     """获取股票技术指标的接口"""
@@ -325,15 +467,20 @@ def get_technical_indicators():
     start_date = data.get('start_date', None)
     end_date = data.get('end_date', None)
     
+    # 只返回指定的指标，可以是列表或逗号分隔的字符串，例如 "RSI,MACD"
+    fields, error = api_format.parse_fields(data.get('fields', None))
+    if error is not None:
+        return jsonify({
+            'status': 'error',
+            'message': error
+        }), 400
+    
     try:
-        # 获取股票数据
-        df = analyzer.get_stock_data(stock_code, start_date, end_date)
-        
-        # 计算技术指标
-        df = analyzer.calculate_indicators(df)
+        # 获取股票数据并计算技术指标，指定 fields 时只计算这些指标及其依赖
+        df = analyzer.get_indicator_data(stock_code, start_date, end_date, fields=fields)
         
         # 转换为字典
-        result = df.tail(20).to_dict('records')
+        result = api_format.indicator_records(df, fields)
         
         return jsonify({
             'status': 'success',
@@ -362,11 +509,8 @@ def get_ai_analysis():
     stock_code = data['stock_code']
     
     try:
-        # 获取股票数据
-        df = analyzer.get_stock_data(stock_code)
-        
-        # 计算技术指标
-        df = analyzer.calculate_indicators(df)
+        # 获取股票数据并计算技术指标
+        df = analyzer.get_indicator_data(stock_code)
         
         # 获取AI分析
         analysis = analyzer.get_ai_analysis(df, stock_code)
@@ -390,6 +534,16 @@ def main():
     port = int(os.getenv('PORT', 5000))
     host = os.getenv('HOST', '0.0.0.0')
     
+    # SERVER_MODE=asgi 时使用异步服务，接口和响应与 Flask 服务相同
+    if SERVER_MODE == 'asgi':
+        import asgi_app
+        asgi_app.main()
+        return
+    
+    # 只在服务进程中启动快照调度，导入本模块的计算进程不会各自构建快照
+    if snapshot_scheduler is not None:
+        snapshot_scheduler.start()
+    
     logger.info(f"启动股票分析服务 at http://{host}:{port}")
     serve(app, host=host, port=port)
 
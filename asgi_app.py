@@ -0,0 +1,509 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+异步 API 服务（ASGI）
+
+提供与 app.py 相同的 /api/* 接口和响应格式，运行在单个事件循环上：
+行情数据异步获取并复用连接，指标计算交给线程池，等待上游数据源的请求不占用线程，
+单个进程可以同时处理数百个在途请求。
+
+启动方式：python asgi_app.py，或 SERVER_MODE=asgi python app.py，
+也可以直接使用 uvicorn asgi_app:app
+"""
+
+import contextlib
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+
+import api_format
+import metrics
+from async_analyzer import AsyncStockAnalyzer
+from scan_jobs import ScanJobManager
+import snapshot
+from screener import QueryError
+
+# 加载环境变量
+load_dotenv()
+
+# 配置日志
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 初始化异步股票分析器
+analyzer = AsyncStockAnalyzer()
+
+# 市场扫描的默认并发数，同时也是单次请求允许的上限
+SCAN_MAX_WORKERS = int(os.getenv('SCAN_MAX_WORKERS', 8))
+
+# 计算阶段的进程数（0 表示不使用进程池）及每批股票数
+SCAN_COMPUTE_WORKERS = int(os.getenv('SCAN_COMPUTE_WORKERS', 0))
+SCAN_CHUNK_SIZE = int(os.getenv('SCAN_CHUNK_SIZE', 16))
+
+# 后台扫描任务在独立的线程池中用同步分析器执行，与 app.py 相同
+scan_jobs = ScanJobManager(analyzer.analyzer, workers=int(os.getenv('SCAN_JOB_WORKERS', 2)),
+                           history=int(os.getenv('SCAN_JOB_HISTORY', 100)))
+
+# 收盘后预计算快照：配置 SNAPSHOT_UNIVERSE 后启用，分析和扫描优先从快照读取；调度线程在 lifespan 中启动
+snapshot_scheduler = snapshot.setup_from_env(analyzer.analyzer)
+
+# 扫描默认是否在确定达不到 min_score 时提前停止计算
+SCAN_SHORT_CIRCUIT = os.getenv('SCAN_SHORT_CIRCUIT', 'false').lower() == 'true'
+
+# 单只股票分析默认是否只获取和计算最新K线所需的尾部数据
+ANALYZE_LATEST_ONLY = os.getenv('ANALYZE_LATEST_ONLY', 'false').lower() == 'true'
+
+
+async def _json_body(request):
+    """读取 JSON 请求体，格式错误时返回 None"""
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+
+class JSONResponse(Response):
+    """与 Flask jsonify 相同的 JSON 编码"""
+    media_type = 'application/json'
+
+    def render(self, content):
+        return (api_format.dumps(content) + '\n').encode('utf-8')
+
+
+def _error(message, status_code):
+    return JSONResponse({
+        'status': 'error',
+        'message': message
+    }, status_code=status_code)
+
+
+async def index(request):
+    """首页"""
+    return FileResponse(os.path.join('static', 'index.html'))
+
+
+async def health_check(request):
+    """健康检查接口"""
+    return JSONResponse({
+        'status': 'ok',
+        'message': '股票分析服务运行正常'
+    })
+
+
+async def get_metrics(request):
+    """Prometheus 格式的运行指标"""
+    return Response(metrics.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+async def analyze_stock(request):
+    """分析单只股票的接口，返回格式化结果供大模型使用"""
+    data = await _json_body(request)
+
+    # 验证输入
+    if not data or 'stock_code' not in data:
+        return _error('请提供有效的股票代码', 400)
+
+    stock_code = data['stock_code']
+    try:
+        latest_only = api_format.parse_flag(data, 'latest_only', ANALYZE_LATEST_ONLY)
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    try:
+        report = await analyzer.analyze_stock(stock_code, latest_only=latest_only)
+        return JSONResponse({
+            'status': 'success',
+            'data': api_format.format_analysis(stock_code, report)
+        })
+    except Exception as e:
+        logger.error(f"分析股票时出错: {str(e)}")
+        return _error(f'分析股票时出错: {str(e)}', 500)
+
+
+async def analyze_stock_for_llm(request):
+    """分析单只股票并返回纯文本结果，专为大型语言模型提供直接可用的输入"""
+    data = await _json_body(request)
+
+    # 验证输入
+    if not data or 'stock_code' not in data:
+        return _error('请提供有效的股票代码', 400)
+
+    stock_code = data['stock_code']
+    try:
+        latest_only = api_format.parse_flag(data, 'latest_only', ANALYZE_LATEST_ONLY)
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    try:
+        report = await analyzer.analyze_stock(stock_code, latest_only=latest_only)
+        return PlainTextResponse(api_format.format_analysis_for_llm(stock_code, report))
+    except Exception as e:
+        logger.error(f"为大模型分析股票时出错: {str(e)}")
+        return PlainTextResponse(f"分析股票{stock_code}时出错: {str(e)}", status_code=500)
+
+
+def _scan_options(data):
+    """扫描的并发参数，不超过服务端配置的上限，与 app.py 相同"""
+    return api_format.parse_scan_options(data, SCAN_MAX_WORKERS, SCAN_COMPUTE_WORKERS, SCAN_CHUNK_SIZE,
+                                         SCAN_SHORT_CIRCUIT)
+
+
+async def scan_market(request):
+    """扫描市场的接口"""
+    data = await _json_body(request)
+
+    # 验证输入
+    if not data or 'stock_list' not in data:
+        return _error('请提供有效的股票代码列表', 400)
+
+    stock_list = data['stock_list']
+    min_score = data.get('min_score', 60)
+    try:
+        options = _scan_options(data)
+    except (TypeError, ValueError) as e:
+        return _error(f'扫描参数无效: {str(e)}', 400)
+
+    try:
+        recommendations = await analyzer.scan_market(stock_list, min_score, **options)
+        return JSONResponse({
+            'status': 'success',
+            'data': recommendations,
+            'count': len(recommendations)
+        })
+    except Exception as e:
+        logger.error(f"扫描市场时出错: {str(e)}")
+        return _error(f'扫描市场时出错: {str(e)}', 500)
+
+
+async def scan_market_stream(request):
+    """流式扫描：每只达到最低评分的股票评分后立即返回，最后返回排序后的汇总（NDJSON 或 SSE）"""
+    data = await _json_body(request)
+
+    # 验证输入
+    if not data or 'stock_list' not in data:
+        return _error('请提供有效的股票代码列表', 400)
+
+    stock_list = data['stock_list']
+    stream = api_format.ScanStream(data.get('min_score', 60))
+    sse = api_format.wants_sse(data, request.headers.get('accept'))
+    try:
+        options = _scan_options(data)
+    except (TypeError, ValueError) as e:
+        return _error(f'扫描参数无效: {str(e)}', 400)
+    options['min_score'] = stream.min_score if options.pop('short_circuit') else None
+
+    async def generate():
+        # 客户端断开时生成器被取消，尚未完成的分析随之取消
+        try:
+            async for index, stock_code, report, error in analyzer.iter_reports(stock_list, **options):
+                if error is not None:
+                    logger.error(f"分析股票 {stock_code} 时出错: {str(error)}")
+                event = stream.item(index, stock_code, report, error)
+                if event is not None:
+                    yield api_format.encode_event(event, sse)
+            yield api_format.encode_event(stream.summary(), sse)
+        except Exception as e:
+            logger.error(f"流式扫描市场时出错: {str(e)}")
+            yield api_format.encode_event({'event': 'summary', 'status': 'error',
+                                           'message': f'扫描市场时出错: {str(e)}'}, sse)
+
+    media_type = 'text/event-stream' if sse else 'application/x-ndjson'
+    return StreamingResponse(generate(), media_type=media_type,
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def submit_scan_job(request):
+    """提交后台扫描任务，立即返回任务ID"""
+    data = await _json_body(request)
+
+    # 验证输入
+    if not data or 'stock_list' not in data:
+        return _error('请提供有效的股票代码列表', 400)
+
+    try:
+        options = _scan_options(data)
+    except (TypeError, ValueError) as e:
+        return _error(f'扫描参数无效: {str(e)}', 400)
+
+    try:
+        job = scan_jobs.submit(data['stock_list'], data.get('min_score', 60), **options)
+        return JSONResponse({
+            'status': 'success',
+            'data': job.progress()
+        }, status_code=202)
+    except Exception as e:
+        logger.error(f"提交扫描任务时出错: {str(e)}")
+        return _error(f'提交扫描任务时出错: {str(e)}', 500)
+
+
+async def list_scan_jobs(request):
+    """列出保留的扫描任务及其进度"""
+    jobs = scan_jobs.list()
+    return JSONResponse({
+        'status': 'success',
+        'data': jobs,
+        'count': len(jobs)
+    })
+
+
+async def get_scan_job(request):
+    """查询扫描任务进度"""
+    job_id = request.path_params['job_id']
+    job = scan_jobs.get(job_id)
+    if job is None:
+        return _error(f'扫描任务不存在: {job_id}', 404)
+    return JSONResponse({
+        'status': 'success',
+        'data': job.progress()
+    })
+
+
+async def get_scan_job_results(request):
+    """获取扫描任务的结果，任务未结束时返回已得到的部分结果"""
+    job_id = request.path_params['job_id']
+    job = scan_jobs.get(job_id)
+    if job is None:
+        return _error(f'扫描任务不存在: {job_id}', 404)
+    recommendations, errors = job.results()
+    return JSONResponse({
+        'status': 'success',
+        'job': job.progress(),
+        'data': recommendations,
+        'count': len(recommendations),
+        'errors': errors
+    })
+
+
+async def cancel_scan_job(request):
+    """取消扫描任务，正在分析的股票完成后停止，已得到的结果保留"""
+    job_id = request.path_params['job_id']
+    job = scan_jobs.cancel(job_id)
+    if job is None:
+        return _error(f'扫描任务不存在: {job_id}', 404)
+    return JSONResponse({
+        'status': 'success',
+        'data': job.progress()
+    })
+
+
+async def get_snapshot_status(request):
+    """查询收盘后快照的版本和构建状态"""
+    if snapshot_scheduler is None:
+        return _error('未启用快照，请配置 SNAPSHOT_UNIVERSE', 404)
+    return JSONResponse({
+        'status': 'success',
+        'data': snapshot_scheduler.status()
+    })
+
+
+async def refresh_snapshot(request):
+    """立即在后台重新构建快照"""
+    if snapshot_scheduler is None:
+        return _error('未启用快照，请配置 SNAPSHOT_UNIVERSE', 404)
+    started = snapshot_scheduler.trigger()
+    return JSONResponse({
+        'status': 'success',
+        'message': '快照开始构建' if started else '快照正在构建中',
+        'data': snapshot_scheduler.status()
+    }, status_code=202)
+
+
+async def refresh_latest_bars(request):
+    """用一次全市场行情请求刷新本地K线存储中所有股票的最新K线"""
+    if analyzer.analyzer.bar_store is None:
+        return _error('未启用本地K线存储，请配置 BAR_STORE_DIR', 404)
+
+    adjust = (await _json_body(request) or {}).get('adjust', 'qfq')
+    if adjust not in ('qfq', ''):
+        return _error('adjust 只支持 qfq 或空字符串（不复权）', 400)
+
+    try:
+        result = await analyzer.run(analyzer.analyzer.refresh_latest, adjust)
+        return JSONResponse({
+            'status': 'success',
+            'data': api_format.format_refresh(result)
+        })
+    except Exception as e:
+        logger.error(f"批量刷新最新K线时出错: {str(e)}")
+        return _error(f'批量刷新最新K线时出错: {str(e)}', 500)
+
+
+async def screen_stocks(request):
+    """在快照的最新指标值上按条件选股，例如 "RSI < 30 AND ADX > 25" """
+    if snapshot_scheduler is None:
+        return _error('未启用快照，请配置 SNAPSHOT_UNIVERSE', 404)
+
+    options, error = api_format.parse_screen(await _json_body(request) or {})
+    if error is not None:
+        return _error(error, 400)
+
+    index = analyzer.analyzer.snapshot.screener(analyzer.analyzer.params_fingerprint())
+    if index is None:
+        return _error('快照尚未构建完成或已过期', 503)
+
+    try:
+        total, rows = index.query(**options)
+    except QueryError as e:
+        return _error(str(e), 400)
+
+    return JSONResponse({
+        'status': 'success',
+        'data': rows,
+        'count': len(rows),
+        'total': total,
+        'snapshot_version': index.version
+    })
+
+
+async def get_technical_indicators(request):
+    """获取股票技术指标的接口"""
+    data = await _json_body(request)
+
+    # 验证输入
+    if not data or 'stock_code' not in data:
+        return _error('请提供有效的股票代码', 400)
+
+    stock_code = data['stock_code']
+    start_date = data.get('start_date', None)
+    end_date = data.get('end_date', None)
+
+    fields, error = api_format.parse_fields(data.get('fields', None))
+    if error is not None:
+        return _error(error, 400)
+
+    try:
+        df = await analyzer.get_indicator_data(stock_code, start_date, end_date, fields=fields)
+        result = await analyzer.run(api_format.indicator_records, df, fields)
+        return JSONResponse({
+            'status': 'success',
+            'data': result,
+            'count': len(result)
+        })
+    except Exception as e:
+        logger.error(f"获取技术指标时出错: {str(e)}")
+        return _error(f'获取技术指标时出错: {str(e)}', 500)
+
+
+async def get_ai_analysis(request):
+    """获取股票AI分析的接口"""
+    data = await _json_body(request)
+
+    # 验证输入
+    if not data or 'stock_code' not in data:
+        return _error('请提供有效的股票代码', 400)
+
+    stock_code = data['stock_code']
+
+    try:
+        df = await analyzer.get_indicator_data(stock_code)
+        analysis = await analyzer.run(analyzer.analyzer.get_ai_analysis, df, stock_code)
+        return JSONResponse({
+            'status': 'success',
+            'data': {
+                'stock_code': stock_code,
+                'analysis': analysis
+            }
+        })
+    except Exception as e:
+        logger.error(f"获取AI分析时出错: {str(e)}")
+        return _error(f'获取AI分析时出错: {str(e)}', 500)
+
+
+def _endpoint_label(scope):
+    """请求耗时指标的 endpoint 标签：路由模板，未匹配的请求为 unmatched"""
+    route = scope.get('route')
+    if route is None:
+        for candidate in app.routes:
+            if candidate.matches(scope)[0] != Match.NONE:
+                route = candidate
+                break
+    return getattr(route, 'path', 'unmatched')
+
+
+class MetricsMiddleware:
+    """记录每个请求的耗时，流式响应在响应体发送完毕时记录"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope['method'],
+                                                 endpoint=_endpoint_label(scope), status=status[0])
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """服务启动时启动快照调度；退出时取消扫描任务，关闭连接池和计算线程池"""
+    if snapshot_scheduler is not None:
+        snapshot_scheduler.start()
+    yield
+    scan_jobs.shutdown()
+    if snapshot_scheduler is not None:
+        snapshot_scheduler.stop()
+    await analyzer.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/api/health', health_check, methods=['GET']),
+        Route('/api/metrics', get_metrics, methods=['GET']),
+        Route('/api/analyze', analyze_stock, methods=['POST']),
+        Route('/api/analyze_for_llm', analyze_stock_for_llm, methods=['POST']),
+        Route('/api/scan', scan_market, methods=['POST']),
+        Route('/api/scan/stream', scan_market_stream, methods=['POST']),
+        Route('/api/scan/jobs', submit_scan_job, methods=['POST']),
+        Route('/api/scan/jobs', list_scan_jobs, methods=['GET']),
+        Route('/api/scan/jobs/{job_id}', get_scan_job, methods=['GET']),
+        Route('/api/scan/jobs/{job_id}', cancel_scan_job, methods=['DELETE']),
+        Route('/api/scan/jobs/{job_id}/results', get_scan_job_results, methods=['GET']),
+        Route('/api/snapshot', get_snapshot_status, methods=['GET']),
+        Route('/api/snapshot/refresh', refresh_snapshot, methods=['POST']),
+        Route('/api/bars/refresh', refresh_latest_bars, methods=['POST']),
+        Route('/api/screen', screen_stocks, methods=['POST']),
+        Route('/api/technical_indicators', get_technical_indicators, methods=['POST']),
+        Route('/api/ai_analysis', get_ai_analysis, methods=['POST']),
+    ],
+    middleware=[Middleware(MetricsMiddleware),
+                Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+
+
+def main():
+    """主函数，启动服务器"""
+    import uvicorn
+
+    port = int(os.getenv('PORT', 5000))
+    host = os.getenv('HOST', '0.0.0.0')
+
+    logger.info(f"启动股票分析服务（异步模式） at http://{host}:{port}")
+    uvicorn.run(app, host=host, port=port, log_level='info')
+
+
+if __name__ == '__main__':
+    main()
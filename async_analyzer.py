@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+异步股票分析
+
+包装 StockAnalyzer 供异步服务（asgi_app.py）使用：行情数据通过 StockAnalyzer 配置的数据源获取，
+数据源提供异步客户端时（eastmoney 数据源的 market_data.AsyncKlineClient）等待网络时不占用线程，
+否则在线程池中调用数据源；指标计算、评分和本地K线文件读写交给线程池执行，不阻塞事件循环。
+与 StockAnalyzer 共用同一份指标缓存、本地K线存储和参数，结果与同步接口一致。
+"""
+
+import asyncio
+import contextlib
+import copy
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from scan_jobs import rank_reports
+from singleflight import AsyncSingleFlight
+from stock_analyzer import StockAnalyzer, REPORT_FIELDS
+import indicator_kernels as kernels
+import metrics
+
+
+class ProviderClient:
+    """把 StockAnalyzer 的同步数据源包装为异步客户端的接口，在计算线程池中读取"""
+
+    def __init__(self, owner):
+        self.owner = owner
+
+    async def fetch(self, stock_code, start_date, end_date, adjust="qfq"):
+        return await self.owner.run(self.owner.analyzer._fetch_stock_data, stock_code, start_date, end_date, adjust)
+
+    async def aclose(self):
+        """数据源由 StockAnalyzer 持有，这里不关闭"""
+
+
+class AsyncStockAnalyzer:
+    """StockAnalyzer 的异步包装"""
+
+    def __init__(self, analyzer=None, client=None, compute_workers=None):
+        """
+        analyzer: 共享的 StockAnalyzer，默认新建
+        client: 异步行情客户端，默认使用 analyzer 数据源的 async_client()；
+                数据源没有异步客户端时（akshare、local）在线程池中读取该数据源，
+                因此同步和异步服务写入本地K线存储的数据格式相同
+        compute_workers: 计算线程数，默认读取 ASYNC_COMPUTE_WORKERS，未设置时为 CPU 核数
+        """
+        self.analyzer = analyzer or StockAnalyzer()
+        self.logger = self.analyzer.logger
+        if compute_workers is None:
+            compute_workers = int(os.getenv('ASYNC_COMPUTE_WORKERS', 0)) or os.cpu_count() or 1
+        self.compute_workers = compute_workers
+        self._executor = None
+        self.inflight = AsyncSingleFlight()
+        if client is None:
+            client = self.analyzer.provider.async_client() or ProviderClient(self)
+        self.client = client
+
+    @property
+    def executor(self):
+        """计算线程池，首次使用时创建，aclose 之后再次使用会重新创建"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.compute_workers, thread_name_prefix='compute')
+        return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """在计算线程池中执行同步函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    async def get_stock_data(self, stock_code, start_date=None, end_date=None, adjust="qfq"):
+        """异步获取股票数据，优先读取本地K线存储，只向数据源补取增量部分"""
+        start_date, end_date = self.analyzer._resolve_dates(start_date, end_date)
+
+        try:
+            bar_store = self.analyzer.bar_store
+            if bar_store is None:
+                return await self.client.fetch(stock_code, start_date, end_date, adjust)
+
+            return await bar_store.get_async(
+                stock_code, start_date, end_date, adjust,
+                lambda start, end: self.client.fetch(stock_code, start, end, adjust),
+                self.executor
+            )
+
+        except Exception as e:
+            self.logger.error(f"获取股票数据失败: {str(e)}")
+            raise Exception(f"获取股票数据失败: {str(e)}")
+
+    async def get_indicator_data(self, stock_code, start_date=None, end_date=None, adjust="qfq", fields=None):
+        """异步版本的 StockAnalyzer.get_indicator_data"""
+        analyzer = self.analyzer
+        start_date, end_date = analyzer._resolve_dates(start_date, end_date)
+        key = analyzer._indicator_cache_key(stock_code, start_date, end_date, adjust)
+
+        df = analyzer._lookup_indicators(key)
+        if df is not None:
+            return df
+
+        if fields is not None:
+            fields, _ = kernels.resolve_fields(fields)
+            key = key + (tuple(fields),)
+            df = analyzer.indicator_cache.get(key)
+            if df is not None:
+                return df
+
+        async def load():
+            df = await self.get_stock_data(stock_code, start_date, end_date, adjust)
+            return await self.run(analyzer._compute_indicator_data, key, df, fields)
+
+        return await self._load_once(key, load)
+
+    async def get_latest_indicator_data(self, stock_code, adjust="qfq", fields=REPORT_FIELDS):
+        """异步版本的 StockAnalyzer.get_latest_indicator_data"""
+        analyzer = self.analyzer
+        fields, bars, start_date, end_date, key = analyzer._latest_request(stock_code, adjust, fields)
+        if key is None:
+            return await self.get_indicator_data(stock_code, adjust=adjust)
+
+        df = analyzer.indicator_cache.get(key)
+        if df is not None:
+            return df
+
+        async def load():
+            df = await self.get_stock_data(stock_code, start_date, end_date, adjust)
+            if len(df) < bars:
+                # 停牌较多时估算的日历天数不够，退回默认区间
+                df = await self.get_stock_data(stock_code, None, end_date, adjust)
+            df = df.tail(bars).reset_index(drop=True)
+            return await self.run(analyzer._compute_indicator_data, key, df, fields)
+
+        return await self._load_once(key, load)
+
+    async def _load_once(self, key, load):
+        """同一缓存键的并发请求只执行一次 load，其余请求共享同一份只读结果"""
+        async def load_unless_cached():
+            df = self.analyzer._lookup_indicators(key)
+            return df if df is not None else await load()
+
+        df, _ = await self.inflight.do(('indicators',) + key, load_unless_cached)
+        return df
+
+    async def analyze_stock(self, stock_code, latest_only=False):
+        """异步分析单个股票，快照中有该股票时直接返回；同一股票、参数和日期的并发请求只分析一次"""
+        report = self.analyzer.snapshot_report(stock_code)
+        if report is not None:
+            return report
+
+        async def analyze():
+            if latest_only:
+                df = await self.get_latest_indicator_data(stock_code)
+            else:
+                df = await self.get_indicator_data(stock_code)
+            return await self.run(self.analyzer._build_report, stock_code, df)
+
+        try:
+            key = self.analyzer._analysis_key(stock_code, latest_only)
+            report, shared = await self.inflight.do(key, analyze)
+            return copy.deepcopy(report) if shared else report
+
+        except Exception as e:
+            self.logger.error(f"分析股票时出错: {str(e)}")
+            raise
+
+    async def analyze_above(self, stock_code, min_score):
+        """分析单个股票，确定达不到 min_score 时提前停止并返回 None（见 StockAnalyzer.report_above）"""
+        report = self.analyzer.snapshot_report(stock_code)
+        if report is not None:
+            return report
+
+        start_date, end_date = self.analyzer._resolve_dates(None, None)
+        key = self.analyzer._indicator_cache_key(stock_code, start_date, end_date, "qfq")
+        df = self.analyzer._lookup_indicators(key)
+        computed = df is not None
+        if not computed:
+            df = await self.get_stock_data(stock_code, start_date, end_date)
+        return await self.run(self.analyzer.report_above, key, stock_code, df, computed, min_score)
+
+    async def scan_market(self, stock_list, min_score=60, max_workers=None, compute_workers=None, chunksize=16,
+                          short_circuit=False):
+        """
+        异步扫描市场，最多 max_workers 只股票同时获取和分析
+
+        结果与 StockAnalyzer.scan_market 一致：按得分降序，同分时保持输入顺序；
+        compute_workers 大于1时使用 StockAnalyzer 的进程池计算（见 iter_reports）；
+        short_circuit 为 True 时确定达不到 min_score 的股票提前停止计算
+        """
+        recommendations = []
+        async for index, stock_code, report, error in self.iter_reports(
+                stock_list, max_workers, min_score if short_circuit else None, compute_workers, chunksize):
+            if error is not None:
+                self.logger.error(f"分析股票 {stock_code} 时出错: {str(error)}")
+            elif report is not None and report['score'] >= min_score:
+                recommendations.append((index, report))
+        return rank_reports(recommendations)
+
+    async def iter_reports(self, stock_list, max_workers=None, min_score=None, compute_workers=None, chunksize=16):
+        """
+        按完成顺序逐只产出 (序号, 股票代码, 报告, 错误)，同时在途的股票不超过 max_workers 只
+
+        指定 min_score 时确定达不到 min_score 的股票提前停止计算，报告和错误均为 None；
+        compute_workers 大于1时在专用线程中逐项推进 StockAnalyzer 的进程池扫描，结果与 Flask 服务相同
+        """
+        if compute_workers and compute_workers > 1:
+            async with contextlib.aclosing(self._iter_reports_process(
+                    stock_list, max_workers, min_score, compute_workers, chunksize)) as reports:
+                async for item in reports:
+                    yield item
+            return
+
+        limit = max_workers or max(len(stock_list), 1)
+        codes = iter(enumerate(stock_list))
+        pending = {}
+        timer = metrics.ScanTimer()
+
+        async def analyze(stock_code):
+            try:
+                if min_score is not None:
+                    return await self.analyze_above(stock_code, min_score), None
+                return await self.analyze_stock(stock_code), None
+            except Exception as e:
+                return None, e
+
+        try:
+            while True:
+                for index, stock_code in codes:
+                    pending[asyncio.ensure_future(analyze(stock_code))] = (index, stock_code)
+                    if len(pending) >= limit:
+                        break
+                if not pending:
+                    break
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index, stock_code = pending.pop(task)
+                    report, error = task.result()
+                    timer.item(report, error)
+                    yield index, stock_code, report, error
+            timer.finish()
+        finally:
+            # 调用方提前停止（例如客户端断开）时取消尚未完成的分析
+            for task in pending:
+                task.cancel()
+
+    async def _iter_reports_process(self, stock_list, max_workers, min_score, compute_workers, chunksize):
+        """
+        StockAnalyzer.iter_reports 的异步包装
+
+        同步生成器的每一步和最后的 close() 都在同一个单线程池中执行，
+        调用方提前停止时不会与仍在执行的一步并发关闭生成器
+        """
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scan')
+        reports = self.analyzer.iter_reports(stock_list, max_workers, compute_workers, chunksize,
+                                              min_score=min_score)
+        try:
+            while True:
+                item = await loop.run_in_executor(executor, next, reports, None)
+                if item is None:
+                    break
+                yield item
+        finally:
+            executor.submit(reports.close)
+            executor.shutdown(wait=False)
+
+    async def aclose(self):
+        """关闭连接池和计算线程池"""
+        await self.client.aclose()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+向量化回测
+
+用每根K线的评分生成持仓信号：评分达到买入阈值时满仓，低于卖出阈值时空仓，介于两者之间保持原状态。
+信号在当天收盘后产生，下一根K线开盘成交，计入佣金、卖出印花税和滑点。
+实时分析沿用原实现的 ADX/±DI，某根K线的值用到了下一根K线的最低价；回测中的指标按 causal 方式计算
+（kernels.compute_indicators），每根K线的评分只使用当日及之前的数据，没有前视偏差，
+因此回测中 ADX 相关规则的得分与同一天的实时评分可能不同。
+全仓进出时每根K线的净值变化是一个乘数，整段净值就是这些乘数的累积乘积，
+因此整个回测只由数组运算组成，没有逐K线循环，可以一次回测 (日期 × 股票) 面板上的全部股票。
+"""
+
+import numpy as np
+import pandas as pd
+
+import indicator_kernels as kernels
+import panel
+import scoring
+
+TRADING_DAYS = 252
+
+DEFAULT_COMMISSION = 0.0003
+DEFAULT_STAMP_TAX = 0.0005
+DEFAULT_SLIPPAGE = 0.001
+
+STAT_COLUMNS = ('total_return', 'annual_return', 'volatility', 'sharpe', 'max_drawdown',
+                'trades', 'win_rate', 'exposure', 'buy_hold_return')
+
+
+def _row_index(x):
+    """与 x 的第0维对应、可以广播的行号"""
+    return np.arange(x.shape[0]).reshape((-1,) + (1,) * (x.ndim - 1))
+
+
+def _shift_bool(x):
+    """沿时间轴后移一根，首行为 False"""
+    out = np.zeros(x.shape, dtype=bool)
+    out[1:] = x[:-1]
+    return out
+
+
+def forward_fill(x, initial):
+    """沿时间轴向前填充 NaN，开头的 NaN 用 initial 填充"""
+    x = np.array(x, dtype=np.float64)
+    x[0] = np.where(np.isnan(x[0]), initial, x[0])
+    index = np.where(np.isnan(x), 0, _row_index(x))
+    np.maximum.accumulate(index, axis=0, out=index)
+    return np.take_along_axis(x, index, axis=0)
+
+
+def target_positions(score, ready, entry_score, exit_score):
+    """
+    每根K线收盘后的目标持仓 (0/1)
+
+    score >= entry_score 时满仓，score < exit_score 时空仓，其余保持上一根的状态；
+    指标尚未就绪（ready 为 False）的K线视为空仓信号
+    """
+    signal = np.full(np.shape(score), np.nan)
+    signal[score >= entry_score] = 1
+    signal[score < exit_score] = 0
+    signal[~ready] = 0
+    return forward_fill(signal, 0) > 0
+
+
+def simulate(open_, close, target, n_bars, initial_cash,
+             commission=DEFAULT_COMMISSION, stamp_tax=DEFAULT_STAMP_TAX, slippage=DEFAULT_SLIPPAGE):
+    """
+    按目标持仓模拟交易
+
+    输入为压紧后的数组（每列前 n_bars 行为有效K线），target 为每根K线收盘后的目标持仓。
+    返回 {'equity', 'position', 'cash', 'holdings', 'factor', 'entry', 'exit'}，
+    position 为每根K线持有的仓位（前一根的目标持仓在本根开盘成交），最后仍持有的仓位按收盘价计值
+    """
+    open_ = kernels.as_float(open_)
+    close = kernels.as_float(close)
+    in_range = _row_index(close) < n_bars
+
+    position = _shift_bool(target) & in_range
+    previous = _shift_bool(position)
+    entry = position & ~previous
+    exit_ = ~position & previous & in_range
+    hold = position & previous
+
+    prev_close = kernels.shift(close, 1)
+    factor = np.ones(close.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 持有：收盘到收盘
+        factor = np.where(hold, close / prev_close, factor)
+        # 买入：以开盘价加滑点买入，扣佣金，按收盘价计值
+        factor = np.where(entry, close / (open_ * (1 + slippage)) * (1 - commission), factor)
+        # 卖出：以开盘价减滑点卖出，扣佣金和印花税
+        factor = np.where(exit_, open_ * (1 - slippage) * (1 - commission - stamp_tax) / prev_close, factor)
+
+    equity = initial_cash * np.cumprod(factor, axis=0)
+    holdings = np.where(position, equity, 0.0)
+    return {
+        'equity': equity,
+        'position': position,
+        'cash': equity - holdings,
+        'holdings': holdings,
+        'factor': factor,
+        'entry': entry,
+        'exit': exit_,
+    }
+
+
+def performance(equity, n_bars):
+    """
+    净值曲线的统计指标（沿第0维，每列前 n_bars 行有效）
+
+    返回 {'total_return', 'annual_return', 'volatility', 'sharpe', 'max_drawdown'}，
+    收益率均为小数，年化按每年 TRADING_DAYS 根K线计算，无风险利率取0
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    n_bars = np.asarray(n_bars)
+    in_range = _row_index(equity) < n_bars
+    last = np.take_along_axis(equity, np.maximum(n_bars - 1, 0)[None], axis=0)[0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total_return = last / equity[0] - 1
+        annual_return = (1 + total_return) ** (TRADING_DAYS / n_bars) - 1
+
+        returns = np.where(in_range, equity / kernels.shift(equity, 1) - 1, 0.0)
+        returns[0] = 0.0
+        count = n_bars - 1
+        mean = returns.sum(axis=0) / count
+        variance = (np.where(in_range, returns - mean, 0.0)[1:] ** 2).sum(axis=0) / (count - 1)
+        std = np.sqrt(variance)
+        volatility = std * np.sqrt(TRADING_DAYS)
+        sharpe = np.where(std > 0, mean / std * np.sqrt(TRADING_DAYS), np.nan)
+
+        running_max = np.maximum.accumulate(np.where(in_range, equity, -np.inf), axis=0)
+        drawdown = np.where(in_range, equity / running_max - 1, 0.0)
+
+    return {
+        'total_return': total_return,
+        'annual_return': annual_return,
+        'volatility': volatility,
+        'sharpe': sharpe,
+        'max_drawdown': drawdown.min(axis=0),
+    }
+
+
+def trade_stats(simulation, n_bars):
+    """每只股票的交易次数、胜率（按单笔交易收益，未平仓的按最后收盘价计）和持仓时间占比"""
+    factor = simulation['factor']
+    entry = simulation['entry']
+    trade_bars = simulation['position'] | simulation['exit']
+
+    # 每笔交易的编号：该列第几次买入，交易期间（含卖出的那根）的乘数累乘即为单笔收益
+    trade_number = np.cumsum(entry, axis=0)
+    n_rows = factor.shape[0]
+    columns = np.broadcast_to(np.arange(factor[0].size).reshape(factor.shape[1:]), factor.shape)
+    keys = (columns * (n_rows + 1) + trade_number)[trade_bars]
+    log_growth = np.bincount(keys, weights=np.log(factor[trade_bars]),
+                             minlength=factor[0].size * (n_rows + 1))
+    trade_keys = (columns * (n_rows + 1) + trade_number)[entry]
+    wins = np.bincount(columns[entry][log_growth[trade_keys] > 0], minlength=factor[0].size)
+
+    trades = entry.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            'trades': trades,
+            'win_rate': np.where(trades > 0, wins.reshape(trades.shape) / trades, np.nan),
+            'exposure': simulation['position'].sum(axis=0) / n_bars,
+        }
+
+
+def run_packed(packed_open, packed_close, indicators, n_bars, initial_cash,
+               entry_score=75, exit_score=45,
+               commission=DEFAULT_COMMISSION, stamp_tax=DEFAULT_STAMP_TAX, slippage=DEFAULT_SLIPPAGE):
+    """
+    在压紧后的数组上评分并回测
+
+    indicators 为压紧后计算的技术指标（compute_indicators 的结果，至少包含 scoring.INDICATOR_FIELDS），
+    应以 causal=True 计算，否则 ADX 相关规则用到下一根K线的数据，回测结果有前视偏差。
+    返回 (每根K线评分, 指标是否就绪, simulate 的结果, 每只股票的统计 {统计名: 数组})
+    """
+    # 评分在压紧后的数组上计算，OBV 趋势比较的是最近5根有效K线
+    columns = dict(indicators, close=packed_close)
+    score, _, _ = scoring.evaluate(columns)
+    ready = np.ones(score.shape, dtype=bool)
+    for name in scoring.FIELDS:
+        ready &= np.isfinite(columns[name])
+
+    target = target_positions(score, ready, entry_score, exit_score)
+    simulation = simulate(packed_open, packed_close, target, n_bars, initial_cash,
+                          commission, stamp_tax, slippage)
+
+    stats = performance(simulation['equity'], n_bars)
+    stats.update(trade_stats(simulation, n_bars))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        first_close = packed_close[0]
+        last_close = np.take_along_axis(packed_close, np.maximum(n_bars - 1, 0)[None], axis=0)[0]
+        stats['buy_hold_return'] = last_close / first_close - 1
+    return score, ready, simulation, stats
+
+
+def portfolio_equity(equity, initial_cash):
+    """等权组合净值：每只股票分得相同资金，上市前持有现金，停牌期间净值不变"""
+    normalized = forward_fill(equity / initial_cash, 1.0)
+    return initial_cash * normalized.mean(axis=1)
+
+
+def run_panel(open_, high, low, close, volume, params, initial_cash,
+              entry_score=75, exit_score=45,
+              commission=DEFAULT_COMMISSION, stamp_tax=DEFAULT_STAMP_TAX, slippage=DEFAULT_SLIPPAGE):
+    """
+    回测 (日期 × 股票) 面板
+
+    每只股票各自以 initial_cash 起始独立回测；停牌或未上市的日期在压紧后的数组中跳过。
+    返回 {'equity', 'position'} 两个 (日期 × 股票) 数组（无K线的日期为 NaN / False）、
+    每只股票的统计 {'stats': {统计名: 数组}}，以及等权组合的净值 'portfolio_equity'
+    """
+    valid, order, n_bars, indicators = panel.compute_packed(open_, high, low, close, volume, params,
+                                                            fields=scoring.INDICATOR_FIELDS, causal=True)
+    _, _, simulation, stats = run_packed(panel.pack(open_, order), panel.pack(close, order), indicators,
+                                         n_bars, initial_cash, entry_score, exit_score,
+                                         commission, stamp_tax, slippage)
+
+    equity = panel.unpack(simulation['equity'], order, valid)
+    position = panel.unpack(simulation['position'].astype(np.float64), order, valid)
+    return {
+        'equity': equity,
+        'position': np.nan_to_num(position) > 0,
+        'stats': stats,
+        'portfolio_equity': portfolio_equity(equity, initial_cash),
+    }
+
+
+def results_to_frames(dates, codes, result):
+    """把 run_panel 的结果整理为 DataFrame：净值和持仓为 (日期 × 股票)，统计为每只股票一行"""
+    stats = pd.DataFrame({name: result['stats'][name] for name in STAT_COLUMNS}, index=codes)
+    portfolio = pd.Series(result['portfolio_equity'], index=dates, name='equity')
+    portfolio_stats = performance(result['portfolio_equity'][:, None], [len(dates)])
+    return {
+        'equity': pd.DataFrame(result['equity'], index=dates, columns=codes),
+        'position': pd.DataFrame(result['position'], index=dates, columns=codes),
+        'stats': stats,
+        'portfolio': portfolio,
+        'portfolio_stats': {name: float(values[0]) for name, values in portfolio_stats.items()},
+    }
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地K线列式存储
+
+按 (复权方式, 股票代码) 将日线数据逐列保存为 npz 文件，
+读取时只向数据源补取最后一根K线之后的增量数据。
+补取逻辑写成生成器（sync），同步的 get 和异步的 get_async 共用。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def _step(generator, value):
+    """推进生成器一步，返回 (是否结束, yield 的值或返回值)"""
+    try:
+        return False, generator.send(value)
+    except StopIteration as stop:
+        return True, stop.value
+
+
+class BarStore:
+    """本地K线存储，get_stock_data 优先读取，再增量补齐"""
+
+    def __init__(self, root, refresh_interval=300):
+        """
+        root: 存储目录
+        refresh_interval: 覆盖到当天的数据在多少秒内视为最新，超时后重新补取当天K线
+        """
+        self.root = root
+        self.refresh_interval = refresh_interval
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def path(self, stock_code, adjust):
+        """返回股票对应的存储文件路径"""
+        return os.path.join(self.root, adjust or 'none', f"{stock_code}.npz")
+
+    def _lock_for(self, stock_code, adjust):
+        """同一股票的读写串行化，不同股票互不阻塞"""
+        key = (adjust, stock_code)
+        with self._locks_guard:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    def load(self, stock_code, adjust):
+        """读取本地数据，返回 (DataFrame, meta)，不存在或损坏时返回 (None, None)"""
+        path = self.path(stock_code, adjust)
+        if not os.path.exists(path):
+            return None, None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                columns = [str(c) for c in data['__columns__']]
+                meta = json.loads(str(data['__meta__']))
+                df = pd.DataFrame({name: data[f"c{i}"] for i, name in enumerate(columns)})
+            return df, meta
+        except Exception as e:
+            logger.warning(f"读取本地K线 {path} 失败，将重新获取: {str(e)}")
+            return None, None
+
+    def save(self, stock_code, adjust, df, meta):
+        """原子写入：先写临时文件再替换，读者不会看到半写的文件"""
+        path = self.path(stock_code, adjust)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {}
+        for i, name in enumerate(df.columns):
+            column = df[name]
+            if name == 'date' or pd.api.types.is_numeric_dtype(column):
+                arrays[f"c{i}"] = column.to_numpy()
+            else:
+                arrays[f"c{i}"] = column.astype(str).to_numpy(dtype=str)
+        arrays['__columns__'] = np.array([str(c) for c in df.columns])
+        arrays['__meta__'] = np.array(json.dumps(meta))
+
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"写入本地K线 {path} 失败: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get(self, stock_code, start_date, end_date, adjust, fetch):
+        """
+        读取 [start_date, end_date] 区间的K线，缺失部分通过 fetch(start, end) 补取
+
+        start_date/end_date 为 YYYYMMDD 字符串，fetch 返回与 get_stock_data 相同格式的 DataFrame
+        """
+        with self._lock_for(stock_code, adjust):
+            sync = self.sync(stock_code, start_date, end_date, adjust)
+            done, value = _step(sync, None)
+            while not done:
+                done, value = _step(sync, fetch(*value))
+            return value
+
+    async def get_async(self, stock_code, start_date, end_date, adjust, fetch, executor=None):
+        """
+        get 的异步版本：fetch 为协程函数，读写本地文件在 executor 中执行，不阻塞事件循环
+
+        不持有按股票的线程锁，同一股票的并发请求应由调用方合并
+        """
+        loop = asyncio.get_running_loop()
+        sync = self.sync(stock_code, start_date, end_date, adjust)
+        done, value = await loop.run_in_executor(executor, _step, sync, None)
+        while not done:
+            delta = await fetch(*value)
+            done, value = await loop.run_in_executor(executor, _step, sync, delta)
+        return value
+
+    def merge_latest(self, quotes, adjust):
+        """
+        把全市场行情表中的最新K线合并到本地已有的股票，返回 {'appended': [...], 'replaced': [...], 'skipped': [...]}
+
+        quotes 为 DataProvider.latest_quotes 的返回格式。昨收等于本地最后一根K线的收盘价时追加为新K线，
+        日期与最后一根相同且昨收等于倒数第二根的收盘价时替换最后一根（同一交易日的盘中更新）；
+        本地数据覆盖到的日期更新为行情的日期。其余情况说明复权历史已变化、
+        停牌或本地数据不连续，该股票跳过，之后仍按原方式逐只补取。本地没有数据的股票不处理
+        """
+        result = {'appended': [], 'replaced': [], 'skipped': []}
+        for quote in quotes.to_dict('records'):
+            stock_code = quote['code']
+            if not os.path.exists(self.path(stock_code, adjust)):
+                continue
+            with self._lock_for(stock_code, adjust):
+                outcome = self._merge_quote(stock_code, adjust, quote)
+            result[outcome].append(stock_code)
+        return result
+
+    def _merge_quote(self, stock_code, adjust, quote):
+        """合并一只股票的最新K线，返回 appended / replaced / skipped"""
+        cached, meta = self.load(stock_code, adjust)
+        if cached is None or len(cached) < 2:
+            return 'skipped'
+
+        date = pd.Timestamp(quote['date'])
+        last_date = cached['date'].iloc[-1]
+        closes = cached['close'].to_numpy()
+        if (date > last_date and np.isclose(quote['prev_close'], closes[-1], rtol=1e-6, atol=1e-6)
+                and pd.Timestamp(meta['end']) >= date - pd.offsets.BDay(1)):
+            # 本地数据覆盖到上一个交易日，行情表是之后的新K线
+            outcome, history, template = 'appended', cached, cached.iloc[-1]
+        elif date == last_date and np.isclose(quote['prev_close'], closes[-2], rtol=1e-6, atol=1e-6):
+            # 同一交易日的盘中更新
+            outcome, history, template = 'replaced', cached.iloc[:-1], cached.iloc[-1]
+        else:
+            return 'skipped'
+
+        # 数据源返回的其他列：数值列（成交额等）无法从行情表得到，记为 NaN，其余列沿用最后一根K线
+        row = {}
+        for name in cached.columns:
+            if name == 'date':
+                row[name] = date
+            elif name in ('open', 'high', 'low', 'close', 'volume'):
+                row[name] = float(quote[name])
+            elif pd.api.types.is_numeric_dtype(cached[name]):
+                row[name] = np.nan
+            else:
+                row[name] = template[name]
+        cached = pd.concat([history, pd.DataFrame([row], columns=cached.columns)], ignore_index=True)
+
+        meta = {'start': meta['start'], 'end': max(meta['end'], date.strftime('%Y%m%d')), 'synced_at': time.time()}
+        self.save(stock_code, adjust, cached, meta)
+        return outcome
+
+    def sync(self, stock_code, start_date, end_date, adjust):
+        """
+        与数据源同步的生成器，不直接发起请求：
+
+        每次 yield (start, end) 表示需要向数据源获取该区间，调用方把获取到的 DataFrame send 回来；
+        结束时返回 [start_date, end_date] 区间的K线（StopIteration.value）。
+        同步和异步两种获取方式共用这一套补取逻辑
+        """
+        today = datetime.now().strftime('%Y%m%d')
+        covered_end = min(end_date, today)
+
+        cached, meta = self.load(stock_code, adjust)
+
+        if cached is None or len(cached) == 0 or start_date < meta['start']:
+            # 首次获取或需要更早的历史：整段获取
+            fetch_end = end_date if cached is None else max(end_date, meta['end'])
+            cached = yield start_date, fetch_end
+            meta = {'start': start_date, 'end': min(fetch_end, today), 'synced_at': time.time()}
+            self.save(stock_code, adjust, cached, meta)
+        elif self._needs_top_up(meta, covered_end, today):
+            cached, meta = yield from self._top_up(stock_code, adjust, cached, meta, end_date, today)
+
+        mask = (cached['date'] >= pd.Timestamp(start_date)) & (cached['date'] <= pd.Timestamp(end_date))
+        return cached[mask].reset_index(drop=True)
+
+    def _needs_top_up(self, meta, covered_end, today):
+        """判断是否需要向数据源补取"""
+        if covered_end > meta['end']:
+            return True
+        # 覆盖到当天的数据在盘中可能变化，超过刷新间隔后重新获取
+        return meta['end'] >= today and time.time() - meta['synced_at'] > self.refresh_interval
+
+    def _top_up(self, stock_code, adjust, cached, meta, end_date, today):
+        """从最后一根K线开始增量获取，重叠的那根K线用于检测复权价格是否变化"""
+        last_date = cached['date'].iloc[-1]
+        delta = yield last_date.strftime('%Y%m%d'), max(end_date, meta['end'])
+
+        overlap = delta[delta['date'] == last_date]
+        if len(delta) > 0 and list(delta.columns) != list(cached.columns):
+            # 数据源返回的列与本地数据不同（例如更换了数据源），直接拼接会产生空值，重新获取全部区间
+            logger.info(f"{stock_code} 数据源返回的列发生变化，重新获取完整历史")
+            cached = yield meta['start'], max(end_date, meta['end'])
+        elif len(overlap) > 0 and not np.isclose(overlap['close'].iloc[0], cached['close'].iloc[-1],
+                                               rtol=1e-6, atol=1e-6):
+            # 除权除息后前复权历史整体变化，增量无法拼接，重新获取全部区间
+            logger.info(f"{stock_code} 复权价格发生变化，重新获取完整历史")
+            cached = yield meta['start'], max(end_date, meta['end'])
+        elif len(delta) > 0:
+            new_bars = delta[delta['date'] >= last_date]
+            cached = pd.concat([cached[cached['date'] < last_date], new_bars], ignore_index=True)
+
+        meta = {'start': meta['start'], 'end': max(min(end_date, today), meta['end']), 'synced_at': time.time()}
+        self.save(stock_code, adjust, cached, meta)
+        return cached, meta
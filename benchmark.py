@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+离线基准测试
+
+行情数据由 synthetic_data 按种子生成，akshare 被替换为 AkshareStub，不访问网络，
+同一组参数每次测试的输入完全相同。覆盖各个 calculate_* 方法、calculate_indicators、
+calculate_score、scan_market 和 Flask 接口，结果保存为 JSON，便于离线比较不同版本：
+
+    python benchmark.py                                  # 全部基准，结果写入 data/benchmarks/
+    python benchmark.py --only methods,indicators --bars 1000
+    python benchmark.py --symbols 500 --latency 0.05 --output after.json
+    python benchmark.py --compare before.json after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import synthetic_data
+
+GROUPS = ('methods', 'indicators', 'score', 'scan', 'routes')
+
+# 比较结果时中位数变化超过该比例才标记
+COMPARE_THRESHOLD = 0.10
+
+
+def measure(fn, repeat=5, setup=None, warmup=1, items=None):
+    """
+    执行 warmup 次预热后计时 repeat 次，返回每次耗时（秒）的统计
+
+    setup 在每次执行前调用，不计入耗时（例如清空缓存）；items 为每次执行处理的股票数，
+    给出时额外计算吞吐量
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    result = {
+        'repeat': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+    if items:
+        result['items'] = items
+        result['items_per_second'] = items / result['median']
+    return result
+
+
+def environment():
+    """运行环境信息，比较结果时用于确认两次测试可比"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit or None,
+    }
+
+
+class BenchmarkSuite:
+    """一组基准测试，全部在 AkshareStub 提供的合成数据上运行"""
+
+    def __init__(self, symbols=50, bars=500, repeat=5, seed=0, latency=0.0, scan_workers=8, log=print):
+        """
+        symbols: 扫描和接口测试使用的股票数
+        bars: 每只股票生成的工作日数
+        repeat: 每项基准的计时次数
+        seed: 合成数据的种子
+        latency: 每次获取数据的模拟网络延迟（秒）
+        scan_workers: 并发扫描的线程数
+        """
+        self.config = {'symbols': symbols, 'bars': bars, 'repeat': repeat, 'seed': seed,
+                       'latency': latency, 'scan_workers': scan_workers}
+        self.repeat = repeat
+        self.log = log
+        self.stub = synthetic_data.AkshareStub(universe=symbols, bars=bars, seed=seed, latency=latency)
+        self.codes = self.stub.universe
+        self.results = {}
+
+        # 基准测试不读写本地K线存储，也不加载快照；数据源固定为被替换的 akshare
+        os.environ['BAR_STORE_DIR'] = ''
+        os.environ['SNAPSHOT_UNIVERSE'] = ''
+        os.environ['MARKET_DATA_PROVIDER'] = 'akshare'
+        from stock_analyzer import StockAnalyzer
+        self.analyzer = StockAnalyzer(bar_store_dir='', provider='akshare')
+
+    def record(self, name, fn, **kwargs):
+        result = measure(fn, self.repeat, **kwargs)
+        self.results[name] = result
+        line = f"{name:45s} 中位数 {result['median'] * 1000:10.3f} ms"
+        if 'items_per_second' in result:
+            line += f"  {result['items_per_second']:10.1f} 只/秒"
+        self.log(line)
+
+    def sample(self):
+        """单只股票的原始K线"""
+        return self.stub.frame(self.codes[0]).copy()
+
+    def bench_methods(self):
+        """每个 calculate_* 指标方法"""
+        a = self.analyzer
+        p = a.params
+        df = self.sample()
+        close = df['close']
+        cases = {
+            'calculate_ema': lambda: a.calculate_ema(close, p['ma_periods']['medium']),
+            'calculate_rsi': lambda: a.calculate_rsi(close, p['rsi_period']),
+            'calculate_macd': lambda: a.calculate_macd(close),
+            'calculate_bollinger_bands': lambda: a.calculate_bollinger_bands(close, p['bollinger_period'],
+                                                                             p['bollinger_std']),
+            'calculate_atr': lambda: a.calculate_atr(df, p['atr_period']),
+            'calculate_stochastic': lambda: a.calculate_stochastic(df, p['stochastic_k'], p['stochastic_d']),
+            'calculate_cci': lambda: a.calculate_cci(df, p['cci_period']),
+            'calculate_adx': lambda: a.calculate_adx(df, p['adx_period']),
+            'calculate_tr': lambda: a.calculate_tr(df),
+            'calculate_ichimoku': lambda: a.calculate_ichimoku(df, p['ichimoku']['tenkan'], p['ichimoku']['kijun'],
+                                                               p['ichimoku']['senkou_span_b']),
+            'calculate_obv': lambda: a.calculate_obv(df),
+            'calculate_mfi': lambda: a.calculate_mfi(df, p['mfi_period']),
+            'calculate_standard_deviation': lambda: a.calculate_standard_deviation(close, p['std_dev_period']),
+            'calculate_z_score': lambda: a.calculate_z_score(close, p['z_score_period']),
+        }
+        for name, fn in cases.items():
+            self.record(f"methods.{name}", fn)
+
+    def bench_indicators(self):
+        """calculate_indicators：全部指标、只算评分用到的指标"""
+        from stock_analyzer import REPORT_FIELDS
+        df = self.sample()
+        self.record('indicators.calculate_indicators', lambda: self.analyzer.calculate_indicators(df.copy()))
+        self.record('indicators.calculate_indicators.report_fields',
+                    lambda: self.analyzer.calculate_indicators(df.copy(), fields=REPORT_FIELDS))
+
+    def bench_score(self):
+        """calculate_score（最新K线）、calculate_score_history（全部K线）和生成报告"""
+        df = self.analyzer.calculate_indicators(self.sample())
+        self.record('score.calculate_score', lambda: self.analyzer.calculate_score(df))
+        self.record('score.calculate_score_history',
+                    lambda: self.analyzer.calculate_score_history(df, numeric_only=True))
+        self.record('score.build_report', lambda: self.analyzer._build_report(self.codes[0], df))
+
+    def bench_scan(self):
+        """scan_market：逐只、线程池并发、提前淘汰；每次执行前清空指标缓存"""
+        a = self.analyzer
+        codes = self.codes
+        workers = self.config['scan_workers']
+        clear = a.indicator_cache.clear
+        self.record('scan.sequential', lambda: a.scan_market(codes, 60), setup=clear, items=len(codes))
+        self.record('scan.threads', lambda: a.scan_market(codes, 60, max_workers=workers),
+                    setup=clear, items=len(codes))
+        self.record('scan.threads.short_circuit_75',
+                    lambda: a.scan_market(codes, 75, max_workers=workers, short_circuit=True),
+                    setup=clear, items=len(codes))
+        self.record('scan.cached', lambda: a.scan_market(codes, 60, max_workers=workers), items=len(codes))
+
+    def bench_routes(self):
+        """Flask 接口：冷启动（清空缓存）与命中缓存"""
+        import app as flask_app
+        client = flask_app.app.test_client()
+        analyzer = flask_app.analyzer
+        clear = analyzer.indicator_cache.clear
+        code = self.codes[0]
+
+        def post(path, body):
+            def call():
+                response = client.post(path, json=body)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{path} 返回 {response.status_code}: {response.get_data(as_text=True)[:200]}")
+            return call
+
+        self.record('routes.health', lambda: client.get('/api/health'))
+        self.record('routes.analyze.cold', post('/api/analyze', {'stock_code': code}), setup=clear)
+        self.record('routes.analyze.warm', post('/api/analyze', {'stock_code': code}))
+        self.record('routes.analyze_for_llm.warm', post('/api/analyze_for_llm', {'stock_code': code}))
+        self.record('routes.technical_indicators.cold', post('/api/technical_indicators', {'stock_code': code}),
+                    setup=clear)
+        self.record('routes.technical_indicators.fields',
+                    post('/api/technical_indicators', {'stock_code': code, 'fields': 'RSI,MACD'}), setup=clear)
+        self.record('routes.scan.cold', post('/api/scan', {'stock_list': self.codes, 'min_score': 60}),
+                    setup=clear, items=len(self.codes))
+
+    def run(self, only=None):
+        """运行指定的基准组（默认全部），返回可保存为 JSON 的结果"""
+        started = time.time()
+        with synthetic_data.stub_akshare(self.stub):
+            for group in only or GROUPS:
+                getattr(self, f"bench_{group}")()
+        return {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'duration': time.time() - started,
+            'environment': environment(),
+            'config': self.config,
+            'results': self.results,
+        }
+
+
+def save(report, path=None):
+    """保存结果，默认写入 data/benchmarks/benchmark-<时间>.json，返回路径"""
+    if path is None:
+        path = os.path.join('data', 'benchmarks', f"benchmark-{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def compare(old, new):
+    """
+    比较两次结果的中位数，返回 [(名称, 旧中位数, 新中位数, 新/旧)]
+
+    只比较两次都有的基准；配置不同时比较没有意义，调用方应先检查 config
+    """
+    rows = []
+    for name, result in new['results'].items():
+        if name in old['results']:
+            before = old['results'][name]['median']
+            after = result['median']
+            rows.append((name, before, after, after / before if before else float('inf')))
+    return rows
+
+
+def print_comparison(old, new, threshold=COMPARE_THRESHOLD):
+    if old['config'] != new['config']:
+        print(f"注意: 两次测试的配置不同\n  旧: {old['config']}\n  新: {new['config']}")
+    print(f"{'基准':45s} {'旧(ms)':>12s} {'新(ms)':>12s} {'新/旧':>8s}")
+    for name, before, after, ratio in compare(old, new):
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = '  变慢'
+        elif ratio < 1 - threshold:
+            mark = '  变快'
+        print(f"{name:45s} {before * 1000:12.3f} {after * 1000:12.3f} {ratio:8.2f}{mark}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='离线基准测试（合成数据，不访问网络）')
+    parser.add_argument('--only', help=f"逗号分隔的基准组，可选 {','.join(GROUPS)}，默认全部")
+    parser.add_argument('--symbols', type=int, default=50, help='扫描和接口测试的股票数，默认 50')
+    parser.add_argument('--bars', type=int, default=500, help='每只股票生成的工作日数，默认 500')
+    parser.add_argument('--repeat', type=int, default=5, help='每项基准的计时次数，默认 5')
+    parser.add_argument('--seed', type=int, default=0, help='合成数据的种子，默认 0')
+    parser.add_argument('--latency', type=float, default=0.0, help='每次获取数据的模拟网络延迟（秒），默认 0')
+    parser.add_argument('--scan-workers', type=int, default=8, help='并发扫描的线程数，默认 8')
+    parser.add_argument('--output', help='结果文件路径，默认 data/benchmarks/benchmark-<时间>.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='比较两个结果文件，不运行基准')
+    parser.add_argument('--threshold', type=float, default=COMPARE_THRESHOLD, help='比较时标记变化的比例，默认 0.10')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.compare[1], encoding='utf-8') as f:
+            new = json.load(f)
+        print_comparison(old, new, args.threshold)
+        return 0
+
+    only = None
+    if args.only:
+        only = [group.strip() for group in args.only.split(',') if group.strip()]
+        unknown = [group for group in only if group not in GROUPS]
+        if unknown:
+            parser.error(f"未知的基准组: {', '.join(unknown)}")
+
+    # 分析器和接口的 INFO 日志会淹没基准输出
+    import logging
+    logging.disable(logging.WARNING)
+
+    suite = BenchmarkSuite(args.symbols, args.bars, args.repeat, args.seed, args.latency, args.scan_workers)
+    report = suite.run(only)
+    path = save(report, args.output)
+    print(f"结果已保存到 {path}，耗时 {report['duration']:.1f} 秒")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+紧凑的指标 DataFrame
+
+数据源返回的K线带有分析用不到的列（股票代码、成交额、振幅、涨跌幅、换手率等），
+calculate_indicators 再加上约35列 float64 指标。紧凑模式下写入指标缓存的 DataFrame
+只保留日期、开高低收量和技术指标列，数值列降为 float32：
+
+    df = compact_frame(analyzer.calculate_indicators(df))
+
+每列降精度前都与 float64 的原值比较，相对误差超过 tolerance 的列（或超出 float32 范围的列）保持 float64。
+OBV 是累积量，评分比较的是相隔几根K线的差值，远小于 OBV 本身，float32 的舍入可能改变趋势判断，始终保持 float64。
+价格按分取整时指标可能恰好落在评分规则的阈值上（例如 RSI 正好为 30），舍入后命中的分支不同；
+转换后最新K线的评分分支与 float64 不一致时，该股票评分用到的列保持 float64，保证评分与完整精度一致。
+
+只有写入指标缓存的数据是紧凑的：本地K线存储和 get_stock_data 返回的K线仍为 float64，日期仍为 datetime64。
+输出报告和指标时用 widen_frame 把 float32 列还原为 float64，序列化结果不带 float32 的舍入尾数。
+"""
+
+import numpy as np
+import pandas as pd
+
+import indicator_kernels as kernels
+import scoring
+
+# 保留的行情列
+FRAME_COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume']
+
+# 降为 float32 时允许的最大相对误差（float32 的舍入误差约为 6e-8）
+DEFAULT_TOLERANCE = 1e-6
+
+# 始终保持 float64 的列
+FLOAT64_COLUMNS = ('OBV',)
+
+
+def downcast(values, tolerance=DEFAULT_TOLERANCE):
+    """把数组转换为 float32；任一元素与 float64 原值的相对误差超过 tolerance 或超出 float32 范围时返回 None"""
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(over='ignore', invalid='ignore'):
+        narrow = values.astype(np.float32)
+    finite = np.isfinite(values)
+    if not np.array_equal(finite, np.isfinite(narrow)):
+        return None
+    error = np.abs(narrow[finite].astype(np.float64) - values[finite])
+    if np.any(error > tolerance * np.abs(values[finite])):
+        return None
+    return narrow
+
+
+def compact_frame(df, tolerance=DEFAULT_TOLERANCE):
+    """只保留日期、开高低收量和技术指标列，数值列在误差不超过 tolerance 时降为 float32，返回新的 DataFrame"""
+    result = _downcast_frame(df, tolerance)
+    if len(df) and all(name in df.columns for name in scoring.FIELDS):
+        if _latest_choices(result) != _latest_choices(df):
+            result = _downcast_frame(df, tolerance, keep=scoring.FIELDS)
+    return result
+
+
+def _latest_choices(df):
+    """最新K线每条评分规则命中的分支"""
+    _, _, choices = scoring.evaluate(scoring.latest_columns(df))
+    return {key: int(choice) for key, choice in choices.items()}
+
+
+def _downcast_frame(df, tolerance, keep=()):
+    """compact_frame 的实现，keep 中的列保持 float64"""
+    columns = {}
+    for name in df.columns:
+        if name == 'date':
+            columns[name] = df[name].to_numpy()
+            continue
+        if name not in FRAME_COLUMNS and name not in kernels.INDICATORS:
+            continue
+        values = df[name].to_numpy(dtype=np.float64)
+        narrow = None if name in FLOAT64_COLUMNS or name in keep else downcast(values, tolerance)
+        columns[name] = values if narrow is None else narrow
+    return pd.DataFrame(columns)
+
+
+def widen(values):
+    """
+    把 float32 数组还原为 float64：按 float32 的最短十进制表示转换（12.34 而不是 12.340000152587891），
+    与原来的 float64 值之差不超过 float32 的舍入误差
+    """
+    return np.array([float(str(value)) for value in values], dtype=np.float64)
+
+
+def widen_frame(df):
+    """把 DataFrame 中的 float32 列还原为 float64（widen），没有 float32 列时原样返回"""
+    narrow = {name: widen(df[name].to_numpy()) for name in df.columns if df[name].dtype == np.float32}
+    return df.assign(**narrow) if narrow else df
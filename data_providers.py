@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+行情数据源
+
+StockAnalyzer 通过数据源获取日线数据，每个实例可以使用不同的数据源：
+
+- akshare（默认）：调用 ak.stock_zh_a_hist；akshare 不支持传入 Session，这里把它的接口模块使用的
+  requests 替换为转发到共享 Session 的对象来复用连接（见 share_session），不能替换时按原样调用
+- eastmoney：直接请求 akshare 使用的同一个东方财富接口，所有请求共享一个 requests.Session，
+  复用 keep-alive 连接，失败自动重试
+- local：从本地目录读取 CSV / Parquet 文件，完全不访问网络，用于测试、基准测试和离线分析
+
+    analyzer = StockAnalyzer(provider=LocalFileProvider('tests/fixtures'))
+    analyzer = StockAnalyzer(provider='eastmoney')
+
+各数据源返回的 DataFrame 格式相同：按日期升序，至少包含 date/open/close/high/low/volume 列。
+"""
+
+import abc
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from market_data import KLINE_URL, PRICE_COLUMNS, AsyncKlineClient, kline_params, klines_to_frame
+
+logger = logging.getLogger(__name__)
+
+# akshare 返回的中文列名 -> 分析使用的列名
+COLUMN_NAMES = {
+    "日期": "date",
+    "开盘": "open",
+    "收盘": "close",
+    "最高": "high",
+    "最低": "low",
+    "成交量": "volume"
+}
+
+# ak.stock_zh_a_spot_em（全市场实时行情表）的列名 -> latest_quotes 的列名
+SPOT_COLUMNS = {
+    "代码": "code",
+    "今开": "open",
+    "最高": "high",
+    "最低": "low",
+    "最新价": "close",
+    "成交量": "volume",
+    "昨收": "prev_close"
+}
+
+# latest_quotes 返回的列
+QUOTE_COLUMNS = ['code', 'date', 'open', 'high', 'low', 'close', 'volume', 'prev_close']
+
+
+def normalize_frame(df):
+    """重命名列、转换日期和数值类型、删除空值并按日期排序"""
+    # 重命名列名以匹配分析需求
+    df = df.rename(columns=COLUMN_NAMES)
+
+    # 确保日期格式正确
+    df['date'] = pd.to_datetime(df['date'])
+
+    # 数据类型转换
+    df[PRICE_COLUMNS] = df[PRICE_COLUMNS].apply(pd.to_numeric, errors='coerce')
+
+    # 删除空值
+    df = df.dropna()
+
+    return df.sort_values('date').reset_index(drop=True)
+
+
+# 数据源用到的 akshare 接口，其所在模块的 requests 由 share_session 替换
+AKSHARE_FUNCTIONS = ('stock_zh_a_hist', 'stock_zh_a_spot_em', 'stock_info_a_code_name')
+
+_akshare_session = None
+_akshare_shared = None
+_akshare_lock = threading.Lock()
+
+
+def pooled_session(max_connections, headers=None):
+    """带连接池的 requests.Session，连接池上限为 max_connections"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(headers or {})
+    return session
+
+
+class SessionRequests:
+    """
+    替换 akshare 接口模块中的 requests 模块：get/post/request 经共享 Session 发出，复用 keep-alive 连接，
+    其余属性（异常类型等）转发给原 requests 模块
+    """
+
+    def __init__(self, session, module):
+        self.session = session
+        self.module = module
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.session.post(url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+
+def share_session(ak, session, functions=AKSHARE_FUNCTIONS):
+    """
+    让 akshare 的 functions 经 session 发出请求，返回已使用共享 Session 的模块名
+
+    akshare 的接口函数通过所在模块的 requests.get 发出请求。只替换 akshare 包内、
+    且 requests 属性就是 requests 模块本身的模块；akshare 改用其他请求方式时不做任何修改，按原样调用
+    """
+    import requests
+
+    shared = []
+    for name in functions:
+        module_name = getattr(getattr(ak, name, None), '__module__', None) or ''
+        module = sys.modules.get(module_name)
+        if module is None or not module_name.startswith('akshare.'):
+            continue
+        current = getattr(module, 'requests', None)
+        if current is requests:
+            module.requests = SessionRequests(session, requests)
+        elif not isinstance(current, SessionRequests):
+            continue
+        if module_name not in shared:
+            shared.append(module_name)
+    return shared
+
+
+def import_akshare():
+    """
+    导入 akshare；AKSHARE_SHARED_SESSION 不为 false 时（默认），首次导入后让它的接口经同一个
+    带连接池的 Session 发出请求（连接池上限读取 MARKET_DATA_MAX_CONNECTIONS），整个进程共用
+    """
+    global _akshare_session, _akshare_shared
+    import akshare as ak
+
+    if os.getenv('AKSHARE_SHARED_SESSION', 'true').lower() != 'true':
+        return ak
+    with _akshare_lock:
+        if _akshare_shared is not ak:
+            if _akshare_session is None:
+                _akshare_session = pooled_session(int(os.getenv('MARKET_DATA_MAX_CONNECTIONS', 100)))
+            shared = share_session(ak, _akshare_session)
+            _akshare_shared = ak
+            if shared:
+                logger.info(f"akshare 接口使用共享连接池: {', '.join(shared)}")
+            else:
+                logger.info("当前 akshare 版本的接口不经模块级 requests 发出请求，不使用共享连接池")
+    return ak
+
+
+def trade_date(now=None):
+    """行情表对应的交易日：工作日为当天，周末为上一个周五（节假日不做区分）"""
+    day = pd.Timestamp(now or datetime.now()).normalize()
+    while day.weekday() >= 5:
+        day -= pd.Timedelta(days=1)
+    return day
+
+
+class DataProvider(abc.ABC):
+    """数据源接口，子类至少实现 get_daily"""
+
+    # 运行指标中的数据源名
+    name = None
+
+    @abc.abstractmethod
+    def get_daily(self, stock_code, start_date, end_date, adjust="qfq"):
+        """[start_date, end_date]（YYYYMMDD）区间的日K线"""
+
+    def stock_list(self):
+        """全部股票代码（快照股票池配置为 all 时使用）"""
+        ak = import_akshare()
+        return [str(code) for code in ak.stock_info_a_code_name()['code']]
+
+    def latest_quotes(self):
+        """
+        全市场每只股票的最新一根日K线（未复权），一次请求取得
+
+        返回列为 code/date/open/high/low/close/volume/prev_close 的 DataFrame，
+        prev_close 为昨收，用于判断最新K线能否与本地历史拼接；停牌等没有最新价的股票不包含在内
+        """
+        ak = import_akshare()
+
+        df = ak.stock_zh_a_spot_em().rename(columns=SPOT_COLUMNS)
+        df['code'] = df['code'].astype(str)
+        df['date'] = trade_date()
+        numeric_columns = QUOTE_COLUMNS[2:]
+        df[numeric_columns] = df[numeric_columns].apply(pd.to_numeric, errors='coerce')
+        return df[QUOTE_COLUMNS].dropna().reset_index(drop=True)
+
+    def async_client(self):
+        """
+        异步服务（async_analyzer）使用的异步客户端，返回的 DataFrame 必须与 get_daily 格式相同；
+        返回 None 时异步服务在线程池中调用 get_daily
+        """
+        return None
+
+    def close(self):
+        """释放连接等资源"""
+
+
+class AkshareProvider(DataProvider):
+    """
+    通过 akshare 获取数据
+
+    akshare 不支持传入 Session，连接复用通过替换其接口模块的 requests 实现（见 import_akshare），
+    失败重试由 akshare 自身决定；需要可配置的超时和自动重试时使用 EastmoneyProvider
+    """
+
+    name = 'akshare'
+
+    def get_daily(self, stock_code, start_date, end_date, adjust="qfq"):
+        ak = import_akshare()
+
+        df = ak.stock_zh_a_hist(symbol=stock_code,
+                                start_date=start_date,
+                                end_date=end_date,
+                                adjust=adjust)
+        return normalize_frame(df)
+
+
+class EastmoneyProvider(DataProvider):
+    """直接请求东方财富日K线接口，所有线程共享一个带连接池的 requests.Session"""
+
+    name = 'eastmoney'
+
+    def __init__(self, timeout=None, max_connections=None, retries=None):
+        """
+        timeout: 单次请求超时（秒），默认读取 MARKET_DATA_TIMEOUT，10秒
+        max_connections: 连接池上限，默认读取 MARKET_DATA_MAX_CONNECTIONS，100
+        retries: 失败后的重试次数，默认读取 MARKET_DATA_RETRIES，2次
+        """
+        self.timeout = float(timeout if timeout is not None else os.getenv('MARKET_DATA_TIMEOUT', 10))
+        self.max_connections = int(max_connections if max_connections is not None
+                                   else os.getenv('MARKET_DATA_MAX_CONNECTIONS', 100))
+        self.retries = int(retries if retries is not None else os.getenv('MARKET_DATA_RETRIES', 2))
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        """首次使用时创建 Session"""
+        with self._lock:
+            if self._session is None:
+                self._session = pooled_session(self.max_connections, {'User-Agent': 'Mozilla/5.0'})
+            return self._session
+
+    def get_daily(self, stock_code, start_date, end_date, adjust="qfq"):
+        params = kline_params(stock_code, start_date, end_date, adjust)
+        session = self._get_session()
+        for attempt in range(self.retries + 1):
+            try:
+                response = session.get(KLINE_URL, params=params, timeout=self.timeout)
+                response.raise_for_status()
+                payload = response.json()
+                break
+            except Exception as e:
+                if attempt >= self.retries:
+                    logger.error(f"获取 {stock_code} 行情数据失败: {str(e)}")
+                    raise Exception(f"获取 {stock_code} 行情数据失败: {str(e)}")
+                time.sleep(0.2 * 2 ** attempt)
+
+        data = payload.get("data") or {}
+        return klines_to_frame(data.get("klines") or [])
+
+    def async_client(self):
+        """请求同一接口的 AsyncKlineClient，超时、连接数和重试次数与本数据源相同"""
+        return AsyncKlineClient(self.timeout, self.max_connections, self.retries)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+class LocalFileProvider(DataProvider):
+    """
+    从本地目录读取日线数据，不访问网络
+
+    文件为 <目录>/<复权方式>/<股票代码>.csv 或 .parquet（不复权为 none，与本地K线存储相同），
+    没有对应复权方式的文件时读取 <目录>/<股票代码>.csv / .parquet。
+    列名可以是 akshare 的中文列名或 date/open/close/high/low/volume。
+    读取过的文件按修改时间缓存在内存中，文件更新后自动重新读取。
+    """
+
+    name = 'local'
+
+    EXTENSIONS = ('.parquet', '.csv')
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def path(self, stock_code, adjust="qfq"):
+        """股票对应的文件路径，不存在时返回 None"""
+        for folder in (os.path.join(self.directory, adjust or 'none'), self.directory):
+            for extension in self.EXTENSIONS:
+                path = os.path.join(folder, f"{stock_code}{extension}")
+                if os.path.isfile(path):
+                    return path
+        return None
+
+    def _load(self, path):
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            cached = self._frames.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        if path.endswith('.parquet'):
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_csv(path, dtype={'股票代码': str})
+        df = normalize_frame(df)
+        with self._lock:
+            self._frames[path] = (mtime, df)
+        return df
+
+    def get_daily(self, stock_code, start_date, end_date, adjust="qfq"):
+        path = self.path(stock_code, adjust)
+        if path is None:
+            raise FileNotFoundError(f"本地没有 {stock_code} 的行情文件: {self.directory}")
+        df = self._load(path)
+        mask = (df['date'] >= pd.Timestamp(start_date)) & (df['date'] <= pd.Timestamp(end_date))
+        return df[mask].reset_index(drop=True)
+
+    def latest_quotes(self):
+        """目录中每只股票文件里的最后一根K线"""
+        rows = []
+        for stock_code in self.stock_list():
+            path = self.path(stock_code)
+            df = self._load(path) if path else None
+            if df is None or len(df) < 2:
+                continue
+            last = df.iloc[-1]
+            rows.append([stock_code, last['date']]
+                        + [float(last[name]) for name in ('open', 'high', 'low', 'close', 'volume')]
+                        + [float(df['close'].iloc[-2])])
+        return pd.DataFrame(rows, columns=QUOTE_COLUMNS)
+
+    def stock_list(self):
+        """目录中有行情文件的股票代码"""
+        codes = set()
+        for folder in [self.directory] + [os.path.join(self.directory, name) for name in ('qfq', 'hfq', 'none')]:
+            if os.path.isdir(folder):
+                codes.update(os.path.splitext(name)[0] for name in os.listdir(folder)
+                             if name.endswith(self.EXTENSIONS))
+        return sorted(codes)
+
+    def write(self, stock_code, df, adjust=None, file_format='csv'):
+        """
+        保存一只股票的日线数据，adjust 为 None 时写入目录根部（所有复权方式共用）
+
+        用于从其他数据源导出离线数据，例如 provider.write(code, analyzer.get_stock_data(code))
+        """
+        folder = self.directory if adjust is None else os.path.join(self.directory, adjust or 'none')
+        os.makedirs(folder, exist_ok=True)
+        df = df[['date'] + PRICE_COLUMNS]
+        if file_format == 'parquet':
+            path = os.path.join(folder, f"{stock_code}.parquet")
+            df.to_parquet(path, index=False)
+        else:
+            path = os.path.join(folder, f"{stock_code}.csv")
+            df.to_csv(path, index=False, date_format='%Y-%m-%d')
+        return path
+
+
+PROVIDERS = {
+    'akshare': AkshareProvider,
+    'eastmoney': EastmoneyProvider,
+    'local': LocalFileProvider,
+}
+
+
+def create_provider(name=None, directory=None):
+    """
+    按名称创建数据源
+
+    name: akshare、eastmoney 或 local，默认读取 MARKET_DATA_PROVIDER，akshare
+    directory: local 数据源的目录，默认读取 MARKET_DATA_DIR，data/market
+    """
+    name = (name or os.getenv('MARKET_DATA_PROVIDER', 'akshare')).lower()
+    if name not in PROVIDERS:
+        raise ValueError(f"不支持的数据源: {name}，可选 {', '.join(PROVIDERS)}")
+    if name == 'local':
+        return LocalFileProvider(directory or os.getenv('MARKET_DATA_DIR', os.path.join('data', 'market')))
+    return PROVIDERS[name]()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+技术指标缓存
+
+进程内共享的 LRU 缓存，保存已计算技术指标的 DataFrame，
+同一交易日内多个接口分析同一只股票时只需获取和计算一次。
+缓存的 DataFrame 按不可变的值共享，读写都不复制：写入后调用方不再修改它，
+读取方需要修改时（例如追加列）先自行 copy()。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+
+class IndicatorCache:
+    """带过期时间(TTL)的线程安全 LRU 缓存"""
+
+    def __init__(self, max_size=256, ttl=300, name='indicators'):
+        """
+        max_size: 最多缓存的条目数，超出后淘汰最久未使用的条目
+        ttl: 条目有效期（秒）
+        name: 命中/未命中计数（metrics.CACHE_LOOKUPS）中的缓存名
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """读取缓存（与缓存共享的只读数据）；未命中或已过期返回 None"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and time.time() - item[0] > self.ttl:
+                del self._items[key]
+                item = None
+            if item is not None:
+                self._items.move_to_end(key)
+        metrics.CACHE_LOOKUPS.inc(cache=self.name, result='miss' if item is None else 'hit')
+        return None if item is None else item[1]
+
+    def put(self, key, df):
+        """写入缓存，df 此后只读"""
+        with self._lock:
+            self._items[key] = (time.time(), df)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def keys(self):
+        """当前全部缓存键（含已过期未清理的条目）"""
+        with self._lock:
+            return list(self._items)
+
+    def discard(self, key):
+        """删除一个缓存条目"""
+        with self._lock:
+            self._items.pop(key, None)
+
+    def invalidate(self, stock_code):
+        """删除某只股票的全部缓存条目"""
+        with self._lock:
+            for key in [k for k in self._items if k[0] == stock_code]:
+                del self._items[key]
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._items.clear()
+
+    def memory_usage(self):
+        """缓存的全部 DataFrame 占用的内存（字节）"""
+        with self._lock:
+            frames = [item[1] for item in self._items.values()]
+        return sum(int(df.memory_usage(deep=True).sum()) for df in frames)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
@@ -0,0 +1,771 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+技术指标计算内核
+
+直接在连续的 float64 ndarray 上计算，所有函数沿第0维（时间）计算，
+既可以传入一维数组（单只股票），也可以传入 (日期 × 股票) 的二维数组。
+缺失值语义与 pandas rolling/ewm 保持一致：窗口内存在 NaN 或 ±inf 时结果为 NaN。
+滚动和、均值、标准差与 pandas 的结果不逐位相同（相对误差约 1e-12，见 PrefixSums）。
+评分比较的两个量在数学上相等时（例如 K 值与其3日均值 D 相同、收盘价恰好等于布林中轨），
+末位舍入可能使评分分支与 pandas 实现不同；其余情况下评分和建议与 pandas 实现一致。
+
+各指标通过 Workspace 取得派生序列和滚动结果，同一组K线上按不同参数多次计算时
+（参数扫描），相同的中间结果只计算一次。
+"""
+
+import math
+from collections import OrderedDict
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 滑动窗口按块计算时，每块最多展开的元素个数，控制临时内存
+_BLOCK_ELEMENTS = 1 << 22
+
+
+def as_float(x):
+    """转换为连续的 float64 数组"""
+    return np.ascontiguousarray(x, dtype=np.float64)
+
+
+def shift(x, periods):
+    """沿时间轴平移，periods 为正表示取过去的值，空出的位置填 NaN"""
+    x = as_float(x)
+    out = np.full(x.shape, np.nan)
+    if periods == 0:
+        out[:] = x
+    elif periods > 0:
+        out[periods:] = x[:-periods]
+    else:
+        out[:periods] = x[-periods:]
+    return out
+
+
+def diff(x, periods=1):
+    """与 Series.diff 相同"""
+    x = as_float(x)
+    return x - shift(x, periods)
+
+
+def pct_change(x, periods=1):
+    """与 Series.pct_change 相同"""
+    x = as_float(x)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return x / shift(x, periods) - 1
+
+
+def ema(x, span):
+    """指数移动平均，与 ewm(span=span, adjust=False).mean() 逐位一致"""
+    x = as_float(x)
+    alpha = 2.0 / (1.0 + span)
+    old_wt = 1.0 - alpha
+    denom = old_wt + alpha
+    out = np.empty(x.shape)
+    if x.shape[0] == 0:
+        return out
+
+    if x.ndim == 1:
+        # 一维时用 Python 浮点数递推，避免逐元素调用 NumPy 的开销
+        values = x.tolist()
+        weighted = values[0]
+        result = [weighted]
+        for cur in values[1:]:
+            if weighted != weighted:
+                weighted = cur
+            elif cur == cur and weighted != cur:
+                weighted = (old_wt * weighted + alpha * cur) / denom
+            result.append(weighted)
+        out[:] = result
+        return out
+
+    # 二维时按行递推，每一步对所有股票向量化。时间方向仍是 Python 循环：EMA 的闭式解（衰减因子的
+    # 累积乘积）或分块递推都会改变舍入，不再与 pandas 逐位一致，EMA5/EMA20、MACD/Signal 的比较
+    # 可能因此翻转；面板上每一步处理全部股票，循环开销按K线数而不是股票数增长
+    out[0] = x[0]
+    for i in range(1, x.shape[0]):
+        weighted = out[i - 1]
+        cur = x[i]
+        updated = (old_wt * weighted + alpha * cur) / denom
+        updated = np.where((weighted == cur) | np.isnan(cur), weighted, updated)
+        out[i] = np.where(np.isnan(weighted), cur, updated)
+    return out
+
+
+def ema_family(x, spans):
+    """
+    一次递推同时计算多个周期的 EMA，返回与 spans 顺序对应的列表，结果与逐个调用 ema 逐位一致
+
+    二维输入时把各周期叠在最后一维，时间方向只循环一遍（时间方向无法向量化的原因见 ema）；
+    一维输入逐个周期计算更快
+    """
+    x = as_float(x)
+    spans = list(spans)
+    if x.ndim == 1 or len(spans) <= 1 or x.shape[0] == 0:
+        return [ema(x, span) for span in spans]
+
+    alpha = 2.0 / (1.0 + np.asarray(spans, dtype=np.float64))
+    old_wt = 1.0 - alpha
+    denom = old_wt + alpha
+    values = np.repeat(x[..., None], len(spans), axis=-1)
+    out = np.empty(values.shape)
+    out[0] = values[0]
+    for i in range(1, x.shape[0]):
+        weighted = out[i - 1]
+        cur = values[i]
+        updated = (old_wt * weighted + alpha * cur) / denom
+        updated = np.where((weighted == cur) | np.isnan(cur), weighted, updated)
+        out[i] = np.where(np.isnan(weighted), cur, updated)
+    return [np.ascontiguousarray(out[..., k]) for k in range(len(spans))]
+
+
+def _prefix(values, dtype):
+    """沿时间轴的累积和，首行前补0，任意窗口的和为两行之差"""
+    zero = np.zeros((1,) + values.shape[1:], dtype=dtype)
+    return np.concatenate([zero, np.cumsum(values, axis=0, dtype=dtype)])
+
+
+def _window_diff(total, window):
+    """由累积和得到每个完整窗口的和"""
+    return total[window:] - total[:-window]
+
+
+def _window_counts(mask, window):
+    """布尔数组在每个完整窗口内为真的个数"""
+    return _window_diff(_prefix(mask, np.int64), window)
+
+
+class PrefixSums:
+    """
+    一个序列的累积量，任意窗口的滚动和、滚动均值都由它做一次减法得到
+
+    累积和使用扩展精度计算后相减，窗口和与 pandas 的补偿求和结果不保证逐位相同：
+    误差来自累积和的舍入，与窗口内数值的量级相当，窗口内正负抵消时相对误差较大，实测在 1e-12 以内
+    """
+
+    def __init__(self, x):
+        self.x = as_float(x)
+        finite = np.isfinite(self.x)
+        self.values = np.where(finite, self.x, 0.0)
+        self._total = _prefix(self.values, np.longdouble)
+        self._finite = _prefix(finite, np.int64)
+        # 与前一个值相同的次数等于 window-1 时窗口内数值完全相同
+        self._same = _prefix(self.x[1:] == self.x[:-1], np.int64)
+        self._negative = None
+        self._positive = None
+
+    def _core(self, window):
+        """返回 (窗口和, 窗口是否完整有效, 窗口内数值是否完全相同)，只覆盖第 window-1 行之后"""
+        window_sum = _window_diff(self._total, window).astype(np.float64)
+        valid = _window_diff(self._finite, window) == window
+        if window > 1:
+            constant = _window_diff(self._same, window - 1) == window - 1
+        else:
+            constant = np.ones(window_sum.shape, dtype=bool)
+        return window_sum, valid, constant
+
+    def sum(self, window):
+        """滚动求和，窗口不完整或含非有限值时为 NaN"""
+        out = np.full(self.x.shape, np.nan)
+        if self.x.shape[0] < window:
+            return out
+
+        window_sum, valid, constant = self._core(window)
+        # 与 pandas 一致：窗口内数值完全相同时直接取 值×窗口长度，避免舍入误差
+        window_sum = np.where(constant, self.x[window - 1:] * window, window_sum)
+        out[window - 1:] = np.where(valid, window_sum, np.nan)
+        return out
+
+    def mean(self, window):
+        """滚动均值，窗口不完整或含非有限值时为 NaN"""
+        out = np.full(self.x.shape, np.nan)
+        if self.x.shape[0] < window:
+            return out
+
+        window_sum, valid, constant = self._core(window)
+        mean = window_sum / window
+        # 与 pandas 一致：全为非负数时均值不为负，全为非正数时均值不为正
+        if self._negative is None:
+            self._negative = _prefix(self.values < 0, np.int64)
+            self._positive = _prefix(self.values > 0, np.int64)
+        negative = _window_diff(self._negative, window)
+        positive = _window_diff(self._positive, window)
+        mean = np.where((negative == 0) & (mean < 0), 0.0, mean)
+        mean = np.where((positive == 0) & (mean > 0), 0.0, mean)
+        mean = np.where(constant, self.x[window - 1:], mean)
+        out[window - 1:] = np.where(valid, mean, np.nan)
+        return out
+
+
+def rolling_sum(x, window):
+    """滚动求和，基于累积和计算，窗口不完整或含非有限值时为 NaN"""
+    return PrefixSums(x).sum(window)
+
+
+def rolling_mean(x, window):
+    """滚动均值，基于累积和计算，窗口不完整或含非有限值时为 NaN"""
+    return PrefixSums(x).mean(window)
+
+
+def _rolling_reduce(x, window, reduce):
+    """按块在滑动窗口视图上做归约，reduce(block) 在最后一维上计算"""
+    x = as_float(x)
+    out = np.full(x.shape, np.nan)
+    if x.shape[0] < window:
+        return out
+
+    x = np.where(np.isfinite(x), x, np.nan)
+    view = sliding_window_view(x, window, axis=0)
+    rows_per_block = max(1, _BLOCK_ELEMENTS // max(1, view[0].size))
+    for start in range(0, view.shape[0], rows_per_block):
+        block = view[start:start + rows_per_block]
+        out[window - 1 + start:window - 1 + start + block.shape[0]] = reduce(block)
+    return out
+
+
+def rolling_max(x, window):
+    """滚动最大值"""
+    return _rolling_reduce(x, window, lambda block: block.max(axis=-1))
+
+
+def rolling_min(x, window):
+    """滚动最小值"""
+    return _rolling_reduce(x, window, lambda block: block.min(axis=-1))
+
+
+def rolling_std(x, window, ddof=1):
+    """
+    滚动标准差（两遍法），窗口内数值完全相同时结果精确为0
+
+    按窗口内的位置依次累加，每个窗口的求和顺序与输入是一维还是 (日期 × 股票) 二维无关，
+    面板结果与逐只计算逐位一致
+    """
+    x = as_float(x)
+    out = np.full(x.shape, np.nan)
+    rows = x.shape[0] - window + 1
+    if rows <= 0:
+        return out
+
+    x = np.where(np.isfinite(x), x, np.nan)
+    last = x[window - 1:]
+    total = x[:rows].copy()
+    constant = x[:rows] == last
+    for k in range(1, window):
+        total += x[k:k + rows]
+        constant &= x[k:k + rows] == last
+    mean = total / window
+    squares = np.zeros(mean.shape)
+    for k in range(window):
+        squares += (x[k:k + rows] - mean) ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.sqrt(squares / (window - ddof))
+    out[window - 1:] = np.where(constant, 0.0, std)
+    return out
+
+
+def true_range(high, low, close):
+    """真实波幅，首根K线没有前收盘价时取当日振幅"""
+    high, low = as_float(high), as_float(low)
+    close_prev = shift(close, 1)
+    tr = np.fmax(high - low, np.abs(high - close_prev))
+    return np.fmax(tr, np.abs(low - close_prev))
+
+
+def typical_price(high, low, close):
+    """典型价格 (H+L+C)/3"""
+    return (as_float(high) + as_float(low) + as_float(close)) / 3
+
+
+def _directional_moves(ws):
+    """
+    (+DM, -DM)，与原实现一致：下降幅度取当日最低价与次日最低价之差的绝对值
+
+    因此某根K线的 ±DM（以及 ADX/±DI）用到了下一根K线的最低价。workspace.causal 为 True 时
+    下降幅度取前一日最低价减当日最低价（Wilder 的定义），只用到当日及之前的数据，用于回测等历史评估
+    """
+    up_move = diff(ws.series('high'))
+    if ws.causal:
+        down_move = -diff(ws.series('low'))
+    else:
+        down_move = np.abs(diff(ws.series('low'), -1))
+    with np.errstate(invalid='ignore'):
+        plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+        minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+    return plus_dm, minus_dm
+
+
+def _money_flows(ws):
+    """MFI 的 (正资金流, 负资金流)"""
+    tp = ws.series('tp')
+    raw_money_flow = tp * ws.series('volume')
+    tp_prev = shift(tp, 1)
+    with np.errstate(invalid='ignore'):
+        return np.where(tp > tp_prev, raw_money_flow, 0.0), np.where(tp < tp_prev, raw_money_flow, 0.0)
+
+
+def _close_delta(ws):
+    return diff(ws.series('close'))
+
+
+# 与参数无关的派生序列：名称 -> 由 Workspace 计算的函数
+_DERIVED_SERIES = {
+    'tr': lambda ws: true_range(ws.series('high'), ws.series('low'), ws.series('close')),
+    'tp': lambda ws: typical_price(ws.series('high'), ws.series('low'), ws.series('close')),
+    'gain': lambda ws: np.where(ws.series('delta') > 0, ws.series('delta'), 0.0),
+    'loss': lambda ws: -np.where(ws.series('delta') < 0, ws.series('delta'), 0.0),
+    'delta': _close_delta,
+    'plus_dm': lambda ws: ws.memo('directional_moves', lambda: _directional_moves(ws))[0],
+    'minus_dm': lambda ws: ws.memo('directional_moves', lambda: _directional_moves(ws))[1],
+    'positive_flow': lambda ws: ws.memo('money_flows', lambda: _money_flows(ws))[0],
+    'negative_flow': lambda ws: ws.memo('money_flows', lambda: _money_flows(ws))[1],
+}
+
+
+class Workspace:
+    """
+    同一组K线上计算指标的中间结果
+
+    序列用名称标识：输入 high/low/close/volume、_DERIVED_SERIES 中的派生序列，
+    以及指标计算时用 define 注册的依赖参数的序列（计算函数只通过 workspace 取依赖，
+    被淘汰后可以重新计算）。相同的 (运算, 序列, 窗口) 只计算一次，
+    每个序列的累积和只计算一次，供所有窗口长度共享。
+    max_items 限制缓存的结果个数（最久未使用的先淘汰），None 表示不限制；
+    返回的数组可能被其他调用共享，调用方不应原地修改。
+    causal 为 True 时 ADX/±DI 不使用下一根K线的数据（见 _directional_moves）。
+    """
+
+    def __init__(self, high=None, low=None, close=None, volume=None, max_items=None, causal=False):
+        self._inputs = {}
+        for name, values in (('high', high), ('low', low), ('close', close), ('volume', volume)):
+            if values is not None:
+                self._inputs[name] = as_float(values)
+        self._factories = dict(_DERIVED_SERIES)
+        self._memo = OrderedDict()
+        self.max_items = max_items
+        self.causal = causal
+
+    def set(self, name, values):
+        """直接提供某个序列（例如已经算好的真实波幅）"""
+        self._inputs[name] = as_float(values)
+
+    def define(self, name, compute):
+        """注册序列的计算方法 compute(workspace)，同名序列只注册一次"""
+        self._factories.setdefault(name, compute)
+
+    def memo(self, key, compute):
+        """读取缓存结果，未命中时调用 compute() 计算并缓存"""
+        if key in self._memo:
+            self._memo.move_to_end(key)
+            return self._memo[key]
+        value = compute()
+        self._memo[key] = value
+        if self.max_items is not None:
+            while len(self._memo) > self.max_items:
+                self._memo.popitem(last=False)
+        return value
+
+    def series(self, name):
+        """按名称取序列"""
+        if name in self._inputs:
+            return self._inputs[name]
+        return self.memo(('series', name), lambda: self._factories[name](self))
+
+    def prefix(self, name):
+        return self.memo(('prefix', name), lambda: PrefixSums(self.series(name)))
+
+    def sum(self, name, window):
+        return self.memo(('sum', name, window), lambda: self.prefix(name).sum(window))
+
+    def mean(self, name, window):
+        return self.memo(('mean', name, window), lambda: self.prefix(name).mean(window))
+
+    def max(self, name, window):
+        return self.memo(('max', name, window), lambda: rolling_max(self.series(name), window))
+
+    def min(self, name, window):
+        return self.memo(('min', name, window), lambda: rolling_min(self.series(name), window))
+
+    def std(self, name, window):
+        return self.memo(('std', name, window), lambda: rolling_std(self.series(name), window))
+
+    def ema(self, name, span):
+        return self.ema_family(name, [span])[0]
+
+    def ema_family(self, name, spans):
+        """多个周期的 EMA，尚未计算的周期在一次递推中一起计算"""
+        missing = sorted({span for span in spans if ('ema', name, span) not in self._memo})
+        if missing:
+            for span, values in zip(missing, ema_family(self.series(name), missing)):
+                self.memo(('ema', name, span), lambda values=values: values)
+        return [self.memo(('ema', name, span), lambda span=span: ema(self.series(name), span))
+                for span in spans]
+
+
+def _workspace(high=None, low=None, close=None, volume=None, tr=None, tp=None):
+    """单次计算用的 Workspace，可直接提供已计算的真实波幅和典型价格"""
+    ws = Workspace(high, low, close, volume)
+    if tr is not None:
+        ws.set('tr', tr)
+    if tp is not None:
+        ws.set('tp', tp)
+    return ws
+
+
+def _rsi(ws, period):
+    gain = ws.mean('gain', period)
+    loss = ws.mean('loss', period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = gain / loss
+        return 100 - (100 / (1 + rs))
+
+
+def rsi(close, period):
+    """RSI，涨跌幅使用简单移动平均"""
+    return _rsi(_workspace(close=close), period)
+
+
+def _macd(ws, fast, slow, signal_period):
+    name = ('macd_line', fast, slow)
+    ws.define(name, lambda ws: ws.ema('close', fast) - ws.ema('close', slow))
+    return ws.series(name), ws.ema(name, signal_period)
+
+
+def macd(close, fast=12, slow=26, signal_period=9):
+    """MACD，返回 (MACD, Signal, Hist)"""
+    line, signal = _macd(_workspace(close=close), fast, slow, signal_period)
+    return line, signal, line - signal
+
+
+def _bollinger_bands(ws, period, std_dev):
+    middle = ws.mean('close', period)
+    std = ws.std('close', period)
+    return middle + (std * std_dev), middle, middle - (std * std_dev)
+
+
+def bollinger_bands(close, period, std_dev):
+    """布林带，返回 (上轨, 中轨, 下轨)"""
+    return _bollinger_bands(_workspace(close=close), period, std_dev)
+
+
+def atr(high, low, close, period, tr=None):
+    """ATR，可传入已计算的真实波幅"""
+    return _workspace(high, low, close, tr=tr).mean('tr', period)
+
+
+def _stochastic(ws, k_period, d_period):
+    name = ('stoch_k', k_period)
+
+    def compute_k(ws):
+        high_roll = ws.max('high', k_period)
+        low_roll = ws.min('low', k_period)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 100 * (ws.series('close') - low_roll) / (high_roll - low_roll)
+
+    ws.define(name, compute_k)
+    return ws.series(name), ws.mean(name, d_period)
+
+
+def stochastic(high, low, close, k_period, d_period):
+    """随机震荡指标，返回 (K, D)"""
+    return _stochastic(_workspace(high, low, close), k_period, d_period)
+
+
+def _cci(ws, period):
+    tp = ws.series('tp')
+    mean_tp = ws.mean('tp', period)
+    name = ('cci_deviation', period)
+    ws.define(name, lambda ws: np.abs(ws.series('tp') - ws.mean('tp', period)))
+    mean_deviation = ws.mean(name, period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (tp - mean_tp) / (0.015 * mean_deviation)
+
+
+def cci(high, low, close, period, tp=None):
+    """顺势指标，可传入已计算的典型价格"""
+    return _cci(_workspace(high, low, close, tp=tp), period)
+
+
+def _directional_index(ws, dm, period):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 * ws.mean(dm, period) / ws.mean('tr', period)
+
+
+def _dx(ws, period):
+    plus_di = ws.series(('plus_di', period))
+    minus_di = ws.series(('minus_di', period))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 * np.abs(plus_di - minus_di) / (plus_di + minus_di)
+
+
+def _adx(ws, period):
+    ws.define(('plus_di', period), lambda ws: _directional_index(ws, 'plus_dm', period))
+    ws.define(('minus_di', period), lambda ws: _directional_index(ws, 'minus_dm', period))
+    ws.define(('dx', period), lambda ws: _dx(ws, period))
+    return ws.mean(('dx', period), period), ws.series(('plus_di', period)), ws.series(('minus_di', period))
+
+
+def adx(high, low, close, period, tr=None):
+    """平均趋向指数，返回 (ADX, DI+, DI-)"""
+    return _adx(_workspace(high, low, close, tr=tr), period)
+
+
+def _ichimoku(ws, tenkan_period, kijun_period, senkou_span_b_period):
+    tenkan_sen = (ws.max('high', tenkan_period) + ws.min('low', tenkan_period)) / 2
+    kijun_sen = (ws.max('high', kijun_period) + ws.min('low', kijun_period)) / 2
+    senkou_span_a = shift((tenkan_sen + kijun_sen) / 2, kijun_period)
+    senkou_b = (ws.max('high', senkou_span_b_period) + ws.min('low', senkou_span_b_period)) / 2
+    senkou_span_b = shift(senkou_b, kijun_period)
+    chikou_span = shift(ws.series('close'), -kijun_period)
+    return tenkan_sen, kijun_sen, senkou_span_a, senkou_span_b, chikou_span
+
+
+def ichimoku(high, low, close, tenkan_period, kijun_period, senkou_span_b_period):
+    """一目均衡表，返回 (转换线, 基准线, 先行带A, 先行带B, 延迟线)"""
+    return _ichimoku(_workspace(high, low, close), tenkan_period, kijun_period, senkou_span_b_period)
+
+
+def obv(close, volume):
+    """能量潮，用涨跌方向乘成交量再累加"""
+    direction = np.sign(diff(close))
+    flow = np.where(np.isnan(direction), 0.0, direction * as_float(volume))
+    flow[0] = 0.0
+    return np.cumsum(flow, axis=0)
+
+
+def _mfi(ws, period):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        money_ratio = ws.sum('positive_flow', period) / ws.sum('negative_flow', period)
+        return 100 - (100 / (1 + money_ratio))
+
+
+def mfi(high, low, close, volume, period, tp=None):
+    """资金流量指标，可传入已计算的典型价格"""
+    return _mfi(_workspace(high, low, close, volume, tp=tp), period)
+
+
+def _z_score(ws, period):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (ws.series('close') - ws.mean('close', period)) / ws.std('close', period)
+
+
+def z_score(close, period):
+    """Z-Score"""
+    return _z_score(_workspace(close=close), period)
+
+
+# 只计算最新值时 EMA 类指标的默认收敛容差，见 ema_horizon。截断误差约为容差乘以价格偏离，
+# 1e-6 时远小于 EMA5/EMA20/EMA60、MACD/Signal 之间通常的差距，评分分支与完整历史一致
+DEFAULT_EMA_TOLERANCE = 1e-6
+
+
+def ema_horizon(span, tolerance=DEFAULT_EMA_TOLERANCE):
+    """
+    EMA 的预热长度：只用最后 n 根K线时，以首根收盘价为初始值递推 n-1 次，初始值的影响衰减为
+    (1-alpha)^(n-1)，取使其不超过 tolerance 的最小 n，即截断后的 EMA 与完整历史的 EMA 之差
+    不超过 tolerance × 截断处价格与 EMA 的偏离
+    """
+    decay = 1.0 - 2.0 / (1.0 + span)
+    if decay <= 0:
+        return 1
+    return max(1, math.ceil(math.log(tolerance) / math.log(decay)) + 1)
+
+
+class IndicatorNode:
+    """
+    指标依赖图中的一个输出列
+
+    deps 为依赖的其他输出列，compute(ws, params, *依赖列的值) 返回本列；
+    close_emas(params) 返回本列用到的收盘价 EMA 周期，用于一次递推算出所需的全部周期；
+    warmup(params, tolerance) 返回使最后一根K线的值与完整历史一致（EMA 类在容差内）所需的K线数
+    """
+
+    def __init__(self, compute, deps=(), close_emas=None, warmup=None):
+        self.compute = compute
+        self.deps = tuple(deps)
+        self.close_emas = close_emas
+        self.warmup = warmup
+
+
+def _ma(params, period):
+    return params['ma_periods'][period]
+
+
+def _ichimoku_period(params, name):
+    return params['ichimoku'][name]
+
+
+def _senkou_a(ws, params, tenkan_sen, kijun_sen):
+    return shift((tenkan_sen + kijun_sen) / 2, _ichimoku_period(params, 'kijun'))
+
+
+def _senkou_b(ws, params):
+    period = _ichimoku_period(params, 'senkou_span_b')
+    senkou_b = (ws.max('high', period) + ws.min('low', period)) / 2
+    return shift(senkou_b, _ichimoku_period(params, 'kijun'))
+
+
+def _midpoint(ws, period):
+    return (ws.max('high', period) + ws.min('low', period)) / 2
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return numerator / denominator
+
+
+# 输出列的依赖图，顺序即 calculate_indicators 添加列的顺序。
+# 真实波幅、典型价格、各窗口滚动结果等公共子表达式由 Workspace 缓存，被多个指标共享时只计算一次
+INDICATORS = {
+    # 一、趋势类指标
+    'SMA5': IndicatorNode(lambda ws, p: ws.mean('close', _ma(p, 'short')),
+                          warmup=lambda p, tol: _ma(p, 'short')),
+    'SMA20': IndicatorNode(lambda ws, p: ws.mean('close', _ma(p, 'medium')),
+                           warmup=lambda p, tol: _ma(p, 'medium')),
+    'SMA60': IndicatorNode(lambda ws, p: ws.mean('close', _ma(p, 'long')),
+                           warmup=lambda p, tol: _ma(p, 'long')),
+    'EMA5': IndicatorNode(lambda ws, p: ws.ema('close', _ma(p, 'short')),
+                          close_emas=lambda p: [_ma(p, 'short')],
+                          warmup=lambda p, tol: ema_horizon(_ma(p, 'short'), tol)),
+    'EMA20': IndicatorNode(lambda ws, p: ws.ema('close', _ma(p, 'medium')),
+                           close_emas=lambda p: [_ma(p, 'medium')],
+                           warmup=lambda p, tol: ema_horizon(_ma(p, 'medium'), tol)),
+    'EMA60': IndicatorNode(lambda ws, p: ws.ema('close', _ma(p, 'long')),
+                           close_emas=lambda p: [_ma(p, 'long')],
+                           warmup=lambda p, tol: ema_horizon(_ma(p, 'long'), tol)),
+    'MACD': IndicatorNode(lambda ws, p: _macd(ws, 12, 26, 9)[0], close_emas=lambda p: [12, 26],
+                          warmup=lambda p, tol: ema_horizon(26, tol)),
+    'Signal': IndicatorNode(lambda ws, p: _macd(ws, 12, 26, 9)[1], close_emas=lambda p: [12, 26],
+                            warmup=lambda p, tol: ema_horizon(26, tol) + ema_horizon(9, tol)),
+    'MACD_hist': IndicatorNode(lambda ws, p, line, signal: line - signal, deps=('MACD', 'Signal')),
+    'BB_upper': IndicatorNode(lambda ws, p, middle: middle + (ws.std('close', p['bollinger_period'])
+                                                              * p['bollinger_std']), deps=('BB_middle',)),
+    'BB_middle': IndicatorNode(lambda ws, p: ws.mean('close', p['bollinger_period']),
+                               warmup=lambda p, tol: p['bollinger_period']),
+    'BB_lower': IndicatorNode(lambda ws, p, middle: middle - (ws.std('close', p['bollinger_period'])
+                                                              * p['bollinger_std']), deps=('BB_middle',)),
+    # 真实波幅和趋向变动需要前一根K线，DX 再做一次 period 窗口的均值
+    'ADX': IndicatorNode(lambda ws, p: _adx(ws, p['adx_period'])[0],
+                         warmup=lambda p, tol: 2 * p['adx_period']),
+    'DI+': IndicatorNode(lambda ws, p: _adx(ws, p['adx_period'])[1],
+                         warmup=lambda p, tol: p['adx_period'] + 1),
+    'DI-': IndicatorNode(lambda ws, p: _adx(ws, p['adx_period'])[2],
+                         warmup=lambda p, tol: p['adx_period'] + 1),
+    'Tenkan': IndicatorNode(lambda ws, p: _midpoint(ws, _ichimoku_period(p, 'tenkan')),
+                            warmup=lambda p, tol: _ichimoku_period(p, 'tenkan')),
+    'Kijun': IndicatorNode(lambda ws, p: _midpoint(ws, _ichimoku_period(p, 'kijun')),
+                           warmup=lambda p, tol: _ichimoku_period(p, 'kijun')),
+    'Senkou_A': IndicatorNode(_senkou_a, deps=('Tenkan', 'Kijun'),
+                              warmup=lambda p, tol: _ichimoku_period(p, 'kijun') + max(
+                                  _ichimoku_period(p, 'tenkan'), _ichimoku_period(p, 'kijun'))),
+    'Senkou_B': IndicatorNode(_senkou_b, warmup=lambda p, tol: _ichimoku_period(p, 'kijun')
+                              + _ichimoku_period(p, 'senkou_span_b')),
+    'Chikou': IndicatorNode(lambda ws, p: shift(ws.series('close'), -_ichimoku_period(p, 'kijun')),
+                            warmup=lambda p, tol: 1),
+
+    # 二、动量类指标
+    'RSI': IndicatorNode(lambda ws, p: _rsi(ws, p['rsi_period']),
+                         warmup=lambda p, tol: p['rsi_period'] + 1),
+    'Stoch_K': IndicatorNode(lambda ws, p: _stochastic(ws, p['stochastic_k'], p['stochastic_d'])[0],
+                             warmup=lambda p, tol: p['stochastic_k']),
+    'Stoch_D': IndicatorNode(lambda ws, p: _stochastic(ws, p['stochastic_k'], p['stochastic_d'])[1],
+                             warmup=lambda p, tol: p['stochastic_k'] + p['stochastic_d'] - 1),
+    'CCI': IndicatorNode(lambda ws, p: _cci(ws, p['cci_period']),
+                         warmup=lambda p, tol: 2 * p['cci_period'] - 1),
+    'ROC': IndicatorNode(lambda ws, p: ws.memo('roc', lambda: pct_change(ws.series('close'), 10) * 100),
+                         warmup=lambda p, tol: 11),
+
+    # 三、成交量类指标
+    # OBV 是从第一根K线开始的累积量，截断历史后整体相差一个常数，只有差值（趋势）与完整历史一致
+    'OBV': IndicatorNode(lambda ws, p: ws.memo('obv', lambda: obv(ws.series('close'), ws.series('volume'))),
+                         warmup=lambda p, tol: 2),
+    'Volume_MA': IndicatorNode(lambda ws, p: ws.mean('volume', p['volume_ma_period']),
+                               warmup=lambda p, tol: p['volume_ma_period']),
+    'Volume_Ratio': IndicatorNode(lambda ws, p, volume_ma: _ratio(ws.series('volume'), volume_ma),
+                                  deps=('Volume_MA',)),
+    'MFI': IndicatorNode(lambda ws, p: _mfi(ws, p['mfi_period']),
+                         warmup=lambda p, tol: p['mfi_period'] + 1),
+
+    # 四、波动率类指标
+    'ATR': IndicatorNode(lambda ws, p: ws.mean('tr', p['atr_period']),
+                         warmup=lambda p, tol: p['atr_period'] + 1),
+    'Volatility': IndicatorNode(lambda ws, p, atr_values: _ratio(atr_values, ws.series('close')) * 100,
+                                deps=('ATR',)),
+    'StdDev': IndicatorNode(lambda ws, p: ws.std('close', p['std_dev_period']),
+                            warmup=lambda p, tol: p['std_dev_period']),
+
+    # 五、统计套利类指标
+    'Z-Score': IndicatorNode(lambda ws, p: _z_score(ws, p['z_score_period']),
+                             warmup=lambda p, tol: p['z_score_period']),
+}
+
+
+def resolve_fields(fields=None):
+    """
+    检查并返回要计算的输出列（保持请求顺序，去重），None 表示全部
+
+    以及按依赖顺序排列的完整计算计划（包含被依赖的列）
+    """
+    if fields is None:
+        fields = list(INDICATORS)
+    else:
+        fields = list(dict.fromkeys(fields))
+        unknown = [name for name in fields if name not in INDICATORS]
+        if unknown:
+            raise Exception(f"未知的技术指标: {', '.join(unknown)}")
+
+    plan = []
+    visited = set()
+
+    def visit(name):
+        if name in visited:
+            return
+        visited.add(name)
+        for dep in INDICATORS[name].deps:
+            visit(dep)
+        plan.append(name)
+
+    for name in fields:
+        visit(name)
+    return fields, plan
+
+
+def warmup_bars(params, fields=None, tolerance=DEFAULT_EMA_TOLERANCE):
+    """
+    只需要最后一根K线的 fields 时至少要计算的K线数
+
+    滚动类指标取窗口长度（用到前一根K线的再加1），EMA 类取 ema_horizon，
+    由其他列派生的取所依赖列的最大值
+    """
+    _, plan = resolve_fields(fields)
+    bars = {}
+    for name in plan:
+        node = INDICATORS[name]
+        own = node.warmup(params, tolerance) if node.warmup else 1
+        bars[name] = max([own] + [bars[dep] for dep in node.deps])
+    return max(bars.values())
+
+
+def compute_indicators(high, low, close, volume, params, workspace=None, fields=None, causal=False):
+    """
+    计算 calculate_indicators 的指标，返回 {列名: 数组}
+
+    fields 为 None 时计算全部列，顺序与 DataFrame 列一致；否则只计算 fields 及其依赖，
+    按 fields 的顺序返回。params 为 StockAnalyzer.params 格式的参数字典。
+    按多组参数计算同一组K线时传入同一个 workspace（此时 high/low/close/volume 可以为 None），共享中间结果。
+    causal 为 True 时每根K线的指标只用到当日及之前的数据（传入 workspace 时由 workspace.causal 决定）
+    """
+    ws = workspace if workspace is not None else Workspace(high, low, close, volume, causal=causal)
+    fields, plan = resolve_fields(fields)
+
+    # 计划中用到的收盘价 EMA 周期一次递推算出
+    spans = [span for name in plan if INDICATORS[name].close_emas
+             for span in INDICATORS[name].close_emas(params)]
+    if spans:
+        ws.ema_family('close', list(dict.fromkeys(spans)))
+
+    values = {}
+    for name in plan:
+        node = INDICATORS[name]
+        values[name] = node.compute(ws, params, *(values[dep] for dep in node.deps))
+    return {name: values[name] for name in fields}
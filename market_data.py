@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+异步行情数据获取
+
+直接请求东方财富日K线接口（akshare 的 stock_zh_a_hist 使用的同一接口），
+用一个共享的 httpx.AsyncClient 复用连接，等待网络时不占用线程。
+返回的 DataFrame 与 data_providers.EastmoneyProvider 格式一致（date/open/close/high/low/volume）。
+"""
+
+import asyncio
+import logging
+import os
+
+import pandas as pd
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+KLINE_URL = "https://push2his.eastmoney.com/api/qt/stock/kline/get"
+
+# 复权方式 -> 接口参数 fqt
+ADJUST_CODES = {"": "0", "qfq": "1", "hfq": "2"}
+
+# 接口参数 ut：东方财富网页端使用的公开令牌（akshare 使用同一个值），接口更换令牌时通过 EASTMONEY_UT 覆盖
+EASTMONEY_UT = os.getenv('EASTMONEY_UT', '7eea3edcaed734bea9cbfc24409ed989')
+
+# klines 中每个逗号分隔字段的含义，只保留分析用到的列
+KLINE_COLUMNS = ["date", "open", "close", "high", "low", "volume", "amount",
+                 "amplitude", "pct_change", "change", "turnover"]
+PRICE_COLUMNS = ["open", "close", "high", "low", "volume"]
+
+
+def market_id(stock_code):
+    """东方财富的市场编号：沪市（6、9开头）为1，其余为0"""
+    return "1" if stock_code.startswith(("6", "9")) else "0"
+
+
+def kline_params(stock_code, start_date, end_date, adjust="qfq"):
+    """日K线接口的请求参数，同步（EastmoneyProvider）和异步客户端共用"""
+    return {
+        "fields1": "f1,f2,f3,f4,f5,f6",
+        "fields2": "f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61",
+        "ut": EASTMONEY_UT,
+        "klt": "101",
+        "fqt": ADJUST_CODES.get(adjust or "", "0"),
+        "secid": f"{market_id(stock_code)}.{stock_code}",
+        "beg": start_date,
+        "end": end_date,
+    }
+
+
+def klines_to_frame(klines):
+    """把接口返回的 klines 字符串列表解析为 date/open/close/high/low/volume 的 DataFrame"""
+    if not klines:
+        return pd.DataFrame({name: pd.Series(dtype='datetime64[ns]' if name == 'date' else 'float64')
+                             for name in ["date"] + PRICE_COLUMNS})
+    df = pd.DataFrame([line.split(",") for line in klines]).iloc[:, :len(KLINE_COLUMNS)]
+    df.columns = KLINE_COLUMNS[:df.shape[1]]
+    df = df[["date"] + PRICE_COLUMNS]
+
+    # 与 _fetch_stock_data 相同的清洗步骤
+    df['date'] = pd.to_datetime(df['date'])
+    df[PRICE_COLUMNS] = df[PRICE_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    df = df.dropna()
+    return df.sort_values('date').reset_index(drop=True)
+
+
+class AsyncKlineClient:
+    """异步日K线客户端，所有请求共享一个连接池"""
+
+    def __init__(self, timeout=None, max_connections=None, retries=None):
+        """
+        timeout: 单次请求超时（秒），默认读取 MARKET_DATA_TIMEOUT，10秒
+        max_connections: 连接池上限，默认读取 MARKET_DATA_MAX_CONNECTIONS，100
+        retries: 失败后的重试次数，默认读取 MARKET_DATA_RETRIES，2次
+        """
+        self.timeout = float(timeout if timeout is not None else os.getenv('MARKET_DATA_TIMEOUT', 10))
+        self.max_connections = int(max_connections if max_connections is not None
+                                   else os.getenv('MARKET_DATA_MAX_CONNECTIONS', 100))
+        self.retries = int(retries if retries is not None else os.getenv('MARKET_DATA_RETRIES', 2))
+        self._client = None
+
+    def _get_client(self):
+        """首次使用时创建 AsyncClient，必须在事件循环中调用"""
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                headers={"User-Agent": "Mozilla/5.0"},
+            )
+        return self._client
+
+    async def fetch(self, stock_code, start_date, end_date, adjust="qfq"):
+        """获取 [start_date, end_date]（YYYYMMDD）区间的日K线"""
+        params = kline_params(stock_code, start_date, end_date, adjust)
+        client = self._get_client()
+        with metrics.STAGE_SECONDS.time(stage='fetch'):
+            for attempt in range(self.retries + 1):
+                try:
+                    response = await client.get(KLINE_URL, params=params)
+                    response.raise_for_status()
+                    payload = response.json()
+                    break
+                except Exception as e:
+                    if attempt >= self.retries:
+                        metrics.UPSTREAM_REQUESTS.inc(source='eastmoney', result='error')
+                        logger.error(f"获取 {stock_code} 行情数据失败: {str(e)}")
+                        raise Exception(f"获取 {stock_code} 行情数据失败: {str(e)}")
+                    await asyncio.sleep(0.2 * 2 ** attempt)
+        metrics.UPSTREAM_REQUESTS.inc(source='eastmoney', result='ok')
+
+        data = payload.get("data") or {}
+        return klines_to_frame(data.get("klines") or [])
+
+    async def aclose(self):
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
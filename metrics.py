@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+运行指标
+
+进程内的计数器、直方图和仪表，按 Prometheus 文本格式（0.0.4）输出，由 /api/metrics 提供。
+热路径上的每次记录只是一次加锁的累加，开销在微秒级。
+
+    with metrics.STAGE_SECONDS.time(stage='indicators'):
+        df = calculate_indicators(df)
+    metrics.CACHE_LOOKUPS.inc(cache='indicators', result='hit')
+
+使用计算进程池（compute_workers）时，在子进程中执行的指标计算和评分不计入本进程的阶段耗时，
+扫描吞吐量和请求耗时不受影响。
+"""
+
+import bisect
+import contextlib
+import functools
+import math
+import threading
+import time
+
+# 默认的耗时分桶（秒），覆盖缓存命中的亚毫秒级到全市场扫描的分钟级
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    """带标签的指标，每组标签值对应一个子序列"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 的标签应为 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def samples(self):
+        """[(指标名后缀, [(标签名, 标签值)], 值)]"""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return [('_total', list(zip(self.labelnames, key)), float(value)) for key, value in series]
+
+    def render(self):
+        # 计数器的指标名按约定以 _total 结尾，HELP/TYPE 使用去掉后缀的名字
+        base = self.name[:-len('_total')] if self.name.endswith('_total') else self.name
+        lines = [f"# HELP {base} {self.documentation}", f"# TYPE {base} counter"]
+        for _, labels, value in self.samples():
+            lines.append(f"{base}_total{_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class Gauge(_Metric):
+    """可增可减的当前值"""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return [('', list(zip(self.labelnames, key)), float(value)) for key, value in series]
+
+
+class Histogram(_Metric):
+    """按分桶统计的观测值分布（例如耗时），可由 Prometheus 计算分位数"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # 各分桶的计数（最后一个为 +Inf）、总和、次数
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """记录 with 块的耗时（秒），块内抛出异常时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total, count))
+                            for key, (counts, total, count) in self._series.items())
+        samples = []
+        for key, (counts, total, count) in series:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', labels + [('le', _format_value(float(bound)))], float(cumulative)))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, float(count)))
+        return samples
+
+
+class Registry:
+    """指标集合"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"指标 {metric.name} 已注册")
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics)
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+    def clear(self):
+        """清空所有指标的数据（用于测试）"""
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+
+def render():
+    return REGISTRY.render()
+
+
+# 请求
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'stock_http_request_duration_seconds', '接口请求耗时（秒）', ('method', 'endpoint', 'status')))
+
+# 分析各阶段：load（含本地K线存储）、fetch（数据源请求）、indicators、score、report、format
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'stock_stage_duration_seconds', '分析各阶段耗时（秒）', ('stage',)))
+
+# 缓存：indicators（技术指标缓存查找）、shared（共享存储查找）、snapshot（快照查找）
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'stock_cache_lookups_total', '缓存查找次数', ('cache', 'result')))
+
+# 数据源：akshare（同步）、eastmoney（异步服务）
+UPSTREAM_REQUESTS = REGISTRY.register(Counter(
+    'stock_upstream_requests_total', '数据源请求次数', ('source', 'result')))
+
+ERRORS = REGISTRY.register(Counter(
+    'stock_errors_total', '各阶段出错次数', ('stage',)))
+
+# 扫描：每只股票的结果 scored（完成评分）、rejected（提前淘汰）、error
+SCAN_SYMBOLS = REGISTRY.register(Counter(
+    'stock_scan_symbols_total', '扫描处理的股票数', ('result',)))
+
+SCAN_SECONDS = REGISTRY.register(Histogram(
+    'stock_scan_duration_seconds', '完整扫描耗时（秒）', ()))
+
+SCAN_THROUGHPUT = REGISTRY.register(Gauge(
+    'stock_scan_last_throughput', '最近一次完成的扫描的吞吐量（只/秒）', ()))
+
+
+def timed(stage):
+    """装饰器：把函数的耗时记入 STAGE_SECONDS"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with STAGE_SECONDS.time(stage=stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class ScanTimer:
+    """记录一次扫描的每只股票结果，扫描完整结束时记录耗时和吞吐量（提前停止的扫描不记录）"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+
+    def item(self, report, error):
+        self.count += 1
+        if error is not None:
+            SCAN_SYMBOLS.inc(result='error')
+        elif report is None:
+            SCAN_SYMBOLS.inc(result='rejected')
+        else:
+            SCAN_SYMBOLS.inc(result='scored')
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.started
+        SCAN_SECONDS.observe(elapsed)
+        if elapsed > 0:
+            SCAN_THROUGHPUT.set(self.count / elapsed)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+截面面板计算
+
+输入 (日期 × 股票) 的开高低收量矩阵，一次向量化计算全部股票的技术指标。
+停牌、上市较晚或历史长度不同的股票用 NaN 表示缺失的K线：计算前把每只股票的
+有效K线按时间顺序压紧到列首，计算后再放回原来的日期行，因此结果与逐只调用
+calculate_indicators 一致，缺失K线所在行的指标为 NaN。
+"""
+
+import numpy as np
+import pandas as pd
+
+import indicator_kernels as kernels
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def valid_bars(open_, high, low, close, volume):
+    """每个 (日期, 股票) 是否有完整的K线"""
+    valid = np.ones(np.shape(close), dtype=bool)
+    for values in (open_, high, low, close, volume):
+        valid &= np.isfinite(values)
+    return valid
+
+
+def pack_order(valid):
+    """返回行索引，使每列的有效行保持时间顺序排在最前面"""
+    return np.argsort(~valid, axis=0, kind='stable')
+
+
+def pack(values, order):
+    """按 pack_order 压紧"""
+    return np.take_along_axis(kernels.as_float(values), order, axis=0)
+
+
+def unpack(packed, order, valid):
+    """把压紧后的结果放回原日期行，缺失K线的行填 NaN"""
+    out = np.empty(packed.shape)
+    np.put_along_axis(out, order, packed, axis=0)
+    out[~valid] = np.nan
+    return out
+
+
+def compute_packed(open_, high, low, close, volume, params, fields=None, causal=False):
+    """
+    在压紧后的面板上计算技术指标，fields 为 None 时计算全部列，causal 见 kernels.compute_indicators
+
+    返回 (valid, order, 每只股票的K线数, {列名: 压紧后的数组})，
+    压紧后每列前 K线数 行为该股票按时间顺序的有效K线
+    """
+    valid = valid_bars(open_, high, low, close, volume)
+    order = pack_order(valid)
+    packed = kernels.compute_indicators(pack(high, order), pack(low, order), pack(close, order),
+                                        pack(volume, order), params, fields=fields, causal=causal)
+    return valid, order, valid.sum(axis=0), packed
+
+
+def compute_panel(open_, high, low, close, volume, params, fields=None):
+    """
+    计算面板上的技术指标
+
+    各输入为形状相同的 (日期 × 股票) 数组，返回 {列名: (日期 × 股票) 数组}，
+    列名与 calculate_indicators 添加的列相同，fields 为 None 时计算全部列
+    """
+    valid, order, _, packed = compute_packed(open_, high, low, close, volume, params, fields)
+    return {name: unpack(values, order, valid) for name, values in packed.items()}
+
+
+def frames_to_panel(frames):
+    """
+    把 {股票代码: get_stock_data 返回的 DataFrame} 合并为面板
+
+    返回 (日期索引, 股票代码列表, {字段: (日期 × 股票) 数组})，日期取所有股票的并集
+    """
+    codes = list(frames)
+    dates = pd.DatetimeIndex(sorted(set().union(*(frame['date'] for frame in frames.values()))))
+    fields = {field: np.full((len(dates), len(codes)), np.nan) for field in PRICE_FIELDS}
+    for j, code in enumerate(codes):
+        frame = frames[code]
+        rows = dates.get_indexer(pd.DatetimeIndex(frame['date']))
+        for field in PRICE_FIELDS:
+            fields[field][rows, j] = frame[field].to_numpy(dtype=np.float64)
+    return dates, codes, fields
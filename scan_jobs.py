@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+后台市场扫描任务
+
+提交扫描后立即返回任务ID，扫描在独立的有界线程池中执行，不占用处理接口请求的线程，
+也不受代理超时和客户端断开的影响。任务运行期间可以查询进度（已完成、失败、总数、预计剩余时间）、
+获取已得到的部分结果，或取消任务。
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+# 每只股票的错误信息最多保留的条数
+MAX_ERRORS = 100
+
+
+def rank_reports(items):
+    """items 为 [(序号, 报告)]，按得分降序排列，同分时保持输入顺序，与 scan_market 的排序一致"""
+    return [report for _, report in sorted(items, key=lambda item: (-item[1]['score'], item[0]))]
+
+
+class ScanJob:
+    """一次扫描任务的状态，由执行线程写入、接口线程读取"""
+
+    def __init__(self, stock_list, min_score, options):
+        self.id = uuid.uuid4().hex
+        self.stock_list = list(stock_list)
+        self.min_score = min_score
+        self.options = options
+        self.status = PENDING
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = 0
+        self.failed = 0
+        self.error = None
+        self.errors = []
+        self._matches = []
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        return len(self.stock_list)
+
+    def cancel(self):
+        """请求取消，正在分析的股票完成后停止"""
+        self._cancel.set()
+        with self._lock:
+            if self.status == PENDING:
+                self.status = CANCELLED
+                self.finished_at = time.time()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def record(self, index, stock_code, report, error):
+        """记录一只股票的结果"""
+        with self._lock:
+            if error is not None:
+                self.failed += 1
+                if len(self.errors) < MAX_ERRORS:
+                    self.errors.append({'stock_code': stock_code, 'error': str(error)})
+            else:
+                # 提前淘汰的股票没有报告
+                self.done += 1
+                if report is not None and report['score'] >= self.min_score:
+                    self._matches.append((index, report))
+
+    def eta(self):
+        """按已完成股票的平均耗时估计剩余秒数，尚无完成的股票时返回 None"""
+        processed = self.done + self.failed
+        if self.status != RUNNING or not processed:
+            return None
+        elapsed = time.time() - self.started_at
+        return round(elapsed / processed * (self.total - processed), 1)
+
+    def progress(self):
+        """任务进度"""
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'total': self.total,
+                'done': self.done,
+                'failed': self.failed,
+                'matched': len(self._matches),
+                'progress': round((self.done + self.failed) / self.total * 100, 1) if self.total else 100.0,
+                'eta_seconds': self.eta(),
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'error': self.error,
+            }
+
+    def results(self):
+        """已得到的符合条件的报告，排序规则与 scan_market 相同；任务完成后即为最终结果"""
+        with self._lock:
+            matches = list(self._matches)
+            errors = list(self.errors)
+        return rank_reports(matches), errors
+
+
+class ScanJobManager:
+    """扫描任务管理：有界线程池执行任务，保留最近的任务供查询"""
+
+    def __init__(self, analyzer, workers=2, history=100):
+        """
+        analyzer: 执行扫描的 StockAnalyzer
+        workers: 同时执行的扫描任务数，超出的任务排队
+        history: 保留的已结束任务数，超出后删除最早结束的任务
+        """
+        self.analyzer = analyzer
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, stock_list, min_score=60, max_workers=None, compute_workers=None, chunksize=16,
+               short_circuit=False):
+        """提交扫描任务，返回 ScanJob；short_circuit 与 StockAnalyzer.scan_market 相同"""
+        job = ScanJob(stock_list, min_score,
+                      {'max_workers': max_workers, 'compute_workers': compute_workers, 'chunksize': chunksize,
+                       'min_score': min_score if short_circuit else None})
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        """按ID获取任务，不存在时返回 None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        """所有保留的任务的进度，按提交顺序"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.progress() for job in jobs]
+
+    def cancel(self, job_id):
+        """取消任务，返回 ScanJob；任务不存在时返回 None"""
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def _evict(self):
+        """删除超出保留数量的最早结束的任务，未结束的任务不删除"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        """在任务线程中执行扫描"""
+        with job._lock:
+            if job.status != PENDING:
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+
+        reports = self.analyzer.iter_reports(job.stock_list, **job.options)
+        try:
+            for index, stock_code, report, error in reports:
+                job.record(index, stock_code, report, error)
+                if job.cancelled:
+                    break
+            status = CANCELLED if job.cancelled else COMPLETED
+        except Exception as e:
+            logger.error(f"扫描任务 {job.id} 出错: {str(e)}")
+            job.error = str(e)
+            status = FAILED
+        finally:
+            reports.close()
+
+        with job._lock:
+            job.status = status
+            job.finished_at = time.time()
+        with self._lock:
+            self._evict()
+
+    def shutdown(self):
+        """取消所有任务并关闭线程池"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        self._executor.shutdown(wait=False)
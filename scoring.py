@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+向量化评分
+
+评分规则以规则表的形式定义，每条规则由若干按顺序匹配的分支组成（与原来的 if/elif 一致，
+最后一个分支为 else），对整列指标一次性求值，得到每根K线的总分和各类别得分。
+输入数组沿第0维（时间）排列，可以是一维（单只股票）或 (日期 × 股票) 的二维数组。
+评分说明文字只在需要时按行生成。
+"""
+
+import numpy as np
+import pandas as pd
+
+import indicator_kernels as kernels
+
+CATEGORIES = ('trend', 'momentum', 'volume', 'volatility', 'statistical')
+
+# 评分用到的指标列
+FIELDS = ('close', 'EMA5', 'EMA20', 'EMA60', 'MACD', 'Signal', 'MACD_hist', 'ADX',
+          'BB_upper', 'BB_middle', 'BB_lower', 'RSI', 'Stoch_K', 'Stoch_D', 'CCI', 'ROC',
+          'Volume_Ratio', 'OBV', 'MFI', 'Volatility', 'StdDev', 'Z-Score')
+
+# 评分用到的技术指标列（不含行情列），只为评分计算指标时传给 compute_indicators 的 fields
+INDICATOR_FIELDS = tuple(name for name in FIELDS if name != 'close')
+
+# OBV 趋势比较最近5根K线的首尾
+OBV_TREND_BARS = 5
+
+
+def _between(x, low, high):
+    return (x >= low) & (x <= high)
+
+
+# (规则名, 类别, [(条件, 得分, 说明模板, 说明用到的列), ...])，最后一个分支的条件为 None
+RULES = (
+    # 1. 趋势评分 (40分)
+    ('ma_alignment', 'trend', (
+        (lambda c: (c['EMA5'] > c['EMA20']) & (c['EMA20'] > c['EMA60']), 15, '多头排列 +15', ()),
+        (lambda c: (c['EMA5'] < c['EMA20']) & (c['EMA20'] < c['EMA60']), 0, '空头排列 +0', ()),
+        (lambda c: c['EMA5'] > c['EMA20'], 5, '部分多头特征 +5', ()),
+        (None, 0, '无明显排列 +0', ()),
+    )),
+    ('macd', 'trend', (
+        (lambda c: (c['MACD'] > c['Signal']) & (c['MACD_hist'] > 0), 10, '金叉且柱状体为正 +10', ()),
+        (lambda c: c['MACD'] > c['Signal'], 5, '金叉 +5', ()),
+        (lambda c: (c['MACD'] < c['Signal']) & (c['MACD_hist'] < 0), 0, '死叉且柱状体为负 +0', ()),
+        (None, 0, '死叉 +0', ()),
+    )),
+    ('adx', 'trend', (
+        (lambda c: c['ADX'] > 30, 10, '强势趋势({:.1f}) +10', ('ADX',)),
+        (lambda c: c['ADX'] > 20, 5, '中等趋势({:.1f}) +5', ('ADX',)),
+        (None, 0, '弱势趋势({:.1f}) +0', ('ADX',)),
+    )),
+    ('bollinger', 'trend', (
+        (lambda c: (c['close'] > c['BB_middle']) & (c['close'] < c['BB_upper']), 5, '上轨区域 +5', ()),
+        (lambda c: (c['close'] < c['BB_middle']) & (c['close'] > c['BB_lower']), 2, '下轨区域 +2', ()),
+        (lambda c: c['close'] > c['BB_upper'], 0, '超买区域 +0', ()),
+        (None, 0, '超卖区域 +0', ()),
+    )),
+    # 2. 动量评分 (25分)
+    ('rsi', 'momentum', (
+        (lambda c: _between(c['RSI'], 40, 60), 10, '中性({:.1f}) +10', ('RSI',)),
+        (lambda c: ((c['RSI'] >= 30) & (c['RSI'] < 40)) | ((c['RSI'] > 60) & (c['RSI'] <= 70)),
+         5, '偏离中性({:.1f}) +5', ('RSI',)),
+        (lambda c: c['RSI'] < 30, 2, '超卖({:.1f}) +2', ('RSI',)),
+        (None, 0, '超买({:.1f}) +0', ('RSI',)),
+    )),
+    ('kd', 'momentum', (
+        (lambda c: (c['Stoch_K'] < c['Stoch_D']) & _between(c['Stoch_K'], 20, 80),
+         5, 'K({:.1f})低于D({:.1f})且在合理区间 +5', ('Stoch_K', 'Stoch_D')),
+        (lambda c: (c['Stoch_K'] > c['Stoch_D']) & _between(c['Stoch_K'], 20, 80),
+         3, 'K({:.1f})高于D({:.1f})且在合理区间 +3', ('Stoch_K', 'Stoch_D')),
+        (None, 0, 'K({:.1f})和D({:.1f})关系不佳或超出合理区间 +0', ('Stoch_K', 'Stoch_D')),
+    )),
+    ('cci', 'momentum', (
+        (lambda c: _between(c['CCI'], -100, 100), 5, '处于正常区间({:.1f}) +5', ('CCI',)),
+        (lambda c: (c['CCI'] >= -200) & (c['CCI'] < -100), 2, '偏弱({:.1f}) +2', ('CCI',)),
+        (lambda c: (c['CCI'] > 100) & (c['CCI'] <= 200), 2, '偏强({:.1f}) +2', ('CCI',)),
+        (None, 0, '极端区域({:.1f}) +0', ('CCI',)),
+    )),
+    ('roc', 'momentum', (
+        (lambda c: (c['ROC'] > 0) & (c['ROC'] <= 5), 5, '适中正增长({:.1f}%) +5', ('ROC',)),
+        (lambda c: (c['ROC'] >= -5) & (c['ROC'] < 0), 2, '轻微下跌({:.1f}%) +2', ('ROC',)),
+        (lambda c: (c['ROC'] > 5) & (c['ROC'] <= 10), 2, '较快增长({:.1f}%), 风险增加 +2', ('ROC',)),
+        (None, 0, '极端变化({:.1f}%) +0', ('ROC',)),
+    )),
+    # 3. 成交量评分 (20分)
+    ('volume', 'volume', (
+        (lambda c: _between(c['Volume_Ratio'], 1.0, 2.0), 10, '适度放大({:.1f}) +10', ('Volume_Ratio',)),
+        (lambda c: (c['Volume_Ratio'] >= 0.5) & (c['Volume_Ratio'] < 1.0),
+         5, '略低但可接受({:.1f}) +5', ('Volume_Ratio',)),
+        (lambda c: c['Volume_Ratio'] > 2.0, 2, '过度放量({:.1f}) +2', ('Volume_Ratio',)),
+        (None, 0, '成交低迷({:.1f}) +0', ('Volume_Ratio',)),
+    )),
+    # OBV 首尾无法比较（含 NaN）时按横盘处理，与 _get_obv_trend 一致
+    ('obv', 'volume', (
+        (lambda c: c['OBV'] > c['OBV_ref'], 5, '上升趋势 +5', ()),
+        (lambda c: ~(c['OBV'] < c['OBV_ref']), 2, '横盘整理 +2', ()),
+        (None, 0, '下降趋势 +0', ()),
+    )),
+    ('mfi', 'volume', (
+        (lambda c: _between(c['MFI'], 40, 60), 5, '中性资金流({:.1f}) +5', ('MFI',)),
+        (lambda c: ((c['MFI'] >= 20) & (c['MFI'] < 40)) | ((c['MFI'] > 60) & (c['MFI'] <= 80)),
+         3, '偏离中性({:.1f}) +3', ('MFI',)),
+        (None, 0, '极端区域({:.1f}) +0', ('MFI',)),
+    )),
+    # 4. 波动率评分 (10分)
+    ('volatility', 'volatility', (
+        (lambda c: c['Volatility'] <= 2, 5, '低波动({:.1f}%) +5', ('Volatility',)),
+        (lambda c: c['Volatility'] <= 4, 3, '中等波动({:.1f}%) +3', ('Volatility',)),
+        (None, 0, '高波动({:.1f}%) +0', ('Volatility',)),
+    )),
+    ('std_dev', 'volatility', (
+        (lambda c: c['StdDev_pct'] <= 3, 5, '低离散度({:.2f}) +5', ('StdDev',)),
+        (lambda c: c['StdDev_pct'] <= 6, 3, '中等离散度({:.2f}) +3', ('StdDev',)),
+        (None, 0, '高离散度({:.2f}) +0', ('StdDev',)),
+    )),
+    # 5. 统计套利评分 (5分)
+    ('z_score', 'statistical', (
+        (lambda c: _between(c['Z-Score'], -2, 2), 5, '合理区间({:.2f}) +5', ('Z-Score',)),
+        (lambda c: ((c['Z-Score'] >= -3) & (c['Z-Score'] < -2)) | ((c['Z-Score'] > 2) & (c['Z-Score'] <= 3)),
+         2, '边缘区域({:.2f}) +2', ('Z-Score',)),
+        (None, 0, '极端偏离({:.2f}) +0', ('Z-Score',)),
+    )),
+)
+
+# 每条规则各分支的得分
+_POINTS = {key: np.array([branch[1] for branch in branches], dtype=np.int64) for key, _, branches in RULES}
+
+# 每条规则的最高得分，各类别之和即 40/25/20/10/5
+RULE_MAX = {key: int(points.max()) for key, points in _POINTS.items()}
+
+# 每条规则用到的技术指标列（收盘价另行提供）
+RULE_FIELDS = {
+    'ma_alignment': ('EMA5', 'EMA20', 'EMA60'),
+    'macd': ('MACD', 'Signal', 'MACD_hist'),
+    'adx': ('ADX',),
+    'bollinger': ('BB_upper', 'BB_middle', 'BB_lower'),
+    'rsi': ('RSI',),
+    'kd': ('Stoch_K', 'Stoch_D'),
+    'cci': ('CCI',),
+    'roc': ('ROC',),
+    'volume': ('Volume_Ratio',),
+    'obv': ('OBV',),
+    'mfi': ('MFI',),
+    'volatility': ('Volatility',),
+    'std_dev': ('StdDev',),
+    'z_score': ('Z-Score',),
+}
+
+# bounded_score 的规则求值顺序。顺序只决定多早能提前停止，不影响得分（任意顺序结果相同）。
+# 按每条规则需要新计算的指标从少到多排列：ROC、OBV、量比各只需对收盘价或成交量逐根计算一次；
+# 均线排列和 MACD 共用同一组 EMA；ADX、KD、Z-Score、布林带需要多级平滑或多个滚动窗口，放在最后
+BOUND_ORDER = ('roc', 'obv', 'volume', 'ma_alignment', 'macd', 'rsi', 'volatility', 'std_dev',
+               'mfi', 'cci', 'adx', 'kd', 'z_score', 'bollinger')
+
+
+def obv_reference(obv):
+    """每根K线往前第 OBV_TREND_BARS-1 根的 OBV，不足时取第一根，对应 df['OBV'].tail(5).iloc[0]"""
+    obv = kernels.as_float(obv)
+    lag = OBV_TREND_BARS - 1
+    ref = kernels.shift(obv, lag)
+    ref[:lag] = obv[:1]
+    return ref
+
+
+def columns_from_frame(df):
+    """从计算好技术指标的 DataFrame 中取出评分需要的列"""
+    return {name: df[name].to_numpy(dtype=np.float64) for name in FIELDS}
+
+
+def latest_columns(df):
+    """只取最后一根K线评分需要的值（标量），逐列复制整段历史的开销比评分本身大得多"""
+    latest = df.iloc[-1]
+    columns = {name: np.float64(latest[name]) for name in FIELDS}
+    columns['OBV_ref'] = np.float64(df['OBV'].iloc[-OBV_TREND_BARS:].iloc[0])
+    return columns
+
+
+def _prepare(columns):
+    """补充规则用到的派生列，只包含部分列时只补充能算出的派生列"""
+    columns = dict(columns)
+    if 'StdDev' in columns:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns['StdDev_pct'] = columns['StdDev'] / columns['close'] * 100
+    if 'OBV_ref' not in columns and 'OBV' in columns:
+        columns['OBV_ref'] = obv_reference(columns['OBV'])
+    return columns
+
+
+def _choose(columns, branches, shape):
+    """每个位置第一个成立的分支序号"""
+    # 倒序覆盖，每个位置最终保留第一个成立的分支
+    choice = np.full(shape, len(branches) - 1, dtype=np.int8)
+    for i in range(len(branches) - 2, -1, -1):
+        choice[branches[i][0](columns)] = i
+    return choice
+
+
+def evaluate(columns):
+    """
+    对全部K线评分
+
+    columns 为 {列名: 数组}，至少包含 FIELDS 中的列。
+    返回 (总分, {类别: 得分}, {规则名: 命中分支序号})，均为与输入同形状的整数数组
+    """
+    columns = _prepare(columns)
+    shape = np.shape(columns['close'])
+    category_scores = {category: np.zeros(shape, dtype=np.int64) for category in CATEGORIES}
+    choices = {}
+    for key, category, branches in RULES:
+        choice = _choose(columns, branches, shape)
+        category_scores[category] += _POINTS[key][choice]
+        choices[key] = choice
+    score = sum(category_scores[category] for category in CATEGORIES)
+    return score, category_scores, choices
+
+
+def bounded_score(compute, close, min_score, order=BOUND_ORDER):
+    """
+    按 order 逐条规则只对最后一根K线评分，已得分加上剩余规则的最高得分低于 min_score 时立即停止
+
+    compute(fields) 返回 {列名: 数组}，只计算该条规则用到的指标（调用方负责在多次调用间共享中间结果）；
+    close 为收盘价数组。返回总分，与 evaluate 对最后一根K线的结果相同；提前停止时返回 None，
+    其余规则的指标不再计算
+    """
+    rules = {key: branches for key, _, branches in RULES}
+    score = 0
+    reachable = sum(RULE_MAX.values())
+    for key in order:
+        arrays = compute(list(RULE_FIELDS[key]))
+        # 与 latest_columns 相同：取最后一根K线的值，OBV 趋势比较最近 OBV_TREND_BARS 根的首尾
+        columns = {name: np.float64(values[-1]) for name, values in arrays.items()}
+        columns['close'] = np.float64(close[-1])
+        if 'OBV' in arrays:
+            columns['OBV_ref'] = np.float64(arrays['OBV'][-OBV_TREND_BARS:][0])
+        choice = _choose(_prepare(columns), rules[key], ())
+        score += int(_POINTS[key][choice])
+        reachable -= RULE_MAX[key]
+        if score + reachable < min_score:
+            return None
+    return score
+
+
+def describe(columns, choices, index):
+    """生成某根K线（index 为数组下标，标量输入时为 ()）的评分说明，与 calculate_score 的 score_details 相同"""
+    details = {}
+    for key, _, branches in RULES:
+        _, _, template, fields = branches[choices[key][index]]
+        details[key] = template.format(*(columns[field][index] for field in fields))
+    return details
+
+
+def score_frame(df, numeric_only=False):
+    """
+    计算 DataFrame 每一行的评分
+
+    返回与 df 同索引的 DataFrame，包含 score 和各类别得分列；
+    numeric_only 为 False 时增加 score_details 列（每行一个说明字典）
+    """
+    columns = columns_from_frame(df)
+    score, category_scores, choices = evaluate(columns)
+    result = pd.DataFrame({'score': score, **category_scores}, index=df.index)
+    if not numeric_only:
+        result['score_details'] = [describe(columns, choices, i) for i in range(len(df))]
+    return result
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+选股查询
+
+在快照中每只股票最新的指标值上执行条件查询，例如：
+
+    RSI < 30 AND ADX > 25 AND Volume_Ratio BETWEEN 1 AND 2
+
+指标值按列存储，每列预先排好序；比较条件在排好序的列上二分查找得到命中的区间，
+条件之间用布尔数组组合，排序直接沿用列的预排序结果，不需要获取数据或重新计算。
+
+支持的语法：比较（< <= > >= = != ）、BETWEEN a AND b、AND、OR、NOT 和括号，
+关键字不区分大小写；列名包含特殊字符时可以用反引号括起来，例如 `Z-Score`。
+比较中任一列为 NaN 时该条件既不成立也不否定（与 SQL 的 NULL 相同），NOT 不会选中这些股票。
+"""
+
+import re
+
+import numpy as np
+
+# 报告中可查询的顶层数值字段
+REPORT_COLUMNS = ('score', 'price', 'price_change')
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+      | `(?P<quoted>[^`]+)`
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*(?:-[A-Za-z_][A-Za-z0-9_]*)*)
+      | (?P<op><=|>=|!=|==|<>|<|>|=)
+      | (?P<paren>[()])
+    )""", re.VERBOSE)
+
+_KEYWORDS = ('AND', 'OR', 'NOT', 'BETWEEN')
+
+
+class QueryError(Exception):
+    """查询语法错误或引用了不存在的列"""
+
+
+def tokenize(query):
+    """把查询字符串切分为 (类型, 值) 列表"""
+    tokens = []
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = _TOKEN.match(query, position)
+        if match is None or match.end() == position:
+            raise QueryError(f"无法解析的查询: {query[position:].strip()[:20]}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'number':
+            tokens.append(('number', float(value)))
+        elif kind == 'quoted':
+            tokens.append(('name', value))
+        elif kind == 'name' and value.upper() in _KEYWORDS:
+            tokens.append(('keyword', value.upper()))
+        else:
+            tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """递归下降解析，OR 优先级最低，其次 AND，NOT 最高"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1] != value):
+            expected = value or kind or '更多内容'
+            raise QueryError(f"查询语法错误: 需要 {expected}，实际为 {token[1] if token[0] else '结尾'}")
+        self.position += 1
+        return token[1]
+
+    def parse(self):
+        node = self.expression()
+        if self.peek()[0] is not None:
+            raise QueryError(f"查询语法错误: 多余的 {self.peek()[1]}")
+        return node
+
+    def expression(self):
+        node = self.conjunction()
+        while self.peek() == ('keyword', 'OR'):
+            self.take()
+            node = ('or', node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.peek() == ('keyword', 'AND'):
+            self.take()
+            node = ('and', node, self.negation())
+        return node
+
+    def negation(self):
+        if self.peek() == ('keyword', 'NOT'):
+            self.take()
+            return ('not', self.negation())
+        if self.peek() == ('paren', '('):
+            self.take()
+            node = self.expression()
+            self.take('paren', ')')
+            return node
+        return self.predicate()
+
+    def predicate(self):
+        column = self.take('name')
+        if self.peek() == ('keyword', 'BETWEEN'):
+            self.take()
+            low = self.take('number')
+            self.take('keyword', 'AND')
+            high = self.take('number')
+            return ('between', column, low, high)
+        op = self.take('op')
+        op = {'==': '=', '<>': '!='}.get(op, op)
+        return ('compare', column, op, self.take('number'))
+
+
+def parse(query):
+    """解析查询，返回语法树"""
+    if not isinstance(query, str) or not query.strip():
+        raise QueryError("查询条件不能为空")
+    return _Parser(tokenize(query)).parse()
+
+
+def columns_of(node):
+    """语法树引用的列名"""
+    if node[0] in ('compare', 'between'):
+        return [node[1]]
+    return [column for child in node[1:] for column in columns_of(child)]
+
+
+class ScreenerIndex:
+    """最新指标值的列式存储，每列带预排序索引"""
+
+    def __init__(self, codes, columns, version=None):
+        """
+        codes: 股票代码列表
+        columns: {列名: 与 codes 对应的 float64 数组}
+        version: 数据来源的快照版本
+        """
+        self.version = version
+        self.codes = np.asarray(codes, dtype=object)
+        self.columns = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+        self._order = {}
+        self._sorted = {}
+        for name, values in self.columns.items():
+            # NaN 排在最后，二分查找只在有效值范围内进行
+            order = np.argsort(values, kind='stable')
+            self._order[name] = order
+            self._sorted[name] = values[order]
+
+    @classmethod
+    def from_reports(cls, reports, version=None):
+        """由 {股票代码: 报告} 构建，列为报告的 indicators、评分、分类评分、价格和涨跌幅"""
+        codes = sorted(reports)
+        names = set()
+        for report in reports.values():
+            names.update(report.get('indicators', {}))
+            names.update(report.get('category_scores', {}))
+        names.update(REPORT_COLUMNS)
+
+        columns = {}
+        for name in sorted(names):
+            values = np.full(len(codes), np.nan)
+            for i, code in enumerate(codes):
+                report = reports[code]
+                value = report.get('indicators', {}).get(name)
+                if value is None:
+                    value = report.get('category_scores', {}).get(name)
+                if value is None and name in REPORT_COLUMNS:
+                    value = report.get(name)
+                if value is not None:
+                    values[i] = value
+            columns[name] = values
+        return cls(codes, columns, version)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _column(self, name):
+        if name not in self.columns:
+            raise QueryError(f"不支持的列: {name}")
+        return self.columns[name]
+
+    def _range(self, name, low, high, low_inclusive, high_inclusive):
+        """low <= 值 <= high（按包含与否）的行，用排好序的列二分查找"""
+        self._column(name)
+        values = self._sorted[name]
+        valid = len(values) - int(np.isnan(values).sum())
+        start = 0 if low is None else np.searchsorted(values[:valid], low, 'left' if low_inclusive else 'right')
+        end = valid if high is None else np.searchsorted(values[:valid], high, 'right' if high_inclusive else 'left')
+        mask = np.zeros(len(values), dtype=bool)
+        mask[self._order[name][start:max(start, end)]] = True
+        return mask
+
+    def _evaluate(self, node):
+        """三值逻辑求值：返回 (条件成立的行, 条件不成立的行)，NaN 的行两者都不是"""
+        kind = node[0]
+        if kind == 'and':
+            true_a, false_a = self._evaluate(node[1])
+            true_b, false_b = self._evaluate(node[2])
+            return true_a & true_b, false_a | false_b
+        if kind == 'or':
+            true_a, false_a = self._evaluate(node[1])
+            true_b, false_b = self._evaluate(node[2])
+            return true_a | true_b, false_a & false_b
+        if kind == 'not':
+            true, false = self._evaluate(node[1])
+            return false, true
+
+        column = node[1]
+        known = ~np.isnan(self._column(column))
+        if kind == 'between':
+            true = self._range(column, node[2], node[3], True, True)
+        else:
+            op, value = node[2], node[3]
+            if op == '<':
+                true = self._range(column, None, value, True, False)
+            elif op == '<=':
+                true = self._range(column, None, value, True, True)
+            elif op == '>':
+                true = self._range(column, value, None, False, True)
+            elif op == '>=':
+                true = self._range(column, value, None, True, True)
+            elif op == '=':
+                true = self._range(column, value, value, True, True)
+            else:
+                true = known & ~self._range(column, value, value, True, True)
+        return true, known & ~true
+
+    def query(self, query, sort='score', descending=True, limit=None, fields=None):
+        """
+        执行查询，返回 (命中的股票数, 结果行列表)
+
+        sort 为排序列，默认按 score 降序，limit 限制返回行数；
+        每行包含股票代码、评分、查询和排序用到的列以及 fields 中的列
+        """
+        tree = parse(query)
+        matched, _ = self._evaluate(tree)
+
+        self._column(sort)
+        order = self._order[sort]
+        if descending:
+            # 倒序时 NaN 仍然排在最后
+            values = self._sorted[sort]
+            valid = len(values) - int(np.isnan(values).sum())
+            order = np.concatenate([order[:valid][::-1], order[valid:]])
+        rows = order[matched[order]]
+        count = len(rows)
+        if limit is not None:
+            rows = rows[:limit]
+
+        names = list(dict.fromkeys(['score'] + columns_of(tree) + [sort] + list(fields or [])))
+        for name in names:
+            self._column(name)
+        result = []
+        for row in rows:
+            item = {'stock_code': self.codes[row]}
+            for name in names:
+                value = self.columns[name][row]
+                item[name] = None if np.isnan(value) else float(value)
+            result.append(item)
+        return count, result
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+内存映射的共享K线和指标存储
+
+把一组股票的日线和技术指标按列写成 .npy 文件：每列是所有股票首尾相接的一维数组，
+另存每只股票的起止位置。各服务进程和计算进程用 np.load(mmap_mode='r') 映射同一组文件，
+读到的是只读的 NumPy 视图，数据只在操作系统的页缓存中保存一份，内存占用不随进程数增加。
+
+只有一个进程写入：发布时持有目录下 .lock 文件的排他锁，新版本写入临时目录后整体改名，
+再原子替换 CURRENT 文件指向新版本。读者最多每 check_interval 秒检查一次 CURRENT，
+发现新版本后重新映射；旧版本的文件被删除后，已映射的进程仍可读到释放为止。
+
+    store = SharedStore('data/shared')
+    store.publish(frames, 'qfq', start_date, end_date, analyzer.params_fingerprint())
+    views = store.get('000001', start_date, end_date, 'qfq')   # {'date': ..., 'close': ..., 'RSI': ...}
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，不做进程间互斥
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 日线列，其余列为技术指标
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = '.lock'
+VERSIONS_DIR = 'versions'
+
+
+class _Version:
+    """一个已映射的版本"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'index.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.version = self.meta['version']
+        self.columns = self.meta['columns']
+        self.positions = {code: i for i, code in enumerate(self.meta['codes'])}
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        self.dates = np.load(os.path.join(path, 'date.npy'), mmap_mode='r').view('datetime64[ns]')
+        self.arrays = {name: np.load(os.path.join(path, f"c{i}.npy"), mmap_mode='r')
+                       for i, name in enumerate(self.columns)}
+
+    def matches(self, start_date, end_date, adjust):
+        meta = self.meta
+        return meta['start_date'] == start_date and meta['end_date'] == end_date and meta['adjust'] == adjust
+
+    def views(self, stock_code, columns):
+        position = self.positions.get(stock_code)
+        if position is None:
+            return None
+        start, end = self.offsets[position], self.offsets[position + 1]
+        views = {'date': self.dates[start:end]}
+        for name in columns:
+            views[name] = self.arrays[name][start:end]
+        return views
+
+
+class SharedStore:
+    """带版本的内存映射存储，一个进程发布，任意多个进程读取"""
+
+    def __init__(self, root, keep=3, check_interval=5):
+        """
+        root: 存储目录（同一主机上的各进程使用同一个目录）
+        keep: 保留的版本数
+        check_interval: 读者检查新版本的最小间隔（秒）
+        """
+        # 绝对路径：计算进程按目录打开同一个存储
+        self.root = os.path.abspath(root)
+        self.keep = keep
+        self.check_interval = check_interval
+        self._current = None
+        self._checked_at = 0
+        # 按版本号指定读取时映射的旧版本
+        self._pinned = {}
+        self._lock = threading.Lock()
+
+    def _version_path(self, version):
+        return os.path.join(self.root, VERSIONS_DIR, version)
+
+    def _versions(self):
+        """已发布的版本，从旧到新"""
+        directory = os.path.join(self.root, VERSIONS_DIR)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name for name in os.listdir(directory) if not name.startswith('.'))
+
+    def publish(self, frames, adjust, start_date, end_date, params_fingerprint):
+        """
+        发布新版本，返回版本号；其他进程正在发布时不等待，返回 None
+
+        frames: {股票代码: DataFrame}，包含 date、开高低收量和技术指标列（calculate_indicators 的结果），
+                只保存所有股票都有的数值列
+        adjust / start_date / end_date: 这些数据对应的复权方式和日期区间，读取时必须一致
+        params_fingerprint: 计算技术指标使用的参数指纹
+        """
+        os.makedirs(os.path.join(self.root, VERSIONS_DIR), exist_ok=True)
+        with open(os.path.join(self.root, LOCK_FILE), 'a') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    logger.info("其他进程正在发布共享存储，跳过本次发布")
+                    return None
+            return self._write(frames, adjust, start_date, end_date, params_fingerprint)
+
+    def _write(self, frames, adjust, start_date, end_date, params_fingerprint):
+        codes = list(frames)
+        columns = []
+        if codes:
+            first = frames[codes[0]]
+            columns = [name for name in first.columns
+                       if name != 'date' and pd.api.types.is_numeric_dtype(first[name])
+                       and all(name in frames[code].columns for code in codes)]
+        lengths = [len(frames[code]) for code in codes]
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64)
+
+        # 精确到微秒，同一秒内多次发布时版本号仍按时间排序
+        version = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        while os.path.exists(self._version_path(version)):
+            version = datetime.now().strftime('%Y%m%d%H%M%S%f')
+
+        tmp_path = os.path.join(self.root, VERSIONS_DIR, f".{version}.{os.getpid()}.tmp")
+        try:
+            os.makedirs(tmp_path)
+            np.save(os.path.join(tmp_path, 'offsets.npy'), offsets)
+            dates = [frames[code]['date'].to_numpy(dtype='datetime64[ns]').view(np.int64) for code in codes]
+            np.save(os.path.join(tmp_path, 'date.npy'), np.concatenate(dates) if dates else np.empty(0, np.int64))
+            for i, name in enumerate(columns):
+                values = [frames[code][name].to_numpy(dtype=np.float64) for code in codes]
+                np.save(os.path.join(tmp_path, f"c{i}.npy"), np.concatenate(values) if values else np.empty(0))
+            meta = {
+                'version': version,
+                'created_at': time.time(),
+                'params': params_fingerprint,
+                'adjust': adjust,
+                'start_date': start_date,
+                'end_date': end_date,
+                'codes': codes,
+                'columns': columns,
+            }
+            with open(os.path.join(tmp_path, 'index.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.rename(tmp_path, self._version_path(version))
+        finally:
+            if os.path.exists(tmp_path):
+                shutil.rmtree(tmp_path, ignore_errors=True)
+
+        current_path = os.path.join(self.root, CURRENT_FILE)
+        tmp_current = f"{current_path}.{os.getpid()}.tmp"
+        with open(tmp_current, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(tmp_current, current_path)
+
+        self._prune()
+        # 发布者自己立即读取新版本
+        self._checked_at = 0
+        logger.info(f"已发布共享存储 {version}，共 {len(codes)} 只股票，{len(columns)} 列")
+        return version
+
+    def _prune(self):
+        """删除超出保留数量的旧版本"""
+        versions = self._versions()
+        for version in versions[:max(0, len(versions) - max(self.keep, 1))]:
+            shutil.rmtree(self._version_path(version), ignore_errors=True)
+
+    def current(self):
+        """当前版本（_Version），最多每 check_interval 秒检查一次是否有新版本；没有可用版本时返回 None"""
+        now = time.time()
+        if now - self._checked_at < self.check_interval:
+            return self._current
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return self._current
+            try:
+                with open(os.path.join(self.root, CURRENT_FILE), encoding='utf-8') as f:
+                    version = f.read().strip()
+            except OSError:
+                version = None
+            if version is not None and (self._current is None or self._current.version != version):
+                try:
+                    self._current = _Version(self._version_path(version))
+                except Exception as e:
+                    logger.warning(f"映射共享存储 {version} 失败: {str(e)}")
+            # 映射完成后才更新检查时间，否则其他线程在映射期间读到的仍是旧版本（首次检查时为 None）
+            self._checked_at = now
+            return self._current
+
+    def _open(self, version):
+        """映射指定版本（计算进程读取父进程选定的版本，不受之后发布的新版本影响）"""
+        current = self.current()
+        if current is not None and current.version == version:
+            return current
+        with self._lock:
+            mapped = self._pinned.get(version)
+            if mapped is None:
+                try:
+                    mapped = _Version(self._version_path(version))
+                except Exception as e:
+                    logger.warning(f"映射共享存储 {version} 失败: {str(e)}")
+                    return None
+                # 只保留最近映射的几个版本
+                if len(self._pinned) >= max(self.keep, 1):
+                    self._pinned.pop(next(iter(self._pinned)))
+                self._pinned[version] = mapped
+            return mapped
+
+    def locate(self, stock_code, start_date, end_date, adjust):
+        """当前版本包含该股票、且日期区间和复权方式一致时返回版本号，否则返回 None"""
+        version = self.current()
+        if version is None or not version.matches(start_date, end_date, adjust) or stock_code not in version.positions:
+            return None
+        return version.version
+
+    def get(self, stock_code, start_date, end_date, adjust, params_fingerprint=None, version=None):
+        """
+        一只股票的只读视图 {'date': datetime64 数组, 列名: float64 数组}
+
+        params_fingerprint 为 None 时只返回开高低收量；否则参数必须与发布时一致，返回全部列。
+        version 为 None 时读取当前版本。
+        没有可用版本、日期区间或复权方式不一致、参数不一致或股票不在其中时返回 None
+        """
+        version = self.current() if version is None else self._open(version)
+        if version is None or not version.matches(start_date, end_date, adjust):
+            return None
+        if params_fingerprint is None:
+            return version.views(stock_code, BAR_COLUMNS)
+        if version.meta['params'] != params_fingerprint:
+            return None
+        return version.views(stock_code, version.columns)
+
+    def frame(self, stock_code, start_date, end_date, adjust, params_fingerprint=None, version=None, copy=False):
+        """
+        get 的 DataFrame 形式，各列直接是映射文件上的只读视图，不复制数据
+
+        可以追加新列，但不能修改已有的值；需要修改时传 copy=True 得到一份可写的副本
+        """
+        views = self.get(stock_code, start_date, end_date, adjust, params_fingerprint, version)
+        if views is None:
+            return None
+        return pd.DataFrame(views, copy=copy)
+
+    def info(self):
+        """当前版本信息"""
+        version = self.current()
+        if version is None:
+            return {'version': None, 'count': 0}
+        meta = version.meta
+        return {
+            'version': meta['version'],
+            'created_at': meta['created_at'],
+            'count': len(meta['codes']),
+            'adjust': meta['adjust'],
+            'start_date': meta['start_date'],
+            'end_date': meta['end_date'],
+        }
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+并发请求合并
+
+同一时刻多个线程请求同一个键时，只有第一个线程（leader）真正执行计算，
+其余线程等待并共享它的结果或异常。计算完成后键立即释放，之后的请求重新执行，
+结果的复用交给缓存负责。用于开盘等高峰时段大量请求同一只热门股票的场景，
+避免重复请求数据源和重复计算。
+AsyncSingleFlight 是供异步服务使用的协程版本。
+"""
+
+import asyncio
+import threading
+
+
+class _Call:
+    """一次正在进行的计算"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """按键合并并发调用，线程安全"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        执行 fn()，同一键的并发调用只执行一次
+
+        返回 (结果, 是否为共享结果)：执行计算的线程得到 False，等待的线程得到 True。
+        fn 抛出的异常会同样抛给所有等待的线程
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        """正在进行的计算个数"""
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """SingleFlight 的 asyncio 版本，只能在同一个事件循环中使用"""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        """
+        await fn()，同一键的并发调用只执行一次
+
+        返回 (结果, 是否为共享结果)。等待的协程被取消时不影响正在进行的计算
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task), False
+
+    def in_flight(self):
+        """正在进行的计算个数"""
+        return len(self._calls)
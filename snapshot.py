@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+收盘后全市场预计算快照
+
+日线数据每个交易日只在收盘后变化一次。调度线程在每个交易日收盘后对配置的股票池
+完整运行一遍分析流程（获取数据 → 计算指标 → 评分），把每只股票的报告（最新指标、评分、
+score_details）写入带版本号的 JSON 快照文件。/api/analyze 和 /api/scan 直接从内存中的快照读取，
+每只股票 O(1)；快照中没有的股票、参数已变化或快照过期时退回实时计算。
+
+新快照先完整写入临时文件再替换，内存中的快照在全部股票计算完成后一次性替换，
+读者不会看到半成品。
+"""
+
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from data_providers import AkshareProvider
+from screener import ScreenerIndex
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PREFIX = 'snapshot-'
+SNAPSHOT_SUFFIX = '.json'
+
+
+def _json_default(o):
+    """报告中的 numpy 标量转换为 Python 类型"""
+    if hasattr(o, 'item'):
+        return o.item()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def load_universe(spec, provider=None):
+    """
+    解析股票池配置
+
+    spec 为 'all' 时使用数据源（默认 akshare）的全部A股；为文件路径时每行一个股票代码；否则为逗号分隔的股票代码
+    """
+    spec = (spec or '').strip()
+    if not spec:
+        return []
+    if spec.lower() == 'all':
+        return (provider or AkshareProvider()).stock_list()
+    if os.path.isfile(spec):
+        with open(spec, encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return [code.strip() for code in spec.split(',') if code.strip()]
+
+
+class SnapshotStore:
+    """带版本的快照文件和内存中的当前快照"""
+
+    def __init__(self, directory, keep=5, max_age_hours=96):
+        """
+        directory: 快照文件目录
+        keep: 保留的快照版本数
+        max_age_hours: 快照超过该时长后不再使用（覆盖周末和短假期）
+        """
+        self.directory = directory
+        self.keep = keep
+        self.max_age = max_age_hours * 3600
+        self._current = None
+        self._index = None
+        self._index_lock = threading.Lock()
+
+    def _versions(self):
+        """目录中的快照版本，从旧到新"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)]
+        return sorted(name[len(SNAPSHOT_PREFIX):-len(SNAPSHOT_SUFFIX)] for name in names)
+
+    def path(self, version):
+        return os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{version}{SNAPSHOT_SUFFIX}")
+
+    def load_latest(self):
+        """读取最新的可用快照，损坏的文件跳过，返回是否读取成功"""
+        for version in reversed(self._versions()):
+            try:
+                with open(self.path(version), encoding='utf-8') as f:
+                    self._current = json.load(f)
+                logger.info(f"已加载快照 {version}，共 {len(self._current['reports'])} 只股票")
+                return True
+            except Exception as e:
+                logger.warning(f"读取快照 {version} 失败: {str(e)}")
+        return False
+
+    def publish(self, reports, params_fingerprint, started_at=None):
+        """写入新版本快照并替换当前快照，返回版本号"""
+        now = datetime.now()
+        version = now.strftime('%Y%m%d%H%M%S')
+        snapshot = {
+            'version': version,
+            'created_at': time.time(),
+            'started_at': started_at,
+            'params': params_fingerprint,
+            'reports': reports,
+        }
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(version)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, default=_json_default)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        # 报告转换为 JSON 兼容的类型后再替换，与从文件加载的快照一致
+        self._current = json.loads(json.dumps(snapshot, default=_json_default))
+        self._prune()
+        return version
+
+    def _prune(self):
+        """删除超出保留数量的旧版本"""
+        versions = self._versions()
+        for version in versions[:max(0, len(versions) - max(self.keep, 1))]:
+            try:
+                os.remove(self.path(version))
+            except OSError as e:
+                logger.warning(f"删除旧快照 {version} 失败: {str(e)}")
+
+    def _usable(self, snapshot, params_fingerprint):
+        return (snapshot is not None and snapshot['params'] == params_fingerprint
+                and time.time() - snapshot['created_at'] <= self.max_age)
+
+    def get(self, stock_code, params_fingerprint):
+        """快照中的报告副本；没有快照、参数不一致、快照过期或股票不在快照中时返回 None"""
+        snapshot = self._current
+        if not self._usable(snapshot, params_fingerprint):
+            return None
+        report = snapshot['reports'].get(stock_code)
+        return copy.deepcopy(report) if report is not None else None
+
+    def screener(self, params_fingerprint):
+        """当前快照的选股索引，每个快照版本只构建一次；快照不可用时返回 None"""
+        snapshot = self._current
+        if not self._usable(snapshot, params_fingerprint):
+            return None
+        with self._index_lock:
+            if self._index is None or self._index[0] is not snapshot:
+                self._index = (snapshot, ScreenerIndex.from_reports(snapshot['reports'], snapshot['version']))
+            return self._index[1]
+
+    def info(self, params_fingerprint=None):
+        """当前快照的版本信息"""
+        snapshot = self._current
+        if snapshot is None:
+            return {'version': None, 'count': 0, 'usable': False}
+        return {
+            'version': snapshot['version'],
+            'created_at': snapshot['created_at'],
+            'count': len(snapshot['reports']),
+            'usable': self._usable(snapshot, params_fingerprint) if params_fingerprint else None,
+        }
+
+
+class SnapshotScheduler:
+    """每个交易日收盘后构建快照的后台线程"""
+
+    def __init__(self, analyzer, store, universe, run_at='15:30', max_workers=8, compute_workers=0, chunksize=16,
+                 bulk_refresh=True):
+        """
+        analyzer: StockAnalyzer
+        store: SnapshotStore
+        universe: 股票代码列表，或返回股票代码列表的函数（每次构建时调用）
+        run_at: 每个工作日的构建时间 HH:MM
+        max_workers / compute_workers / chunksize: 与 scan_market 相同的并发参数
+        bulk_refresh: 构建前先用一次全市场行情请求刷新本地K线存储的最新K线（analyzer.refresh_latest），
+                      已有本地数据的股票构建时不再逐只请求数据源
+        启用共享存储（analyzer.shared_store）时，快照发布后同时发布新版本的共享K线和指标（analyzer.publish_shared）
+        """
+        self.analyzer = analyzer
+        self.store = store
+        self.universe = universe
+        self.run_at = datetime.strptime(run_at, '%H:%M').time()
+        self.options = {'max_workers': max_workers, 'compute_workers': compute_workers, 'chunksize': chunksize}
+        self.bulk_refresh = bulk_refresh
+        self.building = False
+        self.last_error = None
+        self.last_duration = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def next_run(self, now=None):
+        """下一次构建时间：工作日的 run_at"""
+        now = now or datetime.now()
+        candidate = datetime.combine(now.date(), self.run_at)
+        if candidate <= now:
+            candidate += timedelta(days=1)
+        while candidate.weekday() >= 5:
+            candidate += timedelta(days=1)
+        return candidate
+
+    def start(self):
+        """加载最新的快照文件并启动调度线程"""
+        if self._thread is None:
+            self.store.load_latest()
+            self._thread = threading.Thread(target=self._loop, name='snapshot-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            delay = (self.next_run() - datetime.now()).total_seconds()
+            if self._stop.wait(max(delay, 0)):
+                break
+            self.build()
+
+    def trigger(self):
+        """立即在后台构建一次，已在构建时返回 False"""
+        if self.building:
+            return False
+        threading.Thread(target=self.build, name='snapshot-build', daemon=True).start()
+        return True
+
+    def build(self):
+        """完整分析股票池并发布快照，返回版本号；已在构建或失败时返回 None"""
+        with self._lock:
+            if self.building:
+                return None
+            self.building = True
+
+        started_at = time.time()
+        try:
+            universe = self.universe() if callable(self.universe) else self.universe
+            logger.info(f"开始构建快照，共 {len(universe)} 只股票")
+            if self.bulk_refresh and self.analyzer.bar_store is not None:
+                try:
+                    self.analyzer.refresh_latest()
+                except Exception as e:
+                    # 批量刷新失败时构建照常进行，逐只向数据源补取
+                    logger.warning(f"批量刷新最新K线失败，逐只获取: {str(e)}")
+            reports = self.analyzer.analyze_batch(universe, use_snapshot=False, **self.options)
+            version = self.store.publish(reports, self.analyzer.params_fingerprint(), started_at)
+            if self.analyzer.shared_store is not None:
+                try:
+                    self.analyzer.publish_shared(universe, self.options['max_workers'])
+                except Exception as e:
+                    # 共享存储发布失败不影响快照，各进程继续使用上一个版本
+                    logger.warning(f"发布共享存储失败: {str(e)}")
+            self.last_error = None
+            self.last_duration = time.time() - started_at
+            logger.info(f"快照 {version} 构建完成，成功 {len(reports)}/{len(universe)} 只，"
+                        f"耗时 {self.last_duration:.1f} 秒")
+            return version
+        except Exception as e:
+            logger.error(f"构建快照失败: {str(e)}")
+            self.last_error = str(e)
+            return None
+        finally:
+            self.building = False
+
+    def status(self):
+        """快照和调度状态"""
+        info = self.store.info(self.analyzer.params_fingerprint())
+        info.update({
+            'building': self.building,
+            'next_run': self.next_run().strftime('%Y-%m-%d %H:%M:%S'),
+            'last_duration': self.last_duration,
+            'last_error': self.last_error,
+        })
+        return info
+
+
+def setup_from_env(analyzer):
+    """
+    按环境变量启用快照，返回未启动的 SnapshotScheduler；未配置 SNAPSHOT_UNIVERSE 时返回 None
+
+    服务启动时（Flask 的 main()、ASGI 的 lifespan）调用 start() 加载最新的快照文件，
+    之后每个工作日 SNAPSHOT_TIME 重新构建。导入服务模块的计算进程不调用 start()，不会各自构建快照
+    """
+    spec = os.getenv('SNAPSHOT_UNIVERSE', '')
+    if not spec.strip():
+        return None
+
+    store = SnapshotStore(os.getenv('SNAPSHOT_DIR', os.path.join('data', 'snapshots')),
+                          keep=int(os.getenv('SNAPSHOT_KEEP', 5)),
+                          max_age_hours=float(os.getenv('SNAPSHOT_MAX_AGE_HOURS', 96)))
+    analyzer.snapshot = store
+
+    scheduler = SnapshotScheduler(
+        analyzer, store, lambda: load_universe(spec, analyzer.provider),
+        run_at=os.getenv('SNAPSHOT_TIME', '15:30'),
+        max_workers=int(os.getenv('SNAPSHOT_MAX_WORKERS', 8)),
+        compute_workers=int(os.getenv('SNAPSHOT_COMPUTE_WORKERS', 0)),
+        chunksize=int(os.getenv('SCAN_CHUNK_SIZE', 16)),
+        bulk_refresh=os.getenv('SNAPSHOT_BULK_REFRESH', 'true').lower() == 'true',
+    )
+    return scheduler
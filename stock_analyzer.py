@@ -6,9 +6,36 @@ import requests
 from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 import logging
+import json
+import copy
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from bar_store import BarStore
+from data_providers import create_provider
+from indicator_cache import IndicatorCache
+from shared_store import SharedStore
+from singleflight import SingleFlight
+import metrics
+import indicator_kernels as kernels
+import panel
+import scoring
+import backtest
+import compact
+import sweep
+from streaming import StreamingIndicatorState
+
+# 分析报告用到的技术指标列
+REPORT_FIELDS = scoring.INDICATOR_FIELDS + ('ATR',)
+
+# 支撑压力位使用的最近K线数
+SUPPORT_RESISTANCE_BARS = 20
+
+# 按K线数估算日历天数：每年约240个交易日，另加长假的余量
+CALENDAR_DAYS_PER_BAR = 365 / 240
+CALENDAR_DAYS_MARGIN = 15
 
 class StockAnalyzer:
-    def __init__(self, initial_cash=1000000):
+    def __init__(self, initial_cash=1000000, bar_store_dir=None, provider=None, shared_store_dir=None):
         # 设置日志
         logging.basicConfig(level=logging.INFO,
                           format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,6 +44,9 @@ class StockAnalyzer:
         # 加载环境变量
         load_dotenv()
         
+        # 回测时每只股票的初始资金
+        self.initial_cash = initial_cash
+        
         # 配置参数
         self.params = {
             'ma_periods': {'short': 5, 'medium': 20, 'long': 60},
@@ -35,494 +65,530 @@ class StockAnalyzer:
             'z_score_period': 20
         }
         
-    def get_stock_data(self, stock_code, start_date=None, end_date=None):
-        """获取股票数据"""
-        import akshare as ak
+        # 行情数据源：data_providers.DataProvider 实例或名称，默认读取 MARKET_DATA_PROVIDER
+        if provider is None or isinstance(provider, str):
+            provider = create_provider(provider)
+        self.provider = provider
+        
+        # 本地K线存储，设置 BAR_STORE_DIR 后启用；不同数据源的数据分目录保存，互不混用
+        if bar_store_dir is None:
+            bar_store_dir = os.getenv('BAR_STORE_DIR', '')
+        self.bar_store = None
+        if bar_store_dir:
+            self.bar_store = BarStore(os.path.join(bar_store_dir, provider.name or type(provider).__name__),
+                                      refresh_interval=int(os.getenv('BAR_STORE_REFRESH_SECONDS', 300)))
+        
+        # 计算好技术指标的 DataFrame 缓存，所有接口共享
+        self.indicator_cache = IndicatorCache(
+            max_size=int(os.getenv('INDICATOR_CACHE_SIZE', 256)),
+            ttl=int(os.getenv('INDICATOR_CACHE_TTL', 300))
+        )
+        
+        # 同一主机上各进程共享的内存映射K线和指标存储（shared_store.SharedStore），设置 SHARED_STORE_DIR 后启用
+        if shared_store_dir is None:
+            shared_store_dir = os.getenv('SHARED_STORE_DIR', '')
+        self.shared_store = None
+        if shared_store_dir:
+            self.shared_store = SharedStore(shared_store_dir, keep=int(os.getenv('SHARED_STORE_KEEP', 3)))
         
+        # 紧凑模式：写入指标缓存的数据只保留分析用到的列，数值列在误差不超过容差时降为 float32
+        self.compact_frames = os.getenv('COMPACT_FRAMES', 'false').lower() == 'true'
+        self.compact_tolerance = float(os.getenv('COMPACT_TOLERANCE', compact.DEFAULT_TOLERANCE))
+        
+        # 合并同一股票、参数和日期的并发请求，只获取和计算一次
+        self.inflight = SingleFlight()
+        
+        # 收盘后预计算的快照（snapshot.SnapshotStore），设置后优先从快照读取报告
+        self.snapshot = None
+        
+        # 只分析最新K线时 EMA 类指标的收敛容差，决定需要获取和计算的K线数
+        self.latest_tolerance = float(os.getenv('LATEST_EMA_TOLERANCE', kernels.DEFAULT_EMA_TOLERANCE))
+        
+        # 计算阶段的进程池，首次使用时创建
+        self._process_pool = None
+        self._process_pool_workers = 0
+        
+    def _resolve_dates(self, start_date, end_date):
+        """补全默认日期区间：最近一年"""
         if start_date is None:
             start_date = (datetime.now() - timedelta(days=365)).strftime('%Y%m%d')
         if end_date is None:
             end_date = datetime.now().strftime('%Y%m%d')
+        return start_date, end_date
+        
+    def params_fingerprint(self):
+        """参数指纹，参数变化后缓存自动失效"""
+        return json.dumps(self.params, sort_keys=True)
+        
+    def get_stock_data(self, stock_code, start_date=None, end_date=None, adjust="qfq"):
+        """获取股票数据，优先读取本地K线存储，只向数据源补取增量部分"""
+        start_date, end_date = self._resolve_dates(start_date, end_date)
             
         try:
-            # 使用 akshare 获取股票数据
-            df = ak.stock_zh_a_hist(symbol=stock_code, 
-                                  start_date=start_date, 
-                                  end_date=end_date,
-                                  adjust="qfq")
-            
-            # 重命名列名以匹配分析需求
-            df = df.rename(columns={
-                "日期": "date",
-                "开盘": "open",
-                "收盘": "close",
-                "最高": "high",
-                "最低": "low",
-                "成交量": "volume"
-            })
-            
-            # 确保日期格式正确
-            df['date'] = pd.to_datetime(df['date'])
-            
-            # 数据类型转换
-            numeric_columns = ['open', 'close', 'high', 'low', 'volume']
-            df[numeric_columns] = df[numeric_columns].apply(pd.to_numeric, errors='coerce')
-            
-            # 删除空值
-            df = df.dropna()
-            
-            return df.sort_values('date')
+            with metrics.STAGE_SECONDS.time(stage='load'):
+                if self.bar_store is None:
+                    return self._fetch_stock_data(stock_code, start_date, end_date, adjust)
+                
+                return self.bar_store.get(
+                    stock_code, start_date, end_date, adjust,
+                    lambda start, end: self._fetch_stock_data(stock_code, start, end, adjust)
+                )
             
         except Exception as e:
+            metrics.ERRORS.inc(stage='load')
             self.logger.error(f"获取股票数据失败: {str(e)}")
             raise Exception(f"获取股票数据失败: {str(e)}")
             
+    def _fetch_stock_data(self, stock_code, start_date, end_date, adjust):
+        """从数据源获取股票数据"""
+        try:
+            with metrics.STAGE_SECONDS.time(stage='fetch'):
+                df = self.provider.get_daily(stock_code, start_date, end_date, adjust)
+        except Exception:
+            metrics.UPSTREAM_REQUESTS.inc(source=self.provider.name, result='error')
+            raise
+        metrics.UPSTREAM_REQUESTS.inc(source=self.provider.name, result='ok')
+        return df
+            
+    def _indicator_cache_key(self, stock_code, start_date, end_date, adjust):
+        """技术指标缓存键"""
+        return (stock_code, start_date, end_date, adjust, self.params_fingerprint())
+        
+    def get_indicator_data(self, stock_code, start_date=None, end_date=None, adjust="qfq", fields=None):
+        """
+        获取计算好技术指标的数据，命中缓存时不再重复获取和计算
+        
+        fields 为指标列名列表时只计算这些指标及其依赖；已缓存全部指标时直接使用，
+        因此返回的数据至少包含 fields 中的列。返回的 DataFrame 与缓存共享，需要修改时先 copy()
+        """
+        start_date, end_date = self._resolve_dates(start_date, end_date)
+        key = self._indicator_cache_key(stock_code, start_date, end_date, adjust)
+        
+        df = self._lookup_indicators(key)
+        if df is not None:
+            return df
+            
+        if fields is not None:
+            fields, _ = kernels.resolve_fields(fields)
+            key = key + (tuple(fields),)
+            df = self.indicator_cache.get(key)
+            if df is not None:
+                return df
+                
+        def load():
+            df = self.get_stock_data(stock_code, start_date, end_date, adjust)
+            return self._compute_indicator_data(key, df, fields)
+            
+        return self._load_once(key, load)
+        
+    def latest_window(self, fields=REPORT_FIELDS):
+        """只需要最新K线时要获取的K线数：各指标的预热长度，且覆盖 OBV 趋势和支撑压力位用到的最近几根K线"""
+        return max(kernels.warmup_bars(self.params, fields, self.latest_tolerance),
+                   scoring.OBV_TREND_BARS + 1, SUPPORT_RESISTANCE_BARS)
+        
+    def get_latest_indicator_data(self, stock_code, adjust="qfq", fields=REPORT_FIELDS):
+        """
+        只获取和计算最新K线所需的尾部数据
+        
+        K线数由 latest_window 决定：滚动类指标的最新值与完整历史完全一致；EMA 类（EMA、MACD）
+        与完整历史之差不超过 latest_tolerance × 截断处价格与均线的偏离；OBV 的水平值不同，但差值（趋势）一致。
+        需要的K线超出默认区间（最近一年）时与完整分析相同，直接返回 get_indicator_data 的结果
+        """
+        fields, bars, start_date, end_date, key = self._latest_request(stock_code, adjust, fields)
+        if key is None:
+            return self.get_indicator_data(stock_code, adjust=adjust)
+        
+        df = self.indicator_cache.get(key)
+        if df is not None:
+            return df
+            
+        def load():
+            df = self.get_stock_data(stock_code, start_date, end_date, adjust)
+            if len(df) < bars:
+                # 停牌较多时估算的日历天数不够，退回默认区间
+                df = self.get_stock_data(stock_code, None, end_date, adjust)
+            df = df.tail(bars).reset_index(drop=True)
+            return self._compute_indicator_data(key, df, fields)
+            
+        return self._load_once(key, load)
+        
+    def _latest_request(self, stock_code, adjust, fields):
+        """
+        只需要最新K线时的请求参数：(指标列, K线数, 起始日期, 结束日期, 缓存键)
+
+        估算的起始日期不晚于默认区间的起始日期时，缓存键为 None，表示应使用完整分析
+        """
+        fields, _ = kernels.resolve_fields(fields)
+        bars = self.latest_window(fields)
+        now = datetime.now()
+        end_date = now.strftime('%Y%m%d')
+        start_date = (now - timedelta(days=int(bars * CALENDAR_DAYS_PER_BAR) + CALENDAR_DAYS_MARGIN)).strftime('%Y%m%d')
+        if start_date <= self._resolve_dates(None, None)[0]:
+            return fields, bars, start_date, end_date, None
+        key = self._indicator_cache_key(stock_code, 'latest', end_date, adjust) + (bars, tuple(fields))
+        return fields, bars, start_date, end_date, key
+        
+    def _load_once(self, key, load):
+        """缓存未命中时加载指标数据，同一缓存键的并发请求只执行一次 load，其余请求共享同一份只读结果"""
+        def load_unless_cached():
+            # 从未命中缓存到开始加载之间，上一次加载可能刚刚完成并写入缓存
+            df = self._lookup_indicators(key)
+            return df if df is not None else load()
+            
+        df, _ = self.inflight.do(('indicators',) + key, load_unless_cached)
+        return df
+        
+    def _lookup_indicators(self, key):
+        """
+        查找已计算的技术指标：先查本进程的缓存，完整指标再查共享存储
+        
+        共享存储的结果直接建立在映射文件的只读视图上，不复制，也不写入本进程的缓存，常驻内存不随服务进程数增加
+        """
+        df = self.indicator_cache.get(key)
+        if df is not None or self.shared_store is None or len(key) != 5:
+            return df
+        df = self.shared_store.frame(*key)
+        metrics.CACHE_LOOKUPS.inc(cache='shared', result='miss' if df is None else 'hit')
+        return df
+        
+    def _compute_indicator_data(self, key, df, fields=None):
+        """计算技术指标并写入缓存"""
+        df = self.calculate_indicators(df, fields)
+        return self._cache_indicators(key, df)
+        
+    def _cache_indicators(self, key, df):
+        """写入指标缓存，紧凑模式下先转换为紧凑格式（compact.compact_frame），返回写入的数据"""
+        if self.compact_frames:
+            df = compact.compact_frame(df, self.compact_tolerance)
+        self.indicator_cache.put(key, df)
+        return df
+        
     def calculate_ema(self, series, period):
         """计算指数移动平均线"""
-        return series.ewm(span=period, adjust=False).mean()
+        return pd.Series(kernels.ema(series.to_numpy(), period), index=series.index)
         
     def calculate_rsi(self, series, period):
         """计算RSI指标"""
-        delta = series.diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-        rs = gain / loss
-        return 100 - (100 / (1 + rs))
+        return pd.Series(kernels.rsi(series.to_numpy(), period), index=series.index)
         
     def calculate_macd(self, series):
         """计算MACD指标"""
-        exp1 = series.ewm(span=12, adjust=False).mean()
-        exp2 = series.ewm(span=26, adjust=False).mean()
-        macd = exp1 - exp2
-        signal = macd.ewm(span=9, adjust=False).mean()
-        hist = macd - signal
-        return macd, signal, hist
+        macd, signal, hist = kernels.macd(series.to_numpy())
+        return (pd.Series(macd, index=series.index), pd.Series(signal, index=series.index),
+                pd.Series(hist, index=series.index))
         
     def calculate_bollinger_bands(self, series, period, std_dev):
         """计算布林带"""
-        middle = series.rolling(window=period).mean()
-        std = series.rolling(window=period).std()
-        upper = middle + (std * std_dev)
-        lower = middle - (std * std_dev)
-        return upper, middle, lower
+        upper, middle, lower = kernels.bollinger_bands(series.to_numpy(), period, std_dev)
+        return (pd.Series(upper, index=series.index), pd.Series(middle, index=series.index),
+                pd.Series(lower, index=series.index))
         
     def calculate_atr(self, df, period):
         """计算ATR指标"""
-        high = df['high']
-        low = df['low']
-        close = df['close'].shift(1)
-        
-        tr1 = high - low
-        tr2 = abs(high - close)
-        tr3 = abs(low - close)
-        
-        tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-        return tr.rolling(window=period).mean()
+        atr = kernels.atr(df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy(), period)
+        return pd.Series(atr, index=df.index)
         
     def calculate_stochastic(self, df, k_period, d_period):
         """计算随机震荡指标(Stochastic Oscillator)"""
-        high_roll = df['high'].rolling(window=k_period).max()
-        low_roll = df['low'].rolling(window=k_period).min()
-        k = 100 * (df['close'] - low_roll) / (high_roll - low_roll)
-        d = k.rolling(window=d_period).mean()
-        return k, d
+        k, d = kernels.stochastic(df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy(),
+                                  k_period, d_period)
+        return pd.Series(k, index=df.index), pd.Series(d, index=df.index)
         
     def calculate_cci(self, df, period):
         """计算顺势指标(CCI)"""
-        typical_price = (df['high'] + df['low'] + df['close']) / 3
-        mean_tp = typical_price.rolling(window=period).mean()
-        mean_deviation = abs(typical_price - mean_tp).rolling(window=period).mean()
-        cci = (typical_price - mean_tp) / (0.015 * mean_deviation)
-        return cci
+        cci = kernels.cci(df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy(), period)
+        return pd.Series(cci, index=df.index)
         
     def calculate_adx(self, df, period):
         """计算平均趋向指数(ADX)"""
-        tr = self.calculate_tr(df)
-        up_move = df['high'].diff()
-        down_move = df['low'].diff(-1).abs()
-        
-        plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0)
-        minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0)
-        
-        plus_di = 100 * pd.Series(plus_dm).rolling(window=period).mean() / tr.rolling(window=period).mean()
-        minus_di = 100 * pd.Series(minus_dm).rolling(window=period).mean() / tr.rolling(window=period).mean()
-        
-        dx = 100 * abs(plus_di - minus_di) / (plus_di + minus_di)
-        adx = dx.rolling(window=period).mean()
-        
-        return adx, plus_di, minus_di
+        adx, plus_di, minus_di = kernels.adx(df['high'].to_numpy(), df['low'].to_numpy(),
+                                             df['close'].to_numpy(), period)
+        return (pd.Series(adx, index=df.index), pd.Series(plus_di, index=df.index),
+                pd.Series(minus_di, index=df.index))
         
     def calculate_tr(self, df):
         """计算真实波幅(True Range)"""
-        high = df['high']
-        low = df['low']
-        close_prev = df['close'].shift(1)
-        
-        tr1 = high - low
-        tr2 = abs(high - close_prev)
-        tr3 = abs(low - close_prev)
-        
-        tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-        return tr
+        tr = kernels.true_range(df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy())
+        return pd.Series(tr, index=df.index)
         
     def calculate_ichimoku(self, df, tenkan_period, kijun_period, senkou_span_b_period):
         """计算一目均衡表(Ichimoku Cloud)"""
-        # 转换线(Tenkan-sen)
-        tenkan_high = df['high'].rolling(window=tenkan_period).max()
-        tenkan_low = df['low'].rolling(window=tenkan_period).min()
-        tenkan_sen = (tenkan_high + tenkan_low) / 2
-        
-        # 基准线(Kijun-sen)
-        kijun_high = df['high'].rolling(window=kijun_period).max()
-        kijun_low = df['low'].rolling(window=kijun_period).min()
-        kijun_sen = (kijun_high + kijun_low) / 2
-        
-        # 先行带A(Senkou Span A)
-        senkou_span_a = ((tenkan_sen + kijun_sen) / 2).shift(kijun_period)
-        
-        # 先行带B(Senkou Span B)
-        senkou_b_high = df['high'].rolling(window=senkou_span_b_period).max()
-        senkou_b_low = df['low'].rolling(window=senkou_span_b_period).min()
-        senkou_span_b = ((senkou_b_high + senkou_b_low) / 2).shift(kijun_period)
-        
-        # 延迟线(Chikou Span)
-        chikou_span = df['close'].shift(-kijun_period)
-        
-        return tenkan_sen, kijun_sen, senkou_span_a, senkou_span_b, chikou_span
+        lines = kernels.ichimoku(df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy(),
+                                 tenkan_period, kijun_period, senkou_span_b_period)
+        return tuple(pd.Series(line, index=df.index) for line in lines)
         
     def calculate_obv(self, df):
         """计算能量潮(OBV)"""
-        obv = np.zeros(len(df))
-        for i in range(1, len(df)):
-            if df['close'].iloc[i] > df['close'].iloc[i-1]:
-                obv[i] = obv[i-1] + df['volume'].iloc[i]
-            elif df['close'].iloc[i] < df['close'].iloc[i-1]:
-                obv[i] = obv[i-1] - df['volume'].iloc[i]
-            else:
-                obv[i] = obv[i-1]
-        return pd.Series(obv, index=df.index)
+        return pd.Series(kernels.obv(df['close'].to_numpy(), df['volume'].to_numpy()), index=df.index)
         
     def calculate_mfi(self, df, period):
         """计算资金流量指标(MFI)"""
-        typical_price = (df['high'] + df['low'] + df['close']) / 3
-        raw_money_flow = typical_price * df['volume']
-        
-        positive_flow = np.where(typical_price > typical_price.shift(1), raw_money_flow, 0)
-        negative_flow = np.where(typical_price < typical_price.shift(1), raw_money_flow, 0)
-        
-        positive_flow_sum = pd.Series(positive_flow).rolling(window=period).sum()
-        negative_flow_sum = pd.Series(negative_flow).rolling(window=period).sum()
-        
-        money_ratio = positive_flow_sum / negative_flow_sum
-        mfi = 100 - (100 / (1 + money_ratio))
-        
-        return mfi
+        mfi = kernels.mfi(df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy(),
+                          df['volume'].to_numpy(), period)
+        return pd.Series(mfi, index=df.index)
         
     def calculate_standard_deviation(self, series, period):
         """计算标准差"""
-        return series.rolling(window=period).std()
+        return pd.Series(kernels.rolling_std(series.to_numpy(), period), index=series.index)
         
     def calculate_z_score(self, series, period):
         """计算Z-Score"""
-        mean = series.rolling(window=period).mean()
-        std = series.rolling(window=period).std()
-        return (series - mean) / std
+        return pd.Series(kernels.z_score(series.to_numpy(), period), index=series.index)
         
-    def calculate_indicators(self, df):
-        """计算技术指标"""
+    def calculate_indicators(self, df, fields=None, workspace=None):
+        """
+        计算技术指标，fields 为指标列名列表时只计算这些指标及其依赖（见 indicator_kernels.INDICATORS）
+        
+        workspace 为同一组K线上已有中间结果的 kernels.Workspace 时复用其中的结果
+        """
         try:
-            # 📊 一、趋势类指标（Trend Indicators）
-            # MA（Moving Average）移动平均线
-            df['SMA5'] = df['close'].rolling(window=self.params['ma_periods']['short']).mean()
-            df['SMA20'] = df['close'].rolling(window=self.params['ma_periods']['medium']).mean()
-            df['SMA60'] = df['close'].rolling(window=self.params['ma_periods']['long']).mean()
-            df['EMA5'] = self.calculate_ema(df['close'], self.params['ma_periods']['short'])
-            df['EMA20'] = self.calculate_ema(df['close'], self.params['ma_periods']['medium'])
-            df['EMA60'] = self.calculate_ema(df['close'], self.params['ma_periods']['long'])
-            
-            # MACD（移动平均收敛/发散指标）
-            df['MACD'], df['Signal'], df['MACD_hist'] = self.calculate_macd(df['close'])
-            
-            # Bollinger Bands（布林带）
-            df['BB_upper'], df['BB_middle'], df['BB_lower'] = self.calculate_bollinger_bands(
-                df['close'],
-                self.params['bollinger_period'],
-                self.params['bollinger_std']
-            )
-            
-            # ADX（平均趋向指数）
-            df['ADX'], df['DI+'], df['DI-'] = self.calculate_adx(df, self.params['adx_period'])
-            
-            # Ichimoku Cloud（一目均衡表）
-            df['Tenkan'], df['Kijun'], df['Senkou_A'], df['Senkou_B'], df['Chikou'] = self.calculate_ichimoku(
-                df,
-                self.params['ichimoku']['tenkan'],
-                self.params['ichimoku']['kijun'],
-                self.params['ichimoku']['senkou_span_b']
-            )
-            
-            # ⚡ 二、动量类指标（Momentum Indicators）
-            # RSI（相对强弱指标）
-            df['RSI'] = self.calculate_rsi(df['close'], self.params['rsi_period'])
-            
-            # Stochastic Oscillator（随机震荡指标）
-            df['Stoch_K'], df['Stoch_D'] = self.calculate_stochastic(
-                df, 
-                self.params['stochastic_k'],
-                self.params['stochastic_d']
-            )
-            
-            # CCI（顺势指标）
-            df['CCI'] = self.calculate_cci(df, self.params['cci_period'])
-            
-            # ROC（变动率指标）
-            df['ROC'] = df['close'].pct_change(periods=10) * 100
-            
-            # 💹 三、成交量类指标（Volume Indicators）
-            # OBV（能量潮）
-            df['OBV'] = self.calculate_obv(df)
-            
-            # VOL（成交量）
-            df['Volume_MA'] = df['volume'].rolling(window=self.params['volume_ma_period']).mean()
-            df['Volume_Ratio'] = df['volume'] / df['Volume_MA']
-            
-            # MFI（资金流量指标）
-            df['MFI'] = self.calculate_mfi(df, self.params['mfi_period'])
-            
-            # 🧠 四、波动率类指标（Volatility Indicators）
-            # ATR（平均真实波幅）
-            df['ATR'] = self.calculate_atr(df, self.params['atr_period'])
-            df['Volatility'] = df['ATR'] / df['close'] * 100
-            
-            # Standard Deviation（标准差）
-            df['StdDev'] = self.calculate_standard_deviation(df['close'], self.params['std_dev_period'])
-            
-            # 🧮 五、统计套利类指标
-            # Z-Score
-            df['Z-Score'] = self.calculate_z_score(df['close'], self.params['z_score_period'])
+            with metrics.STAGE_SECONDS.time(stage='indicators'):
+                # 趋势、动量、成交量、波动率、统计套利五类指标，由 indicator_kernels 按依赖图在 ndarray 上算出
+                indicators = kernels.compute_indicators(
+                    df['high'].to_numpy(),
+                    df['low'].to_numpy(),
+                    df['close'].to_numpy(),
+                    df['volume'].to_numpy(),
+                    self.params,
+                    workspace=workspace,
+                    fields=fields
+                )
+                for name, values in indicators.items():
+                    df[name] = values
             
             return df
             
         except Exception as e:
+            metrics.ERRORS.inc(stage='indicators')
             self.logger.error(f"计算技术指标时出错: {str(e)}")
             raise
             
-    def calculate_score(self, df):
-        """计算股票评分 - 更加详细和精确的评分系统"""
+    def calculate_indicators_panel(self, stock_list, start_date=None, end_date=None, max_workers=None,
+                                   fields=None):
+        """
+        面板模式：一次向量化计算多只股票的技术指标
+        
+        返回 (日期索引, 股票代码列表, {指标名: (日期 × 股票) 数组})，fields 指定时只计算这些指标，
+        获取数据失败的股票记录日志后跳过
+        """
+        dates, codes, price_fields = self._load_panel(stock_list, start_date, end_date, max_workers)
+        if not codes:
+            return dates, codes, {}
+            
+        indicators = panel.compute_panel(price_fields['open'], price_fields['high'], price_fields['low'],
+                                         price_fields['close'], price_fields['volume'], self.params, fields)
+        return dates, codes, indicators
+        
+    def _load_panel(self, stock_list, start_date, end_date, max_workers):
+        """并发获取多只股票的K线并合并为面板，获取失败的股票记录日志后跳过"""
+        frames = self._load_frames(stock_list, start_date, end_date, max_workers)
+        if not frames:
+            return pd.DatetimeIndex([]), [], {}
+        return panel.frames_to_panel(frames)
+        
+    def _load_frames(self, stock_list, start_date, end_date, max_workers):
+        """并发获取多只股票的K线，返回 {股票代码: DataFrame}，获取失败的股票记录日志后跳过"""
+        start_date, end_date = self._resolve_dates(start_date, end_date)
+        
+        def fetch(stock_code):
+            try:
+                return stock_code, self.get_stock_data(stock_code, start_date, end_date)
+            except Exception as e:
+                self.logger.error(f"获取股票 {stock_code} 数据时出错: {str(e)}")
+                return stock_code, None
+                
+        with ThreadPoolExecutor(max_workers=max_workers or 1) as executor:
+            return {code: df for code, df in executor.map(fetch, stock_list) if df is not None and len(df) > 0}
+            
+    def _panel_indicator_frames(self, frames):
+        """在面板上一次向量化计算多只股票的全部技术指标，返回 {股票代码: 含指标列的 DataFrame}"""
+        with metrics.STAGE_SECONDS.time(stage='indicators'):
+            _, codes, fields = panel.frames_to_panel(frames)
+            _, _, counts, packed = panel.compute_packed(fields['open'], fields['high'], fields['low'],
+                                                        fields['close'], fields['volume'], self.params)
+            results = {}
+            for j, stock_code in enumerate(codes):
+                df = frames[stock_code]
+                indicators = pd.DataFrame({name: values[:counts[j], j] for name, values in packed.items()},
+                                          index=df.index)
+                results[stock_code] = pd.concat([df, indicators], axis=1)
+        return results
+        
+    def publish_shared(self, stock_list, max_workers=None):
+        """
+        计算股票池默认日期区间（最近一年，前复权）的技术指标，作为新版本发布到共享存储，返回版本号
+        
+        同一时间只有一个进程能发布，其他进程正在发布时返回 None
+        """
+        if self.shared_store is None:
+            raise Exception("发布共享存储需要设置 SHARED_STORE_DIR")
+            
+        try:
+            start_date, end_date = self._resolve_dates(None, None)
+            frames = self._load_frames(stock_list, start_date, end_date, max_workers)
+            if not frames:
+                raise Exception("没有可发布的股票数据")
+            # 只保存分析用到的行情列和技术指标
+            frames = self._panel_indicator_frames({code: df[['date'] + _ARRAY_COLUMNS]
+                                                   for code, df in frames.items()})
+            return self.shared_store.publish(frames, "qfq", start_date, end_date, self.params_fingerprint())
+            
+        except Exception as e:
+            self.logger.error(f"发布共享存储失败: {str(e)}")
+            raise
+        
+    def run_backtest(self, stock_list, start_date=None, end_date=None, entry_score=75, exit_score=45,
+                 commission=backtest.DEFAULT_COMMISSION, stamp_tax=backtest.DEFAULT_STAMP_TAX,
+                 slippage=backtest.DEFAULT_SLIPPAGE, max_workers=None):
+        """
+        按评分回测多只股票，每只股票以 initial_cash 起始独立回测
+        
+        默认阈值与 get_recommendation 一致：评分达到"推荐买入"(75) 时买入，
+        跌到"建议减持"(低于45) 时卖出。返回 {'equity', 'position', 'stats', 'portfolio', 'portfolio_stats'}，
+        详见 backtest.results_to_frames
+        """
         try:
-            score = 0
-            score_details = {}
-            latest = df.iloc[-1]
-            
-            # 1. 📊 趋势评分 (40分)
-            trend_score = 0
-            
-            # 1.1 移动平均线多头排列 (15分)
-            if latest['EMA5'] > latest['EMA20'] > latest['EMA60']:
-                trend_score += 15
-                score_details['ma_alignment'] = '多头排列 +15'
-            elif latest['EMA5'] < latest['EMA20'] < latest['EMA60']:
-                score_details['ma_alignment'] = '空头排列 +0'
+            dates, codes, fields = self._load_panel(stock_list, start_date, end_date, max_workers)
+            if not codes:
+                raise Exception("没有可回测的股票数据")
+                
+            result = backtest.run_panel(fields['open'], fields['high'], fields['low'], fields['close'],
+                                        fields['volume'], self.params, self.initial_cash,
+                                        entry_score=entry_score, exit_score=exit_score,
+                                        commission=commission, stamp_tax=stamp_tax, slippage=slippage)
+            return backtest.results_to_frames(dates, codes, result)
+            
+        except Exception as e:
+            self.logger.error(f"回测时出错: {str(e)}")
+            raise
+        
+    def sweep_params(self, stock_list, grid, start_date=None, end_date=None, rank_by='sharpe',
+                     workers=None, max_workers=None, entry_score=75, exit_score=45,
+                     commission=backtest.DEFAULT_COMMISSION, stamp_tax=backtest.DEFAULT_STAMP_TAX,
+                     slippage=backtest.DEFAULT_SLIPPAGE):
+        """
+        参数扫描：对 self.params 的参数网格逐一计算指标、评分并回测，按 rank_by 排序
+        
+        grid 为 {参数路径: 候选值列表}，例如 {'rsi_period': [10, 14], 'ma_periods.short': [3, 5]}。
+        workers 为计算进程数（默认 CPU 核数），max_workers 为获取数据的线程数。
+        返回每个参数组合一行的 DataFrame，详见 sweep.run_sweep
+        """
+        try:
+            dates, codes, fields = self._load_panel(stock_list, start_date, end_date, max_workers)
+            if not codes:
+                raise Exception("没有可用于参数扫描的股票数据")
+                
+            return sweep.run_sweep(fields, self.params, grid, self.initial_cash,
+                                   workers=workers if workers is not None else os.cpu_count(),
+                                   rank_by=rank_by,
+                                   cache_items=int(os.getenv('SWEEP_CACHE_ITEMS', sweep.DEFAULT_CACHE_ITEMS)),
+                                   entry_score=entry_score, exit_score=exit_score,
+                                   commission=commission, stamp_tax=stamp_tax, slippage=slippage)
+            
+        except Exception as e:
+            self.logger.error(f"参数扫描时出错: {str(e)}")
+            raise
+            
+    def refresh_latest(self, adjust="qfq"):
+        """
+        批量刷新最新K线：一次请求全市场行情表（provider.latest_quotes），把最新K线合并到本地K线存储中
+        已有的每只股票，再在面板上一次性重新计算这些股票已缓存的技术指标
+        
+        返回 {'appended', 'replaced', 'skipped': 股票代码列表, 'recomputed': 重新计算的指标缓存条目数}。
+        跳过的股票（复权历史变化、停牌等）之后仍按原方式逐只补取。
+        后复权（hfq）的最新价格不等于行情表中的价格，不支持批量刷新
+        """
+        if self.bar_store is None:
+            raise Exception("批量刷新需要启用本地K线存储（BAR_STORE_DIR）")
+        if adjust == 'hfq':
+            raise Exception("后复权数据不支持批量刷新")
+            
+        try:
+            try:
+                with metrics.STAGE_SECONDS.time(stage='fetch'):
+                    quotes = self.provider.latest_quotes()
+            except Exception:
+                metrics.UPSTREAM_REQUESTS.inc(source=self.provider.name, result='error')
+                raise
+            metrics.UPSTREAM_REQUESTS.inc(source=self.provider.name, result='ok')
+            
+            result = self.bar_store.merge_latest(quotes, adjust)
+            changed = set(result['appended']) | set(result['replaced'])
+            result['recomputed'] = self._refresh_indicator_cache(changed, adjust)
+            self.logger.info(f"批量刷新最新K线：追加 {len(result['appended'])} 只，替换 {len(result['replaced'])} 只，"
+                             f"跳过 {len(result['skipped'])} 只，重新计算 {result['recomputed']} 个指标缓存")
+            return result
+            
+        except Exception as e:
+            self.logger.error(f"批量刷新最新K线失败: {str(e)}")
+            raise
+            
+    def _refresh_indicator_cache(self, changed, adjust):
+        """
+        最新K线变化后更新指标缓存：完整指标的条目按日期区间分组，每组在面板上一次向量化重新计算；
+        只含部分指标或只含尾部K线的条目直接删除，下次使用时从本地K线存储重新计算。返回重新计算的条目数
+        """
+        fingerprint = self.params_fingerprint()
+        groups = {}
+        for key in self.indicator_cache.keys():
+            if key[0] not in changed or key[3] != adjust:
+                continue
+            if len(key) == 5 and key[4] == fingerprint:
+                groups.setdefault((key[1], key[2]), []).append(key)
             else:
-                # 部分多头特征加5分
-                if latest['EMA5'] > latest['EMA20']:
-                    trend_score += 5
-                    score_details['ma_alignment'] = '部分多头特征 +5'
+                self.indicator_cache.discard(key)
+                
+        recomputed = 0
+        for (start_date, end_date), keys in groups.items():
+            frames = {}
+            for key in keys:
+                # 本地K线存储刚刚同步过，不会向数据源请求；读取失败的条目删除（错误已由 get_stock_data 记录）
+                try:
+                    df = self.get_stock_data(key[0], start_date, end_date, adjust)
+                except Exception:
+                    df = None
+                if df is not None and len(df) > 0:
+                    frames[key[0]] = df
                 else:
-                    score_details['ma_alignment'] = '无明显排列 +0'
-            
-            # 1.2 MACD信号 (10分)
-            if latest['MACD'] > latest['Signal'] and latest['MACD_hist'] > 0:
-                # MACD金叉且柱状体为正
-                trend_score += 10
-                score_details['macd'] = '金叉且柱状体为正 +10'
-            elif latest['MACD'] > latest['Signal']:
-                # 仅MACD金叉
-                trend_score += 5
-                score_details['macd'] = '金叉 +5'
-            elif latest['MACD'] < latest['Signal'] and latest['MACD_hist'] < 0:
-                score_details['macd'] = '死叉且柱状体为负 +0'
-            else:
-                score_details['macd'] = '死叉 +0'
-            
-            # 1.3 ADX强度 (10分)
-            if latest['ADX'] > 30:
-                # 强势趋势
-                trend_score += 10
-                score_details['adx'] = f'强势趋势({latest["ADX"]:.1f}) +10'
-            elif latest['ADX'] > 20:
-                # 中等趋势
-                trend_score += 5
-                score_details['adx'] = f'中等趋势({latest["ADX"]:.1f}) +5'
-            else:
-                score_details['adx'] = f'弱势趋势({latest["ADX"]:.1f}) +0'
-            
-            # 1.4 布林带位置 (5分)
-            if latest['close'] > latest['BB_middle'] and latest['close'] < latest['BB_upper']:
-                # 上轨区域但不超买
-                trend_score += 5
-                score_details['bollinger'] = '上轨区域 +5'
-            elif latest['close'] < latest['BB_middle'] and latest['close'] > latest['BB_lower']:
-                # 下轨区域但不超卖
-                trend_score += 2
-                score_details['bollinger'] = '下轨区域 +2'
-            elif latest['close'] > latest['BB_upper']:
-                # 超过上轨(超买)不加分
-                score_details['bollinger'] = '超买区域 +0'
-            else:
-                # 超过下轨(超卖)不加分
-                score_details['bollinger'] = '超卖区域 +0'
-            
-            # 2. ⚡ 动量评分 (25分)
-            momentum_score = 0
-            
-            # 2.1 RSI (10分)
-            if 40 <= latest['RSI'] <= 60:
-                # 中性区域，增长空间
-                momentum_score += 10
-                score_details['rsi'] = f'中性({latest["RSI"]:.1f}) +10'
-            elif 30 <= latest['RSI'] < 40 or 60 < latest['RSI'] <= 70:
-                # 偏离中性但未到极值
-                momentum_score += 5
-                score_details['rsi'] = f'偏离中性({latest["RSI"]:.1f}) +5'
-            elif latest['RSI'] < 30:
-                # 超卖区域，不鼓励盲目抄底
-                momentum_score += 2
-                score_details['rsi'] = f'超卖({latest["RSI"]:.1f}) +2'
-            else:
-                # 超买区域，不鼓励追高
-                score_details['rsi'] = f'超买({latest["RSI"]:.1f}) +0'
-            
-            # 2.2 随机震荡指标KD (5分)
-            if latest['Stoch_K'] < latest['Stoch_D'] and 20 <= latest['Stoch_K'] <= 80:
-                momentum_score += 5
-                score_details['kd'] = f'K({latest["Stoch_K"]:.1f})低于D({latest["Stoch_D"]:.1f})且在合理区间 +5'
-            elif latest['Stoch_K'] > latest['Stoch_D'] and 20 <= latest['Stoch_K'] <= 80:
-                momentum_score += 3
-                score_details['kd'] = f'K({latest["Stoch_K"]:.1f})高于D({latest["Stoch_D"]:.1f})且在合理区间 +3'
-            else:
-                score_details['kd'] = f'K({latest["Stoch_K"]:.1f})和D({latest["Stoch_D"]:.1f})关系不佳或超出合理区间 +0'
-            
-            # 2.3 CCI (5分)
-            if -100 <= latest['CCI'] <= 100:
-                momentum_score += 5
-                score_details['cci'] = f'处于正常区间({latest["CCI"]:.1f}) +5'
-            elif -200 <= latest['CCI'] < -100:
-                momentum_score += 2
-                score_details['cci'] = f'偏弱({latest["CCI"]:.1f}) +2'
-            elif 100 < latest['CCI'] <= 200:
-                momentum_score += 2
-                score_details['cci'] = f'偏强({latest["CCI"]:.1f}) +2'
-            else:
-                score_details['cci'] = f'极端区域({latest["CCI"]:.1f}) +0'
-            
-            # 2.4 ROC变动率 (5分)
-            if 0 < latest['ROC'] <= 5:
-                momentum_score += 5
-                score_details['roc'] = f'适中正增长({latest["ROC"]:.1f}%) +5'
-            elif -5 <= latest['ROC'] < 0:
-                momentum_score += 2
-                score_details['roc'] = f'轻微下跌({latest["ROC"]:.1f}%) +2'
-            elif 5 < latest['ROC'] <= 10:
-                momentum_score += 2
-                score_details['roc'] = f'较快增长({latest["ROC"]:.1f}%), 风险增加 +2'
-            else:
-                score_details['roc'] = f'极端变化({latest["ROC"]:.1f}%) +0'
-            
-            # 3. 💹 成交量评分 (20分)
-            volume_score = 0
-            
-            # 3.1 成交量变化 (10分)
-            if 1.0 <= latest['Volume_Ratio'] <= 2.0:
-                # 成交量适度放大
-                volume_score += 10
-                score_details['volume'] = f'适度放大({latest["Volume_Ratio"]:.1f}) +10'
-            elif 0.5 <= latest['Volume_Ratio'] < 1.0:
-                # 略低但可接受
-                volume_score += 5
-                score_details['volume'] = f'略低但可接受({latest["Volume_Ratio"]:.1f}) +5'
-            elif latest['Volume_Ratio'] > 2.0:
-                # 过度放量可能暗示风险
-                volume_score += 2
-                score_details['volume'] = f'过度放量({latest["Volume_Ratio"]:.1f}) +2'
-            else:
-                score_details['volume'] = f'成交低迷({latest["Volume_Ratio"]:.1f}) +0'
-            
-            # 3.2 OBV趋势 (5分)
-            obv_trend = self._get_obv_trend(df)
-            if obv_trend == "上升":
-                volume_score += 5
-                score_details['obv'] = f'上升趋势 +5'
-            elif obv_trend == "横盘":
-                volume_score += 2
-                score_details['obv'] = f'横盘整理 +2'
-            else:
-                score_details['obv'] = f'下降趋势 +0'
-            
-            # 3.3 MFI资金流向 (5分)
-            if 40 <= latest['MFI'] <= 60:
-                volume_score += 5
-                score_details['mfi'] = f'中性资金流({latest["MFI"]:.1f}) +5'
-            elif 20 <= latest['MFI'] < 40 or 60 < latest['MFI'] <= 80:
-                volume_score += 3
-                score_details['mfi'] = f'偏离中性({latest["MFI"]:.1f}) +3'
-            else:
-                score_details['mfi'] = f'极端区域({latest["MFI"]:.1f}) +0'
-            
-            # 4. 🧠 波动率评分 (10分)
-            volatility_score = 0
-            
-            # 4.1 ATR与价格比率 (5分)
-            if latest['Volatility'] <= 2:
-                volatility_score += 5
-                score_details['volatility'] = f'低波动({latest["Volatility"]:.1f}%) +5'
-            elif latest['Volatility'] <= 4:
-                volatility_score += 3
-                score_details['volatility'] = f'中等波动({latest["Volatility"]:.1f}%) +3'
-            else:
-                score_details['volatility'] = f'高波动({latest["Volatility"]:.1f}%) +0'
-            
-            # 4.2 价格标准差 (5分)
-            if latest['StdDev'] / latest['close'] * 100 <= 3:
-                volatility_score += 5
-                score_details['std_dev'] = f'低离散度({latest["StdDev"]:.2f}) +5'
-            elif latest['StdDev'] / latest['close'] * 100 <= 6:
-                volatility_score += 3
-                score_details['std_dev'] = f'中等离散度({latest["StdDev"]:.2f}) +3'
-            else:
-                score_details['std_dev'] = f'高离散度({latest["StdDev"]:.2f}) +0'
-            
-            # 5. 🧮 统计套利评分 (5分)
-            stat_score = 0
-            
-            # 5.1 Z-Score均值回归可能性 (5分)
-            if -2 <= latest['Z-Score'] <= 2:
-                stat_score += 5
-                score_details['z_score'] = f'合理区间({latest["Z-Score"]:.2f}) +5'
-            elif -3 <= latest['Z-Score'] < -2 or 2 < latest['Z-Score'] <= 3:
-                stat_score += 2
-                score_details['z_score'] = f'边缘区域({latest["Z-Score"]:.2f}) +2'
-            else:
-                score_details['z_score'] = f'极端偏离({latest["Z-Score"]:.2f}) +0'
-            
-            # 汇总各部分得分
-            score = trend_score + momentum_score + volume_score + volatility_score + stat_score
-            
-            # 汇总各类别得分
-            category_scores = {
-                'trend': trend_score,
-                'momentum': momentum_score,
-                'volume': volume_score,
-                'volatility': volatility_score,
-                'statistical': stat_score
-            }
+                    self.indicator_cache.discard(key)
+            if not frames:
+                continue
+                
+            for stock_code, df in self._panel_indicator_frames(frames).items():
+                self._cache_indicators(self._indicator_cache_key(stock_code, start_date, end_date, adjust), df)
+                recomputed += 1
+        return recomputed
+        
+    def create_streaming_state(self, stock_code, start_date=None, end_date=None):
+        """用历史K线初始化流式指标状态，之后每根新K线调用 state.update(bar) 增量更新"""
+        df = self.get_stock_data(stock_code, start_date, end_date)
+        return StreamingIndicatorState.from_frame(df, self.params)
+        
+    def calculate_score(self, df):
+        """计算股票评分 - 更加详细和精确的评分系统，规则定义见 scoring.RULES"""
+        try:
+            with metrics.STAGE_SECONDS.time(stage='score'):
+                columns = scoring.latest_columns(df)
+                score, category_scores, choices = scoring.evaluate(columns)
+                
+                score_details = scoring.describe(columns, choices, ())
+                category_scores = {category: int(value) for category, value in category_scores.items()}
             
-            return score, score_details, category_scores
+            return int(score), score_details, category_scores
             
         except Exception as e:
+            metrics.ERRORS.inc(stage='score')
             self.logger.error(f"计算评分时出错: {str(e)}")
             raise
             
+    def calculate_score_history(self, df, numeric_only=False):
+        """计算每根K线的评分，返回包含 score 和各类别得分列的 DataFrame，numeric_only 为 True 时不生成评分说明"""
+        try:
+            return scoring.score_frame(df, numeric_only=numeric_only)
+        except Exception as e:
+            self.logger.error(f"计算历史评分时出错: {str(e)}")
+            raise
+            
     def get_recommendation(self, score):
         """根据得分给出建议"""
         if score >= 75:
@@ -536,22 +602,63 @@ class StockAnalyzer:
         else:
             return '建议卖出'
             
-    def analyze_stock(self, stock_code):
-        """分析单个股票"""
-        try:
-            # 获取股票数据
-            df = self.get_stock_data(stock_code)
+    def analyze_stock(self, stock_code, latest_only=False):
+        """
+        分析单个股票，latest_only 为 True 时只获取和计算最新K线所需的尾部数据
+        
+        同一股票、参数和日期的并发请求只分析一次，共享同一份报告；
+        设置了快照且快照中有该股票时直接返回快照中的报告
+        """
+        report = self.snapshot_report(stock_code)
+        if report is not None:
+            return report
+        return self._analyze_live(stock_code, latest_only)
+        
+    def snapshot_report(self, stock_code):
+        """快照中的报告，快照不可用时返回 None"""
+        if self.snapshot is None:
+            return None
+        report = self.snapshot.get(stock_code, self.params_fingerprint())
+        metrics.CACHE_LOOKUPS.inc(cache='snapshot', result='miss' if report is None else 'hit')
+        return report
+        
+    def _analyze_live(self, stock_code, latest_only=False):
+        """实时获取数据并分析"""
+        def analyze():
+            # 获取股票数据并计算技术指标
+            if latest_only:
+                df = self.get_latest_indicator_data(stock_code)
+            else:
+                df = self.get_indicator_data(stock_code)
             
-            # 计算技术指标
-            df = self.calculate_indicators(df)
+            return self._build_report(stock_code, df)
             
-            # 评分系统 - 获取详细得分
-            score, score_details, category_scores = self.calculate_score(df)
+        try:
+            key = self._analysis_key(stock_code, latest_only)
+            report, shared = self.inflight.do(key, analyze)
+            return copy.deepcopy(report) if shared else report
             
-            # 获取最新数据
-            latest = df.iloc[-1]
-            prev = df.iloc[-2]
+        except Exception as e:
+            metrics.ERRORS.inc(stage='analyze')
+            self.logger.error(f"分析股票时出错: {str(e)}")
+            raise
             
+    def _analysis_key(self, stock_code, latest_only):
+        """合并并发分析请求的键：股票代码、是否只分析最新K线、日期和参数"""
+        return ('analyze', stock_code, bool(latest_only), datetime.now().strftime('%Y%m%d'),
+                self.params_fingerprint())
+            
+    def _build_report(self, stock_code, df):
+        """根据计算好技术指标的数据生成分析报告"""
+        # 评分系统 - 获取详细得分
+        score, score_details, category_scores = self.calculate_score(df)
+        
+        with metrics.STAGE_SECONDS.time(stage='report'):
+            # 获取最新数据（紧凑模式下的 float32 列先还原为 float64，报告中的值不带 float32 的舍入尾数）
+            tail = compact.widen_frame(df.iloc[-2:])
+            latest = tail.iloc[-1]
+            prev = tail.iloc[-2]
+        
             # 生成报告
             report = {
                 'stock_code': stock_code,
@@ -561,46 +668,45 @@ class StockAnalyzer:
                 'category_scores': category_scores,
                 'price': latest['close'],
                 'price_change': (latest['close'] - prev['close']) / prev['close'] * 100,
-                
+            
                 # 趋势类指标
                 'ma_trend': 'UP' if latest['EMA5'] > latest['EMA20'] else 'DOWN',
                 'macd_signal': 'BUY' if latest['MACD'] > latest['Signal'] else 'SELL',
                 'adx': latest['ADX'],
                 'bb_position': self._get_bb_position(latest),
-                
+            
                 # 动量类指标
                 'rsi': latest['RSI'],
                 'stoch_k': latest['Stoch_K'],
                 'stoch_d': latest['Stoch_D'],
                 'cci': latest['CCI'],
                 'roc': latest['ROC'],
-                
+            
                 # 成交量类指标
                 'volume_status': 'HIGH' if latest['Volume_Ratio'] > 1.5 else 'NORMAL',
                 'obv_trend': self._get_obv_trend(df),
                 'mfi': latest['MFI'],
-                
+            
                 # 波动率指标
                 'atr': latest['ATR'],
                 'volatility': latest['Volatility'],
                 'std_dev': latest['StdDev'],
-                
+            
                 # 统计类指标
                 'z_score': latest['Z-Score'],
-                
+            
                 # 支撑压力位
                 'support_resistance': self._calculate_support_resistance(df),
-                
-                # 最终建议
-                'recommendation': self.get_recommendation(score)
-            }
             
-            return report
-            
-        except Exception as e:
-            self.logger.error(f"分析股票时出错: {str(e)}")
-            raise
+                # 最终建议
+                'recommendation': self.get_recommendation(score),
             
+                # 最新K线的全部指标值，供快照和选股查询使用
+                'indicators': {name: float(latest[name]) for name in ('close',) + REPORT_FIELDS}
+            }
+        
+        return report
+        
     def _get_bb_position(self, latest_row):
         """判断价格在布林带中的位置"""
         close = latest_row['close']
@@ -634,10 +740,10 @@ class StockAnalyzer:
         try:
             # 获取最近的价格数据
             close = df['close'].tail(20)
-            current_price = close.iloc[-1]
+            current_price = float(close.iloc[-1])
             
             # 计算波动范围
-            price_range = df['high'].tail(20).max() - df['low'].tail(20).min()
+            price_range = float(df['high'].tail(20).max()) - float(df['low'].tail(20).min())
             
             # 简单计算支撑位和压力位
             resistance = current_price + (price_range * 0.382)
@@ -647,19 +753,293 @@ class StockAnalyzer:
         except:
             return "无法计算支撑位和压力位"
             
-    def scan_market(self, stock_list, min_score=60):
-        """扫描市场，寻找符合条件的股票"""
+    def scan_market(self, stock_list, min_score=60, max_workers=None, compute_workers=None, chunksize=16,
+                    short_circuit=False):
+        """
+        扫描市场，寻找符合条件的股票
+        
+        max_workers 大于1时使用线程池并发获取数据；compute_workers 大于1时
+        技术指标和评分在进程池中计算，每批 chunksize 只股票。结果与逐只扫描一致
+        
+        short_circuit 为 True 时逐条规则评分，一旦最高可能得分低于 min_score 就放弃该股票，
+        剩余指标不再计算（见 report_above），结果不变
+        """
         recommendations = []
         
-        for stock_code in stock_list:
-            try:
-                report = self.analyze_stock(stock_code)
-                if report['score'] >= min_score:
-                    recommendations.append(report)
-            except Exception as e:
-                self.logger.error(f"分析股票 {stock_code} 时出错: {str(e)}")
+        for index, stock_code, report, error in self.iter_reports(
+                stock_list, max_workers, compute_workers, chunksize,
+                min_score=min_score if short_circuit else None):
+            if error is not None:
+                self.logger.error(f"分析股票 {stock_code} 时出错: {str(error)}")
                 continue
+            if report is not None and report['score'] >= min_score:
+                recommendations.append((index, report))
                 
-        # 按得分排序
+        # 按得分排序，同分时保持输入顺序
+        recommendations.sort(key=lambda x: x[0])
+        recommendations = [report for _, report in recommendations]
         recommendations.sort(key=lambda x: x['score'], reverse=True)
-        return recommendations 
\ No newline at end of file
+        return recommendations
+        
+    def analyze_batch(self, stock_list, max_workers=None, compute_workers=None, chunksize=16, use_snapshot=True):
+        """批量分析股票，返回 {股票代码: 报告}，失败的股票记录日志后跳过；use_snapshot 为 False 时全部实时计算"""
+        reports = {}
+        for index, stock_code, report, error in self.iter_reports(stock_list, max_workers, compute_workers,
+                                                                   chunksize, use_snapshot):
+            if error is not None:
+                self.logger.error(f"分析股票 {stock_code} 时出错: {str(error)}")
+                continue
+            reports[stock_code] = report
+        return reports
+        
+    def iter_reports(self, stock_list, max_workers=None, compute_workers=None, chunksize=16, use_snapshot=True,
+                      min_score=None):
+        """
+        逐只产出 (序号, 股票代码, 报告, 错误)，并发模式下按完成顺序产出
+        
+        快照中已有的股票最先产出，其余股票实时计算。指定 min_score 时实时计算的股票
+        一旦确定达不到 min_score 就停止计算，报告和错误均为 None
+        """
+        timer = metrics.ScanTimer()
+        reports = self._generate_reports(stock_list, max_workers, compute_workers, chunksize, use_snapshot, min_score)
+        try:
+            for item in reports:
+                timer.item(item[2], item[3])
+                yield item
+            timer.finish()
+        finally:
+            reports.close()
+            
+    def _generate_reports(self, stock_list, max_workers, compute_workers, chunksize, use_snapshot, min_score):
+        """iter_reports 的实现"""
+        items = list(enumerate(stock_list))
+        if use_snapshot and self.snapshot is not None:
+            missing = []
+            for index, stock_code in items:
+                report = self.snapshot_report(stock_code)
+                if report is None:
+                    missing.append((index, stock_code))
+                else:
+                    yield index, stock_code, report, None
+            items = missing
+            
+        if compute_workers and compute_workers > 1:
+            yield from self._iter_reports_process(items, max_workers or 1, compute_workers, chunksize, min_score)
+            return
+            
+        if not max_workers or max_workers <= 1:
+            for index, stock_code in items:
+                try:
+                    if min_score is None:
+                        yield index, stock_code, self._analyze_live(stock_code), None
+                    else:
+                        key, df, computed = self._fetch_for_analysis(stock_code)
+                        yield index, stock_code, self.report_above(key, stock_code, df, computed, min_score), None
+                except Exception as e:
+                    yield index, stock_code, None, e
+            return
+            
+        # 线程池只负责获取数据（I/O），计算和评分在数据到达后于当前线程完成；
+        # 同时在途的任务数有上限，避免获取速度快于计算时数据堆积在内存中
+        pending = {}
+        codes = iter(items)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                for index, stock_code in codes:
+                    future = executor.submit(self._fetch_for_analysis, stock_code)
+                    pending[future] = (index, stock_code)
+                    if len(pending) >= max_workers * 2:
+                        break
+                if not pending:
+                    break
+                    
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, stock_code = pending.pop(future)
+                    try:
+                        key, df, computed = future.result()
+                        if min_score is not None:
+                            yield index, stock_code, self.report_above(key, stock_code, df, computed, min_score), None
+                            continue
+                        if not computed:
+                            df = self._compute_indicator_data(key, df)
+                        yield index, stock_code, self._build_report(stock_code, df), None
+                    except Exception as e:
+                        yield index, stock_code, None, e
+                        
+    def report_above(self, key, stock_code, df, computed, min_score):
+        """
+        只在评分可能达到 min_score 时生成报告，否则返回 None
+        
+        computed 为 False 时 df 为原始K线：按 scoring.BOUND_ORDER 逐条规则计算所需指标并评分，
+        最高可能得分低于 min_score 时立即放弃，剩余指标不再计算；通过的股票在同一个 Workspace 上
+        补算全部指标并写入缓存（key 为 None 时不写入），报告与完整计算一致
+        """
+        if not computed:
+            workspace = kernels.Workspace(df['high'].to_numpy(), df['low'].to_numpy(),
+                                          df['close'].to_numpy(), df['volume'].to_numpy())
+            compute = lambda fields: kernels.compute_indicators(None, None, None, None, self.params,
+                                                                workspace=workspace, fields=fields)
+            if scoring.bounded_score(compute, df['close'].to_numpy(), min_score) is None:
+                return None
+            df = self.calculate_indicators(df, workspace=workspace)
+            if key is not None:
+                df = self._cache_indicators(key, df)
+        report = self._build_report(stock_code, df)
+        return report if report['score'] >= min_score else None
+        
+    def _iter_reports_process(self, items, fetch_workers, compute_workers, chunksize, min_score=None):
+        """线程池获取数据，按批把紧凑数组交给进程池计算指标和评分，items 为 [(序号, 股票代码)]"""
+        compute_pool = self._get_process_pool(compute_workers)
+        pending_fetch = {}
+        pending_compute = set()
+        batch = []
+        codes = iter(items)
+        exhausted = False
+        
+        with ThreadPoolExecutor(max_workers=fetch_workers) as fetch_pool:
+            while True:
+                # 补充获取任务；计算积压时暂停，避免数据堆积在内存中
+                while (not exhausted and len(pending_fetch) < fetch_workers * 2
+                       and len(pending_compute) < compute_workers * 2):
+                    item = next(codes, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    pending_fetch[fetch_pool.submit(self._fetch_for_compute, item[1])] = item
+                    
+                if batch and (len(batch) >= chunksize or (exhausted and not pending_fetch)):
+                    pending_compute.add(compute_pool.submit(_compute_reports, self.params, batch, min_score,
+                                                            self.shared_store and self.shared_store.root))
+                    batch = []
+                    
+                if not pending_fetch and not pending_compute:
+                    break
+                    
+                done, _ = wait(list(pending_fetch) + list(pending_compute), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in pending_compute:
+                        pending_compute.remove(future)
+                        yield from future.result()
+                        continue
+                        
+                    index, stock_code = pending_fetch.pop(future)
+                    try:
+                        key, df, computed = future.result()
+                        if computed:
+                            # 命中缓存的股票直接在当前进程生成报告
+                            if min_score is not None:
+                                yield index, stock_code, self.report_above(key, stock_code, df, True, min_score), None
+                            else:
+                                yield index, stock_code, self._build_report(stock_code, df), None
+                        elif isinstance(df, tuple):
+                            # 共享存储中的K线：只传版本号和日期区间，由计算进程映射读取
+                            batch.append((index, stock_code, df, None))
+                        else:
+                            dates, values = _frame_to_arrays(df)
+                            batch.append((index, stock_code, dates, values))
+                    except Exception as e:
+                        yield index, stock_code, None, e
+                        
+    def _get_process_pool(self, workers):
+        """获取计算阶段的进程池，工作进程数变化时重建"""
+        if self._process_pool is None or self._process_pool_workers != workers:
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=False)
+            # 使用 spawn 启动工作进程，避免在多线程的服务进程中 fork
+            self._process_pool = ProcessPoolExecutor(max_workers=workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            self._process_pool_workers = workers
+        return self._process_pool
+        
+    def _fetch_for_analysis(self, stock_code):
+        """在线程池中执行：命中缓存时返回指标数据，否则只获取原始K线"""
+        start_date, end_date = self._resolve_dates(None, None)
+        key = self._indicator_cache_key(stock_code, start_date, end_date, "qfq")
+        df = self._lookup_indicators(key)
+        if df is not None:
+            return key, df, True
+        return key, self.get_stock_data(stock_code, start_date, end_date), False
+        
+    def _fetch_for_compute(self, stock_code):
+        """
+        计算进程池模式下在线程池中执行，与 _fetch_for_analysis 相同，但共享存储中有该股票的K线时
+        不读取数据，只返回 (版本号, 起始日期, 结束日期)，由计算进程直接映射读取
+        """
+        start_date, end_date = self._resolve_dates(None, None)
+        key = self._indicator_cache_key(stock_code, start_date, end_date, "qfq")
+        df = self._lookup_indicators(key)
+        if df is not None:
+            return key, df, True
+        if self.shared_store is not None:
+            version = self.shared_store.locate(stock_code, start_date, end_date, "qfq")
+            if version is not None:
+                return key, (version, start_date, end_date), False
+        return key, self.get_stock_data(stock_code, start_date, end_date), False
+
+
+# 传给计算进程的行情列，按此顺序排列为 float64 二维数组
+_ARRAY_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+# 每个计算进程内复用的分析器
+_worker_analyzer = None
+
+# 每个计算进程内映射的共享存储，按目录缓存
+_worker_shared_stores = {}
+
+
+def _frame_to_arrays(df):
+    """把行情 DataFrame 压缩为 (int64 日期数组, float64 行情数组)，避免序列化整个 DataFrame"""
+    dates = df['date'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    values = np.ascontiguousarray(df[_ARRAY_COLUMNS].to_numpy(dtype=np.float64))
+    return dates, values
+
+
+def _frame_from_arrays(dates, values):
+    """由紧凑数组还原计算技术指标所需的 DataFrame"""
+    df = pd.DataFrame(values, columns=_ARRAY_COLUMNS)
+    df.insert(0, 'date', pd.to_datetime(dates))
+    return df
+
+
+def _shared_frame(shared_root, stock_code, ref):
+    """从共享存储读取一只股票的K线，ref 为 (版本号, 起始日期, 结束日期)；各列是只读视图，计算指标时只追加新列"""
+    store = _worker_shared_stores.get(shared_root)
+    if store is None:
+        store = _worker_shared_stores[shared_root] = SharedStore(shared_root)
+    version, start_date, end_date = ref
+    df = store.frame(stock_code, start_date, end_date, "qfq", version=version)
+    if df is None:
+        raise Exception(f"共享存储 {version} 中没有 {stock_code} 的数据")
+    return df
+
+
+def _compute_reports(params, batch, min_score=None, shared_root=None):
+    """
+    计算进程入口：batch 为 [(序号, 股票代码, 日期数组, 行情数组)]，返回与 iter_reports 相同的结果元组
+    
+    行情数组为 None 时日期数组位置是共享存储的 (版本号, 起始日期, 结束日期)，从 shared_root 映射读取。
+    指定 min_score 时确定达不到 min_score 的股票提前停止计算，报告为 None
+    """
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        _worker_analyzer = StockAnalyzer(bar_store_dir='')
+    _worker_analyzer.params = params
+    
+    results = []
+    for index, stock_code, dates, values in batch:
+        try:
+            if values is None:
+                df = _shared_frame(shared_root, stock_code, dates)
+            else:
+                df = _frame_from_arrays(dates, values)
+            if min_score is not None:
+                report = _worker_analyzer.report_above(None, stock_code, df, False, min_score)
+                results.append((index, stock_code, report, None))
+                continue
+            df = _worker_analyzer.calculate_indicators(df)
+            results.append((index, stock_code, _worker_analyzer._build_report(stock_code, df), None))
+        except Exception as e:
+            # 只回传错误信息，避免异常对象无法序列化
+            results.append((index, stock_code, None, Exception(str(e))))
+    return results
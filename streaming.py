@@ -0,0 +1,464 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+流式技术指标
+
+StreamingIndicatorState 为单只股票保存 EMA/MACD 递推值、各滚动窗口的环形缓冲区、
+OBV 和 ATR/ADX 累积量。每来一根新K线调用 update(bar)，各滚动窗口的和、均值、标准差和最高/最低价
+都增量维护（精确的部分和与单调队列），计算量与窗口长度无关，
+返回与对全部历史调用 calculate_indicators 后最后一行相同的指标值。
+状态可以用 to_dict/from_dict（或 dumps/loads）保存后恢复。
+"""
+
+import json
+import math
+from collections import deque
+
+import pandas as pd
+
+NAN = float('nan')
+
+
+def _div(a, b):
+    """与 NumPy 浮点除法一致：除以0得到 ±inf，0/0 得到 NaN"""
+    if b == 0:
+        if a != a or a == 0:
+            return NAN
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+
+def _accumulate(partials, x):
+    """把 x 加到部分和列表中（Shewchuk 算法），部分和互不重叠，其精确和等于所有加入值的精确和"""
+    i = 0
+    for y in partials:
+        if abs(x) < abs(y):
+            x, y = y, x
+        hi = x + y
+        lo = y - (hi - x)
+        if lo:
+            partials[i] = lo
+            i += 1
+        x = hi
+    partials[i:] = [x]
+
+
+def _two_product(a, b):
+    """a * b 的精确值，表示为 (乘积, 舍入误差)（Dekker 算法）"""
+    product = a * b
+    a_hi, a_lo = _split(a)
+    b_hi, b_lo = _split(b)
+    return product, ((a_hi * b_hi - product) + a_hi * b_lo + a_lo * b_hi) + a_lo * b_lo
+
+
+def _split(a):
+    c = 134217729.0 * a
+    hi = c - (c - a)
+    return hi, a - hi
+
+
+class _Window:
+    """
+    一个滚动窗口的累计量，加入或移出一个值只做常数量计算，与窗口长度无关
+
+    和（以及平方和）以互不重叠的部分和精确保存，math.fsum 取整后与对窗口内的值直接调用 math.fsum 完全相同；
+    最大/最小值用单调队列维护。窗口未满或含 NaN、±inf 时结果为 NaN；
+    窗口内的值全部相同时直接返回该值（与 pandas 一致，不受舍入影响）
+    """
+
+    def __init__(self, window, squares=False, extrema=False):
+        self.window = window
+        # (值, 到该值为止连续相同值的个数)
+        self.items = deque()
+        self.sums = []
+        self.squares = [] if squares else None
+        self.nonfinite = 0
+        # (序号, 值)，只在需要最大/最小值的窗口上维护
+        self.maxima = deque() if extrema else None
+        self.minima = deque() if extrema else None
+        self.position = 0
+
+    def push(self, value):
+        self._append(value)
+        if self.maxima is not None and math.isfinite(value):
+            while self.maxima and self.maxima[-1][1] <= value:
+                self.maxima.pop()
+            self.maxima.append((self.position, value))
+            while self.minima and self.minima[-1][1] >= value:
+                self.minima.pop()
+            self.minima.append((self.position, value))
+        self.position += 1
+        if len(self.items) > self.window:
+            self._add(self.items.popleft()[0], -1)
+            oldest = self.position - self.window
+            for queue in (self.maxima, self.minima):
+                if queue and queue[0][0] < oldest:
+                    queue.popleft()
+
+    def replace_last(self, value):
+        """修改最后加入的值（只用于不求最大/最小值的窗口）"""
+        self._add(self.items.pop()[0], -1)
+        self._append(value)
+
+    def _append(self, value):
+        run = self.items[-1][1] + 1 if self.items and self.items[-1][0] == value else 1
+        self.items.append((value, run))
+        self._add(value, 1)
+
+    def _add(self, value, sign):
+        if not math.isfinite(value):
+            self.nonfinite += sign
+            return
+        _accumulate(self.sums, sign * value)
+        if self.squares is not None:
+            for term in _two_product(value, value):
+                _accumulate(self.squares, sign * term)
+
+    def _ready(self):
+        return len(self.items) == self.window and self.nonfinite == 0
+
+    def _constant(self):
+        return self.items[-1][1] >= self.window
+
+    def sum(self):
+        if not self._ready():
+            return NAN
+        if self._constant():
+            return self.items[-1][0] * self.window
+        return math.fsum(self.sums)
+
+    def mean(self):
+        if not self._ready():
+            return NAN
+        if self._constant():
+            return self.items[-1][0]
+        return math.fsum(self.sums) / self.window
+
+    def std(self):
+        """样本标准差：sum((x - mean)^2) = sum(x^2) - 2 * mean * sum(x) + n * mean^2，各项精确展开后一次取整"""
+        if not self._ready():
+            return NAN
+        if self._constant():
+            return 0.0
+        mean = math.fsum(self.sums) / self.window
+        terms = list(self.squares)
+        for partial in self.sums:
+            terms.extend(_two_product(-2.0 * mean, partial))
+        for term in _two_product(mean, mean):
+            terms.extend(_two_product(float(self.window), term))
+        return math.sqrt(math.fsum(terms) / (self.window - 1))
+
+    def max(self):
+        return self.maxima[0][1] if self._ready() else NAN
+
+    def min(self):
+        return self.minima[0][1] if self._ready() else NAN
+
+
+def _ema_step(previous, current, span):
+    """EMA 递推一步，与 ewm(span=span, adjust=False) 一致"""
+    if previous is None or previous != previous:
+        return current
+    if current == current and previous != current:
+        alpha = 2.0 / (1.0 + span)
+        old_wt = 1.0 - alpha
+        return (old_wt * previous + alpha * current) / (old_wt + alpha)
+    return previous
+
+
+class StreamingIndicatorState:
+    """单只股票的增量指标状态"""
+
+    # 需要保存的缓冲区及其长度来源
+    _BUFFERS = ('closes', 'highs', 'lows', 'volumes', 'gains', 'losses', 'trs', 'plus_dm', 'minus_dm',
+                'dxs', 'stoch_k', 'tps', 'tp_deviations', 'positive_flows', 'negative_flows',
+                'senkou_a_src', 'senkou_b_src', 'obvs', 'rows')
+
+    def __init__(self, params):
+        self.params = params
+        self.count = 0
+        self.last_date = None
+        self.emas = {}
+        self.obv = 0.0
+        self.prev_up_move = NAN
+
+        ma = params['ma_periods']
+        ichimoku = params['ichimoku']
+        close_window = max(ma['short'], ma['medium'], ma['long'], params['bollinger_period'],
+                           params['std_dev_period'], params['z_score_period'], 11)
+        range_window = max(params['stochastic_k'], ichimoku['tenkan'], ichimoku['kijun'],
+                           ichimoku['senkou_span_b'], 2)
+        lengths = {
+            'closes': close_window,
+            'highs': range_window,
+            'lows': range_window,
+            'volumes': params['volume_ma_period'],
+            'gains': params['rsi_period'],
+            'losses': params['rsi_period'],
+            'trs': max(params['atr_period'], params['adx_period']),
+            'plus_dm': params['adx_period'],
+            'minus_dm': params['adx_period'],
+            'dxs': params['adx_period'],
+            'stoch_k': params['stochastic_d'],
+            'tps': max(params['cci_period'], 2),
+            'tp_deviations': params['cci_period'],
+            'positive_flows': params['mfi_period'],
+            'negative_flows': params['mfi_period'],
+            'senkou_a_src': ichimoku['kijun'] + 1,
+            'senkou_b_src': ichimoku['kijun'] + 1,
+            # calculate_score 判断 OBV 趋势需要最近5个值
+            'obvs': 5,
+            'rows': 5,
+        }
+        for name in self._BUFFERS:
+            setattr(self, name, deque(maxlen=lengths[name]))
+
+        # 各缓冲区上的滚动窗口，随缓冲区一起更新
+        windows = {
+            'closes': (ma['short'], ma['medium'], ma['long'], params['bollinger_period'],
+                       params['std_dev_period'], params['z_score_period']),
+            'highs': (params['stochastic_k'], ichimoku['tenkan'], ichimoku['kijun'], ichimoku['senkou_span_b']),
+            'lows': (params['stochastic_k'], ichimoku['tenkan'], ichimoku['kijun'], ichimoku['senkou_span_b']),
+            'volumes': (params['volume_ma_period'],),
+            'gains': (params['rsi_period'],),
+            'losses': (params['rsi_period'],),
+            'trs': (params['atr_period'], params['adx_period']),
+            'plus_dm': (params['adx_period'],),
+            'minus_dm': (params['adx_period'],),
+            'dxs': (params['adx_period'],),
+            'stoch_k': (params['stochastic_d'],),
+            'tps': (params['cci_period'],),
+            'tp_deviations': (params['cci_period'],),
+            'positive_flows': (params['mfi_period'],),
+            'negative_flows': (params['mfi_period'],),
+        }
+        # 只有收盘价上求标准差的窗口需要平方和
+        std_windows = {params['bollinger_period'], params['std_dev_period'], params['z_score_period']}
+        self._windows = {
+            name: {window: _Window(window, squares=name == 'closes' and window in std_windows,
+                                   extrema=name in ('highs', 'lows'))
+                   for window in set(sizes)}
+            for name, sizes in windows.items()
+        }
+
+    def _append(self, name, value):
+        """向缓冲区追加一个值，同时更新其上的滚动窗口"""
+        getattr(self, name).append(value)
+        for window in self._windows.get(name, {}).values():
+            window.push(value)
+
+    def _replace_last(self, name, value):
+        """修改缓冲区最后一个值"""
+        getattr(self, name)[-1] = value
+        for window in self._windows[name].values():
+            window.replace_last(value)
+
+    def _window(self, name, window):
+        return self._windows[name][window]
+
+    @classmethod
+    def from_frame(cls, df, params):
+        """用历史K线（get_stock_data 的返回格式）初始化状态"""
+        state = cls(params)
+        columns = [c for c in ('date', 'open', 'high', 'low', 'close', 'volume') if c in df.columns]
+        for bar in df[columns].to_dict('records'):
+            state.update(bar)
+        return state
+
+    def update(self, bar):
+        """
+        加入一根新K线，返回最新一行的指标值 {列名: 值}
+
+        bar 至少包含 high/low/close/volume，可选 date/open
+        """
+        params = self.params
+        ma = params['ma_periods']
+        ichimoku = params['ichimoku']
+        high, low = float(bar['high']), float(bar['low'])
+        close, volume = float(bar['close']), float(bar['volume'])
+        prev_close = self.closes[-1] if self.closes else NAN
+        prev_high = self.highs[-1] if self.highs else NAN
+        prev_low = self.lows[-1] if self.lows else NAN
+        prev_tp = self.tps[-1] if self.tps else NAN
+
+        self._append('closes', close)
+        self._append('highs', high)
+        self._append('lows', low)
+        self._append('volumes', volume)
+        row = {'date': bar.get('date'), 'open': bar.get('open'), 'high': high, 'low': low,
+               'close': close, 'volume': volume}
+
+        # 一、趋势类指标
+        row['SMA5'] = self._window('closes', ma['short']).mean()
+        row['SMA20'] = self._window('closes', ma['medium']).mean()
+        row['SMA60'] = self._window('closes', ma['long']).mean()
+        for key, span in (('EMA5', ma['short']), ('EMA20', ma['medium']), ('EMA60', ma['long'])):
+            self.emas[key] = row[key] = _ema_step(self.emas.get(key), close, span)
+        # MACD 使用固定的 12/26/9 周期
+        for key, span in (('fast', 12), ('slow', 26)):
+            self.emas[key] = _ema_step(self.emas.get(key), close, span)
+        macd = self.emas['fast'] - self.emas['slow']
+        self.emas['Signal'] = _ema_step(self.emas.get('Signal'), macd, 9)
+        row['MACD'], row['Signal'] = macd, self.emas['Signal']
+        row['MACD_hist'] = macd - self.emas['Signal']
+
+        middle = self._window('closes', params['bollinger_period']).mean()
+        std = self._window('closes', params['bollinger_period']).std()
+        row['BB_upper'] = middle + (std * params['bollinger_std'])
+        row['BB_middle'] = middle
+        row['BB_lower'] = middle - (std * params['bollinger_std'])
+
+        tr = high - low
+        if prev_close == prev_close:
+            tr = max(tr, abs(high - prev_close), abs(low - prev_close))
+        row['ADX'], row['DI+'], row['DI-'] = self._update_adx(high, low, prev_high, prev_low, tr)
+
+        tenkan = (self._window('highs', ichimoku['tenkan']).max() + self._window('lows', ichimoku['tenkan']).min()) / 2
+        kijun = (self._window('highs', ichimoku['kijun']).max() + self._window('lows', ichimoku['kijun']).min()) / 2
+        senkou_b = (self._window('highs', ichimoku['senkou_span_b']).max()
+                    + self._window('lows', ichimoku['senkou_span_b']).min()) / 2
+        self._append('senkou_a_src', (tenkan + kijun) / 2)
+        self._append('senkou_b_src', senkou_b)
+        full = self.senkou_a_src.maxlen
+        row['Tenkan'], row['Kijun'] = tenkan, kijun
+        row['Senkou_A'] = self.senkou_a_src[0] if len(self.senkou_a_src) == full else NAN
+        row['Senkou_B'] = self.senkou_b_src[0] if len(self.senkou_b_src) == full else NAN
+        # 延迟线取未来的收盘价，最新一行总是 NaN
+        row['Chikou'] = NAN
+
+        # 二、动量类指标
+        delta = close - prev_close
+        self._append('gains', delta if delta > 0 else 0.0)
+        self._append('losses', -delta if delta < 0 else 0.0)
+        rs = _div(self._window('gains', params['rsi_period']).mean(),
+                  self._window('losses', params['rsi_period']).mean())
+        row['RSI'] = 100 - (100 / (1 + rs))
+
+        high_roll = self._window('highs', params['stochastic_k']).max()
+        low_roll = self._window('lows', params['stochastic_k']).min()
+        stoch_k = _div(100 * (close - low_roll), high_roll - low_roll)
+        self._append('stoch_k', stoch_k)
+        row['Stoch_K'] = stoch_k
+        row['Stoch_D'] = self._window('stoch_k', params['stochastic_d']).mean()
+
+        tp = (high + low + close) / 3
+        self._append('tps', tp)
+        mean_tp = self._window('tps', params['cci_period']).mean()
+        self._append('tp_deviations', abs(tp - mean_tp))
+        row['CCI'] = _div(tp - mean_tp, 0.015 * self._window('tp_deviations', params['cci_period']).mean())
+
+        roc_base = self.closes[-11] if len(self.closes) >= 11 else NAN
+        row['ROC'] = (_div(close, roc_base) - 1) * 100
+
+        # 三、成交量类指标
+        if close > prev_close:
+            self.obv += volume
+        elif close < prev_close:
+            self.obv -= volume
+        self._append('obvs', self.obv)
+        row['OBV'] = self.obv
+        row['Volume_MA'] = self._window('volumes', params['volume_ma_period']).mean()
+        row['Volume_Ratio'] = _div(volume, row['Volume_MA'])
+
+        raw_money_flow = tp * volume
+        self._append('positive_flows', raw_money_flow if tp > prev_tp else 0.0)
+        self._append('negative_flows', raw_money_flow if tp < prev_tp else 0.0)
+        money_ratio = _div(self._window('positive_flows', params['mfi_period']).sum(),
+                           self._window('negative_flows', params['mfi_period']).sum())
+        row['MFI'] = 100 - (100 / (1 + money_ratio))
+
+        # 四、波动率类指标
+        row['ATR'] = self._window('trs', params['atr_period']).mean()
+        row['Volatility'] = _div(row['ATR'], close) * 100
+        row['StdDev'] = self._window('closes', params['std_dev_period']).std()
+
+        # 五、统计套利类指标
+        row['Z-Score'] = _div(close - self._window('closes', params['z_score_period']).mean(),
+                              self._window('closes', params['z_score_period']).std())
+
+        self.count += 1
+        self.last_date = row['date']
+        self._append('rows', row)
+        return dict(row)
+
+    def _update_adx(self, high, low, prev_high, prev_low, tr):
+        """
+        更新 ADX/DI
+
+        与 calculate_adx 一致，某根K线的下降幅度取其最低价与下一根K线最低价之差，
+        因此新K线到来时先修正上一根K线的 DM 和 DX，新K线自身的 DM 暂记为0
+        """
+        period = self.params['adx_period']
+        if self.plus_dm:
+            up_move = self.prev_up_move
+            down_move = abs(prev_low - low)
+            self._replace_last('plus_dm', up_move if (up_move > down_move and up_move > 0) else 0.0)
+            self._replace_last('minus_dm', down_move if (down_move > up_move and down_move > 0) else 0.0)
+            self._replace_last('dxs', self._dx(period)[0])
+
+        self.prev_up_move = high - prev_high
+        self._append('plus_dm', 0.0)
+        self._append('minus_dm', 0.0)
+        self._append('trs', tr)
+        dx, plus_di, minus_di = self._dx(period)
+        self._append('dxs', dx)
+        return self._window('dxs', period).mean(), plus_di, minus_di
+
+    def _dx(self, period):
+        """以当前缓冲区末尾为窗口终点计算 (DX, DI+, DI-)"""
+        tr_mean = self._window('trs', period).mean()
+        plus_di = _div(100 * self._window('plus_dm', period).mean(), tr_mean)
+        minus_di = _div(100 * self._window('minus_dm', period).mean(), tr_mean)
+        dx = _div(100 * abs(plus_di - minus_di), plus_di + minus_di)
+        return dx, plus_di, minus_di
+
+    def latest(self):
+        """最新一行的指标值"""
+        return dict(self.rows[-1]) if self.rows else {}
+
+    def frame(self):
+        """最近几行指标组成的 DataFrame，可直接传给 calculate_score"""
+        return pd.DataFrame(list(self.rows))
+
+    def to_dict(self):
+        """导出为可 JSON 序列化的字典"""
+        buffers = {}
+        for name in self._BUFFERS:
+            values = list(getattr(self, name))
+            if name == 'rows':
+                values = [{k: (str(v) if k == 'date' and v is not None else v) for k, v in row.items()}
+                          for row in values]
+            buffers[name] = values
+        return {
+            'params': self.params,
+            'count': self.count,
+            'last_date': None if self.last_date is None else str(self.last_date),
+            'emas': dict(self.emas),
+            'obv': self.obv,
+            'prev_up_move': self.prev_up_move,
+            'buffers': buffers,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """从 to_dict 的结果恢复"""
+        state = cls(data['params'])
+        state.count = data['count']
+        state.last_date = data['last_date']
+        state.emas = dict(data['emas'])
+        state.obv = data['obv']
+        state.prev_up_move = data['prev_up_move']
+        for name in cls._BUFFERS:
+            for value in data['buffers'][name]:
+                state._append(name, value)
+        return state
+
+    def dumps(self):
+        """序列化为 JSON 字符串"""
+        return json.dumps(self.to_dict(), ensure_ascii=False)
+
+    @classmethod
+    def loads(cls, text):
+        """从 dumps 的结果恢复"""
+        return cls.from_dict(json.loads(text))
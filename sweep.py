@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+参数扫描
+
+对一组参数网格在同一个 (日期 × 股票) 面板上计算技术指标、评分并回测，按指定指标排序。
+面板只压紧一次，每个工作进程持有一个 indicator_kernels.Workspace：
+各序列的累积和、各窗口的滚动结果和多周期 EMA 在不同参数组合之间共享，
+只有参数真正变化的部分才重新计算，且只计算评分用到的指标。参数组合按网格顺序连续分块交给工作进程，
+相邻组合只有最后几个参数不同，缓存命中率最高。
+"""
+
+import copy
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import backtest
+import indicator_kernels as kernels
+import panel
+import scoring
+
+# 组合级指标：组合净值的统计、个股统计的均值、评分与未来收益的相关系数
+METRICS = ('sharpe', 'total_return', 'annual_return', 'volatility', 'max_drawdown',
+           'mean_sharpe', 'win_rate', 'trades', 'exposure', 'score_ic', 'mean_score')
+
+# 越小越好的指标，排序时升序
+LOWER_IS_BETTER = ('volatility',)
+
+# score_ic 使用的未来收益周期（K线数）
+FORWARD_BARS = 5
+
+# 每个工作进程缓存的中间结果个数
+DEFAULT_CACHE_ITEMS = 256
+
+_worker_data = None
+_worker_workspace = None
+
+
+def expand_grid(base_params, grid):
+    """
+    展开参数网格
+
+    grid 为 {参数路径: 候选值列表}，嵌套参数用点号连接，例如 'ma_periods.short'。
+    返回 [(本组合覆盖的参数 {参数路径: 值}, 完整参数字典)]，按 grid 的键顺序做笛卡尔积
+    """
+    names = list(grid)
+    combos = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = copy.deepcopy(base_params)
+        for name, value in zip(names, values):
+            *parents, leaf = name.split('.')
+            target = params
+            for parent in parents:
+                target = target.get(parent)
+                if not isinstance(target, dict):
+                    raise Exception(f"未知参数: {name}")
+            if leaf not in target:
+                raise Exception(f"未知参数: {name}")
+            target[leaf] = value
+        combos.append((dict(zip(names, values)), params))
+    return combos
+
+
+def prepare(fields):
+    """把面板压紧一次，供所有参数组合共用"""
+    valid = panel.valid_bars(*(fields[name] for name in panel.PRICE_FIELDS))
+    order = panel.pack_order(valid)
+    data = {name: panel.pack(fields[name], order) for name in panel.PRICE_FIELDS}
+    data.update(valid=valid, order=order, n_bars=valid.sum(axis=0))
+    return data
+
+
+def create_workspace(data, cache_items=DEFAULT_CACHE_ITEMS):
+    """在压紧后的面板上创建共享中间结果的 Workspace，指标按 causal 方式计算，评分和 score_ic 没有前视偏差"""
+    return kernels.Workspace(data['high'], data['low'], data['close'], data['volume'], max_items=cache_items,
+                             causal=True)
+
+
+def _nanmean(values):
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    return float(values.mean()) if values.size else float('nan')
+
+
+def score_ic(score, ready, close, forward_bars=FORWARD_BARS):
+    """评分与未来 forward_bars 根K线收益率的相关系数（所有股票和日期合并计算）"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        forward = kernels.shift(close, -forward_bars) / close - 1
+    mask = ready & np.isfinite(forward)
+    if mask.sum() < 2:
+        return float('nan')
+    x = score[mask].astype(np.float64)
+    y = forward[mask]
+    x = x - x.mean()
+    y = y - y.mean()
+    denom = np.sqrt((x * x).sum() * (y * y).sum())
+    return float((x * y).sum() / denom) if denom > 0 else float('nan')
+
+
+def evaluate(data, workspace, params, initial_cash, options):
+    """计算一组参数的指标、评分和回测结果，返回 {指标名: 数值}"""
+    indicators = kernels.compute_indicators(None, None, None, None, params, workspace=workspace,
+                                            fields=scoring.INDICATOR_FIELDS)
+    score, ready, simulation, stats = backtest.run_packed(data['open'], data['close'], indicators,
+                                                          data['n_bars'], initial_cash, **options)
+
+    equity = panel.unpack(simulation['equity'], data['order'], data['valid'])
+    portfolio = backtest.performance(backtest.portfolio_equity(equity, initial_cash)[:, None], [len(equity)])
+    metrics = {name: float(values[0]) for name, values in portfolio.items()}
+    metrics['mean_sharpe'] = _nanmean(stats['sharpe'])
+    metrics['win_rate'] = _nanmean(stats['win_rate'])
+    metrics['trades'] = int(stats['trades'].sum())
+    metrics['exposure'] = _nanmean(stats['exposure'])
+    metrics['score_ic'] = score_ic(score, ready, data['close'])
+    metrics['mean_score'] = _nanmean(score[ready])
+    return metrics
+
+
+def _init_worker(data, cache_items):
+    """工作进程初始化：保存压紧后的面板，创建本进程的 Workspace"""
+    global _worker_data, _worker_workspace
+    _worker_data = data
+    _worker_workspace = create_workspace(data, cache_items)
+
+
+def _evaluate_batch(batch, initial_cash, options):
+    """工作进程入口：batch 为 [(序号, 参数字典)]"""
+    return [(index, evaluate(_worker_data, _worker_workspace, params, initial_cash, options))
+            for index, params in batch]
+
+
+def run_sweep(fields, base_params, grid, initial_cash, workers=None, rank_by='sharpe',
+              cache_items=DEFAULT_CACHE_ITEMS, **options):
+    """
+    参数扫描
+
+    fields 为 panel.frames_to_panel 返回的 {字段: (日期 × 股票) 数组}，
+    options 为 backtest.run_packed 的回测参数（entry_score、exit_score、commission 等）。
+    workers 大于1时用多个进程并行计算。返回 DataFrame：每个参数组合一行，
+    包含 grid 中的参数列和 METRICS 中的指标列，按 rank_by 排序，rank 列为名次
+    """
+    if rank_by not in METRICS:
+        raise Exception(f"不支持的排序指标: {rank_by}")
+
+    combos = expand_grid(base_params, grid)
+    data = prepare(fields)
+    jobs = [(index, params) for index, (_, params) in enumerate(combos)]
+    results = {}
+
+    if not workers or workers <= 1 or len(jobs) <= 1:
+        workspace = create_workspace(data, cache_items)
+        for index, params in jobs:
+            results[index] = evaluate(data, workspace, params, initial_cash, options)
+    else:
+        # 连续分块：相邻组合共享的中间结果最多
+        chunk = max(1, -(-len(jobs) // (workers * 4)))
+        batches = [jobs[start:start + chunk] for start in range(0, len(jobs), chunk)]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(data, cache_items)) as executor:
+            futures = [executor.submit(_evaluate_batch, batch, initial_cash, options) for batch in batches]
+            for future in futures:
+                results.update(future.result())
+
+    rows = [dict(overrides, **results[index]) for index, (overrides, _) in enumerate(combos)]
+    table = pd.DataFrame(rows, columns=list(grid) + list(METRICS))
+    table = table.sort_values(rank_by, ascending=rank_by in LOWER_IS_BETTER, na_position='last',
+                              kind='stable').reset_index(drop=True)
+    table.insert(0, 'rank', np.arange(1, len(table) + 1))
+    return table
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+合成行情数据
+
+按种子生成可重复的日线数据（对数正态随机游走），可以配置K线数、停牌缺口和涨跌停天数，
+并提供与 akshare 接口相同的替身，离线运行分析、接口和基准测试：
+
+    with stub_akshare(bars=500) as stub:
+        analyzer.analyze_stock("000001")   # 不访问网络
+        print(stub.calls)
+
+同一股票代码和种子每次生成的数据完全相同，不同请求区间取到的是同一条序列的不同切片，
+因此本地K线存储的增量补取也能得到一致的结果。
+"""
+
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# akshare stock_zh_a_hist 返回的列
+HIST_COLUMNS = ['日期', '股票代码', '开盘', '收盘', '最高', '最低', '成交量', '成交额', '振幅', '涨跌幅', '涨跌额', '换手率']
+
+
+def limit_ratio(symbol):
+    """涨跌停幅度：创业板（300）和科创板（688）为 20%，其余为 10%"""
+    return 0.2 if symbol.startswith(('300', '301', '688')) else 0.1
+
+
+# symbols 生成代码时轮流使用的板块前缀（含涨跌停幅度为 20% 的创业板和科创板）
+SYMBOL_PREFIXES = ('000', '600', '002', '601', '300', '688')
+
+
+def symbols(count):
+    """count 个股票代码，轮流取各板块：000001、600001、002001、601001、300001、688001、000002……"""
+    if count > len(SYMBOL_PREFIXES) * 999:
+        raise ValueError(f"最多生成 {len(SYMBOL_PREFIXES) * 999} 个股票代码")
+    return [f"{SYMBOL_PREFIXES[i % len(SYMBOL_PREFIXES)]}{i // len(SYMBOL_PREFIXES) + 1:03d}" for i in range(count)]
+
+
+@functools.lru_cache(maxsize=16)
+def _business_days(end, bars):
+    return pd.bdate_range(end=end, periods=bars)
+
+
+def generate_ohlcv(symbol, bars=500, end_date=None, seed=0, drift=0.0003, volatility=0.02,
+                   gap_rate=0.01, limit_rate=0.01):
+    """
+    生成一只股票的日线数据，列与 StockAnalyzer 使用的相同（date/open/high/low/close/volume）
+
+    bars: 工作日数（停牌的日子不产生K线，实际K线数略少）
+    end_date: 最后一个工作日，默认今天
+    seed: 种子，与股票代码一起决定生成的序列
+    drift / volatility: 日收益率的均值和标准差
+    gap_rate: 每个交易日开始停牌的概率，停牌持续1-10个交易日，复牌当天价格跳空
+    limit_rate: 每个交易日涨停或跌停的概率，其中一半为开盘即封板的一字板
+    """
+    rng = np.random.default_rng([seed, zlib.crc32(symbol.encode('utf-8'))])
+    dates = _business_days(pd.Timestamp(end_date or datetime.now()).normalize(), bars)
+    limit = limit_ratio(symbol)
+
+    returns = rng.normal(drift, volatility, bars)
+    limit_days = rng.random(bars) < limit_rate
+    returns[limit_days] = np.where(rng.random(limit_days.sum()) < 0.5, limit, -limit)
+    one_word = limit_days & (rng.random(bars) < 0.5)
+
+    # 停牌：区间内没有K线、价格不变，复牌当天按停牌期间累积的波动跳空（仍受涨跌停限制）
+    trading = np.ones(bars, dtype=bool)
+    day = 1
+    while day < bars:
+        if rng.random() < gap_rate:
+            length = int(rng.integers(1, 11))
+            trading[day:day + length] = False
+            returns[day:day + length] = 0.0
+            if day + length < bars:
+                returns[day + length] += rng.normal(0, volatility * np.sqrt(length))
+            day += length
+        day += 1
+    returns = np.clip(returns, -limit, limit)
+
+    # 逐日按分取整，涨跌停价按前收盘价计算，保证相邻收盘价的涨跌幅不超过限制
+    close = np.empty(bars)
+    price = 10.0
+    for i, change in enumerate(returns.tolist()):
+        price = min(max(round(price * (1 + change), 2), round(price * (1 - limit), 2)),
+                    round(price * (1 + limit), 2))
+        close[i] = price
+    prev_close = np.concatenate([[close[0]], close[:-1]])
+    open_ = np.round(prev_close * (1 + np.clip(rng.normal(0, volatility / 3, bars), -limit, limit)), 2)
+    open_[one_word] = close[one_word]
+    spread = np.abs(rng.normal(0, volatility / 2, bars))
+    high = np.round(np.maximum(open_, close) * (1 + spread), 2)
+    low = np.round(np.minimum(open_, close) * (1 - spread), 2)
+    # 涨跌停价封顶/封底，一字板四价相同
+    high = np.minimum(high, np.round(prev_close * (1 + limit), 2))
+    low = np.maximum(low, np.round(prev_close * (1 - limit), 2))
+    high = np.maximum(high, np.maximum(open_, close))
+    low = np.minimum(low, np.minimum(open_, close))
+    high[one_word] = close[one_word]
+    low[one_word] = close[one_word]
+
+    volume = np.round(rng.lognormal(11, 0.5, bars) * np.where(limit_days, 0.3, 1.0))
+
+    df = pd.DataFrame({
+        'date': dates,
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': volume,
+    })
+    return df[trading].reset_index(drop=True)
+
+
+def to_akshare(symbol, df):
+    """把 generate_ohlcv 的结果转换为 ak.stock_zh_a_hist 的返回格式"""
+    prev_close = df['close'].shift(1).fillna(df['open'])
+    return pd.DataFrame({
+        '日期': df['date'].dt.strftime('%Y-%m-%d'),
+        '股票代码': symbol,
+        '开盘': df['open'],
+        '收盘': df['close'],
+        '最高': df['high'],
+        '最低': df['low'],
+        '成交量': df['volume'].astype(np.int64),
+        '成交额': np.round(df['volume'] * 100 * df['close'], 2),
+        '振幅': np.round((df['high'] - df['low']) / prev_close * 100, 2),
+        '涨跌幅': np.round((df['close'] - prev_close) / prev_close * 100, 2),
+        '涨跌额': np.round(df['close'] - prev_close, 2),
+        '换手率': np.round(df['volume'] / 1e5, 2),
+    }, columns=HIST_COLUMNS)
+
+
+def write_fixtures(directory, universe=100, bars=500, end_date=None, seed=0, **options):
+    """
+    把合成数据写成 data_providers.LocalFileProvider 读取的 CSV 文件，返回股票代码列表
+
+        codes = write_fixtures('data/market', universe=50)
+        analyzer = StockAnalyzer(provider=LocalFileProvider('data/market'))
+    """
+    codes = symbols(universe) if isinstance(universe, int) else list(universe)
+    os.makedirs(directory, exist_ok=True)
+    for code in codes:
+        df = generate_ohlcv(code, bars, end_date, seed, **options)
+        df.to_csv(os.path.join(directory, f"{code}.csv"), index=False, date_format='%Y-%m-%d')
+    return codes
+
+
+class AkshareStub:
+    """
+    akshare 的替身，提供本项目用到的 stock_zh_a_hist、stock_zh_a_spot_em 和 stock_info_a_code_name
+
+    生成的序列按股票代码缓存；calls 记录每个函数的调用次数，latency 为每次调用的模拟网络延迟（秒）
+    """
+
+    def __init__(self, universe=100, bars=500, end_date=None, seed=0, latency=0.0, **options):
+        """
+        universe: 股票池大小（stock_info_a_code_name 返回的股票数）或股票代码列表
+        bars / end_date / seed 和其他参数: 传给 generate_ohlcv
+        """
+        self.universe = symbols(universe) if isinstance(universe, int) else list(universe)
+        self.bars = bars
+        self.end_date = end_date
+        self.seed = seed
+        self.latency = latency
+        self.options = options
+        self.calls = {'stock_zh_a_hist': 0, 'stock_info_a_code_name': 0, 'stock_zh_a_spot_em': 0}
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def frame(self, symbol):
+        """某只股票的完整序列（StockAnalyzer 的列名）"""
+        with self._lock:
+            df = self._frames.get(symbol)
+        if df is None:
+            df = generate_ohlcv(symbol, self.bars, self.end_date, self.seed, **self.options)
+            with self._lock:
+                self._frames.setdefault(symbol, df)
+        return df
+
+    def stock_zh_a_hist(self, symbol='000001', period='daily', start_date='19700101', end_date='20500101',
+                        adjust='', timeout=None):
+        """与 ak.stock_zh_a_hist 相同的参数和返回格式，复权方式不影响合成数据"""
+        with self._lock:
+            self.calls['stock_zh_a_hist'] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        df = self.frame(symbol)
+        mask = (df['date'] >= pd.Timestamp(start_date)) & (df['date'] <= pd.Timestamp(end_date))
+        return to_akshare(symbol, df[mask].reset_index(drop=True))
+
+    def stock_zh_a_spot_em(self):
+        """与 ak.stock_zh_a_spot_em 相同的主要列：股票池中每只股票的最后一根K线作为最新行情"""
+        with self._lock:
+            self.calls['stock_zh_a_spot_em'] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        rows = []
+        for code in self.universe:
+            df = self.frame(code)
+            last = df.iloc[-1]
+            rows.append({'代码': code, '名称': f"合成{code}", '最新价': last['close'], '今开': last['open'],
+                         '最高': last['high'], '最低': last['low'], '成交量': int(last['volume']),
+                         '昨收': df['close'].iloc[-2]})
+        return pd.DataFrame(rows)
+
+    def stock_info_a_code_name(self):
+        with self._lock:
+            self.calls['stock_info_a_code_name'] += 1
+        return pd.DataFrame({'code': self.universe, 'name': [f"合成{code}" for code in self.universe]})
+
+
+@contextlib.contextmanager
+def stub_akshare(stub=None, **kwargs):
+    """
+    在 with 块内把 akshare 模块替换为 AkshareStub（stub 为 None 时按 kwargs 新建），退出时恢复
+
+    StockAnalyzer 在调用时才 import akshare，因此替换对已创建的分析器同样生效
+    """
+    stub = stub or AkshareStub(**kwargs)
+    previous = sys.modules.get('akshare')
+    sys.modules['akshare'] = stub
+    try:
+        yield stub
+    finally:
+        if previous is None:
+            sys.modules.pop('akshare', None)
+        else:
+            sys.modules['akshare'] = previous
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试公共夹具：合成行情数据和 akshare 替身，全部离线运行
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_providers import LocalFileProvider  # noqa: E402
+from stock_analyzer import StockAnalyzer  # noqa: E402
+from synthetic_data import generate_ohlcv, stub_akshare, write_fixtures  # noqa: E402
+
+# 固定最后一个交易日，测试结果不随运行日期变化
+END_DATE = '2024-06-28'
+
+
+@pytest.fixture(scope='session')
+def analyzer():
+    """不使用本地K线存储和共享存储的分析器"""
+    return StockAnalyzer(bar_store_dir='', shared_store_dir='')
+
+
+@pytest.fixture(scope='session')
+def params(analyzer):
+    return analyzer.params
+
+
+@pytest.fixture(params=[0, 1, 2], ids=lambda seed: f"seed{seed}")
+def bars(request):
+    """一只股票的合成日线，包含停牌缺口和涨跌停"""
+    return generate_ohlcv('000001', bars=400, end_date=END_DATE, seed=request.param,
+                          gap_rate=0.02, limit_rate=0.02)
+
+
+@pytest.fixture
+def akshare():
+    """
+    把 akshare 替换为合成数据的替身
+
+    行情表（latest_quotes）的日期是当前交易日，因此序列截止到今天，且不生成停牌缺口
+    """
+    with stub_akshare(universe=20, bars=300, gap_rate=0.0) as stub:
+        yield stub
+
+
+@pytest.fixture(scope='session')
+def market(tmp_path_factory):
+    """
+    写入本地目录的合成行情，返回 (目录, 股票代码列表)
+
+    序列截止到今天，分析器的默认日期区间（最近一年）能取到数据
+    """
+    directory = str(tmp_path_factory.mktemp('market'))
+    return directory, write_fixtures(directory, universe=24, bars=400, gap_rate=0.02, limit_rate=0.02)
+
+
+@pytest.fixture
+def local_analyzer(market):
+    """创建读取本地合成行情的新分析器（缓存为空），用完后关闭计算进程池"""
+    created = []
+
+    def create(**kwargs):
+        kwargs.setdefault('bar_store_dir', '')
+        kwargs.setdefault('shared_store_dir', '')
+        analyzer = StockAnalyzer(provider=LocalFileProvider(market[0]), **kwargs)
+        created.append(analyzer)
+        return analyzer
+
+    yield create
+    for analyzer in created:
+        if analyzer._process_pool is not None:
+            analyzer._process_pool.shutdown()
+
+
+@pytest.fixture(scope='session')
+def servers(market):
+    """
+    读取本地合成行情的 Flask 服务和异步服务的测试客户端 (flask, asgi)
+
+    两个服务模块在导入时按环境变量创建分析器，因此先设置环境变量再导入；允许2个计算进程
+    """
+    env = {
+        'MARKET_DATA_PROVIDER': 'local',
+        'MARKET_DATA_DIR': market[0],
+        'BAR_STORE_DIR': '',
+        'SHARED_STORE_DIR': '',
+        'SNAPSHOT_UNIVERSE': '',
+        'SCAN_COMPUTE_WORKERS': '2',
+    }
+    with pytest.MonkeyPatch.context() as mp:
+        for name, value in env.items():
+            mp.setenv(name, value)
+        import app
+        import asgi_app
+    from starlette.testclient import TestClient
+
+    with TestClient(asgi_app.app) as asgi:
+        yield app.app.test_client(), asgi
+    app.scan_jobs.shutdown()
+    for analyzer in (app.analyzer, asgi_app.analyzer.analyzer):
+        if analyzer._process_pool is not None:
+            analyzer._process_pool.shutdown()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试用的参考实现：原 StockAnalyzer.calculate_indicators 的 pandas 版本
+"""
+
+import numpy as np
+import pandas as pd
+
+# 内核使用扩展精度的累积和，与 pandas 的补偿求和不逐位相同
+RTOL = 1e-9
+ATOL = 1e-8
+
+
+def reference_indicators(df, params):
+    """原 StockAnalyzer.calculate_indicators 的 pandas 实现"""
+    df = df.copy()
+    close, high, low, volume = df['close'], df['high'], df['low'], df['volume']
+    ma = params['ma_periods']
+    ichimoku = params['ichimoku']
+
+    df['SMA5'] = close.rolling(window=ma['short']).mean()
+    df['SMA20'] = close.rolling(window=ma['medium']).mean()
+    df['SMA60'] = close.rolling(window=ma['long']).mean()
+    df['EMA5'] = close.ewm(span=ma['short'], adjust=False).mean()
+    df['EMA20'] = close.ewm(span=ma['medium'], adjust=False).mean()
+    df['EMA60'] = close.ewm(span=ma['long'], adjust=False).mean()
+
+    macd = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    df['MACD'] = macd
+    df['Signal'] = macd.ewm(span=9, adjust=False).mean()
+    df['MACD_hist'] = macd - df['Signal']
+
+    middle = close.rolling(window=params['bollinger_period']).mean()
+    std = close.rolling(window=params['bollinger_period']).std()
+    df['BB_upper'] = middle + std * params['bollinger_std']
+    df['BB_middle'] = middle
+    df['BB_lower'] = middle - std * params['bollinger_std']
+
+    tr = pd.concat([high - low, (high - close.shift(1)).abs(), (low - close.shift(1)).abs()], axis=1).max(axis=1)
+    period = params['adx_period']
+    up_move = high.diff()
+    down_move = low.diff(-1).abs()
+    plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0)
+    minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0)
+    plus_di = 100 * pd.Series(plus_dm).rolling(window=period).mean() / tr.rolling(window=period).mean()
+    minus_di = 100 * pd.Series(minus_dm).rolling(window=period).mean() / tr.rolling(window=period).mean()
+    dx = 100 * abs(plus_di - minus_di) / (plus_di + minus_di)
+    df['ADX'], df['DI+'], df['DI-'] = dx.rolling(window=period).mean(), plus_di, minus_di
+
+    def midpoint(window):
+        return (high.rolling(window=window).max() + low.rolling(window=window).min()) / 2
+
+    tenkan, kijun = midpoint(ichimoku['tenkan']), midpoint(ichimoku['kijun'])
+    df['Tenkan'], df['Kijun'] = tenkan, kijun
+    df['Senkou_A'] = ((tenkan + kijun) / 2).shift(ichimoku['kijun'])
+    df['Senkou_B'] = midpoint(ichimoku['senkou_span_b']).shift(ichimoku['kijun'])
+    df['Chikou'] = close.shift(-ichimoku['kijun'])
+
+    delta = close.diff()
+    gain = delta.where(delta > 0, 0).rolling(window=params['rsi_period']).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=params['rsi_period']).mean()
+    df['RSI'] = 100 - (100 / (1 + gain / loss))
+
+    high_roll = high.rolling(window=params['stochastic_k']).max()
+    low_roll = low.rolling(window=params['stochastic_k']).min()
+    df['Stoch_K'] = 100 * (close - low_roll) / (high_roll - low_roll)
+    df['Stoch_D'] = df['Stoch_K'].rolling(window=params['stochastic_d']).mean()
+
+    typical_price = (high + low + close) / 3
+    mean_tp = typical_price.rolling(window=params['cci_period']).mean()
+    mean_deviation = abs(typical_price - mean_tp).rolling(window=params['cci_period']).mean()
+    df['CCI'] = (typical_price - mean_tp) / (0.015 * mean_deviation)
+    df['ROC'] = close.pct_change(periods=10) * 100
+
+    direction = np.sign(close.diff()).fillna(0)
+    df['OBV'] = (direction * volume).cumsum()
+    df['Volume_MA'] = volume.rolling(window=params['volume_ma_period']).mean()
+    df['Volume_Ratio'] = volume / df['Volume_MA']
+
+    raw_money_flow = typical_price * volume
+    positive_flow = pd.Series(np.where(typical_price > typical_price.shift(1), raw_money_flow, 0))
+    negative_flow = pd.Series(np.where(typical_price < typical_price.shift(1), raw_money_flow, 0))
+    money_ratio = (positive_flow.rolling(window=params['mfi_period']).sum()
+                   / negative_flow.rolling(window=params['mfi_period']).sum())
+    df['MFI'] = 100 - (100 / (1 + money_ratio))
+
+    df['ATR'] = tr.rolling(window=params['atr_period']).mean()
+    df['Volatility'] = df['ATR'] / close * 100
+    df['StdDev'] = close.rolling(window=params['std_dev_period']).std()
+    z_mean = close.rolling(window=params['z_score_period']).mean()
+    df['Z-Score'] = (close - z_mean) / close.rolling(window=params['z_score_period']).std()
+    return df
+
+
+def assert_columns_close(actual, expected, columns):
+    for name in columns:
+        np.testing.assert_allclose(np.asarray(actual[name], dtype=np.float64),
+                                   np.asarray(expected[name], dtype=np.float64),
+                                   rtol=RTOL, atol=ATOL, equal_nan=True, err_msg=name)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Flask 服务与异步服务：相同请求返回相同的状态码和响应，请求参数按相同规则校验
+"""
+
+import json
+
+import pytest
+
+import api_format
+
+
+def _post_both(servers, path, payload):
+    """同一请求分别发给两个服务，返回 [(状态码, 响应体)]"""
+    flask_client, asgi_client = servers
+    flask_response = flask_client.post(path, json=payload)
+    asgi_response = asgi_client.post(path, json=payload)
+    return [(flask_response.status_code, flask_response.data),
+            (asgi_response.status_code, asgi_response.content)]
+
+
+@pytest.mark.parametrize('value, expected', [
+    (True, True), (False, False), (1, True), (0, False),
+    ('true', True), ('False', False), ('1', True), ('0', False),
+])
+def test_parse_flag_accepts_booleans_and_their_strings(value, expected):
+    assert api_format.parse_flag({'latest_only': value}, 'latest_only', None) is expected
+
+
+@pytest.mark.parametrize('value', ['no', '', 2, None, [], {}])
+def test_parse_flag_rejects_other_values(value):
+    with pytest.raises(ValueError):
+        api_format.parse_flag({'latest_only': value}, 'latest_only', False)
+
+
+@pytest.mark.parametrize('path', ['/api/analyze', '/api/analyze_for_llm'])
+@pytest.mark.parametrize('value', ['false', '0', False])
+def test_analyze_latest_only_strings_are_parsed(servers, market, path, value):
+    code = market[1][0]
+    responses = _post_both(servers, path, {'stock_code': code, 'latest_only': value})
+    expected = _post_both(servers, path, {'stock_code': code})
+
+    assert responses[0] == responses[1] == expected[0]
+    assert responses[0][0] == 200
+
+
+@pytest.mark.parametrize('path', ['/api/analyze', '/api/analyze_for_llm'])
+def test_analyze_rejects_invalid_latest_only(servers, market, path):
+    (status, body), other = _post_both(servers, path, {'stock_code': market[1][0], 'latest_only': 'maybe'})
+
+    assert (status, body) == other
+    assert status == 400
+    assert json.loads(body)['status'] == 'error'
+
+
+def test_scan_with_compute_workers_matches_between_services(servers, market):
+    from asgi_app import analyzer
+
+    payload = {'stock_list': market[1][:12], 'min_score': 0, 'max_workers': 4, 'compute_workers': 2,
+               'chunksize': 4}
+    flask_response, asgi_response = _post_both(servers, '/api/scan', payload)
+    sequential = _post_both(servers, '/api/scan', dict(payload, compute_workers=0))
+
+    assert flask_response == asgi_response == sequential[1]
+    assert json.loads(flask_response[1])['count'] == 12
+    # 异步服务确实使用了进程池，而不是忽略 compute_workers
+    assert analyzer.analyzer._process_pool is not None
+
+
+@pytest.mark.parametrize('path', ['/api/scan', '/api/scan/stream', '/api/scan/jobs'])
+@pytest.mark.parametrize('options', [
+    {'max_workers': 'x'}, {'compute_workers': 'x'}, {'chunksize': 0}, {'short_circuit': 'maybe'},
+])
+def test_invalid_scan_options_are_rejected_by_both_services(servers, market, path, options):
+    (status, body), other = _post_both(servers, path, dict({'stock_list': market[1][:2]}, **options))
+
+    assert (status, body) == other
+    assert status == 400
+    assert json.loads(body)['message'].startswith('扫描参数无效')
+
+
+def test_stream_with_compute_workers_matches_between_services(servers, market):
+    payload = {'stock_list': market[1][:8], 'min_score': 50, 'compute_workers': 2, 'chunksize': 2,
+               'short_circuit': 'true'}
+    (flask_status, flask_body), (asgi_status, asgi_body) = _post_both(servers, '/api/scan/stream', payload)
+
+    assert flask_status == asgi_status == 200
+    # 结果事件按完成顺序产出，比较事件集合；汇总事件在最后且完全相同
+    flask_lines, asgi_lines = flask_body.decode().splitlines(), asgi_body.decode().splitlines()
+    assert sorted(flask_lines) == sorted(asgi_lines)
+    assert flask_lines[-1] == asgi_lines[-1]
+    assert json.loads(flask_lines[-1])['event'] == 'summary'
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+回测：指标按 causal 方式计算，某根K线之前的评分、持仓和净值不受之后K线的影响
+"""
+
+import numpy as np
+
+import backtest
+import indicator_kernels as kernels
+import panel
+import scoring
+from conftest import END_DATE
+from synthetic_data import generate_ohlcv, symbols
+
+
+def test_causal_adx_ignores_future_bars(params, bars):
+    high, low = bars['high'].to_numpy(), bars['low'].to_numpy()
+    close, volume = bars['close'].to_numpy(), bars['volume'].to_numpy()
+    cut = len(bars) // 2
+    changed = low.copy()
+    changed[cut:] *= 0.9
+
+    before = kernels.compute_indicators(high, low, close, volume, params, fields=['ADX'], causal=True)
+    after = kernels.compute_indicators(high, changed, close, volume, params, fields=['ADX'], causal=True)
+    np.testing.assert_array_equal(before['ADX'][:cut], after['ADX'][:cut])
+
+
+def _indicator(prices, params, name):
+    """回测使用的指标（causal），放回 (日期 × 股票) 的位置"""
+    valid, order, _, packed = panel.compute_packed(*prices, params, fields=[name], causal=True)
+    return panel.unpack(packed[name], order, valid)
+
+
+def test_backtest_has_no_lookahead(params):
+    frames = {code: generate_ohlcv(code, bars=400, end_date=END_DATE, seed=3, gap_rate=0.02)
+              for code in symbols(12)}
+    dates, _, fields = panel.frames_to_panel(frames)
+    prices = [fields[name] for name in panel.PRICE_FIELDS]
+    cut = len(dates) * 2 // 3
+
+    # 之后的K线整体跌去一半：价格、最低价和成交量都变化
+    future = [values.copy() for values in prices]
+    for values in future:
+        values[cut:] *= 0.5
+
+    # 评分用到的全部指标在 cut 之前不变（非 causal 的 ADX 在 cut-1 处用到了 cut 的最低价）
+    for name in scoring.INDICATOR_FIELDS:
+        before = _indicator(prices, params, name)
+        after = _indicator(future, params, name)
+        np.testing.assert_array_equal(after[:cut], before[:cut], err_msg=name)
+
+    expected = backtest.run_panel(*prices, params, initial_cash=100000)
+    actual = backtest.run_panel(*future, params, initial_cash=100000)
+    np.testing.assert_array_equal(actual['equity'][:cut], expected['equity'][:cut])
+    np.testing.assert_array_equal(actual['position'][:cut], expected['position'][:cut])
+    assert not np.array_equal(actual['equity'][cut:], expected['equity'][cut:], equal_nan=True)
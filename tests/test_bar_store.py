@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地K线存储：首次整段获取、之后只补取增量，复权价格变化时重新获取完整历史；
+用全市场行情表合并最新K线（追加、替换、跳过）
+"""
+
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from bar_store import BarStore
+from data_providers import QUOTE_COLUMNS, AkshareProvider
+from stock_analyzer import StockAnalyzer
+from synthetic_data import generate_ohlcv
+
+
+class Source:
+    """按区间返回合成序列的数据源，记录每次请求的区间"""
+
+    def __init__(self, df):
+        self.df = df
+        self.requests = []
+
+    def __call__(self, start, end):
+        self.requests.append((start, end))
+        mask = (self.df['date'] >= pd.Timestamp(start)) & (self.df['date'] <= pd.Timestamp(end))
+        return self.df[mask].reset_index(drop=True)
+
+
+@pytest.fixture
+def series():
+    """截止到今天的序列，补取当天K线时与数据源对齐"""
+    return generate_ohlcv('000001', bars=300, gap_rate=0.0)
+
+
+def _ymd(date):
+    return pd.Timestamp(date).strftime('%Y%m%d')
+
+
+def test_second_read_within_refresh_interval_does_not_fetch(tmp_path, series):
+    store = BarStore(str(tmp_path), refresh_interval=300)
+    source = Source(series)
+    start, end = _ymd(series['date'].iloc[0]), datetime.now().strftime('%Y%m%d')
+
+    first = store.get('000001', start, end, 'qfq', source)
+    second = store.get('000001', start, end, 'qfq', source)
+
+    assert source.requests == [(start, end)]
+    pd.testing.assert_frame_equal(first, series)
+    pd.testing.assert_frame_equal(second, series)
+
+
+def test_top_up_fetches_only_the_increment(tmp_path, series):
+    store = BarStore(str(tmp_path))
+    source = Source(series)
+    start = _ymd(series['date'].iloc[0])
+    stored_end = series['date'].iloc[-21]
+    store.get('000001', start, _ymd(stored_end), 'qfq', source)
+
+    today = datetime.now().strftime('%Y%m%d')
+    result = store.get('000001', start, today, 'qfq', source)
+
+    # 从本地最后一根K线开始补取，重叠的一根用于检测复权变化
+    assert source.requests[1] == (_ymd(stored_end), today)
+    assert len(source(*source.requests[1])) == 21
+    pd.testing.assert_frame_equal(result, series)
+
+
+def test_changed_adjustment_refetches_full_history(tmp_path, series):
+    store = BarStore(str(tmp_path))
+    start = _ymd(series['date'].iloc[0])
+    stored_end = series['date'].iloc[-21]
+    store.get('000001', start, _ymd(stored_end), 'qfq', Source(series))
+
+    # 除权后前复权历史整体下移
+    adjusted = series.copy()
+    adjusted[['open', 'high', 'low', 'close']] *= 0.9
+    source = Source(adjusted)
+    today = datetime.now().strftime('%Y%m%d')
+    result = store.get('000001', start, today, 'qfq', source)
+
+    assert source.requests == [(_ymd(stored_end), today), (start, today)]
+    pd.testing.assert_frame_equal(result, adjusted)
+
+
+def test_bar_store_is_opt_in_and_keyed_by_provider(tmp_path, monkeypatch):
+    monkeypatch.delenv('BAR_STORE_DIR', raising=False)
+    assert StockAnalyzer(shared_store_dir='').bar_store is None
+
+    analyzer = StockAnalyzer(bar_store_dir=str(tmp_path), provider='akshare', shared_store_dir='')
+    assert analyzer.bar_store.path('000001', 'qfq') == str(tmp_path / 'akshare' / 'qfq' / '000001.npz')
+
+
+def _quotes(date, prev_close, close=5.0):
+    """只有 000001 一只股票的行情表"""
+    return pd.DataFrame([['000001', pd.Timestamp(date), 4.8, 5.2, 4.7, close, 1000.0, prev_close]],
+                        columns=QUOTE_COLUMNS)
+
+
+def _save_bars(store, closes, dates=('2024-01-01', '2024-01-02')):
+    df = pd.DataFrame({'date': pd.to_datetime(list(dates)), 'open': 1.0, 'close': list(closes),
+                       'high': 2.0, 'low': 0.5, 'volume': 10.0})
+    store.save('000001', 'qfq', df, {'start': '20240101', 'end': _ymd(dates[-1]), 'synced_at': 0})
+
+
+def _outcome(result):
+    return [name for name, codes in result.items() if codes == ['000001']]
+
+
+def test_merge_appends_next_bar(tmp_path):
+    store = BarStore(str(tmp_path))
+    _save_bars(store, [3.0, 4.0])
+
+    assert _outcome(store.merge_latest(_quotes('2024-01-03', 4.0), 'qfq')) == ['appended']
+    df, meta = store.load('000001', 'qfq')
+    assert df['close'].tolist() == [3.0, 4.0, 5.0]
+    assert meta['end'] == '20240103'
+
+
+def test_merge_replaces_same_day_bar(tmp_path):
+    store = BarStore(str(tmp_path))
+    _save_bars(store, [3.0, 4.0])
+
+    assert _outcome(store.merge_latest(_quotes('2024-01-02', 3.0), 'qfq')) == ['replaced']
+    df, meta = store.load('000001', 'qfq')
+    assert df['close'].tolist() == [3.0, 5.0]
+    assert meta['end'] == '20240102'
+
+
+@pytest.mark.parametrize('date, prev_close, closes', [
+    # 昨收同时等于最后两根K线的收盘价，但行情日期与本地最后一根之间缺了一个交易日
+    ('2024-01-04', 3.0, [3.0, 3.0]),
+    # 昨收与本地收盘价不符：复权历史已变化
+    ('2024-01-03', 4.4, [3.0, 4.0]),
+    # 比本地最后一根更早的行情
+    ('2023-12-29', 3.0, [3.0, 4.0]),
+], ids=['gap', 'adjustment', 'older'])
+def test_merge_skips_quotes_that_do_not_continue_the_history(tmp_path, date, prev_close, closes):
+    store = BarStore(str(tmp_path))
+    _save_bars(store, closes)
+
+    assert _outcome(store.merge_latest(_quotes(date, prev_close), 'qfq')) == ['skipped']
+    df, meta = store.load('000001', 'qfq')
+    assert df['close'].tolist() == closes
+    assert meta['end'] == '20240102'
+
+
+def test_merge_ignores_stocks_without_local_history(tmp_path):
+    assert BarStore(str(tmp_path)).merge_latest(_quotes('2024-01-03', 4.0), 'qfq') == {
+        'appended': [], 'replaced': [], 'skipped': []}
+
+
+def test_merge_latest_from_akshare_quotes(tmp_path, akshare):
+    store = BarStore(str(tmp_path))
+    codes = akshare.universe[:5]
+    for code in codes:
+        history = akshare.frame(code).iloc[:-1]
+        store.save(code, 'qfq', history, {'start': '20000101', 'end': _ymd(history['date'].iloc[-1]),
+                                          'synced_at': 0})
+
+    result = store.merge_latest(AkshareProvider().latest_quotes(), 'qfq')
+    assert sorted(result['appended']) == sorted(codes)
+    for code in codes:
+        expected = akshare.frame(code).iloc[-1]
+        df, meta = store.load(code, 'qfq')
+        assert df['date'].iloc[-1] == expected['date']
+        assert df['close'].iloc[-1] == pytest.approx(expected['close'])
+        assert meta['end'] == _ymd(expected['date'])
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+紧凑模式：降精度后评分分支不变、阈值处退回 float64，报告和指标输出还原为 float64
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+import api_format
+import compact
+from synthetic_data import generate_ohlcv, symbols
+
+from conftest import END_DATE
+
+
+@pytest.fixture(scope='module')
+def frames(analyzer):
+    """一组股票计算好的指标"""
+    return [analyzer.calculate_indicators(generate_ohlcv(code, bars=300, end_date=END_DATE, seed=7))
+            for code in symbols(30)]
+
+
+def test_compact_frame_keeps_score_branches(analyzer, frames):
+    for indicators in frames:
+        narrow = compact.compact_frame(indicators)
+        assert compact._latest_choices(narrow) == compact._latest_choices(indicators)
+        assert analyzer.calculate_score(narrow)[0] == analyzer.calculate_score(indicators)[0]
+        assert narrow['OBV'].dtype == np.float64
+        assert narrow['close'].dtype == np.float32
+        assert list(narrow.columns)[:len(compact.FRAME_COLUMNS)] == compact.FRAME_COLUMNS
+
+
+def test_compact_frame_falls_back_at_thresholds(frames):
+    df = frames[0].copy()
+    # float32 舍入后恰好等于阈值30，命中的分支从"超卖"变为"偏离中性"
+    df.loc[df.index[-1], 'RSI'] = 30 - 1e-9
+    assert np.float32(df['RSI'].iloc[-1]) == 30
+
+    narrow = compact.compact_frame(df)
+    assert compact._latest_choices(narrow) == compact._latest_choices(df)
+    assert narrow['RSI'].dtype == np.float64
+
+
+def test_widen_uses_shortest_float32_representation():
+    values = np.array([12.34, 0.1, np.nan, -3e-7], dtype=np.float32)
+    widened = compact.widen(values)
+
+    assert widened.dtype == np.float64
+    assert widened[[0, 1, 3]].tolist() == [12.34, 0.1, -3e-7]
+    assert np.isnan(widened[2])
+    assert np.array_equal(widened[[0, 1, 3]].astype(np.float32), values[[0, 1, 3]])
+
+
+def test_compact_reports_and_indicators_serialize_as_float64(market, local_analyzer):
+    code = market[1][0]
+    full = local_analyzer()
+    narrow = local_analyzer()
+    narrow.compact_frames = True
+    expected = full.analyze_stock(code)
+    report = narrow.analyze_stock(code)
+
+    assert narrow.get_indicator_data(code)['close'].dtype == np.float32
+    assert (report['score'], report['recommendation']) == (expected['score'], expected['recommendation'])
+    assert report['price'] == float(str(np.float32(expected['price'])))
+    for name, value in report['indicators'].items():
+        assert type(value) is float
+        assert value == pytest.approx(expected['indicators'][name], rel=compact.DEFAULT_TOLERANCE, nan_ok=True)
+    # 序列化结果不带 float32 的舍入尾数
+    assert json.loads(api_format.dumps(report))['price'] == report['price']
+
+    records = api_format.indicator_records(narrow.get_indicator_data(code), rows=1)
+    assert records[0]['close'] == float(str(np.float32(records[0]['close'])))
+    assert records[0]['close'] == pytest.approx(expected['price'], rel=compact.DEFAULT_TOLERANCE)
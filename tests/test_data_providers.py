@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+行情数据源：按名称选择、本地文件读取、东方财富请求参数和重试、akshare 共享连接池
+"""
+
+import importlib
+import os
+import sys
+import types
+
+import pandas as pd
+import pytest
+import requests
+
+import data_providers
+import market_data
+from data_providers import (AkshareProvider, EastmoneyProvider, LocalFileProvider, SessionRequests,
+                            create_provider)
+from synthetic_data import generate_ohlcv
+
+
+@pytest.mark.parametrize('name, expected', [('akshare', AkshareProvider), ('EastMoney', EastmoneyProvider),
+                                            ('local', LocalFileProvider)])
+def test_create_provider_by_name(tmp_path, name, expected):
+    assert type(create_provider(name, str(tmp_path))) is expected
+
+
+def test_create_provider_reads_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv('MARKET_DATA_PROVIDER', 'local')
+    monkeypatch.setenv('MARKET_DATA_DIR', str(tmp_path))
+    provider = create_provider()
+    assert isinstance(provider, LocalFileProvider) and provider.directory == str(tmp_path)
+
+    monkeypatch.delenv('MARKET_DATA_PROVIDER')
+    assert isinstance(create_provider(), AkshareProvider)
+    with pytest.raises(ValueError):
+        create_provider('tushare')
+
+
+def _chinese_columns(df):
+    return df.rename(columns={v: k for k, v in data_providers.COLUMN_NAMES.items()})
+
+
+def test_local_provider_reads_chinese_columns_and_filters_dates(tmp_path):
+    df = generate_ohlcv('000001', bars=60, end_date='2024-06-28', gap_rate=0.0)
+    shuffled = _chinese_columns(df).sample(frac=1, random_state=0)
+    shuffled.to_csv(tmp_path / '000001.csv', index=False)
+    provider = LocalFileProvider(str(tmp_path))
+
+    result = provider.get_daily('000001', '20240601', '20240628')
+    expected = df[df['date'] >= '2024-06-01'].reset_index(drop=True)
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+    with pytest.raises(FileNotFoundError):
+        provider.get_daily('600001', '20240601', '20240628')
+
+
+def test_local_provider_prefers_the_adjustment_folder_and_reloads_changed_files(tmp_path):
+    provider = LocalFileProvider(str(tmp_path))
+    df = generate_ohlcv('000001', bars=30, end_date='2024-06-28', gap_rate=0.0)
+    provider.write('000001', df)
+    adjusted = df.assign(close=df['close'] * 0.9)
+    path = provider.write('000001', adjusted, adjust='qfq')
+
+    assert provider.path('000001', 'qfq') == path
+    assert provider.path('000001', '') == str(tmp_path / '000001.csv')
+    assert provider.get_daily('000001', '20240101', '20240628', 'qfq')['close'].iloc[-1] == pytest.approx(
+        adjusted['close'].iloc[-1])
+
+    # 文件更新后（修改时间变化）重新读取
+    provider.write('000001', adjusted.assign(close=1.0), adjust='qfq')
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert provider.get_daily('000001', '20240101', '20240628', 'qfq')['close'].iloc[-1] == 1.0
+    assert provider.stock_list() == ['000001']
+
+
+def test_local_provider_latest_quotes(tmp_path):
+    provider = LocalFileProvider(str(tmp_path))
+    df = generate_ohlcv('000001', bars=30, end_date='2024-06-28', gap_rate=0.0)
+    provider.write('000001', df)
+    provider.write('600001', df.tail(1))
+
+    quotes = provider.latest_quotes()
+    assert list(quotes.columns) == data_providers.QUOTE_COLUMNS
+    assert quotes['code'].tolist() == ['000001']
+    assert quotes['prev_close'].iloc[0] == pytest.approx(df['close'].iloc[-2])
+    assert quotes['close'].iloc[0] == pytest.approx(df['close'].iloc[-1])
+
+
+def test_kline_token_can_be_overridden(monkeypatch):
+    assert market_data.kline_params('600001', '20240101', '20240628')['ut'] == '7eea3edcaed734bea9cbfc24409ed989'
+    monkeypatch.setenv('EASTMONEY_UT', 'token')
+    try:
+        importlib.reload(market_data)
+        params = market_data.kline_params('600001', '20240101', '20240628', 'hfq')
+        assert (params['ut'], params['secid'], params['fqt']) == ('token', '1.600001', '2')
+    finally:
+        monkeypatch.delenv('EASTMONEY_UT')
+        importlib.reload(market_data)
+
+
+class Session:
+    """记录请求并按顺序返回结果的 Session 替身，结果为异常时抛出"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        self.calls.append((url, kwargs))
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class Response:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def test_eastmoney_provider_retries_then_parses_klines(monkeypatch):
+    monkeypatch.setattr(data_providers.time, 'sleep', lambda seconds: None)
+    klines = ['2024-06-27,10.0,10.5,10.8,9.9,1000,0,0,0,0,0', '2024-06-28,10.5,10.2,10.6,10.1,1200,0,0,0,0,0']
+    provider = EastmoneyProvider(retries=1)
+    provider._session = Session(requests.ConnectionError('reset'), Response({'data': {'klines': klines}}))
+
+    df = provider.get_daily('000001', '20240627', '20240628')
+    assert df['close'].tolist() == [10.5, 10.2]
+    assert len(provider._session.calls) == 2
+    url, kwargs = provider._session.calls[0]
+    assert url == market_data.KLINE_URL
+    assert kwargs['params'] == market_data.kline_params('000001', '20240627', '20240628')
+
+    provider._session = Session(requests.ConnectionError('reset'), requests.ConnectionError('reset'))
+    with pytest.raises(Exception, match='获取 000001 行情数据失败'):
+        provider.get_daily('000001', '20240627', '20240628')
+
+
+@pytest.fixture
+def fake_akshare(monkeypatch):
+    """一个像 akshare 接口模块那样通过模块级 requests.get 发请求的模块，以及只提供该接口的 akshare"""
+    module = types.ModuleType('akshare.fake_em')
+    module.requests = requests
+    exec("def stock_zh_a_hist(symbol):\n    return requests.get('https://example.com/kline', params={'s': symbol})",
+         module.__dict__)
+    other = types.ModuleType('akshare.fake_other')
+    other.requests = object()
+    exec("def stock_zh_a_spot_em():\n    return 'spot'", other.__dict__)
+    monkeypatch.setitem(sys.modules, module.__name__, module)
+    monkeypatch.setitem(sys.modules, other.__name__, other)
+    return module, types.SimpleNamespace(stock_zh_a_hist=module.stock_zh_a_hist,
+                                         stock_zh_a_spot_em=other.stock_zh_a_spot_em)
+
+
+def test_share_session_routes_akshare_requests_through_the_session(fake_akshare):
+    module, ak = fake_akshare
+    session = Session('response')
+
+    assert data_providers.share_session(ak, session) == ['akshare.fake_em']
+    assert isinstance(module.requests, SessionRequests)
+    assert module.requests.exceptions is requests.exceptions
+    assert ak.stock_zh_a_hist('000001') == 'response'
+    assert session.calls == [('https://example.com/kline', {'params': {'s': '000001'}})]
+
+    # 再次调用不重复包装；requests 不是 requests 模块的模块保持原样
+    wrapper = module.requests
+    assert data_providers.share_session(ak, Session()) == ['akshare.fake_em']
+    assert module.requests is wrapper
+    assert not isinstance(sys.modules['akshare.fake_other'].requests, SessionRequests)
+
+
+def test_stubbed_akshare_is_not_patched(akshare):
+    stub = data_providers.import_akshare()
+    assert stub is akshare
+    assert data_providers.share_session(stub, Session()) == []
+    assert len(AkshareProvider().get_daily(akshare.universe[0], '20200101', '20991231')) > 0
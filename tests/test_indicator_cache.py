@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+技术指标缓存：过期时间、LRU 淘汰和不复制的共享读取
+"""
+
+import pandas as pd
+import pytest
+
+import indicator_cache
+from indicator_cache import IndicatorCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(indicator_cache.time, 'time', clock)
+    return clock
+
+
+def _frame(value):
+    return pd.DataFrame({'close': [value]})
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = IndicatorCache(max_size=4, ttl=300)
+    cache.put('a', _frame(1.0))
+
+    clock.now += 300
+    assert cache.get('a') is not None
+    clock.now += 1
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = IndicatorCache(max_size=2, ttl=300)
+    cache.put('a', _frame(1.0))
+    cache.put('b', _frame(2.0))
+    cache.get('a')
+    cache.put('c', _frame(3.0))
+
+    assert cache.keys() == ['a', 'c']
+    assert cache.get('b') is None
+
+
+def test_hits_share_the_stored_frame(clock):
+    cache = IndicatorCache()
+    df = _frame(1.0)
+    cache.put('a', df)
+
+    assert cache.get('a') is df
+    assert cache.get('a') is cache.get('a')
+
+
+def test_invalidate_removes_every_entry_of_a_stock(clock):
+    cache = IndicatorCache()
+    cache.put(('000001', '20240101', '20240628', 'qfq', 'p'), _frame(1.0))
+    cache.put(('000001', 'latest', '20240628', 'qfq', 'p', 120, ('RSI',)), _frame(2.0))
+    cache.put(('600001', '20240101', '20240628', 'qfq', 'p'), _frame(3.0))
+
+    cache.invalidate('000001')
+
+    assert cache.keys() == [('600001', '20240101', '20240628', 'qfq', 'p')]
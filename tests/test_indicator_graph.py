@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+指标依赖图：只计算选中的指标及其依赖，公共中间结果只计算一次
+"""
+
+import numpy as np
+import pytest
+
+import indicator_kernels as kernels
+
+
+def test_selected_fields_match_full_computation(analyzer, bars):
+    full = analyzer.calculate_indicators(bars.copy())
+    fields = ['RSI', 'ADX', 'MFI']
+    partial = analyzer.calculate_indicators(bars.copy(), fields=fields)
+    for name in fields:
+        np.testing.assert_array_equal(partial[name].to_numpy(), full[name].to_numpy())
+    # 依赖项不作为输出列
+    assert 'DI+' not in partial.columns
+
+
+def test_compute_indicators_returns_requested_fields_in_order(params, bars):
+    values = kernels.compute_indicators(bars['high'], bars['low'], bars['close'], bars['volume'], params,
+                                        fields=['MACD_hist', 'RSI', 'MACD_hist'])
+    assert list(values) == ['MACD_hist', 'RSI']
+
+
+def test_plan_orders_dependencies_first():
+    fields, plan = kernels.resolve_fields(['MACD_hist', 'Volume_Ratio'])
+    assert fields == ['MACD_hist', 'Volume_Ratio']
+    for name in plan:
+        for dep in kernels.INDICATORS[name].deps:
+            assert plan.index(dep) < plan.index(name)
+    assert {'MACD', 'Signal', 'Volume_MA'} <= set(plan)
+
+
+def test_unknown_field_is_rejected():
+    with pytest.raises(Exception, match='未知的技术指标: FOO'):
+        kernels.resolve_fields(['RSI', 'FOO'])
+
+
+def test_shared_rolling_std_is_computed_once(params, bars, monkeypatch):
+    calls = []
+    rolling_std = kernels.rolling_std
+    monkeypatch.setattr(kernels, 'rolling_std', lambda x, window: calls.append(window) or rolling_std(x, window))
+
+    # 布林带、标准差和 Z-Score 使用同一个20日收盘价标准差
+    assert params['bollinger_period'] == params['std_dev_period'] == params['z_score_period']
+    kernels.compute_indicators(bars['high'], bars['low'], bars['close'], bars['volume'], params,
+                               fields=['BB_upper', 'BB_lower', 'StdDev', 'Z-Score'])
+    assert calls == [params['bollinger_period']]
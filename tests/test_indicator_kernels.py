@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+NumPy 指标内核与原 pandas 实现：指标值在容差内一致，评分和建议不变
+"""
+
+import numpy as np
+import pytest
+
+import indicator_kernels as kernels
+import scoring
+from conftest import END_DATE
+from reference import assert_columns_close, reference_indicators
+from synthetic_data import generate_ohlcv, symbols
+
+# 评分规则中比较两个指标的分支：(规则名: (指标, 与之比较的指标))
+TIES = {
+    'kd': ('Stoch_K', ('Stoch_D',)),
+    'bollinger': ('close', ('BB_upper', 'BB_middle', 'BB_lower')),
+}
+
+
+@pytest.fixture(scope='module')
+def universe(analyzer, params):
+    """120 只股票 × 3 个种子的 (内核结果, pandas 结果)"""
+    frames = []
+    for seed in range(3):
+        for code in symbols(120):
+            df = generate_ohlcv(code, bars=400, end_date=END_DATE, seed=seed, gap_rate=0.02, limit_rate=0.02)
+            frames.append((analyzer.calculate_indicators(df.copy()), reference_indicators(df, params)))
+    return frames
+
+
+def test_kernels_match_pandas_reference(analyzer, params, bars):
+    result = analyzer.calculate_indicators(bars.copy())
+    expected = reference_indicators(bars, params)
+    assert_columns_close(result, expected, kernels.INDICATORS)
+
+
+def test_latest_score_and_recommendation_match_pandas(analyzer, universe):
+    for result, expected in universe:
+        score, _, categories = analyzer.calculate_score(result)
+        expected_score, _, expected_categories = analyzer.calculate_score(expected)
+        assert (score, categories) == (expected_score, expected_categories)
+        assert analyzer.get_recommendation(score) == analyzer.get_recommendation(expected_score)
+
+
+def test_score_branches_differ_only_at_exact_ties(universe):
+    differing = total = 0
+    for result, expected in universe:
+        _, _, choices = scoring.evaluate(scoring.columns_from_frame(result))
+        _, _, expected_choices = scoring.evaluate(scoring.columns_from_frame(expected))
+        total += len(result)
+        for key in choices:
+            rows = np.nonzero(choices[key] != expected_choices[key])[0]
+            differing += len(rows)
+            # 只有比较的两个量在末位舍入范围内相等时，分支才可能不同
+            assert len(rows) == 0 or key in TIES, key
+            if len(rows):
+                name, others = TIES[key]
+                value = result[name].to_numpy()[rows]
+                gap = np.min([np.abs(value - result[other].to_numpy()[rows]) for other in others], axis=0)
+                assert np.all(gap <= 1e-12 * np.abs(value)), key
+    assert differing / total < 1e-3
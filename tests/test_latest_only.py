@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+只分析最新K线：与完整分析（默认区间）的最新一行一致
+"""
+
+import numpy as np
+import pytest
+
+import indicator_kernels as kernels
+from stock_analyzer import REPORT_FIELDS
+from synthetic_data import generate_ohlcv
+
+ROLLING_FIELDS = ['RSI', 'ATR', 'BB_upper', 'BB_lower', 'Stoch_K', 'Stoch_D', 'CCI', 'MFI', 'Volume_Ratio']
+
+
+def test_default_tolerance_report_matches_full_analysis(market, local_analyzer):
+    analyzer = local_analyzer()
+    # EMA60 在默认容差下需要的K线超过一年，完整报告的 latest_only 退回完整分析
+    assert analyzer.latest_window(REPORT_FIELDS) > 245
+    for code in market[1]:
+        assert analyzer.analyze_stock(code, latest_only=True) == analyzer.analyze_stock(code)
+
+
+def test_rolling_fields_use_a_short_tail(market, local_analyzer):
+    analyzer = local_analyzer()
+    assert analyzer.latest_window(ROLLING_FIELDS) < 100
+    for code in market[1]:
+        latest = analyzer.get_latest_indicator_data(code, fields=ROLLING_FIELDS)
+        full = analyzer.get_indicator_data(code)
+        assert len(latest) == analyzer.latest_window(ROLLING_FIELDS)
+        assert latest['date'].iloc[-1] == full['date'].iloc[-1]
+        for name in ROLLING_FIELDS:
+            np.testing.assert_allclose(latest[name].iloc[-1], full[name].iloc[-1], rtol=1e-9, err_msg=name)
+
+
+@pytest.mark.parametrize('span', [5, 9, 12, 20, 26, 60])
+@pytest.mark.parametrize('tolerance', [1e-2, 1e-6])
+def test_ema_horizon_bounds_truncation_error(span, tolerance):
+    close = generate_ohlcv('000001', bars=800, seed=span)['close'].to_numpy()
+    n = kernels.ema_horizon(span, tolerance)
+    full = kernels.ema(close, span)
+    truncated = kernels.ema(close[-n:], span)
+    # 截断处的初始值取当日收盘价，与完整历史的 EMA 之差按 (1-alpha)^n 衰减
+    deviation = abs(full[-n] - close[-n])
+    assert abs(truncated[-1] - full[-1]) <= tolerance * deviation + 1e-12 * abs(full[-1])
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+运行指标：Prometheus 文本格式（0.0.4）的结构、转义和直方图分桶，两种服务记录相同的请求标签
+"""
+
+import math
+import re
+
+import pytest
+
+import metrics
+from metrics import Counter, Gauge, Histogram, Registry
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\[\\n"])*)"(?:,|$)')
+
+
+def parse(text):
+    """
+    按文本格式解析，返回 {指标名: (类型, [(样本名, {标签}, 值)])}
+
+    每个指标以 HELP、TYPE 开头，样本名为指标名或加上该类型允许的后缀，标签值按格式转义
+    """
+    assert text.endswith('\n')
+    families = {}
+    current = None
+    for line in text[:-1].split('\n'):
+        if line.startswith('# HELP '):
+            current = line.split(' ')[2]
+            assert current not in families
+        elif line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            assert name == current and kind in ('counter', 'gauge', 'histogram')
+            families[name] = (kind, [])
+        else:
+            match = _SAMPLE.match(line)
+            assert match, line
+            name, labels, value = match.groups()
+            kind, samples = families[current]
+            suffixes = {'counter': ('_total',), 'gauge': ('',), 'histogram': ('_bucket', '_sum', '_count')}[kind]
+            assert name in [current + suffix for suffix in suffixes], line
+            pairs = _LABEL.findall(labels or '')
+            assert ','.join(f'{k}="{v}"' for k, v in pairs) == (labels or ''), line
+            samples.append((name, dict(pairs), float(value)))
+    return families
+
+
+def _unescape(value):
+    return re.sub(r'\\(.)', lambda m: {'n': '\n'}.get(m.group(1), m.group(1)), value)
+
+
+def test_counter_gauge_and_escaped_labels():
+    registry = Registry()
+    counter = registry.register(Counter('demo_lookups_total', '查找次数', ('result',)))
+    gauge = registry.register(Gauge('demo_level', '当前值', ('name',)))
+    label = 'a"b\\c\nd'
+    counter.inc(result=label)
+    counter.inc(2, result='hit')
+    gauge.set(1.5, name='x')
+    gauge.dec(name='y')
+
+    families = parse(registry.render())
+    kind, samples = families['demo_lookups']
+    assert kind == 'counter'
+    assert [(name, _unescape(labels['result']), value) for name, labels, value in samples] == [
+        ('demo_lookups_total', label, 1.0), ('demo_lookups_total', 'hit', 2.0)]
+    assert families['demo_level'] == ('gauge', [('demo_level', {'name': 'x'}, 1.5),
+                                                ('demo_level', {'name': 'y'}, -1.0)])
+    assert 'demo_lookups_total{result="hit"} 2\n' in registry.render()
+
+
+def test_histogram_buckets_are_cumulative_and_end_with_inf():
+    registry = Registry()
+    histogram = registry.register(Histogram('demo_seconds', '耗时', ('stage',), buckets=(1.0, 0.1)))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, stage='load')
+    with pytest.raises(RuntimeError):
+        with histogram.time(stage='fail'):
+            raise RuntimeError('x')
+
+    _, samples = parse(registry.render())['demo_seconds']
+    load = [(name, labels.get('le'), value) for name, labels, value in samples if labels['stage'] == 'load']
+    # 等于上界的观测值计入该分桶（le 为小于等于）
+    assert load == [('demo_seconds_bucket', '0.1', 2.0), ('demo_seconds_bucket', '1', 3.0),
+                    ('demo_seconds_bucket', '+Inf', 4.0), ('demo_seconds_sum', None, 2.65),
+                    ('demo_seconds_count', None, 4.0)]
+    assert histogram.count(stage='fail') == 1
+
+
+@pytest.mark.parametrize('value, expected', [
+    (3.0, '3'), (0.25, '0.25'), (1e16, '1e+16'), (math.inf, '+Inf'), (-math.inf, '-Inf'), (7, '7'),
+])
+def test_value_formatting(value, expected):
+    assert metrics._format_value(value) == expected
+
+
+def test_label_names_and_duplicate_metrics_are_checked():
+    registry = Registry()
+    counter = registry.register(Counter('demo_total', '次数', ('result',)))
+    with pytest.raises(ValueError):
+        counter.inc(stage='x')
+    with pytest.raises(ValueError):
+        registry.register(Gauge('demo_total', '重复', ()))
+
+
+def test_default_registry_is_valid_text_format():
+    families = parse(metrics.render())
+    assert set(families) >= {'stock_http_request_duration_seconds', 'stock_stage_duration_seconds',
+                             'stock_cache_lookups', 'stock_scan_symbols', 'stock_scan_last_throughput'}
+
+
+def test_both_services_label_requests_by_route_template(servers):
+    def count(endpoint, status):
+        return metrics.HTTP_REQUEST_SECONDS.count(method='GET', endpoint=endpoint, status=status)
+
+    before = (count('/api/scan/jobs/{job_id}', 404), count('unmatched', 404))
+    for client in servers:
+        # Flask 服务在响应关闭时记录（waitress 发送完毕后关闭），测试客户端需要显式关闭
+        for path, status in (('/api/scan/jobs/missing', 404), ('/no/such/path', 404), ('/api/metrics', 200)):
+            response = client.get(path)
+            response.close()
+            assert response.status_code == status
+        assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
+
+    assert (count('/api/scan/jobs/{job_id}', 404), count('unmatched', 404)) == (before[0] + 2, before[1] + 2)
+    body = servers[1].get('/api/metrics').text
+    parse(body)
+    assert 'endpoint="/api/scan/jobs/{job_id}"' in body
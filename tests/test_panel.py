@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+截面面板：停牌缺口和历史长度不同的股票合并计算，结果与逐只计算一致
+"""
+
+import numpy as np
+
+import indicator_kernels as kernels
+import panel
+from conftest import END_DATE
+from synthetic_data import generate_ohlcv, symbols
+
+
+def _frames():
+    """历史长度不同、停牌日期不同的一组股票"""
+    return {code: generate_ohlcv(code, bars=250 + 30 * i, end_date=END_DATE, seed=i, gap_rate=0.03)
+            for i, code in enumerate(symbols(8))}
+
+
+def test_panel_matches_single_stock(analyzer, params):
+    frames = _frames()
+    dates, codes, fields = panel.frames_to_panel(frames)
+    indicators = panel.compute_panel(fields['open'], fields['high'], fields['low'], fields['close'],
+                                     fields['volume'], params)
+
+    for j, code in enumerate(codes):
+        single = analyzer.calculate_indicators(frames[code].copy())
+        rows = dates.get_indexer(single['date'])
+        missing = np.setdiff1d(np.arange(len(dates)), rows)
+        for name in kernels.INDICATORS:
+            np.testing.assert_array_equal(indicators[name][rows, j], single[name].to_numpy(), err_msg=name)
+            # 停牌和上市前的日期没有指标值
+            assert np.isnan(indicators[name][missing, j]).all(), name
+
+
+def test_panel_fields_match_full_panel(params):
+    _, _, fields = panel.frames_to_panel(_frames())
+    prices = [fields[name] for name in panel.PRICE_FIELDS]
+    full = panel.compute_panel(*prices, params)
+    partial = panel.compute_panel(*prices, params, fields=['RSI', 'ADX'])
+
+    assert set(partial) >= {'RSI', 'ADX'}
+    for name in ('RSI', 'ADX'):
+        np.testing.assert_array_equal(partial[name], full[name])
+
+
+def test_analyzer_panel_skips_failed_stocks(market, local_analyzer):
+    analyzer = local_analyzer()
+    codes = list(market[1][:6])
+    dates, loaded, indicators = analyzer.calculate_indicators_panel(codes + ['999999'], max_workers=3)
+
+    assert loaded == codes
+    for j, code in enumerate(codes):
+        single = analyzer.get_indicator_data(code)
+        rows = dates.get_indexer(single['date'])
+        np.testing.assert_array_equal(indicators['MACD'][rows, j], single['MACD'].to_numpy())
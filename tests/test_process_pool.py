@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+计算进程池：指标和评分在工作进程中计算，结果与当前进程计算一致
+"""
+
+MISSING = '999999'
+
+
+def test_process_pool_scan_matches_in_process_scan(market, local_analyzer):
+    codes = list(market[1]) + [MISSING]
+    expected = local_analyzer().scan_market(codes, min_score=0, max_workers=4)
+    pooled = local_analyzer().scan_market(codes, min_score=0, max_workers=4, compute_workers=2, chunksize=5)
+
+    assert pooled == expected
+    assert [report['stock_code'] for report in pooled] == [report['stock_code'] for report in expected]
+
+
+def test_process_pool_mixes_cached_and_computed_stocks(market, local_analyzer):
+    analyzer = local_analyzer()
+    codes = list(market[1][:8])
+    # 前一半已在当前进程计算并缓存，其余在工作进程中计算
+    cached = analyzer.analyze_batch(codes[:4], max_workers=2)
+    pooled = analyzer.analyze_batch(codes, max_workers=2, compute_workers=2, chunksize=2)
+
+    assert {code: pooled[code] for code in codes[:4]} == cached
+    assert pooled == local_analyzer().analyze_batch(codes, max_workers=2)
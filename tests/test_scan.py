@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+市场扫描：并发获取与逐只扫描的结果和顺序一致，出错的股票跳过，提前停止不改变结果
+"""
+
+import logging
+
+import pytest
+
+MISSING = '999999'
+
+
+def _codes(market):
+    """股票池中间插入一只本地没有数据的股票"""
+    codes = list(market[1])
+    return codes[:5] + [MISSING] + codes[5:]
+
+
+def test_concurrent_scan_matches_sequential(market, local_analyzer):
+    codes = _codes(market)
+    sequential = local_analyzer().scan_market(codes, min_score=0, max_workers=1)
+    concurrent = local_analyzer().scan_market(codes, min_score=0, max_workers=8)
+
+    assert concurrent == sequential
+    assert len(sequential) == len(codes) - 1
+
+
+def test_scan_orders_by_score_then_input_position(market, local_analyzer):
+    codes = _codes(market)
+    reports = local_analyzer().scan_market(codes, min_score=0, max_workers=8)
+
+    positions = [codes.index(report['stock_code']) for report in reports]
+    keys = [(-report['score'], position) for report, position in zip(reports, positions)]
+    assert keys == sorted(keys)
+
+
+def test_failed_stocks_are_logged_and_skipped(market, local_analyzer, caplog):
+    codes = _codes(market)
+    with caplog.at_level(logging.ERROR):
+        reports = local_analyzer().analyze_batch(codes, max_workers=4)
+
+    assert set(reports) == set(market[1])
+    assert any(MISSING in record.getMessage() for record in caplog.records)
+
+
+
+@pytest.mark.parametrize('options', [{'max_workers': 1}, {'max_workers': 8}, {'max_workers': 4, 'compute_workers': 2}],
+                         ids=['sequential', 'threads', 'processes'])
+@pytest.mark.parametrize('min_score', [40, 60, 75])
+def test_short_circuit_scan_matches_full_scan(market, local_analyzer, options, min_score):
+    codes = _codes(market)
+    full = local_analyzer().scan_market(codes, min_score=min_score)
+    analyzer = local_analyzer()
+    bounded = analyzer.scan_market(codes, min_score=min_score, short_circuit=True, **options)
+
+    assert bounded == full
+    # 通过的股票写入缓存的是完整指标，再次扫描（读取缓存）结果不变
+    assert analyzer.scan_market(codes, min_score=min_score, short_circuit=True, **options) == full
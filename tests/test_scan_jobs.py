@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+后台扫描任务：进度、部分结果、取消和保留数量，完成后的结果与 scan_market 相同
+"""
+
+import threading
+import time
+
+import pytest
+
+import scan_jobs
+from scan_jobs import ScanJobManager
+
+
+class Gate:
+    """逐只放行的分析器替身：每次 release() 产出一只股票的报告（得分为序号×10），记录生成器是否已关闭"""
+
+    def __init__(self, errors=()):
+        self.errors = set(errors)
+        self.closed = threading.Event()
+        self._permits = threading.Semaphore(0)
+
+    def release(self, count=1):
+        for _ in range(count):
+            self._permits.release()
+
+    def iter_reports(self, stock_list, **options):
+        try:
+            for index, stock_code in enumerate(stock_list):
+                self._permits.acquire()
+                if stock_code in self.errors:
+                    yield index, stock_code, None, ValueError(f'无数据: {stock_code}')
+                else:
+                    yield index, stock_code, {'stock_code': stock_code, 'score': index * 10}, None
+        finally:
+            self.closed.set()
+
+
+def _wait_until(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, '等待超时'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def manager():
+    created = []
+
+    def create(analyzer, **kwargs):
+        manager = ScanJobManager(analyzer, **kwargs)
+        created.append(manager)
+        return manager
+
+    yield create
+    for manager in created:
+        manager.shutdown()
+
+
+def test_progress_and_partial_results_while_running(manager):
+    gate = Gate()
+    job = manager(gate).submit(['a', 'b', 'c', 'd'], min_score=10)
+
+    gate.release(2)
+    _wait_until(lambda: job.progress()['done'] == 2)
+    progress = job.progress()
+    assert progress['status'] == scan_jobs.RUNNING
+    assert (progress['total'], progress['matched'], progress['progress']) == (4, 1, 50.0)
+    assert progress['eta_seconds'] is not None
+    assert [report['stock_code'] for report in job.results()[0]] == ['b']
+
+    gate.release(2)
+    _wait_until(lambda: job.status == scan_jobs.COMPLETED)
+    recommendations, errors = job.results()
+    assert [report['stock_code'] for report in recommendations] == ['d', 'c', 'b']
+    assert errors == []
+    assert job.progress()['progress'] == 100.0 and job.progress()['eta_seconds'] is None
+
+
+def test_failed_stocks_are_counted_and_reported(manager):
+    gate = Gate(errors={'b'})
+    job = manager(gate).submit(['a', 'b', 'c'], min_score=0)
+    gate.release(3)
+    _wait_until(lambda: job.status == scan_jobs.COMPLETED)
+
+    assert (job.done, job.failed) == (2, 1)
+    assert job.results()[1] == [{'stock_code': 'b', 'error': '无数据: b'}]
+
+
+def test_cancel_stops_after_the_current_stock_and_keeps_results(manager):
+    gate = Gate()
+    jobs = manager(gate)
+    job = jobs.submit(['a', 'b', 'c', 'd'], min_score=0)
+    gate.release(1)
+    _wait_until(lambda: job.done == 1)
+
+    assert jobs.cancel(job.id) is job
+    # 正在等待的一只股票完成后停止，其余股票不再分析，扫描生成器被关闭
+    gate.release(1)
+    assert gate.closed.wait(10)
+    _wait_until(lambda: job.status == scan_jobs.CANCELLED)
+    assert job.done == 2
+    assert [report['stock_code'] for report in job.results()[0]] == ['b', 'a']
+    assert jobs.cancel('missing') is None
+
+
+def test_cancelled_pending_job_never_runs(manager):
+    gate = Gate()
+    jobs = manager(gate, workers=1)
+    running = jobs.submit(['a'], min_score=0)
+    pending = jobs.submit(['b'], min_score=0)
+
+    jobs.cancel(pending.id)
+    assert pending.status == scan_jobs.CANCELLED
+    gate.release(1)
+    _wait_until(lambda: running.status == scan_jobs.COMPLETED)
+    assert (pending.done, pending.started_at) == (0, None)
+
+
+def test_only_the_latest_finished_jobs_are_kept(manager):
+    gate = Gate()
+    jobs = manager(gate, history=2)
+    finished = []
+    for code in 'abc':
+        finished.append(jobs.submit([code], min_score=0))
+        gate.release(1)
+        _wait_until(lambda: finished[-1].status == scan_jobs.COMPLETED)
+    running = jobs.submit(['d'], min_score=0)
+
+    assert [job['job_id'] for job in jobs.list()] == [finished[1].id, finished[2].id, running.id]
+    assert jobs.get(finished[0].id) is None
+    gate.release(1)
+
+
+def test_finished_job_matches_scan_market(manager, local_analyzer, market):
+    analyzer = local_analyzer()
+    stock_list = market[1][:10] + ['999999']
+    job = manager(analyzer).submit(stock_list, min_score=40, max_workers=4, short_circuit=True)
+    _wait_until(lambda: job.status == scan_jobs.COMPLETED, timeout=60)
+
+    recommendations, errors = job.results()
+    assert recommendations == analyzer.scan_market(stock_list, min_score=40)
+    assert [error['stock_code'] for error in errors] == ['999999']
+    assert (job.done, job.failed) == (10, 1)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+流式扫描：NDJSON 每行一个事件、SSE 每帧一个事件，汇总排名与 /api/scan 相同
+"""
+
+import json
+
+import pytest
+
+import api_format
+
+MISSING = '999999'
+
+
+def _text(response):
+    """Flask 和 Starlette 测试客户端响应的文本"""
+    return response.get_data(as_text=True) if hasattr(response, 'get_data') else response.text
+
+
+def _parse_ndjson(body):
+    assert body.endswith('\n')
+    return [json.loads(line) for line in body[:-1].split('\n')]
+
+
+def _parse_sse(body):
+    """按空行切分帧，每帧必须恰好是 event 行和 data 行，且事件名与数据一致"""
+    assert body.endswith('\n\n')
+    events = []
+    for frame in body[:-2].split('\n\n'):
+        event_line, data_line = frame.split('\n')
+        assert event_line.startswith('event: ') and data_line.startswith('data: ')
+        event = json.loads(data_line[len('data: '):])
+        assert event['event'] == event_line[len('event: '):]
+        events.append(event)
+    return events
+
+
+def test_events_with_newlines_stay_on_one_line_or_frame():
+    event = {'event': 'error', 'index': 0, 'stock_code': '000001', 'message': '第一行\n第二行\r\n'}
+
+    line = api_format.encode_event(event)
+    assert line.count('\n') == 1 and json.loads(line) == event
+    assert _parse_sse(api_format.encode_event(event, sse=True)) == [event]
+
+
+@pytest.mark.parametrize('data, accept, expected', [
+    ({}, None, False),
+    ({}, 'text/event-stream', True),
+    ({'format': 'SSE'}, None, True),
+    ({'format': 'ndjson'}, 'text/event-stream', False),
+    (None, 'application/json, text/event-stream', True),
+])
+def test_format_parameter_takes_precedence_over_accept(data, accept, expected):
+    assert api_format.wants_sse(data, accept) is expected
+
+
+def test_summary_ranks_like_scan_and_counts_failures():
+    stream = api_format.ScanStream(60)
+    events = [stream.item(index, code, None if score is None else {'score': score}, error)
+              for index, code, score, error in [(2, 'c', 70, None), (0, 'a', 70, None), (1, 'b', 59, None),
+                                                (3, 'd', None, ValueError('x')), (4, 'e', None, None),
+                                                (5, 'f', 90, None)]]
+
+    assert [event and event['event'] for event in events] == ['result', 'result', None, 'error', None, 'result']
+    summary = stream.summary()
+    assert (summary['total'], summary['done'], summary['failed'], summary['count']) == (6, 5, 1, 3)
+    assert summary['ranking'] == [{'stock_code': 'f', 'score': 90}, {'stock_code': 'a', 'score': 70},
+                                  {'stock_code': 'c', 'score': 70}]
+
+
+@pytest.mark.parametrize('sse', [False, True], ids=['ndjson', 'sse'])
+def test_stream_routes_frame_events_and_match_scan(servers, market, sse):
+    stock_list = market[1][:6] + [MISSING]
+    payload = {'stock_list': stock_list, 'min_score': 40, 'max_workers': 3}
+    headers = {'Accept': 'text/event-stream'} if sse else {}
+    for client in servers:
+        response = client.post('/api/scan/stream', json=payload, headers=headers)
+        events = _parse_sse(_text(response)) if sse else _parse_ndjson(_text(response))
+        scan = json.loads(_text(client.post('/api/scan', json=payload)))
+
+        assert response.status_code == 200
+        assert response.headers['Content-Type'].startswith('text/event-stream' if sse else 'application/x-ndjson')
+        assert response.headers['Cache-Control'] == 'no-cache'
+        *items, summary = events
+        assert summary['event'] == 'summary' and summary['status'] == 'success'
+        assert [event['stock_code'] for event in items if event['event'] == 'error'] == [MISSING]
+        results = {event['data']['stock_code'] for event in items if event['event'] == 'result'}
+        assert summary['ranking'] == [{'stock_code': report['stock_code'], 'score': report['score']}
+                                      for report in scan['data']]
+        assert results == {report['stock_code'] for report in scan['data']}
+        assert (summary['total'], summary['failed']) == (len(stock_list), 1)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+评分：整段历史的向量化评分与逐根K线对最新一行评分一致，提前停止的评分与完整评分一致
+"""
+
+import random
+
+import pytest
+
+import indicator_kernels as kernels
+import scoring
+from synthetic_data import generate_ohlcv, symbols
+
+from conftest import END_DATE
+
+
+@pytest.fixture(scope='module')
+def frames(analyzer):
+    """一组股票的原始K线和计算好的指标"""
+    result = []
+    for code in symbols(30):
+        df = generate_ohlcv(code, bars=300, end_date=END_DATE, seed=7)
+        result.append((df, analyzer.calculate_indicators(df.copy())))
+    return result
+
+
+def full_score(df):
+    score, _, _ = scoring.evaluate(scoring.latest_columns(df))
+    return int(score)
+
+
+def _bounded(params, bars, min_score, order=scoring.BOUND_ORDER, calls=None):
+    workspace = kernels.Workspace(bars['high'].to_numpy(), bars['low'].to_numpy(),
+                                  bars['close'].to_numpy(), bars['volume'].to_numpy())
+
+    def compute(fields):
+        if calls is not None:
+            calls.append(fields)
+        return kernels.compute_indicators(None, None, None, None, params, workspace=workspace, fields=fields)
+
+    return scoring.bounded_score(compute, bars['close'].to_numpy(), min_score, order)
+
+
+@pytest.mark.parametrize('min_score', [0, 30, 50, 60, 75, 101])
+def test_bounded_score_matches_full_score(params, frames, min_score):
+    for bars, indicators in frames:
+        bounded = _bounded(params, bars, min_score)
+        expected = full_score(indicators)
+        # 完整评分达不到 min_score 时提前停止，否则结果与完整评分相同
+        if expected < min_score:
+            assert bounded is None
+        else:
+            assert bounded == expected
+
+
+def test_bound_order_covers_every_rule_and_does_not_change_scores(params, frames):
+    assert sorted(scoring.BOUND_ORDER) == sorted(scoring.RULE_MAX)
+    rng = random.Random(0)
+    orders = [tuple(reversed(scoring.BOUND_ORDER))] + [
+        tuple(rng.sample(scoring.BOUND_ORDER, len(scoring.BOUND_ORDER))) for _ in range(3)]
+    for bars, indicators in frames[:10]:
+        for order in orders:
+            assert _bounded(params, bars, 0, order) == full_score(indicators)
+
+
+def test_unreachable_min_score_stops_after_the_first_rule(params, frames):
+    calls = []
+    assert _bounded(params, frames[0][0], sum(scoring.RULE_MAX.values()) + 1, calls=calls) is None
+    assert calls == [list(scoring.RULE_FIELDS[scoring.BOUND_ORDER[0]])]
+
+
+def test_score_frame_latest_row_matches_evaluate(frames):
+    for _, indicators in frames:
+        history = scoring.score_frame(indicators, numeric_only=True)
+        assert int(history['score'].iloc[-1]) == full_score(indicators)
+
+
+def test_score_frame_rows_match_calculate_score(analyzer, frames):
+    _, indicators = frames[0]
+    history = analyzer.calculate_score_history(indicators)
+    # 每一行的评分、说明和类别得分等于截取到该行后 calculate_score 对最后一行的结果
+    for end in range(100, len(indicators) + 1, 23):
+        score, details, categories = analyzer.calculate_score(indicators.iloc[:end])
+        row = history.iloc[end - 1]
+        assert int(row['score']) == score
+        assert row['score_details'] == details
+        assert {category: int(row[category]) for category in scoring.CATEGORIES} == categories
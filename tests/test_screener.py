@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+选股查询：语法和优先级、NaN 的三值逻辑、二分查找结果与逐行求值一致，请求参数校验
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+import api_format
+import screener
+from screener import QueryError, ScreenerIndex
+
+A = ('compare', 'A', '>', 1.0)
+B = ('compare', 'B', '<', 2.0)
+C = ('compare', 'C', '=', 3.0)
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('A > 1 OR B < 2 AND C = 3', ('or', A, ('and', B, C))),
+    ('A > 1 AND B < 2 OR C = 3', ('or', ('and', A, B), C)),
+    ('NOT A > 1 AND B < 2', ('and', ('not', A), B)),
+    ('NOT (A > 1 AND B < 2)', ('not', ('and', A, B))),
+    ('(A > 1 OR B < 2) AND C == 3', ('and', ('or', A, B), C)),
+    ('a > 1 and not not B < 2', ('and', ('compare', 'a', '>', 1.0), ('not', ('not', B)))),
+    ('A BETWEEN -1 AND 2.5e1 AND B < 2', ('and', ('between', 'A', -1.0, 25.0), B)),
+    ('`Z-Score` <> 0 OR Z-Score >= .5', ('or', ('compare', 'Z-Score', '!=', 0.0),
+                                         ('compare', 'Z-Score', '>=', 0.5))),
+])
+def test_precedence_and_syntax(query, expected):
+    assert screener.parse(query) == expected
+
+
+@pytest.mark.parametrize('query', ['', '   ', 'A >', 'A > 1 B < 2', '(A > 1', 'A > 1)', 'A BETWEEN 1 OR 2',
+                                   'A > B', 'A ~ 1', 'AND A > 1', None, 5])
+def test_invalid_queries_raise_query_error(query):
+    with pytest.raises(QueryError):
+        screener.parse(query)
+
+
+def _reference(node, row):
+    """逐行三值逻辑求值：True、False 或 None（NaN）"""
+    kind = node[0]
+    if kind == 'and':
+        a, b = _reference(node[1], row), _reference(node[2], row)
+        return False if False in (a, b) else (None if None in (a, b) else True)
+    if kind == 'or':
+        a, b = _reference(node[1], row), _reference(node[2], row)
+        return True if True in (a, b) else (None if None in (a, b) else False)
+    if kind == 'not':
+        value = _reference(node[1], row)
+        return None if value is None else not value
+    value = float(row[node[1]])
+    if math.isnan(value):
+        return None
+    if kind == 'between':
+        return node[2] <= value <= node[3]
+    return {'<': value < node[3], '<=': value <= node[3], '>': value > node[3], '>=': value >= node[3],
+            '=': value == node[3], '!=': value != node[3]}[node[2]]
+
+
+@pytest.fixture(scope='module')
+def index():
+    """整数值便于命中相等比较，约一成为 NaN"""
+    rng = np.random.default_rng(3)
+    count = 200
+    columns = {}
+    for name in ('score', 'A', 'B', 'C'):
+        values = rng.integers(0, 6, count).astype(float)
+        values[rng.random(count) < 0.1] = np.nan
+        columns[name] = values
+    return ScreenerIndex([f'{i:06d}' for i in range(count)], columns, version='v1')
+
+
+@pytest.mark.parametrize('query', [
+    'A > 1', 'A >= 1', 'A < 3', 'A <= 3', 'A = 2', 'A != 2', 'A BETWEEN 1 AND 3',
+    'NOT A > 2', 'A > 1 OR B < 2 AND C = 3', 'NOT (A > 1 AND B < 2) OR NOT C != 3',
+    'NOT (A BETWEEN 2 AND 4 OR B = 0)',
+])
+def test_query_matches_row_by_row_evaluation(index, query):
+    tree = screener.parse(query)
+    rows = [{name: values[i] for name, values in index.columns.items()} for i in range(len(index))]
+    expected = {index.codes[i] for i, row in enumerate(rows) if _reference(tree, row) is True}
+
+    count, result = index.query(query, limit=None)
+    assert count == len(expected)
+    assert {item['stock_code'] for item in result} == expected
+
+
+@pytest.mark.parametrize('descending', [True, False])
+def test_sort_keeps_nan_last_and_limit_keeps_total(index, descending):
+    total, rows = index.query('A >= 0', sort='B', descending=descending, limit=None)
+    values = [row['B'] for row in rows]
+    known = [value for value in values if value is not None]
+
+    assert known == sorted(known, reverse=descending)
+    assert values == known + [None] * (len(values) - len(known))
+    limited_total, limited = index.query('A >= 0', sort='B', descending=descending, limit=5)
+    assert limited_total == total and limited == rows[:5]
+    assert set(rows[0]) == {'stock_code', 'score', 'A', 'B'}
+
+
+def test_unknown_columns_raise_query_error(index):
+    for options in ({'query': 'X > 1'}, {'query': 'A > 1', 'sort': 'X'}, {'query': 'A > 1', 'fields': ['X']}):
+        with pytest.raises(QueryError):
+            index.query(**options)
+
+
+def test_index_from_reports_reads_indicators_scores_and_report_columns():
+    reports = {'600001': {'score': 55, 'price': 9.5, 'price_change': -1.0, 'indicators': {'RSI': 25.0},
+                          'category_scores': {'trend': 20}},
+               '000001': {'score': 80, 'price': 12.0, 'price_change': 2.0, 'indicators': {'RSI': None},
+                          'category_scores': {'trend': 35}}}
+    index = ScreenerIndex.from_reports(reports, 'v2')
+
+    assert list(index.codes) == ['000001', '600001']
+    assert index.query('trend > 10 AND price > 1')[1] == [
+        {'stock_code': '000001', 'score': 80.0, 'trend': 35.0, 'price': 12.0},
+        {'stock_code': '600001', 'score': 55.0, 'trend': 20.0, 'price': 9.5}]
+    assert index.query('NOT RSI < 30')[0] == 0
+
+
+@pytest.mark.parametrize('data, message', [
+    ({}, '请提供查询条件 query'),
+    ([], '请提供查询条件 query'),
+    ({'query': 1}, '请提供查询条件 query'),
+    ({'query': 'A > 1', 'order': 'up'}, 'order 只能是 asc 或 desc'),
+    ({'query': 'A > 1', 'limit': True}, 'limit 参数无效'),
+    ({'query': 'A > 1', 'limit': -1}, 'limit 参数无效'),
+    ({'query': 'A > 1', 'sort': ['A']}, 'sort 参数无效'),
+    ({'query': 'A > 1', 'fields': {'A': 1}}, 'fields 参数无效'),
+    ({'query': 'A > 1', 'fields': ['A', 1]}, 'fields 参数无效'),
+    ({'query': 'A > 1', 'fields': [['A']]}, 'fields 参数无效'),
+])
+def test_parse_screen_rejects_invalid_parameters(data, message):
+    assert api_format.parse_screen(data) == (None, message)
+
+
+def test_parse_screen_defaults_and_field_string():
+    assert api_format.parse_screen({'query': 'A > 1', 'fields': 'B, C', 'order': 'ASC', 'sort': ''}) == (
+        {'query': 'A > 1', 'sort': 'score', 'descending': False, 'limit': 100, 'fields': ['B', 'C']}, None)
+
+
+@pytest.mark.parametrize('fields', [[1], ['RSI', None], [['RSI']], [{'RSI': 1}], {}, []])
+def test_parse_fields_rejects_non_string_items(fields):
+    assert api_format.parse_fields(fields) == (None, 'fields 参数无效')
+
+
+def test_invalid_fields_return_400_on_both_services(servers, market):
+    payload = {'stock_code': market[1][0], 'fields': [['RSI']]}
+    flask_client, asgi_client = servers
+    flask_response = flask_client.post('/api/technical_indicators', json=payload)
+    asgi_response = asgi_client.post('/api/technical_indicators', json=payload)
+
+    assert flask_response.status_code == asgi_response.status_code == 400
+    assert flask_response.data == asgi_response.content
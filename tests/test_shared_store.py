@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+共享存储：发布和读取、只读视图不复制数据、版本切换，分析器和计算进程直接读取映射的视图
+"""
+
+import numpy as np
+import pytest
+
+from shared_store import BAR_COLUMNS, SharedStore
+from synthetic_data import generate_ohlcv
+
+START, END = '20230701', '20240628'
+
+
+@pytest.fixture
+def frames():
+    frames = {}
+    for seed, code in enumerate(('000001', '600001')):
+        df = generate_ohlcv(code, bars=50 + seed * 10, end_date='2024-06-28', seed=seed)
+        frames[code] = df[['date'] + BAR_COLUMNS].assign(RSI=df['close'] / 10)
+    return frames
+
+
+def test_publish_and_read_views(tmp_path, frames):
+    store = SharedStore(str(tmp_path))
+    version = store.publish(frames, 'qfq', START, END, 'params')
+
+    assert store.info()['version'] == version and store.info()['count'] == 2
+    assert store.locate('600001', START, END, 'qfq') == version
+    for code, expected in frames.items():
+        bars = store.get(code, START, END, 'qfq')
+        assert list(bars) == ['date'] + BAR_COLUMNS
+        full = store.get(code, START, END, 'qfq', 'params')
+        assert np.array_equal(full['date'], expected['date'].to_numpy())
+        assert np.array_equal(full['RSI'], expected['RSI'].to_numpy())
+        assert not full['close'].flags.writeable
+
+    for args in ((START, END, 'hfq'), ('20230101', END, 'qfq')):
+        assert store.get('000001', *args) is None
+    assert store.get('000001', START, END, 'qfq', 'other') is None
+    assert store.get('999999', START, END, 'qfq') is None
+
+
+def test_frame_is_zero_copy_unless_asked(tmp_path, frames):
+    store = SharedStore(str(tmp_path))
+    store.publish(frames, 'qfq', START, END, 'params')
+    views = store.get('000001', START, END, 'qfq', 'params')
+
+    df = store.frame('000001', START, END, 'qfq', 'params')
+    for name, values in views.items():
+        assert np.shares_memory(df[name].to_numpy(), values)
+    with pytest.raises(ValueError):
+        df.loc[0, 'close'] = 0.0
+    # 追加新列不修改映射的文件
+    df['extra'] = df['close'] * 2
+
+    copied = store.frame('000001', START, END, 'qfq', 'params', copy=True)
+    assert not np.shares_memory(copied['close'].to_numpy(), views['close'])
+    copied.loc[0, 'close'] = 0.0
+    assert views['close'][0] == frames['000001']['close'].iloc[0]
+
+
+def test_new_version_replaces_current_and_old_version_stays_readable(tmp_path, frames):
+    store = SharedStore(str(tmp_path), keep=2)
+    first = store.publish(frames, 'qfq', START, END, 'params')
+    reader = SharedStore(str(tmp_path), check_interval=0)
+    assert reader.locate('000001', START, END, 'qfq') == first
+
+    changed = {code: df.assign(close=df['close'] + 1) for code, df in frames.items()}
+    second = store.publish(changed, 'qfq', START, END, 'params')
+    assert second > first
+    assert reader.locate('000001', START, END, 'qfq') == second
+    assert reader.get('000001', START, END, 'qfq')['close'][0] == changed['000001']['close'].iloc[0]
+    assert reader.get('000001', START, END, 'qfq', version=first)['close'][0] == frames['000001']['close'].iloc[0]
+
+
+def test_analyzer_reads_published_indicators_without_copying(market, local_analyzer, tmp_path):
+    codes = list(market[1][:6])
+    assert local_analyzer(shared_store_dir=str(tmp_path)).publish_shared(codes, max_workers=2)
+
+    reader = local_analyzer(shared_store_dir=str(tmp_path))
+    reader.provider.get_daily = None  # 共享存储命中时不再读取行情
+    df = reader.get_indicator_data(codes[0])
+    assert not df['RSI'].to_numpy().flags.writeable
+    assert reader.indicator_cache.get(reader._indicator_cache_key(codes[0], *reader._resolve_dates(None, None),
+                                                                  'qfq')) is None
+
+    report = reader.analyze_stock(codes[0])
+    assert report['stock_code'] == codes[0] and isinstance(report['score'], (int, float))
+
+
+def test_compute_pool_reads_shared_bars_when_params_differ(market, local_analyzer, tmp_path):
+    codes = list(market[1][:6])
+    local_analyzer(shared_store_dir=str(tmp_path)).publish_shared(codes, max_workers=2)
+
+    reader = local_analyzer(shared_store_dir=str(tmp_path))
+    expected = local_analyzer()
+    for analyzer in (reader, expected):
+        analyzer.params['rsi_period'] = 10
+    # 参数不同，指标不能直接使用；父进程不读取行情，计算进程在映射的K线视图上计算
+    reader.provider.get_daily = None
+    pooled = reader.scan_market(codes, min_score=0, max_workers=2, compute_workers=2, chunksize=2)
+
+    assert pooled == expected.scan_market(codes, min_score=0, max_workers=2)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+并发请求合并：同一键的并发调用只执行一次，结果和异常共享给所有等待者
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+def _run_concurrently(count, target):
+    """count 个线程同时开始执行 target(i)，返回按线程序号排列的结果"""
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = ('ok', target(i))
+        except Exception as e:
+            results[i] = ('error', e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_run_once():
+    flight = SingleFlight()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return {'score': 80}
+
+    results = _run_concurrently(8, lambda i: flight.do('000001', compute))
+
+    assert len(calls) == 1
+    values = [value for _, value in results]
+    assert all(value[0] is values[0][0] for value in values)
+    assert sorted(shared for _, shared in values) == [False] + [True] * 7
+    assert flight.in_flight() == 0
+
+
+def test_exception_reaches_every_waiter():
+    flight = SingleFlight()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        time.sleep(0.2)
+        raise ValueError('数据源超时')
+
+    results = _run_concurrently(5, lambda i: flight.do('000001', fail))
+
+    assert len(calls) == 1
+    assert all(kind == 'error' and str(error) == '数据源超时' for kind, error in results)
+    # 失败后键已释放，下一次调用重新执行
+    assert flight.do('000001', lambda: 1) == (1, False)
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    flight = SingleFlight()
+    calls = []
+    results = _run_concurrently(4, lambda i: flight.do(i, lambda: calls.append(i) or i))
+    assert sorted(calls) == [0, 1, 2, 3]
+    assert [value for _, value in results] == [(0, False), (1, False), (2, False), (3, False)]
+
+
+def test_async_calls_run_once_and_share_errors():
+    async def scenario():
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'report'
+
+        async def fail():
+            await asyncio.sleep(0.05)
+            raise ValueError('失败')
+
+        results = await asyncio.gather(*(flight.do('a', compute) for _ in range(6)))
+        errors = await asyncio.gather(*(flight.do('b', fail) for _ in range(3)), return_exceptions=True)
+        return calls, results, errors, flight.in_flight()
+
+    calls, results, errors, in_flight = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert results == [('report', False)] + [('report', True)] * 5
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert in_flight == 0
+
+
+def test_concurrent_analyses_fetch_once(market, local_analyzer, monkeypatch):
+    analyzer = local_analyzer()
+    code = market[1][0]
+    calls = []
+    get_daily = analyzer.provider.get_daily
+
+    def slow_get_daily(*args, **kwargs):
+        calls.append(args[0])
+        time.sleep(0.2)
+        return get_daily(*args, **kwargs)
+
+    monkeypatch.setattr(analyzer.provider, 'get_daily', slow_get_daily)
+    results = _run_concurrently(6, lambda i: analyzer.analyze_stock(code))
+
+    assert calls == [code]
+    reports = [report for _, report in results]
+    assert all(report == reports[0] for report in reports)
+    # 共享的报告各自独立，修改一份不影响其他请求
+    assert len({id(report) for report in reports}) == len(reports)
+
+
+@pytest.mark.parametrize('latest_only', [False, True])
+def test_concurrent_analysis_errors_reach_every_request(local_analyzer, latest_only):
+    analyzer = local_analyzer()
+    results = _run_concurrently(4, lambda i: analyzer.analyze_stock('999999', latest_only=latest_only))
+    assert all(kind == 'error' and '999999' in str(error) for kind, error in results)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+收盘后快照：发布和重新加载、过期和参数变化后退回实时计算、旧版本清理、调度时间
+"""
+
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import snapshot
+from snapshot import SnapshotScheduler, SnapshotStore
+
+
+def _reports():
+    return {'000001': {'stock_code': '000001', 'score': np.int64(70), 'price': np.float64(10.5)},
+            '600001': {'stock_code': '600001', 'score': 40, 'price': 8.25}}
+
+
+def test_published_snapshot_is_reloaded_with_plain_types(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    version = store.publish(_reports(), 'p')
+
+    reloaded = SnapshotStore(str(tmp_path))
+    assert reloaded.load_latest()
+    for source in (store, reloaded):
+        report = source.get('000001', 'p')
+        assert report == {'stock_code': '000001', 'score': 70, 'price': 10.5}
+        assert type(report['score']) is int
+        assert source.info('p') == dict(source.info('p'), version=version, count=2, usable=True)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_get_returns_an_independent_copy(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.publish(_reports(), 'p')
+
+    store.get('000001', 'p')['score'] = 0
+    assert store.get('000001', 'p')['score'] == 70
+    assert store.get('999999', 'p') is None
+
+
+def test_stale_or_mismatched_snapshot_is_not_used(tmp_path):
+    store = SnapshotStore(str(tmp_path), max_age_hours=1)
+    store.publish(_reports(), 'p')
+
+    assert store.get('000001', 'other') is None
+    assert store.screener('other') is None
+    assert store.info('other')['usable'] is False
+
+    store._current['created_at'] -= 3601
+    assert store.get('000001', 'p') is None
+    assert store.screener('p') is None
+    assert store.info('p')['usable'] is False
+
+
+def test_old_versions_are_pruned_and_corrupt_files_skipped(tmp_path):
+    store = SnapshotStore(str(tmp_path), keep=2)
+    for version in ('20240101150000', '20240102150000'):
+        with open(store.path(version), 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'created_at': 0, 'params': 'p', 'reports': {}}, f)
+    version = store.publish(_reports(), 'p')
+
+    assert store._versions() == ['20240102150000', version]
+
+    with open(store.path('99991231235959'), 'w', encoding='utf-8') as f:
+        f.write('{"version": ')
+    reloaded = SnapshotStore(str(tmp_path))
+    assert reloaded.load_latest()
+    assert reloaded.info()['version'] == version
+
+
+@pytest.mark.parametrize('now, expected', [
+    ('2024-06-27 10:00', '2024-06-27 15:30'),   # 周四收盘前：当天
+    ('2024-06-27 15:30', '2024-06-28 15:30'),   # 到点后：下一个工作日
+    ('2024-06-28 16:00', '2024-07-01 15:30'),   # 周五收盘后：跳过周末
+    ('2024-06-29 09:00', '2024-07-01 15:30'),
+])
+def test_next_run_is_the_next_weekday_after_close(tmp_path, now, expected):
+    scheduler = SnapshotScheduler(None, SnapshotStore(str(tmp_path)), [])
+    assert scheduler.next_run(datetime.strptime(now, '%Y-%m-%d %H:%M')) == datetime.strptime(
+        expected, '%Y-%m-%d %H:%M')
+
+
+def test_analyzer_reads_the_built_snapshot_until_params_change(tmp_path, local_analyzer, market):
+    analyzer = local_analyzer()
+    codes = market[1][:6]
+    live = {code: analyzer.analyze_stock(code) for code in codes}
+    analyzer.snapshot = SnapshotStore(str(tmp_path))
+    scheduler = SnapshotScheduler(analyzer, analyzer.snapshot, lambda: codes + ['999999'], bulk_refresh=False)
+
+    version = scheduler.build()
+    assert version is not None and scheduler.last_error is None
+    assert scheduler.status()['count'] == len(codes)
+    for code in codes:
+        report = analyzer.snapshot_report(code)
+        assert report == json.loads(json.dumps(live[code], default=snapshot._json_default))
+        assert analyzer.analyze_stock(code) == report
+    assert analyzer.snapshot_report('999999') is None
+
+    # 参数变化后快照不再可用，退回实时计算
+    analyzer.params = dict(analyzer.params, rsi_period=9)
+    assert analyzer.snapshot_report(codes[0]) is None
+    assert scheduler.status()['usable'] is False
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+流式指标状态：逐根K线增量更新的结果与对截至该K线的历史批量计算一致
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import indicator_kernels as kernels
+from reference import assert_columns_close
+from streaming import StreamingIndicatorState, _Window
+
+
+def test_streaming_matches_batch(analyzer, params, bars):
+    state = StreamingIndicatorState(params)
+    rows = [state.update(bar) for bar in bars[['date', 'open', 'high', 'low', 'close', 'volume']].to_dict('records')]
+    # 每次 update 的结果等于对截至该K线的历史批量计算后的最后一行；延迟线取未来的收盘价，流式结果总是 NaN
+    columns = [name for name in kernels.INDICATORS if name != 'Chikou']
+    for end in list(range(30, len(bars), 37)) + [len(bars)]:
+        batch = analyzer.calculate_indicators(bars.iloc[:end].copy())
+        assert_columns_close(pd.DataFrame([rows[end - 1]]), batch.tail(1), columns)
+
+
+def test_streaming_state_round_trip(params, bars):
+    records = bars[['date', 'open', 'high', 'low', 'close', 'volume']].to_dict('records')
+    middle = len(records) // 2
+
+    continuous = StreamingIndicatorState(params)
+    restored = StreamingIndicatorState(params)
+    for bar in records[:middle]:
+        continuous.update(bar)
+        restored.update(bar)
+    restored = StreamingIndicatorState.loads(restored.dumps())
+
+    for bar in records[middle:]:
+        expected, actual = continuous.update(bar), restored.update(bar)
+        for name, value in expected.items():
+            if isinstance(value, float) and math.isnan(value):
+                assert math.isnan(actual[name]), name
+            else:
+                assert actual[name] == value, name
+
+
+@pytest.mark.parametrize('window', [1, 3, 20])
+def test_streaming_window_matches_rolling(window):
+    rng = np.random.default_rng(window)
+    values = np.round(rng.normal(100, 5, 300), 2)
+    # 连续相同值、NaN 和 inf
+    values[50:80] = 101.0
+    values[120] = np.nan
+    values[200] = np.inf
+    series = pd.Series(values)
+
+    aggregate = _Window(window, squares=True, extrema=True)
+    sums, stds, maxima, minima = [], [], [], []
+    for value in values:
+        aggregate.push(float(value))
+        sums.append(aggregate.sum())
+        stds.append(aggregate.std() if window > 1 else math.nan)
+        maxima.append(aggregate.max())
+        minima.append(aggregate.min())
+
+    finite = series.where(np.isfinite(series))
+    # 含非有限值的窗口结果为 NaN
+    valid = finite.rolling(window).count() == window
+    np.testing.assert_allclose(sums, series.rolling(window).sum().where(valid), rtol=1e-12, equal_nan=True)
+    np.testing.assert_array_equal(maxima, series.rolling(window).max().where(valid))
+    np.testing.assert_array_equal(minima, series.rolling(window).min().where(valid))
+    if window > 1:
+        # 两遍法的参考值：全部相同的窗口标准差恰好为0（pandas 的增量算法会留下舍入残差）
+        expected = series.rolling(window).apply(lambda v: np.std(v, ddof=1), raw=True).where(valid)
+        np.testing.assert_allclose(stds, expected, rtol=1e-9, atol=1e-12, equal_nan=True)
+
+
+def test_state_from_history_continues_with_new_bars(market, local_analyzer):
+    analyzer = local_analyzer()
+    code = market[1][0]
+    history = analyzer.get_stock_data(code)
+    state = analyzer.create_streaming_state(code, end_date=history['date'].iloc[-2].strftime('%Y%m%d'))
+
+    row = state.update(history.iloc[-1][['date', 'open', 'high', 'low', 'close', 'volume']].to_dict())
+    batch = analyzer.calculate_indicators(history.copy())
+    columns = [name for name in kernels.INDICATORS if name != 'Chikou']
+    assert_columns_close(pd.DataFrame([row]), batch.tail(1), columns)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+参数扫描：网格展开、共享中间结果不改变结果、按指标排序
+"""
+
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import panel
+import sweep
+from conftest import END_DATE
+from synthetic_data import generate_ohlcv, symbols
+
+GRID = {'rsi_period': [10, 14], 'ma_periods.short': [3, 5, 8]}
+
+
+@pytest.fixture(scope='module')
+def fields():
+    frames = {code: generate_ohlcv(code, bars=300, end_date=END_DATE, seed=5, gap_rate=0.02)
+              for code in symbols(10)}
+    return panel.frames_to_panel(frames)[2]
+
+
+def test_expand_grid_is_cartesian_in_key_order(params):
+    base = copy.deepcopy(params)
+    combos = sweep.expand_grid(params, GRID)
+
+    assert [overrides for overrides, _ in combos] == [
+        {'rsi_period': rsi, 'ma_periods.short': short} for rsi in (10, 14) for short in (3, 5, 8)]
+    for overrides, full in combos:
+        assert full['rsi_period'] == overrides['rsi_period']
+        assert full['ma_periods']['short'] == overrides['ma_periods.short']
+        assert full['ma_periods']['long'] == params['ma_periods']['long']
+    # 基础参数不被修改
+    assert params == base
+
+
+@pytest.mark.parametrize('name', ['unknown', 'ma_periods.unknown', 'rsi_period.short'])
+def test_expand_grid_rejects_unknown_parameters(params, name):
+    with pytest.raises(Exception, match='未知参数'):
+        sweep.expand_grid(params, {name: [1]})
+
+
+def test_shared_workspace_matches_independent_runs(params, fields):
+    table = sweep.run_sweep(fields, params, GRID, 100000, workers=1)
+
+    data = sweep.prepare(fields)
+    for overrides, full in sweep.expand_grid(params, GRID):
+        # 每个组合单独用新的 Workspace 计算，结果与共享中间结果时相同
+        expected = sweep.evaluate(data, sweep.create_workspace(data), full, 100000, {})
+        row = table[(table['rsi_period'] == overrides['rsi_period'])
+                    & (table['ma_periods.short'] == overrides['ma_periods.short'])]
+        assert len(row) == 1
+        for name in sweep.METRICS:
+            np.testing.assert_equal(row[name].iloc[0], expected[name], err_msg=name)
+
+
+def test_process_workers_match_single_process(params, fields):
+    single = sweep.run_sweep(fields, params, GRID, 100000, workers=1)
+    pooled = sweep.run_sweep(fields, params, GRID, 100000, workers=2)
+    pd.testing.assert_frame_equal(pooled, single)
+
+
+@pytest.mark.parametrize('rank_by', ['sharpe', 'score_ic', 'volatility'])
+def test_table_is_ranked(params, fields, rank_by):
+    table = sweep.run_sweep(fields, params, GRID, 100000, workers=1, rank_by=rank_by)
+
+    assert list(table['rank']) == list(range(1, len(table) + 1))
+    assert len(table) == 6
+    values = table[rank_by].dropna().to_numpy()
+    expected = np.sort(values) if rank_by in sweep.LOWER_IS_BETTER else np.sort(values)[::-1]
+    np.testing.assert_array_equal(values, expected)
+    # NaN 排在最后
+    assert table[rank_by].isna().to_numpy()[len(values):].all()
+
+
+def test_unknown_rank_metric_is_rejected(params, fields):
+    with pytest.raises(Exception, match='不支持的排序指标'):
+        sweep.run_sweep(fields, params, GRID, 100000, rank_by='profit')
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+合成行情数据、akshare 替身和基准测试工具
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+import synthetic_data
+from synthetic_data import AkshareStub, generate_ohlcv, limit_ratio, stub_akshare, symbols
+
+from conftest import END_DATE
+
+
+def test_generator_is_deterministic():
+    first = generate_ohlcv('600001', bars=300, end_date=END_DATE, seed=5)
+    second = generate_ohlcv('600001', bars=300, end_date=END_DATE, seed=5)
+    pd.testing.assert_frame_equal(first, second)
+    other = generate_ohlcv('600001', bars=300, end_date=END_DATE, seed=6)
+    assert not first['close'].equals(other['close'])
+
+
+@pytest.mark.parametrize('code', ['000001', '300001', '688001'])
+def test_generator_respects_price_limits(code):
+    df = generate_ohlcv(code, bars=1000, end_date=END_DATE, seed=1, limit_rate=0.05)
+    change = df['close'].pct_change().dropna()
+    # 价格按分取整，允许一分钱的误差
+    assert (change.abs() <= limit_ratio(code) + 0.01 / df['close'].shift(1).dropna().min()).all()
+    assert (df['high'] >= df[['open', 'close']].max(axis=1)).all()
+    assert (df['low'] <= df[['open', 'close']].min(axis=1)).all()
+    assert df['date'].is_monotonic_increasing
+
+
+def test_gaps_remove_trading_days():
+    complete = generate_ohlcv('000002', bars=500, end_date=END_DATE, seed=2, gap_rate=0.0)
+    gapped = generate_ohlcv('000002', bars=500, end_date=END_DATE, seed=2, gap_rate=0.05)
+    assert len(complete) == 500
+    assert len(gapped) < 500
+    assert complete['date'].iloc[-1] == pd.Timestamp(END_DATE)
+
+
+def test_symbols_cycle_through_boards():
+    assert symbols(7) == ['000001', '600001', '002001', '601001', '300001', '688001', '000002']
+
+
+def test_stub_returns_akshare_format_and_counts_calls():
+    stub = AkshareStub(universe=3, bars=200, end_date=END_DATE)
+    df = stub.stock_zh_a_hist('000001', start_date='20240101', end_date='20240331')
+    assert list(df.columns) == synthetic_data.HIST_COLUMNS
+    assert df['日期'].min() >= '2024-01-01' and df['日期'].max() <= '2024-03-31'
+    assert stub.calls['stock_zh_a_hist'] == 1
+
+    # 不同区间取到的是同一条序列的切片
+    full = stub.frame('000001')
+    window = full[(full['date'] >= '2024-01-01') & (full['date'] <= '2024-03-31')]
+    np.testing.assert_array_equal(df['收盘'].to_numpy(), window['close'].to_numpy())
+
+
+def test_stub_akshare_replaces_and_restores_module():
+    previous = sys.modules.get('akshare')
+    with stub_akshare(universe=2, bars=100, end_date=END_DATE) as stub:
+        import akshare
+        assert akshare is stub
+        assert len(akshare.stock_info_a_code_name()) == 2
+    assert sys.modules.get('akshare') is previous
+
+
+def test_measure_and_compare():
+    result = benchmark.measure(lambda: sum(range(100)), repeat=3, items=10)
+    assert result['repeat'] == 3
+    assert result['min'] <= result['median']
+    assert result['items_per_second'] > 0
+
+    old = {'results': {'a': {'median': 2.0}, 'b': {'median': 1.0}}}
+    new = {'results': {'a': {'median': 1.0}, 'c': {'median': 1.0}}}
+    assert benchmark.compare(old, new) == [('a', 2.0, 1.0, 0.5)]